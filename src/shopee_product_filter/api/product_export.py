@@ -0,0 +1,163 @@
+"""
+商品DBの検索結果の逐次書き出し (CSV / JSONL / Parquet のバイト列のストリーム)
+
+`/basic-products/export/` は検索条件に一致する全商品を返すため、結果をまとめてメモリに載せると
+商品数に比例してメモリを使う。ここの関数は、DBのカーソルから `chunk` 件ずつ受け取った行 (タプル) を
+その場でエンコードしてバイト列として順に返すので、サーバーのメモリは1チャンク分で済む。
+
+- CSV / JSONL: `core/product_writers.py` と同じ形式 (CSV のヘッダーは最初の1回だけ、None は空文字列 / null)。
+  日時は ISO 8601 の文字列にする。
+- Parquet: 型付きのスキーマで、チャンクごとに1つの row group として書き出し、書き出した分をすぐに返す。
+  pyarrow は Parquet を使う場合のみ必要 (`uv sync --extra parquet`)。
+- `gzip_stream`: 任意のバイト列のストリームを gzip で圧縮しながら返す (Content-Encoding: gzip 用)。
+- `accepts_gzip`: リクエストの Accept-Encoding が gzip を受け付けるか (q=0 は受け付けない)。
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, Sequence
+
+EXPORT_FORMATS = {"csv": "text/csv; charset=utf-8", "jsonl": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+EXPORT_SUFFIXES = {"csv": ".csv", "jsonl": ".jsonl", "parquet": ".parquet"}
+# Parquet の列の型 (ここにない列は文字列)
+ARROW_COLUMN_TYPES: Dict[str, str] = {"id": "int64", "sold": "int64", "price": "float64", "created_at": "timestamp", "updated_at": "timestamp"}
+
+Rows = Sequence[Sequence[Any]]
+
+
+def _text_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def iter_csv(columns: Sequence[str], chunks: Iterable[Rows]) -> Iterator[bytes]:
+    """ヘッダー行のあと、チャンクごとに CSV の行をまとめて返す (0件でもヘッダーは返す)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode("utf-8")
+    for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(tuple('' if value is None else _text_value(value) for value in row) for row in rows)
+        yield buffer.getvalue().encode("utf-8")
+
+
+def iter_jsonl(columns: Sequence[str], chunks: Iterable[Rows]) -> Iterator[bytes]:
+    """チャンクごとに JSON Lines の行をまとめて返す"""
+    dumps = json.dumps
+    for rows in chunks:
+        lines = [dumps(dict(zip(columns, map(_text_value, row))), ensure_ascii=False) for row in rows]
+        yield ("\n".join(lines) + "\n").encode("utf-8") if lines else b""
+
+
+def arrow_export_schema(columns: Sequence[str]) -> Any:
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise ImportError("Parquet の書き出しには pyarrow が必要です (uv sync --extra parquet)。") from e
+    types = {"int64": pa.int64(), "float64": pa.float64(), "timestamp": pa.timestamp("us", tz="UTC")}
+    return pa.schema([(name, types.get(ARROW_COLUMN_TYPES.get(name, ""), pa.string())) for name in columns])
+
+
+class _DrainableBuffer(io.RawIOBase):
+    """ParquetWriter の書き出し先。書かれたバイト列を drain() で取り出して捨てる"""
+
+    def __init__(self) -> None:
+        self._chunks: list = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_parquet(columns: Sequence[str], chunks: Iterable[Rows], compression: str = "zstd") -> Iterator[bytes]:
+    """チャンクごとに1つの row group を書き出し、書き出したバイト列を返す (最後にフッター)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = arrow_export_schema(columns)
+    sink = _DrainableBuffer()
+    writer = pq.ParquetWriter(sink, schema, compression=compression)
+    try:
+        for rows in chunks:
+            if not rows:
+                continue
+            table = pa.Table.from_arrays(
+                [pa.array([row[i] for row in rows], type=schema.field(i).type) for i in range(len(columns))], schema=schema
+            )
+            writer.write_table(table, row_group_size=len(rows))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def iter_export(fmt: str, columns: Sequence[str], chunks: Iterable[Rows]) -> Iterator[bytes]:
+    """
+    書き出し形式 ("csv" / "jsonl" / "parquet") のバイト列のストリームを返す。
+
+    Raises:
+        ValueError: 不明な形式の場合。
+    """
+    if fmt == "csv":
+        return iter_csv(columns, chunks)
+    if fmt == "jsonl":
+        return iter_jsonl(columns, chunks)
+    if fmt == "parquet":
+        arrow_export_schema(columns)  # pyarrow がなければストリームを始める前にエラーにする
+        return iter_parquet(columns, chunks)
+    raise ValueError(f"不明な書き出し形式です: {fmt} (選択肢: {', '.join(EXPORT_FORMATS)})")
+
+
+def gzip_stream(stream: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """バイト列のストリームを gzip で圧縮しながら返す"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for data in stream:
+        compressed = compressor.compress(data)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """
+    Accept-Encoding ヘッダーの値が gzip を受け付けるか。
+    gzip (または x-gzip) の q 値、gzip がない場合は `*` の q 値が 0 より大きければ受け付ける (q の省略は 1)。
+    q 値が不正な項目は無視する。
+    """
+    qualities: Dict[str, float] = {}
+    for entry in accept_encoding.split(","):
+        coding, *params = (part.strip() for part in entry.split(";"))
+        coding = coding.lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = -1.0
+        if 0.0 <= quality <= 1.0:
+            qualities[coding] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
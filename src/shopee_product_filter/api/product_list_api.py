@@ -1,21 +1,34 @@
-import os
 import sys
+import asyncio
+import base64
+import binascii
+import json
 import logging
-from typing import List, Optional, Dict, Any, Annotated
+import math
+import os
+from typing import Iterable, Iterator, List, Literal, Mapping, Optional, Dict, Any, Annotated, Set, Tuple
 from datetime import datetime, timezone
-import tempfile
 from contextlib import asynccontextmanager
+from dataclasses import replace
 
 # FastAPI のインポート
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Query
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Depends, HTTPException, Request, status, UploadFile, File, Query
+from fastapi.responses import HTMLResponse, StreamingResponse
 # SQLModel と SQLAlchemy の select
-from sqlmodel import Field, Session, SQLModel, create_engine, select
+from sqlmodel import Field, Session, SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import Index, case, func, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.sql.expression import and_
 from pydantic import BaseModel
 
-# parse_product_list.py を同じディレクトリからインポート
-from ..core.parse_product_list import parse_shopee_shop_products_from_file_final
+from ..core.extraction_stats import ExtractionStats
+from ..core.product_record import PRODUCT_FIELDS
+from ..core.selector_order import stored_layout_count
+from .product_export import EXPORT_FORMATS, EXPORT_SUFFIXES, accepts_gzip, arrow_export_schema, gzip_stream, iter_export
+from .storage_profile import StorageProfile, create_async_reader_engine, create_reader_engine, create_writer_engine
+from .upload_jobs import PageWriter, UploadJobQueue, UploadQueueFullError
+from .upload_parse import SELECTOR_ORDER_COUNTERS, ParsedUploadPage, init_parse_worker, parse_uploaded_page
 
 # BeautifulSoup をインポート
 from bs4 import BeautifulSoup
@@ -25,15 +38,66 @@ logging.basicConfig(level=logging.INFO, format='%(levelname)s:%(name)s:%(message
 logger = logging.getLogger(__name__)
 
 # --- 商品リスト情報専用のDB設定 ---
-DB_FILE_PRODUCT_LIST = "shopee_product_list_data.db"
-DATABASE_URL_PRODUCT_LIST = f"sqlite:///{DB_FILE_PRODUCT_LIST}"
+# WAL モードや PRAGMA、接続プールの設定は環境変数 SHOPEE_DB_* で変更できる (storage_profile.py を参照)
+storage_profile = StorageProfile.from_env()
+DB_FILE_PRODUCT_LIST = storage_profile.absolute_path
+DATABASE_URL_PRODUCT_LIST = storage_profile.url
+
+logger.info(f"商品リスト情報APIは、データベースファイル '{DB_FILE_PRODUCT_LIST}' を使用します。 ({storage_profile})")
+
+# 書き込み (アップロード・ソーシング情報の更新) は接続1本のエンジンで順番に行い、検索は読み込み専用の接続のプールで行う。
+# 検索・ページ送り・集計・IDでの取得は async def のエンドポイントから非同期のエンジン (aiosqlite) で行い、
+# FastAPI のスレッドプールを使わない (書き出しと実行計画は同期のエンジン)
+engine_product_list = create_writer_engine(storage_profile)
+engine_product_list_reader = create_reader_engine(storage_profile)
+engine_product_list_async_reader = create_async_reader_engine(storage_profile)
+# 非同期の検索を同時に実行する数はプールの大きさまでにし、空きを待つリクエストは到着順に通す
+# (AsyncAdaptedQueuePool は、返された接続を後から来たリクエストが先に取ることがあり、応答時間の最大が伸びる)。
+# セマフォはサーバーのイベントループの上で使うので、import 時ではなく起動時 (lifespan) に作る
+async_read_slots: Optional[asyncio.Semaphore] = None
 
-logger.info(f"商品リスト情報APIは、データベースファイル '{DB_FILE_PRODUCT_LIST}' を使用します。")
+# --- アップロードされたHTMLの解析結果キャッシュ ---
+# キャッシュと以下のストアは商品リストDBと同じディレクトリに置く (起動時のカレントディレクトリには作らない)
+PARSE_DATA_DIR = os.path.dirname(DB_FILE_PRODUCT_LIST)
+# 同じ保存ページの再アップロードでは、HTMLを解析せずにキャッシュの結果をDBに書き込む
+PARSE_CACHE_DIR = os.path.join(PARSE_DATA_DIR, "shopee_parse_cache")
+PARSE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# ページ全体がキャッシュに一致しなくても、前回と同じHTMLのアイテムはフィールドの抽出をスキップする
+ITEM_FINGERPRINT_DB = os.path.join(PARSE_DATA_DIR, "shopee_item_fingerprints.db")
+# レイアウトごとに外れ続けるセレクタを学習し、同じレイアウトのページでは評価を省く
+SELECTOR_ORDER_DB = os.path.join(PARSE_DATA_DIR, "shopee_selector_order.db")
+# キャッシュとどちらのストアも、解析用のワーカープロセスがそれぞれ開く (upload_parse.py を参照)
 
-engine_product_list = create_engine(DATABASE_URL_PRODUCT_LIST, echo=False)
+# --- アップロードのジョブキュー (upload_jobs.py を参照) ---
+# 解析はワーカープロセスで並列に、DBへの書き込みは書き込み専用のタスクで行い、アップロード中も検索を止めない
+UPLOAD_MAX_QUEUED_JOBS = 8  # 実行待ちのジョブがこれを超えると 429 を返す
+UPLOAD_CONCURRENT_JOBS = 2  # 同時に実行するジョブの数
+UPLOAD_PARSE_PROCESSES = None  # 解析用のワーカープロセスの数 (None はCPUコア数)
+UPLOAD_JOB_HISTORY = 100  # /jobs/{job_id} で参照できる終わったジョブの数
+# プロセス起動後に解析用のワーカープロセスで増えたセレクタの記録の件数 (/parser-stats/ の selector_order)
+upload_selector_order_counts: Dict[str, int] = {name: 0 for name in SELECTOR_ORDER_COUNTERS}
 
-# --- SQLModelの商品リスト情報モデル定義 (変更なし) ---
+# --- フィールド抽出の計測 (アップロード時に collect_stats=true を指定した場合のみ) ---
+# プロセス起動後に計測したアップロードの合計。/parser-stats/ で参照できる
+extraction_stats_totals = ExtractionStats()
+# ヒューリスティック段階 (とエラー) の割合がこれを超えたフィールドがあれば、マークアップの変更を疑って警告する
+HEURISTIC_WARN_SHARE = 0.2
+
+# --- SQLModelの商品リスト情報モデル定義 ---
 class ProductBasicItem(SQLModel, table=True):
+    # 検索 (/basic-products/) の絞り込みと並び順に使う複合インデックス。
+    # 単独の列のインデックスは範囲の絞り込みと並び順 (sort) に、shop_type から始まるインデックスは
+    # 「ショップタイプ + 価格/販売数/登録日時」の絞り込みと並び順に使う。
+    # id は SQLite の rowid なのでどのインデックスにも末尾に含まれ、同じ値の商品の並び (id) もインデックスで決まる。
+    __table_args__ = (
+        Index("ix_productbasicitem_price", "price"),
+        Index("ix_productbasicitem_sold", "sold"),
+        Index("ix_productbasicitem_created_at", "created_at"),
+        Index("ix_productbasicitem_shop_type_price", "shop_type", "price"),
+        Index("ix_productbasicitem_shop_type_sold", "shop_type", "sold"),
+        Index("ix_productbasicitem_shop_type_created_at", "shop_type", "created_at"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True, index=True)
     sold: Optional[int] = Field(default=0)
     price: Optional[float] = None
@@ -47,6 +111,69 @@ class ProductBasicItem(SQLModel, table=True):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), nullable=False)
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), nullable=False)
 
+# 抽出結果のフィールドのうち、DBのモデルに保存するもの (location はモデルにないため保存しない)
+UPLOAD_MODEL_FIELDS = tuple(key for key in PRODUCT_FIELDS if key in ProductBasicItem.model_fields)
+# 既存の商品を更新するときに上書きするフィールド (created_at / sourcing_status / sourcing_notes などはもともと含まれない)
+UPLOAD_UPDATE_FIELDS = tuple(key for key in UPLOAD_MODEL_FIELDS if key not in ("id", "created_at", "sourcing_status", "sourcing_notes"))
+# アップロードの商品は、この件数ごとに1回の INSERT ... ON CONFLICT でまとめて書き込む
+UPLOAD_UPSERT_BATCH_SIZE = 1000
+# 既存の product_url を調べる IN 句1回あたりの件数 (SQLite のバインド変数の上限より十分小さくする)
+EXISTING_URL_QUERY_CHUNK = 500
+
+# 検索結果の並び順 (sort パラメータ)。どれも上のインデックスで並べられるよう、同じ値の商品は id で並べる
+SORT_ORDERS = {
+    "id": (ProductBasicItem.id.asc(),),  # type: ignore[union-attr]
+    "sold_desc": (ProductBasicItem.sold.desc(), ProductBasicItem.id.desc()),  # type: ignore[union-attr]
+    "price_asc": (ProductBasicItem.price.asc(), ProductBasicItem.id.asc()),  # type: ignore[union-attr]
+    "created_at_desc": (ProductBasicItem.created_at.desc(), ProductBasicItem.id.desc()),  # type: ignore[attr-defined]
+}
+ProductSort = Literal["id", "sold_desc", "price_asc", "created_at_desc"]
+# カーソルによるページ送り (/basic-products/page/) の並びのキー: (並べる列, 降順か)。id 順以外は同じ値の中を id で並べる
+SORT_KEYS = {
+    "id": (ProductBasicItem.id, False),
+    "sold_desc": (ProductBasicItem.sold, True),
+    "price_asc": (ProductBasicItem.price, False),
+    "created_at_desc": (ProductBasicItem.created_at, True),
+}
+# total=estimate のとき、一致する商品をこの件数まで数える (超えた場合は total_exact=false で「この件数以上」)
+TOTAL_ESTIMATE_LIMIT = 10000
+# 分布 (/basic-products/facets/) のヒストグラムの既定の区切り (SGD / 個)。最初の区切り未満と最後の区切り以上も1つの区間にする
+DEFAULT_PRICE_EDGES = (5.0, 10.0, 20.0, 50.0, 100.0, 200.0, 500.0)
+DEFAULT_SOLD_EDGES = (10, 100, 1000, 10000, 100000)
+MAX_HISTOGRAM_EDGES = 50
+# 書き出し (/basic-products/export/) でDBのカーソルから一度に取り出してエンコードする行数
+EXPORT_CHUNK_SIZE = 5000
+
+# --- カーソルによるページ送りのレスポンスモデル ---
+class ProductPage(BaseModel):
+    items: List[ProductBasicItem]
+    next_cursor: Optional[str] = None  # 次のページの cursor (最後のページでは None)
+    total: Optional[int] = None  # 検索条件に一致する商品数 (total=none の場合は None)
+    total_exact: bool = True  # False の場合、total は数えるのを打ち切った件数 (実際はそれ以上)
+
+# --- 分布 (ファセット) のレスポンスモデル ---
+class FacetCount(BaseModel):
+    value: Optional[str]  # None は値のない商品
+    count: int
+
+class HistogramBucket(BaseModel):
+    low: Optional[float]  # 区間の下限 (以上)。None は下限なし
+    high: Optional[float]  # 区間の上限 (未満)。None は上限なし
+    count: int
+
+class Histogram(BaseModel):
+    min: Optional[float] = None
+    max: Optional[float] = None
+    missing: int = 0  # 値のない商品数
+    buckets: List[HistogramBucket]
+
+class ProductFacets(BaseModel):
+    total: int
+    shop_type: List[FacetCount]
+    sourcing_status: List[FacetCount]
+    price: Histogram
+    sold: Histogram
+
 # --- ソーシング情報更新用のリクエストボディモデル (変更なし) ---
 class SourcingInfoUpdate(BaseModel):
     sourcing_status: Optional[str] = None
@@ -55,14 +182,29 @@ class SourcingInfoUpdate(BaseModel):
 # --- FastAPIのライフサイクルイベント管理 (変更なし) ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global async_read_slots
     logger.info(f"商品リスト情報API起動シーケンス開始 (lifespan)。データベースファイル: '{DB_FILE_PRODUCT_LIST}'")
     try:
         SQLModel.metadata.create_all(engine_product_list)
         actual_table_name = "productbasicitem"
         logger.info(f"商品リスト情報データベース '{DB_FILE_PRODUCT_LIST}' のテーブル '{actual_table_name}' を確認/作成しました。")
+        _ensure_search_indexes()
     except Exception as e:
         logger.critical(f"商品リスト情報データベース '{DB_FILE_PRODUCT_LIST}' の起動エラー (lifespan): {e}", exc_info=True)
+    async_read_slots = asyncio.Semaphore(storage_profile.async_reader_pool_size)
+    await upload_jobs.start()
     yield
+    await upload_jobs.stop()
+    try:
+        # 検索で使われた列の統計を必要に応じて更新し、次回の起動後もインデックスを正しく選べるようにする
+        with engine_product_list.begin() as connection:
+            connection.exec_driver_sql("PRAGMA optimize")
+    except Exception as e:
+        logger.warning(f"商品リスト情報データベースの PRAGMA optimize に失敗しました: {e}")
+    await engine_product_list_async_reader.dispose()
+    async_read_slots = None
+    engine_product_list_reader.dispose()
+    engine_product_list.dispose()
     logger.info("商品リスト情報APIシャットダウン完了 (lifespan)。")
 
 # FastAPIのインスタンスを生成
@@ -73,12 +215,43 @@ product_list_app = FastAPI(
     lifespan=lifespan
 )
 
-# --- DBセッションの定義 (変更なし) ---
+
+def _ensure_search_indexes() -> None:
+    """
+    既存のDBに検索用のインデックスがなければ作る (create_all は既存のテーブルにインデックスを追加しないため)。
+    作った場合は ANALYZE で統計を取り直し、SQLite の実行計画がインデックスを選べるようにする。
+    """
+    table = ProductBasicItem.__table__  # type: ignore[attr-defined]
+    with engine_product_list.begin() as connection:
+        existing = {row[1] for row in connection.exec_driver_sql(f"PRAGMA index_list({table.name})")}
+        created = [index for index in table.indexes if index.name not in existing]
+        for index in created:
+            index.create(connection)
+        if created:
+            connection.exec_driver_sql(f"ANALYZE {table.name}")
+            logger.info(f"検索用のインデックスを作成しました: {', '.join(sorted(str(index.name) for index in created))}")
+
+# --- DBセッションの定義 ---
+# 書き込み用 (接続1本。書き込みのリクエストは順番に処理される)
 def get_product_list_session():
     with Session(engine_product_list) as session:
         yield session
 ProductListSession = Annotated[Session, Depends(get_product_list_session)]
 
+# 読み込み専用 (書き込みのコミット中も待たされない)
+def get_product_list_read_session():
+    with Session(engine_product_list_reader) as session:
+        yield session
+ProductListReadSession = Annotated[Session, Depends(get_product_list_read_session)]
+
+# 読み込み専用 (非同期。async def のエンドポイント用)
+async def get_product_list_async_read_session():
+    if async_read_slots is None:
+        raise RuntimeError("商品リストAPIの起動処理 (lifespan) が実行されていません。")
+    async with async_read_slots, AsyncSession(engine_product_list_async_reader) as session:
+        yield session
+ProductListAsyncReadSession = Annotated[AsyncSession, Depends(get_product_list_async_read_session)]
+
 
 # --- API エンドポイント ---
 @product_list_app.get("/", response_class=HTMLResponse, summary="商品リストAPIのトップページ")
@@ -91,12 +264,8 @@ async def read_product_list_root():
     <ul><li><a href="/docs">APIドキュメント (Swagger UI)</a></li><li><a href="/redoc">APIドキュメント (ReDoc)</a></li><li><a href="/basic-products/">DB内商品リスト情報取得</a></li></ul>
     </body></html>"""
 
-@product_list_app.get("/basic-products/", response_model=List[ProductBasicItem], summary="商品リスト情報を取得・検索")
-def get_basic_products_with_filters(
-    # ★★★ session をデフォルト値を持つ引数の前に持ってくる ★★★
-    session: ProductListSession,
-    offset: int = 0,
-    limit: int = Query(default=100, le=200),
+# --- 検索条件 ---
+def product_filter_conditions(
     min_price_sgd: Optional[float] = Query(default=None),
     max_price_sgd: Optional[float] = Query(default=None),
     min_sold: Optional[int] = Query(default=None),
@@ -115,23 +284,356 @@ def get_basic_products_with_filters(
     if sourcing_status: conditions.append(ProductBasicItem.sourcing_status == sourcing_status) # type: ignore
     if start_date_created: conditions.append(ProductBasicItem.created_at >= start_date_created) # type: ignore
     if end_date_created: conditions.append(ProductBasicItem.created_at <= end_date_created) # type: ignore
-    
+    return conditions
+ProductFilterConditions = Annotated[List[Any], Depends(product_filter_conditions)]
+
+
+def basic_products_statement(conditions: List[Any], sort: str = "id"):
+    """検索条件と並び順から、商品を取得する SELECT 文を作る (offset / limit は呼び出し側で付ける)"""
     statement = select(ProductBasicItem)
     if conditions:
         statement = statement.where(and_(*conditions))
-        
-    statement = statement.offset(offset).limit(limit).order_by(ProductBasicItem.id)
-    products = session.exec(statement).all()
+    return statement.order_by(*SORT_ORDERS[sort])
+
+
+def explain_query_plan(session: Session, statement: Any) -> List[Dict[str, Any]]:
+    """SELECT 文の SQLite の実行計画 (`EXPLAIN QUERY PLAN`) を行のリストで返す"""
+    connection = session.connection()
+    compiled = statement.compile(dialect=connection.dialect)
+    params = compiled.construct_params()
+    # 日時は SQLAlchemy が保存するのと同じ文字列にして渡す (値は実行計画の形には影響しない)
+    values = tuple(
+        value.isoformat(sep=" ") if isinstance(value, datetime) else value
+        for value in (params[name] for name in compiled.positiontup or ())
+    )
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled.string}", values).all()
+    return [{"id": row[0], "parent": row[1], "detail": row[3]} for row in rows]
+
+
+@product_list_app.get("/basic-products/", response_model=List[ProductBasicItem], summary="商品リスト情報を取得・検索")
+async def get_basic_products_with_filters(
+    # ★★★ session をデフォルト値を持つ引数の前に持ってくる ★★★
+    session: ProductListAsyncReadSession,
+    conditions: ProductFilterConditions,
+    offset: int = 0,
+    limit: int = Query(default=100, le=200),
+    sort: ProductSort = Query(default="id", description="並び順 (id / sold_desc: 販売数の多い順 / price_asc: 価格の安い順 / created_at_desc: 新しい順)"),
+):
+    statement = basic_products_statement(conditions, sort).offset(offset).limit(limit)
+    products = (await session.exec(statement)).all()
     return products if products else []
 
 
+def _encode_cursor(sort: str, segment: int, value: Any, last_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([sort, segment, value, last_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def _cursor_value(sort: str, value: Any) -> Any:
+    """cursor の並びのキーの値を列の型に合わせて戻す (型が合わなければ ValueError)"""
+    column, _ = SORT_KEYS[sort]
+    if column is ProductBasicItem.created_at:
+        if not isinstance(value, str):
+            raise ValueError("並びのキーの値が日時の文字列ではありません。")
+        return datetime.fromisoformat(value)
+    # bool は int のサブクラスなので別に除く
+    if isinstance(value, bool):
+        raise ValueError("並びのキーの値が数値ではありません。")
+    if column is ProductBasicItem.price:
+        if not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError("並びのキーの値が数値ではありません。")
+        return value
+    if not isinstance(value, int):
+        raise ValueError("並びのキーの値が整数ではありません。")
+    return value
+
+
+def _decode_cursor(cursor: str, sort: str) -> Tuple[int, Any, int]:
+    """cursor を (区間, 最後の商品の並びのキーの値, 最後の商品の id) に戻す。不正な cursor は 400 エラー"""
+    try:
+        cursor_sort, segment, value, last_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if cursor_sort != sort:
+            raise ValueError(f"cursor は sort={cursor_sort} の検索のものです。")
+        segments = _sort_segments(sort)
+        if isinstance(segment, bool) or not isinstance(segment, int) or not 0 <= segment < len(segments):
+            raise ValueError("区間が範囲外です。")
+        if isinstance(last_id, bool) or not isinstance(last_id, int):
+            raise ValueError("id が整数ではありません。")
+        # 値が NULL の商品の区間だけ、並びのキーの値が None になる
+        if segments[segment]:
+            if value is not None:
+                raise ValueError("NULL の区間の並びのキーの値が None ではありません。")
+        else:
+            value = _cursor_value(sort, value)
+        return segment, value, last_id
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"不正な cursor です: {e}")
+
+
+def _sort_segments(sort: str) -> List[bool]:
+    """
+    並び順を、値のある商品の区間と値が NULL の商品の区間に分けて返す (True が NULL の区間)。
+    SQLite の並び順に合わせ、昇順では NULL の区間が先、降順では後。
+    各区間の中は (値, id) の行値の比較だけで次のページを探せるので、どのページもインデックスの範囲検索で取得できる。
+    """
+    column, descending = SORT_KEYS[sort]
+    if column is ProductBasicItem.id or not ProductBasicItem.__table__.c[column.key].nullable:  # type: ignore[attr-defined]
+        return [False]
+    return [False, True] if descending else [True, False]
+
+
+def _segment_statement(conditions: List[Any], sort: str, is_null: bool, after: Optional[Tuple[Any, int]]):
+    """1つの区間の、after (最後の商品の (値, id)) より後の商品を並び順に取得する SELECT 文"""
+    column, descending = SORT_KEYS[sort]
+    id_column = ProductBasicItem.id
+    segment_conditions = list(conditions)
+    if column is id_column:
+        if after is not None:
+            segment_conditions.append(id_column < after[1] if descending else id_column > after[1])  # type: ignore[operator]
+        order_by: Tuple[Any, ...] = (id_column.desc() if descending else id_column.asc(),)  # type: ignore[union-attr]
+    elif is_null:
+        segment_conditions.append(column.is_(None))  # type: ignore[union-attr]
+        if after is not None:
+            segment_conditions.append(id_column < after[1] if descending else id_column > after[1])  # type: ignore[operator]
+        order_by = (id_column.desc() if descending else id_column.asc(),)  # type: ignore[union-attr]
+    else:
+        segment_conditions.append(column.is_not(None))  # type: ignore[union-attr]
+        if after is not None:
+            key, value = tuple_(column, id_column), after
+            segment_conditions.append(key < value if descending else key > value)
+        order_by = SORT_ORDERS[sort]
+    statement = select(ProductBasicItem)
+    if segment_conditions:
+        statement = statement.where(and_(*segment_conditions))
+    return statement.order_by(*order_by)
+
+
+async def _count_products(session: AsyncSession, conditions: List[Any], limit: Optional[int] = None) -> int:
+    """検索条件に一致する商品数 (limit を指定した場合はその件数で数えるのを打ち切る)"""
+    matches = select(ProductBasicItem.id)
+    if conditions:
+        matches = matches.where(and_(*conditions))
+    if limit is not None:
+        matches = matches.limit(limit)
+    return (await session.exec(select(func.count()).select_from(matches.subquery()))).one()
+
+
+@product_list_app.get("/basic-products/page/", response_model=ProductPage, summary="商品リスト情報をカーソルでページ送りして取得・検索")
+async def get_basic_products_page(
+    session: ProductListAsyncReadSession,
+    conditions: ProductFilterConditions,
+    limit: int = Query(default=100, ge=1, le=200),
+    sort: ProductSort = Query(default="id", description="並び順 (/basic-products/ と同じ)"),
+    cursor: Optional[str] = Query(default=None, description="前のページのレスポンスの next_cursor (省略すると最初のページ)"),
+    total: Literal["none", "exact", "estimate"] = Query(
+        default="none", description=f"一致する商品数を返すか (estimate は {TOTAL_ESTIMATE_LIMIT} 件で数えるのを打ち切る)"
+    ),
+):
+    """
+    /basic-products/ と同じ検索条件と並び順で、offset の代わりに cursor でページを送る。
+    cursor は前のページの最後の商品の (並びのキーの値, id) なので、何ページ目でも取得にかかる時間は変わらない。
+    検索条件は最初のページと同じものを指定する (cursor は並び順だけを検証する)。
+    """
+    segments = _sort_segments(sort)
+    start_segment, after = 0, None
+    if cursor:
+        start_segment, value, last_id = _decode_cursor(cursor, sort)
+        after = (value, last_id)
+
+    # 次のページがあるかを知るため limit + 1 件まで取得する (区間の残りが足りなければ次の区間から続ける)
+    items: List[ProductBasicItem] = []
+    item_segments: List[int] = []
+    for segment in range(start_segment, len(segments)):
+        statement = _segment_statement(conditions, sort, segments[segment], after if segment == start_segment else None)
+        rows = (await session.exec(statement.limit(limit + 1 - len(items)))).all()
+        items.extend(rows)
+        item_segments.extend([segment] * len(rows))
+        if len(items) > limit:
+            break
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        column, _ = SORT_KEYS[sort]
+        last = items[-1]
+        next_cursor = _encode_cursor(sort, item_segments[limit - 1], getattr(last, column.key), last.id)  # type: ignore[arg-type]
+
+    page = ProductPage(items=items, next_cursor=next_cursor)
+    if total == "exact":
+        page.total = await _count_products(session, conditions)
+    elif total == "estimate":
+        page.total = await _count_products(session, conditions, TOTAL_ESTIMATE_LIMIT + 1)
+        if page.total > TOTAL_ESTIMATE_LIMIT:
+            page.total, page.total_exact = TOTAL_ESTIMATE_LIMIT, False
+    return page
+
+
+def _histogram_edges(edges: Optional[List[float]], default: Tuple[float, ...], name: str) -> List[float]:
+    if not edges:
+        return list(default)
+    if len(edges) > MAX_HISTOGRAM_EDGES or any(low >= high for low, high in zip(edges, edges[1:])):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{name} は {MAX_HISTOGRAM_EDGES} 個以下の、小さい順に並んだ重複のない値を指定してください。",
+        )
+    return list(edges)
+
+
+def _bucket_index(column: Any, edges: List[float]) -> Any:
+    """列の値が入るヒストグラムの区間の番号 (0 〜 len(edges)) を表す CASE 式。値が NULL なら NULL"""
+    whens = [(column.is_(None), None)] + [(column < edge, index) for index, edge in enumerate(edges)]
+    return case(*whens, else_=len(edges))
+
+
+def _histogram(counts: Dict[Optional[int], int], edges: List[float], low: Optional[float], high: Optional[float]) -> Histogram:
+    bounds: List[Optional[float]] = [None, *edges, None]
+    return Histogram(
+        min=low,
+        max=high,
+        missing=counts.get(None, 0),
+        buckets=[HistogramBucket(low=bounds[i], high=bounds[i + 1], count=counts.get(i, 0)) for i in range(len(edges) + 1)],
+    )
+
+
+@product_list_app.get("/basic-products/facets/", response_model=ProductFacets, summary="検索条件に一致する商品の分布 (件数・ヒストグラム)")
+async def get_basic_products_facets(
+    session: ProductListAsyncReadSession,
+    conditions: ProductFilterConditions,
+    price_edges: Optional[List[float]] = Query(default=None, description="価格 (SGD) のヒストグラムの区切り (小さい順。省略時は既定の区切り)"),
+    sold_edges: Optional[List[float]] = Query(default=None, description="販売数のヒストグラムの区切り (小さい順。省略時は既定の区切り)"),
+):
+    """
+    /basic-products/ と同じ検索条件に一致する商品について、ショップタイプ・ソーシング状況ごとの件数と、
+    価格・販売数のヒストグラム (と最小値・最大値) を返す。
+    (ショップタイプ, ソーシング状況, 価格の区間, 販売数の区間) の組ごとの件数を1回の GROUP BY で数え、
+    組の数 (多くても数千) の行だけを受け取って、項目ごとの件数に足し合わせる。商品の行そのものは転送しない。
+    """
+    price_edges = _histogram_edges(price_edges, DEFAULT_PRICE_EDGES, "price_edges")
+    sold_edges = _histogram_edges(sold_edges, DEFAULT_SOLD_EDGES, "sold_edges")
+    price_bucket = _bucket_index(ProductBasicItem.price, price_edges).label("price_bucket")
+    sold_bucket = _bucket_index(ProductBasicItem.sold, sold_edges).label("sold_bucket")
+    statement = select(  # type: ignore[call-overload]
+        ProductBasicItem.shop_type,
+        ProductBasicItem.sourcing_status,
+        price_bucket,
+        sold_bucket,
+        func.count(),
+        func.min(ProductBasicItem.price),
+        func.max(ProductBasicItem.price),
+        func.min(ProductBasicItem.sold),
+        func.max(ProductBasicItem.sold),
+    )
+    if conditions:
+        statement = statement.where(and_(*conditions))
+    statement = statement.group_by(ProductBasicItem.shop_type, ProductBasicItem.sourcing_status, price_bucket, sold_bucket)
+
+    total = 0
+    shop_types: Dict[Optional[str], int] = {}
+    sourcing_statuses: Dict[Optional[str], int] = {}
+    price_counts: Dict[Optional[int], int] = {}
+    sold_counts: Dict[Optional[int], int] = {}
+    price_values: List[float] = []
+    sold_values: List[float] = []
+    for shop_type, sourcing_status, price_index, sold_index, count, *extremes in (await session.exec(statement)).all():
+        total += count
+        shop_types[shop_type] = shop_types.get(shop_type, 0) + count
+        sourcing_statuses[sourcing_status] = sourcing_statuses.get(sourcing_status, 0) + count
+        price_counts[price_index] = price_counts.get(price_index, 0) + count
+        sold_counts[sold_index] = sold_counts.get(sold_index, 0) + count
+        price_values.extend(value for value in extremes[:2] if value is not None)
+        sold_values.extend(value for value in extremes[2:] if value is not None)
+
+    def facet_counts(counts: Dict[Optional[str], int]) -> List[FacetCount]:
+        return [FacetCount(value=value, count=count) for value, count in sorted(counts.items(), key=lambda pair: -pair[1])]
+
+    return ProductFacets(
+        total=total,
+        shop_type=facet_counts(shop_types),
+        sourcing_status=facet_counts(sourcing_statuses),
+        price=_histogram(price_counts, price_edges, min(price_values, default=None), max(price_values, default=None)),
+        sold=_histogram(sold_counts, sold_edges, min(sold_values, default=None), max(sold_values, default=None)),
+    )
+
+
+def _iter_export_chunks(statement: Any) -> Iterator[List[Any]]:
+    """
+    SELECT 文の結果を EXPORT_CHUNK_SIZE 行ずつ返す。
+    レスポンスを送り終えるまでリクエストのセッションが開いている保証はないので、読み込み用のエンジンから専用の接続を開き、
+    サーバー側のカーソル (stream_results) で少しずつ取り出す。
+    """
+    with engine_product_list_reader.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=EXPORT_CHUNK_SIZE).execute(statement)
+        for partition in result.partitions():
+            yield partition
+
+
+@product_list_app.get("/basic-products/export/", summary="検索条件に一致する全商品を CSV / JSONL / Parquet で書き出す")
+def export_basic_products(
+    request: Request,
+    conditions: ProductFilterConditions,
+    format: Literal["csv", "jsonl", "parquet"] = Query(default="csv", description="書き出し形式"),
+    sort: ProductSort = Query(default="id", description="並び順 (/basic-products/ と同じ)"),
+):
+    """
+    /basic-products/ と同じ検索条件に一致する商品を、件数の上限なしで全件書き出す。
+    DBのカーソルから EXPORT_CHUNK_SIZE 件ずつ読んでエンコードしながら送るので、サーバーのメモリは商品数によらず一定。
+    クライアントの Accept-Encoding が gzip を受け付ける場合 (q=0 を除く) は gzip で圧縮する (Parquet はファイル自体が圧縮済みなので圧縮しない)。
+    どちらの場合も、キャッシュが圧縮の有無を区別できるよう `Vary: Accept-Encoding` を付ける。
+    """
+    if format == "parquet":
+        try:
+            arrow_export_schema([])
+        except ImportError as e:
+            raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(e))
+    table = ProductBasicItem.__table__  # type: ignore[attr-defined]
+    columns = [column.name for column in table.columns]
+    statement = select(*table.columns)
+    if conditions:
+        statement = statement.where(and_(*conditions))
+    statement = statement.order_by(*SORT_ORDERS[sort])
+
+    stream = iter_export(format, columns, _iter_export_chunks(statement))
+    headers = {"Content-Disposition": f'attachment; filename="basic_products{EXPORT_SUFFIXES[format]}"', "Vary": "Accept-Encoding"}
+    if format != "parquet" and accepts_gzip(request.headers.get("accept-encoding", "")):
+        stream = gzip_stream(stream)
+        headers["Content-Encoding"] = "gzip"
+    logger.info(f"商品の書き出しを開始します (形式: {format}, 並び順: {sort}, 圧縮: {headers.get('Content-Encoding', 'なし')})")
+    return StreamingResponse(stream, media_type=EXPORT_FORMATS[format], headers=headers)
+
+
+@product_list_app.get("/basic-products/query-plan/", summary="商品リスト情報の検索の実行計画 (デバッグ用)")
+def get_basic_products_query_plan(
+    session: ProductListReadSession,
+    conditions: ProductFilterConditions,
+    offset: int = 0,
+    limit: int = Query(default=100, le=200),
+    sort: ProductSort = Query(default="id"),
+):
+    """
+    /basic-products/ と同じパラメータの検索について、SQLite の `EXPLAIN QUERY PLAN` を返す。
+    `table_scan` はテーブル全体をインデックスなしで読む段階があるか、`temp_sort` は並べ替えのために一時的なB木を作るかを表す。
+    (絞り込みなしの id 順は、テーブルを id 順に読んで limit 件で止めるので table_scan になるが問題ない)
+    """
+    statement = basic_products_statement(conditions, sort).offset(offset).limit(limit)
+    plan = explain_query_plan(session, statement)
+    table = ProductBasicItem.__tablename__
+    return {
+        "sql": str(statement.compile(dialect=session.connection().dialect)),
+        "plan": plan,
+        "table_scan": any(step["detail"].startswith(f"SCAN {table}") and "INDEX" not in step["detail"] for step in plan),
+        "temp_sort": any("TEMP B-TREE" in step["detail"] for step in plan),
+    }
+
+
 @product_list_app.get("/basic-products/{item_id}", response_model=ProductBasicItem, summary="特定の商品リスト情報をIDで取得")
-def get_basic_product_by_id(
+async def get_basic_product_by_id(
     # ★★★ session をデフォルト値を持つ引数の前に持ってくる (この関数は item_id が必須なので元々OKだった) ★★★
     item_id: int, 
-    session: ProductListSession
+    session: ProductListAsyncReadSession
 ):
-    product = session.get(ProductBasicItem, item_id)
+    product = await session.get(ProductBasicItem, item_id)
     if not product:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="商品リストアイテムが見つかりません")
     return product
@@ -166,77 +668,207 @@ def update_sourcing_info(
 
 @product_list_app.post("/upload-product-list-html/", summary="商品リストHTMLをアップロードしてDBに保存/更新")
 async def upload_product_list_html_and_save(
-    # ★★★ session をデフォルト値を持つ引数の前に持ってくる ★★★
-    session: ProductListSession, 
-    html_files: List[UploadFile] = File(...)
+    html_files: List[UploadFile] = File(...),
+    collect_stats: bool = Query(default=False, description="フィールドごとの抽出時間とフォールバック段階を集計してレスポンスに含める"),
 ):
-    # (以降のロジックは変更なし)
-    processed_results = []
-    for html_file in html_files:
-        file_name = html_file.filename
-        logger.info(f"商品リストHTMLファイル処理開始: {file_name}")
-        temp_file_path = None
+    # ジョブキューに入れて終わるまで待ち、ページごとの結果を返す (解析と書き込みはイベントループの外で行うので、他のリクエストは止まらない)
+    job = await _submit_upload_job(html_files, collect_stats)
+    await job.wait()
+    return job.results()
+
+
+@product_list_app.post("/upload-jobs/", status_code=status.HTTP_202_ACCEPTED, summary="商品リストHTMLのアップロードをジョブとして受け付ける")
+async def submit_upload_job(
+    html_files: List[UploadFile] = File(...),
+    collect_stats: bool = Query(default=False, description="フィールドごとの抽出時間とフォールバック段階を集計して結果に含める"),
+):
+    # 受け付けたらすぐにジョブの ID を返す。進み具合と結果は /jobs/{job_id} で参照する
+    job = await _submit_upload_job(html_files, collect_stats)
+    return job.to_dict()
+
+
+@product_list_app.get("/jobs/{job_id}", summary="アップロードのジョブの進み具合とページごとの結果")
+async def get_upload_job(job_id: str):
+    job = upload_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ジョブが見つかりません (終わってから時間がたったジョブは消えます)。")
+    return job.to_dict()
+
+
+async def _submit_upload_job(html_files: List[UploadFile], collect_stats: bool):
+    """
+    アップロードされたファイルを読み込んでジョブキューに入れる (UploadFile はレスポンスを返すと閉じられるため、バイト列にしてから渡す)。
+    キューが一杯なら 429 にする。
+    """
+    uploads = [(html_file.filename, await html_file.read()) for html_file in html_files]
+    try:
+        return upload_jobs.submit(uploads, {"collect_stats": collect_stats})
+    except UploadQueueFullError as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e), headers={"Retry-After": "30"})
+
+
+class _ParsedPageWriter(PageWriter):
+    """
+    1回のアップロードのジョブのページを、全ページの解析が終わってから1つのトランザクションでDBに保存/更新する
+    (ジョブキューの書き込み用のスレッドで使う)。
+    ページごとにセーブポイントを置き、書き込みに失敗したページだけを取り消してエラーにする (ほかのページはコミットする)。
+    書き込んだページの商品は残さないので、ページ数の多いジョブでもメモリは増えない。
+    """
+
+    def __init__(self, options: Mapping[str, Any]):
+        self.options = options
+        self.session = Session(engine_product_list)
+        self._pages: List[Tuple[Optional[str], ParsedUploadPage, Dict[str, Any]]] = []
+
+    def write(self, file_name: Optional[str], page: ParsedUploadPage) -> None:
+        if page.from_cache:
+            logger.info(f"ファイル '{file_name}' は解析キャッシュに一致したため、解析をスキップしました。")
+        for name, count in page.selector_order_counts.items():
+            upload_selector_order_counts[name] = upload_selector_order_counts.get(name, 0) + count
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".html", mode="w+b") as tmp:
-                content = await html_file.read()
-                tmp.write(content)
-                temp_file_path = tmp.name
-            
-            parsed_items: Optional[List[Dict[str, Any]]] = parse_shopee_shop_products_from_file_final(temp_file_path)
-
-            if parsed_items is None:
-                logger.warning(f"ファイル '{file_name}' から商品リストのコンテナが見つかりませんでした。スキップします。")
-                processed_results.append({"file_name": file_name, "status": "skipped", "message": "商品リストのコンテナが見つかりませんでした。"})
-                continue
-            if not parsed_items:
-                logger.info(f"ファイル '{file_name}' から抽出された商品アイテムはありませんでした。")
-                processed_results.append({"file_name": file_name, "status": "success", "message": "抽出アイテムなし", "items_processed": 0})
-                continue
-
-            items_processed_count = 0
-
-            for item_data in parsed_items:
-                product_url = item_data.get("product_url")
-                if not product_url:
-                    logger.warning(f"アイテムにproduct_urlがありません。スキップします。データ: {item_data}")
-                    continue
-                
-                existing_item = session.exec(
-                    select(ProductBasicItem).where(ProductBasicItem.product_url == product_url)
-                ).first()
-                current_time = datetime.now(timezone.utc)
-                valid_model_keys = ProductBasicItem.model_fields.keys()
-
-                if existing_item:
-                    logger.info(f"商品URL '{product_url}' は既存のため、更新します。 (ファイル: {file_name})")
-                    update_data = { k: v for k, v in item_data.items() if k in valid_model_keys and k not in ["created_at", "id", "sourcing_status", "sourcing_notes", "status_updated_at"]}
-                    for key, value in update_data.items():
-                        setattr(existing_item, key, value)
-                    existing_item.updated_at = current_time
-                    session.add(existing_item)
-                else:
-                    logger.info(f"商品URL '{product_url}' は新規のため、追加します。 (ファイル: {file_name})")
-                    filtered_new_item_data = { k: v for k, v in item_data.items() if k in valid_model_keys and k != "id"}
-                    new_item = ProductBasicItem(**filtered_new_item_data)
-                    session.add(new_item)
-                items_processed_count += 1
-            
-            session.commit()
-            processed_results.append({"file_name": file_name, "status": "success", "message": f"{items_processed_count} アイテム処理完了", "items_processed": items_processed_count})
-            logger.info(f"ファイル '{file_name}' のDB保存/更新が完了しました。処理アイテム数: {items_processed_count}")
-
-        except HTTPException:
-            session.rollback()
-            processed_results.append({"file_name": file_name, "status": "error", "message": "処理中にHTTPエラーが発生しました。"})
-            raise
+            with self.session.begin_nested():
+                result = _upsert_parsed_page(self.session, file_name, page)
         except Exception as e:
-            session.rollback()
             logger.error(f"商品リストHTML '{file_name}' の処理中に予期せぬエラーが発生しました: {e}", exc_info=True)
-            processed_results.append({"file_name": file_name, "status": "error", "message": f"予期せぬサーバーエラー: {e}"})
-        finally:
-            if temp_file_path and os.path.exists(temp_file_path):
-                try: os.remove(temp_file_path)
-                except Exception as e_remove: logger.error(f"一時ファイルの削除に失敗: {temp_file_path}, エラー: {e_remove}")
-                    
-    return processed_results
+            result = {"file_name": file_name, "status": "error", "message": f"予期せぬサーバーエラー: {e}"}
+        # コミット後の結果の集計には商品を使わないので、計測結果などだけを残す
+        self._pages.append((file_name, replace(page, items=()), result))
+
+    def commit(self) -> List[Dict[str, Any]]:
+        self.session.commit()
+        pages, self._pages = self._pages, []
+        return [_finish_page_result(file_name, page, result, self.options) for file_name, page, result in pages]
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def _upsert_parsed_page(session: Session, file_name: Optional[str], page: ParsedUploadPage) -> Dict[str, Any]:
+    """
+    1ページ分の商品を保存/更新し、ページの結果を返す (コミットは呼び出し側で行う)。
+    同じ product_url が `UPLOAD_UPSERT_BATCH_SIZE` 件ごとの別のバッチに現れても、追加/更新の件数には1件として数える。
+    """
+    items_processed_count = 0
+    items_found_count = 0
+    inserted_count = updated_count = 0
+    pending_items: List[Mapping[str, Any]] = []
+    # このページで保存済みの product_url (後のバッチでは既存の商品として見えるので、更新の件数から除く)
+    seen_urls: Set[str] = set()
+
+    def flush() -> None:
+        nonlocal inserted_count, updated_count
+        urls = {item["product_url"] for item in pending_items}
+        inserted, updated = upsert_basic_products(session, pending_items)
+        inserted_count += inserted
+        updated_count += updated - len(urls & seen_urls)
+        seen_urls.update(urls)
+        pending_items.clear()
+
+    for item_data in page.items:
+        items_found_count += 1
+        if not item_data.get("product_url"):
+            logger.warning(f"アイテムにproduct_urlがありません。スキップします。データ: {item_data}")
+            continue
+        pending_items.append(item_data)
+        items_processed_count += 1
+        if len(pending_items) >= UPLOAD_UPSERT_BATCH_SIZE:
+            flush()
+    flush()
+
+    if not page.list_found:
+        return {"file_name": file_name, "status": "skipped", "message": "商品リストのコンテナが見つかりませんでした。"}
+    if not items_found_count:
+        return {"file_name": file_name, "status": "success", "message": "抽出アイテムなし", "items_processed": 0}
+    return {
+        "file_name": file_name, "status": "success", "message": f"{items_processed_count} アイテム処理完了",
+        "items_processed": items_processed_count, "items_inserted": inserted_count, "items_updated": updated_count,
+    }
+
+
+def _finish_page_result(file_name: Optional[str], page: ParsedUploadPage, result: Dict[str, Any], options: Mapping[str, Any]) -> Dict[str, Any]:
+    """コミットしたページの結果をログに出し、抽出の計測結果を合計に足し込む"""
+    if result["status"] == "error":
+        return result
+    # キャッシュの結果を使った場合は解析していないので、計測結果は None になる
+    file_stats = ExtractionStats.from_dict(page.stats) if page.stats is not None else None
+    stats_result = _record_extraction_stats(file_name, file_stats) if file_stats is not None and file_stats.items else None
+    if result["status"] == "skipped":
+        logger.warning(f"ファイル '{file_name}' から商品リストのコンテナが見つかりませんでした。スキップします。")
+    elif "items_inserted" not in result:
+        logger.info(f"ファイル '{file_name}' から抽出された商品アイテムはありませんでした。")
+    else:
+        if options.get("collect_stats"):
+            result["extraction_stats"] = stats_result
+        logger.info(
+            f"ファイル '{file_name}' のDB保存/更新が完了しました。処理アイテム数: {result['items_processed']} "
+            f"(新規: {result['items_inserted']}, 更新: {result['items_updated']})"
+        )
+    return result
+
+
+upload_jobs = UploadJobQueue(
+    parse_uploaded_page, _ParsedPageWriter,
+    max_queued_jobs=UPLOAD_MAX_QUEUED_JOBS, concurrent_jobs=UPLOAD_CONCURRENT_JOBS, parse_processes=UPLOAD_PARSE_PROCESSES,
+    history=UPLOAD_JOB_HISTORY,
+    parse_initializer=init_parse_worker, parse_initargs=(PARSE_CACHE_DIR, PARSE_CACHE_MAX_BYTES, ITEM_FINGERPRINT_DB, SELECTOR_ORDER_DB),
+)
+
+
+def upsert_basic_products(session: Session, items: Iterable[Mapping[str, Any]]) -> Tuple[int, int]:
+    """
+    商品を product_url をキーに1回の `INSERT ... ON CONFLICT (product_url) DO UPDATE` で追加/更新し、
+    (追加した件数, 更新した件数) を返す。コミットは呼び出し側で行う。
+
+    - 同じ product_url が複数ある場合は、後に現れたものの値を使う (1件として数える)。
+    - 既存の商品は `UPLOAD_UPDATE_FIELDS` と updated_at だけを上書きし、
+      created_at / sourcing_status / sourcing_notes はそのまま残す。
+    """
+    rows: Dict[str, Dict[str, Any]] = {}
+    for item in items:
+        rows[item["product_url"]] = {key: item.get(key) for key in UPLOAD_MODEL_FIELDS}
+    if not rows:
+        return 0, 0
+
+    # 追加と更新の件数を分けて返すため、既存の product_url だけは先にまとめて調べる
+    urls = list(rows)
+    existing_count = 0
+    for start in range(0, len(urls), EXISTING_URL_QUERY_CHUNK):
+        chunk = urls[start:start + EXISTING_URL_QUERY_CHUNK]
+        existing_count += len(session.exec(select(ProductBasicItem.product_url).where(ProductBasicItem.product_url.in_(chunk))).all())  # type: ignore
+
+    current_time = datetime.now(timezone.utc)
+    for row in rows.values():
+        row["created_at"] = current_time
+        row["updated_at"] = current_time
+    table = ProductBasicItem.__table__  # type: ignore[attr-defined]
+    statement = sqlite_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.product_url],
+        set_={key: statement.excluded[key] for key in (*UPLOAD_UPDATE_FIELDS, "updated_at")},
+    )
+    session.execute(statement, list(rows.values()))
+    return len(rows) - existing_count, existing_count
+
+
+def _record_extraction_stats(file_name: Optional[str], file_stats: ExtractionStats) -> Dict[str, Any]:
+    """1ファイル分の計測結果をプロセス全体の合計に足し込み、ヒューリスティックに頼っているフィールドがあれば警告する"""
+    extraction_stats_totals.merge(file_stats)
+    degraded = file_stats.degraded_fields(HEURISTIC_WARN_SHARE)
+    if degraded:
+        shares = ", ".join(f"{label}={share:.0%}" for label, share in degraded.items())
+        logger.warning(f"ファイル '{file_name}' の抽出でヒューリスティックの段階が多く使われています ({shares})。Shopee のマークアップが変わった可能性があります。")
+    return file_stats.to_dict()
+
+
+@product_list_app.get("/parser-stats/", summary="アップロード時に計測したフィールド別の抽出時間とフォールバック段階の合計")
+def get_parser_stats():
+    totals = extraction_stats_totals.to_dict()
+    totals["degraded_fields"] = extraction_stats_totals.degraded_fields(HEURISTIC_WARN_SHARE)
+    totals["selector_order"] = _selector_order_stats()
+    totals["upload_jobs"] = upload_jobs.stats()
+    return totals
+
 
+def _selector_order_stats() -> Dict[str, Any]:
+    """解析用のワーカープロセスで増えたセレクタの記録の件数と、保存済みのレイアウト数 (ストアは読み込み専用で開く)"""
+    return {**upload_selector_order_counts, "layouts": stored_layout_count(SELECTOR_ORDER_DB)}
@@ -0,0 +1,191 @@
+"""
+商品リストDB (SQLite) の接続設定 (ストレージプロファイル)
+
+素の `create_engine("sqlite:///...")` は、ロールバックジャーナルのまま PRAGMA も設定しないため、
+大きなアップロードをコミットしている間は検索のリクエストがロックを待たされ、"database is locked" で失敗していた。
+
+`StorageProfile` は以下をまとめて設定する。
+- WAL モード (`journal_mode=WAL`): 書き込み中も読み込みはコミット済みのスナップショットを読めるので、待たされない。
+- `synchronous=NORMAL`: WAL モードでは、電源断の直前のコミットが失われうるだけで、DBが壊れることはない。
+- `cache_size` / `mmap_size`: ページキャッシュとメモリマップの大きさ。
+- `busy_timeout`: ロックを取れないときに、エラーにせず待つ時間。
+- 接続プール: 読み込み用と書き込み用でエンジンを分ける。
+  - 読み込み用 (`create_reader_engine`): `reader_pool_size` 本の接続のプール。各接続は `query_only` で、誤って書き込むとエラーになる。
+  - 書き込み用 (`create_writer_engine`): 接続1本だけのプール。SQLite の書き込みはもともと1つずつしかできないので、
+    書き込みのリクエストは SQLite のロックではなくプールの空きを待つ (`pool_timeout_seconds` 秒まで)。
+    トランザクションは `BEGIN IMMEDIATE` で始める (セーブポイント (`Session.begin_nested`) を使えるようにするため)。
+  - 非同期の読み込み用 (`create_async_reader_engine`): SQLAlchemy asyncio + aiosqlite のエンジン。
+    `async def` の検索エンドポイントが使う。FastAPI のスレッドプールを使わないので、プールの大きさ
+    (`async_reader_pool_size` / `async_reader_max_overflow`) は同期の読み込み用とは別に決める。
+
+設定は環境変数 (`SHOPEE_DB_PATH`, `SHOPEE_DB_CACHE_SIZE_KIB` など、`ENV_PREFIX` + フィールド名の大文字) で上書きできる。
+DBファイルのパスは起動時に絶対パスにするので、起動後にカレントディレクトリが変わっても同じファイルを使う。
+
+書き込みと読み込みの競合の計測は `benchmarks/sqlite_contention.py` を、
+スレッドプール (同期) と非同期の検索の同時接続時の応答時間の比較は `benchmarks/read_concurrency.py` を参照。
+"""
+import os
+from dataclasses import dataclass, fields, replace
+from typing import Any, Dict, List, Mapping, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlmodel import create_engine
+
+ENV_PREFIX = "SHOPEE_DB_"
+DEFAULT_DB_PATH = "shopee_product_list_data.db"
+
+
+@dataclass(frozen=True)
+class StorageProfile:
+    """SQLite の接続設定 (フィールド名は環境変数の名前にも使う)"""
+
+    path: str = DEFAULT_DB_PATH
+    wal: bool = True
+    synchronous: str = "NORMAL"
+    cache_size_kib: int = 64 * 1024  # 接続ごとのページキャッシュ (64MiB)
+    mmap_size_bytes: int = 256 * 1024 * 1024
+    busy_timeout_ms: int = 5000
+    reader_pool_size: int = 8
+    reader_max_overflow: int = 8
+    async_reader_pool_size: int = 16
+    async_reader_max_overflow: int = 16
+    pool_timeout_seconds: float = 60.0
+    pool_recycle_seconds: int = 3600
+
+    @classmethod
+    def from_env(cls, environ: Optional[Mapping[str, str]] = None, **defaults: Any) -> "StorageProfile":
+        """環境変数 (`SHOPEE_DB_<フィールド名の大文字>`) で上書きしたプロファイルを作る"""
+        environ = os.environ if environ is None else environ
+        values: Dict[str, Any] = dict(defaults)
+        for field in fields(cls):
+            raw = environ.get(ENV_PREFIX + field.name.upper())
+            if raw is None:
+                continue
+            if field.type in (bool, "bool"):
+                values[field.name] = raw.strip().lower() in ("1", "true", "yes", "on")
+            elif field.type in (int, "int"):
+                values[field.name] = int(raw)
+            elif field.type in (float, "float"):
+                values[field.name] = float(raw)
+            else:
+                values[field.name] = raw
+        return cls(**values)
+
+    @property
+    def absolute_path(self) -> str:
+        return os.path.abspath(self.path)
+
+    @property
+    def url(self) -> str:
+        return f"sqlite:///{self.absolute_path}"
+
+    @property
+    def async_url(self) -> str:
+        return f"sqlite+aiosqlite:///{self.absolute_path}"
+
+    def with_path(self, path: str) -> "StorageProfile":
+        return replace(self, path=path)
+
+    def pragmas(self, read_only: bool = False) -> List[str]:
+        """接続ごとに実行する PRAGMA (journal_mode は DB ファイルに記録されるので、書き込み用の接続でだけ設定する)"""
+        statements = [f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}"]
+        if self.wal and not read_only:
+            statements.append("PRAGMA journal_mode=WAL")
+        if self.synchronous:
+            statements.append(f"PRAGMA synchronous={self.synchronous}")
+        if self.cache_size_kib:
+            statements.append(f"PRAGMA cache_size=-{int(self.cache_size_kib)}")
+        if self.mmap_size_bytes:
+            statements.append(f"PRAGMA mmap_size={int(self.mmap_size_bytes)}")
+        statements.append("PRAGMA temp_store=MEMORY")
+        if read_only:
+            statements.append("PRAGMA query_only=ON")
+        return statements
+
+
+def _install_pragmas(engine: Engine, statements: List[str]) -> None:
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+
+def _install_immediate_begin(engine: Engine) -> None:
+    """
+    pysqlite の暗黙の BEGIN (最初の INSERT などの直前にだけ送る) を止め、トランザクションの開始時に `BEGIN IMMEDIATE` を送る。
+    暗黙の BEGIN のままだと、最初の文が SAVEPOINT の場合にそのセーブポイントが外側のトランザクションになり、
+    RELEASE の時点でコミットされてしまう。IMMEDIATE にするのは、読み込みから始めたトランザクションが書き込みに移るときに、
+    ほかのプロセスの書き込みと競合して (busy_timeout を待たずに) SQLITE_BUSY になるのを避けるため。
+    """
+    @event.listens_for(engine, "connect")
+    def disable_pysqlite_begin(dbapi_connection: Any, connection_record: Any) -> None:
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def begin_immediate(connection: Any) -> None:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def _connect_args(profile: StorageProfile) -> Dict[str, Any]:
+    # FastAPI は同期のエンドポイントをスレッドプールで実行するので、接続をスレッド間で使えるようにする
+    return {"check_same_thread": False, "timeout": profile.busy_timeout_ms / 1000}
+
+
+def create_writer_engine(profile: StorageProfile, echo: bool = False) -> Engine:
+    """書き込み用のエンジン (接続1本。テーブルの作成と WAL モードへの切り替えもこの接続で行う。トランザクションは BEGIN IMMEDIATE で始める)"""
+    engine = create_engine(
+        profile.url,
+        echo=echo,
+        connect_args=_connect_args(profile),
+        poolclass=QueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=profile.pool_timeout_seconds,
+        pool_recycle=profile.pool_recycle_seconds,
+    )
+    _install_pragmas(engine, profile.pragmas())
+    _install_immediate_begin(engine)
+    return engine
+
+
+def create_reader_engine(profile: StorageProfile, echo: bool = False) -> Engine:
+    """読み込み用のエンジン (`reader_pool_size` 本の接続のプール。各接続は query_only)"""
+    engine = create_engine(
+        profile.url,
+        echo=echo,
+        connect_args=_connect_args(profile),
+        poolclass=QueuePool,
+        pool_size=profile.reader_pool_size,
+        max_overflow=profile.reader_max_overflow,
+        pool_timeout=profile.pool_timeout_seconds,
+        pool_recycle=profile.pool_recycle_seconds,
+    )
+    _install_pragmas(engine, profile.pragmas(read_only=True))
+    return engine
+
+
+def create_async_reader_engine(profile: StorageProfile, echo: bool = False) -> AsyncEngine:
+    """
+    非同期の読み込み用のエンジン (aiosqlite。`async_reader_pool_size` 本の接続のプール。各接続は query_only)。
+    aiosqlite は接続ごとに1本のスレッドで SQLite を呼ぶので、イベントループは待たされない。
+    """
+    engine = create_async_engine(
+        profile.async_url,
+        echo=echo,
+        connect_args={"timeout": profile.busy_timeout_ms / 1000},
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=profile.async_reader_pool_size,
+        max_overflow=profile.async_reader_max_overflow,
+        pool_timeout=profile.pool_timeout_seconds,
+        pool_recycle=profile.pool_recycle_seconds,
+    )
+    # PRAGMA は接続を作ったとき (同期のイベント) に、aiosqlite の接続をラップした DBAPI の接続で実行する
+    _install_pragmas(engine.sync_engine, profile.pragmas(read_only=True))
+    return engine
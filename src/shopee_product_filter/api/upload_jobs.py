@@ -0,0 +1,503 @@
+"""
+商品リストHTMLのアップロードのジョブキュー (解析はワーカープロセスのプール、DBへの書き込みは専用の書き込みタスク)
+
+アップロードのエンドポイントは `async def` のまま、HTMLの解析 (lxml) と SQLModel のコミットをイベントループの上で
+同期的に実行していたため、大きなアップロードの間は検索 (`/basic-products/`) を含む他のリクエストがすべて止まっていた。
+
+`UploadJobQueue` は、アップロードをジョブとして上限付きのキューに入れ、イベントループの外で処理する。
+- `submit()`: アップロードされたファイルのバイト列をジョブにしてキューに入れる。キューが一杯なら `UploadQueueFullError`。
+- ジョブの実行タスク (`concurrent_jobs` 本): ジョブを1つずつ取り出し、ファイルをページ単位に展開して
+  (`.html.gz` / `.html.zst` / `.zip`。`core/html_archive.py` を参照。展開はスレッドで行う)、
+  展開したページから順に、ページごとの解析 (`parse_page`) をワーカープロセスのプールに振り分ける。
+  1回のアップロードの複数のファイルは、CPUコアの数まで並列に解析される。
+  解析中・退避待ちのページがジョブごとに `max_pending_pages` (既定はワーカープロセス数の2倍) に達すると、
+  退避が進むまで次のページを展開しないので、大きな zip でも展開したHTMLと解析済みの商品はメモリにたまらない。
+- 書き込みタスク (1本): ジョブを開始した順に1つずつ、解析の終わったページの結果を (展開した順に) 一時ファイルに退避し
+  (`SPOOL_MEMORY_BYTES` まではメモリ上)、ジョブの全ページの解析が終わってから、書き込み専用の1本のスレッドで
+  退避した結果を DB に書き込んで (`open_writer` がジョブごとに作る `PageWriter`)、1回でコミットする。
+  SQLite の書き込みはもともと1つずつしかできないので、書き込みを1か所に集めて、ほかのジョブの解析とは並行して進める。
+  ジョブのトランザクションは書き込み用の接続 (1本) をコミットまで使い、その間はほかの書き込み (ソーシング情報の更新など) が
+  待たされるが、解析の間は接続を使わないので、待たされるのは退避した結果を書き込む間だけになる。
+- ワーカープロセスが異常終了して解析用のプールが壊れた (`BrokenProcessPool`) 場合は、同じ設定のプールを作り直す。
+  壊れたプールで解析中だったページは、それぞれワーカープロセス1つだけの専用のプールで1回だけ解析し直すので、
+  ほかのページの異常終了に巻き込まれず、解析し直しても異常終了したページだけがエラーになる。
+- `get()`: ジョブの状態 (`UploadJob.to_dict()`)。ページごとの進み具合 (queued / parsing / parsed / spooled / writing) と、
+  終わったページの結果 (`PageWriter.commit()` の返す success / skipped / error の辞書) を持つ。
+
+ワーカープロセスは spawn で起動する (イベントループやスレッドの動いているプロセスを fork しないため)。
+`parse_page` と `parse_initializer` は、ワーカープロセスから import できるモジュールの関数にすること。
+
+終わったジョブは `history` 件まで残し、古いものから消す。ジョブはプロセスのメモリ上にだけあるので、再起動すると消える。
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import tempfile
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Set, Tuple, Union
+
+from ..core.html_archive import iter_html_pages
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_QUEUED_JOBS = 8
+DEFAULT_CONCURRENT_JOBS = 2
+DEFAULT_HISTORY = 100
+# 書き込みの順番を待てるジョブの数 (これを超えると次のジョブを開始しない)
+DEFAULT_WRITE_BACKLOG = 2
+# 1つのジョブで、解析中・退避待ちのページの上限 (ワーカープロセス1つあたり)
+DEFAULT_PENDING_PAGES_PER_PROCESS = 2
+# 書き込みを始めるまでの解析結果の退避を、メモリ上に置くバイト数 (超えると一時ファイルに書き出す)
+SPOOL_MEMORY_BYTES = 16 * 1024 * 1024
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_CANCELLED = "cancelled"
+
+# ページの処理中の状態 (終わったページの status は PageWriter.commit() の結果の success / skipped / error)
+PAGE_QUEUED = "queued"
+PAGE_PARSING = "parsing"
+PAGE_PARSED = "parsed"  # 退避の順番待ち
+PAGE_SPOOLED = "spooled"  # ジョブの全ページの解析が終わるのを待っている
+PAGE_WRITING = "writing"
+
+# (ファイル名, HTMLのバイト列, ジョブのオプション) -> 解析の結果 (ワーカープロセスで実行する)
+ParsePage = Callable[[Optional[str], bytes, Mapping[str, Any]], Any]
+# ジョブのオプション -> そのジョブのページの書き込み (書き込み用のスレッドで実行する)
+OpenWriter = Callable[[Mapping[str, Any]], "PageWriter"]
+
+
+class UploadQueueFullError(Exception):
+    """ジョブのキューが一杯で、アップロードを受け付けられない"""
+
+
+class PageWriter:
+    """
+    1つのジョブの解析結果の書き込み (`UploadJobQueue` の `open_writer` がジョブごとに作る)。
+    どのメソッドも、書き込み用の1本のスレッドで呼ばれる。
+    """
+
+    def write(self, file_name: Optional[str], parsed: Any) -> None:
+        """1ページの解析結果を書き込む (コミットはしない)。ページはジョブの全ページの解析が終わってから、展開した順に渡される"""
+        raise NotImplementedError
+
+    def commit(self) -> List[Dict[str, Any]]:
+        """書き込んだページをまとめてコミットし、ページごとの結果の辞書を `write()` した順に返す"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """コミットしていない書き込みを取り消す (`commit()` のあとも含め、最後に必ず呼ばれる)"""
+
+
+def iter_upload_pages(uploads: List[Tuple[Optional[str], bytes]]) -> Iterator[Tuple[Optional[str], Union[bytes, Exception]]]:
+    """
+    アップロードされたファイルを、展開済みのHTMLページ単位の (ファイル名, HTMLのバイト列) にして返す
+    (zip のページのファイル名は「アップロードのファイル名!メンバー名」)。展開は1ページずつ行い、ディスクには書き出さない。
+    展開に失敗した場合は、HTMLの代わりに例外を返す (そのファイルの残りのページは処理しない)。
+    """
+    for upload_name, data in uploads:
+        page_count = 0
+        try:
+            for file_name, content in iter_html_pages(data, upload_name or ""):
+                page_count += 1
+                yield file_name, content
+        except Exception as e:
+            yield upload_name, e
+            continue
+        if not page_count:
+            yield upload_name, ValueError("アーカイブにHTMLのページが含まれていません。")
+
+
+def _fail_page(page: Dict[str, Any], error: Exception) -> None:
+    logger.error(f"商品リストHTML '{page['file_name']}' の処理中に予期せぬエラーが発生しました: {error}", exc_info=error)
+    page.update(status="error", message=f"予期せぬサーバーエラー: {error}")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class _PageStream:
+    """1つのジョブの解析中のページを、展開した順に書き込みタスクへ渡す (解析中・退避待ちのページは `limit` 件まで)"""
+
+    def __init__(self, limit: int):
+        self._slots = asyncio.Semaphore(limit)
+        self._pages: "asyncio.Queue[Optional[Tuple[Dict[str, Any], Any]]]" = asyncio.Queue()
+
+    async def reserve(self) -> None:
+        """次のページの枠を取る (空きがなければ、書き込みタスクが退避したページの枠を返すまで待つ)"""
+        await self._slots.acquire()
+
+    def release(self) -> None:
+        self._slots.release()
+
+    def put(self, page: Dict[str, Any], parsed: Any) -> None:
+        """ページと、その解析 (Future) または展開・実行の失敗の例外を渡す (枠は書き込みタスクが返す)"""
+        self._pages.put_nowait((page, parsed))
+
+    def close(self) -> None:
+        self._pages.put_nowait(None)
+
+    async def get(self) -> Optional[Tuple[Dict[str, Any], Any]]:
+        """次のページ (ジョブの最後のページのあとは None)"""
+        return await self._pages.get()
+
+
+class _ParsedSpool:
+    """ジョブの解析結果を、書き込みを始めるまで退避しておく一時ファイル (`SPOOL_MEMORY_BYTES` まではメモリ上)"""
+
+    def __init__(self) -> None:
+        self._file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+        self._count = 0
+
+    def add(self, parsed: Any) -> None:
+        pickle.dump(parsed, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._count += 1
+
+    def __iter__(self) -> Iterator[Any]:
+        """退避した解析結果を、退避した順に1つずつ読み出す"""
+        self._file.seek(0)
+        for _ in range(self._count):
+            yield pickle.load(self._file)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class UploadJob:
+    """1回のアップロードのジョブ (ページごとの進み具合と結果を持つ)"""
+
+    def __init__(self, uploads: List[Tuple[Optional[str], bytes]], options: Optional[Mapping[str, Any]] = None):
+        self.id = uuid.uuid4().hex
+        self.options: Dict[str, Any] = dict(options or {})
+        self.status = JOB_QUEUED
+        self.upload_names = [name for name, _ in uploads]
+        self.created_at = _now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.pages: List[Dict[str, Any]] = []
+        self._uploads: Optional[List[Tuple[Optional[str], bytes]]] = uploads
+        self._done = asyncio.Event()
+
+    def __repr__(self) -> str:
+        return f"UploadJob(id={self.id!r}, status={self.status!r}, uploads={len(self.upload_names)}, pages={len(self.pages)})"
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    async def wait(self) -> None:
+        """ジョブが終わるまで待つ"""
+        await self._done.wait()
+
+    def take_uploads(self) -> List[Tuple[Optional[str], bytes]]:
+        """アップロードされたバイト列を取り出す (ジョブからは参照を外し、処理が終わったページから解放されるようにする)"""
+        uploads, self._uploads = self._uploads or [], None
+        return uploads
+
+    def add_page(self, file_name: Optional[str]) -> Dict[str, Any]:
+        page: Dict[str, Any] = {"file_name": file_name, "status": PAGE_QUEUED}
+        self.pages.append(page)
+        return page
+
+    def results(self) -> List[Dict[str, Any]]:
+        """ページごとの結果 (処理中のページも含めて、展開した順)"""
+        return [dict(page) for page in self.pages]
+
+    def _finish(self, status: str = JOB_DONE) -> None:
+        self.status = status
+        self.finished_at = _now()
+        self._uploads = None
+        self._done.set()
+
+    def to_dict(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for page in self.pages:
+            counts[page["status"]] = counts.get(page["status"], 0) + 1
+        return {
+            "id": self.id,
+            "status": self.status,
+            "uploads": self.upload_names,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "pages_total": len(self.pages),
+            "page_status_counts": counts,
+            "items_processed": sum(page.get("items_processed", 0) for page in self.pages),
+            "results": self.results(),
+        }
+
+
+class UploadJobQueue:
+    """
+    アップロードのジョブキュー。イベントループの上で `start()` してから使い、終了時に `stop()` を呼ぶこと。
+
+    Args:
+        parse_page: 1ページを解析する関数 (ワーカープロセスで実行する。例外はそのページのエラーとして記録する)。
+        open_writer: ジョブのオプションを受け取り、そのジョブのページを書き込む `PageWriter` を返す関数
+            (書き込み用の1本のスレッドで実行する)。
+        max_queued_jobs: 実行を待てるジョブの数。これを超えると `submit()` は `UploadQueueFullError` になる。
+        concurrent_jobs: 同時に実行するジョブの数。
+        parse_processes: 解析用のワーカープロセスの数 (None の場合はCPUコア数)。
+        history: 状態を残しておく終わったジョブの数。
+        write_backlog: 書き込みの順番を待てるジョブの数。
+        parse_initializer / parse_initargs: ワーカープロセスの開始時に呼ぶ関数とその引数 (プロセスごとの準備に使う)。
+        max_pending_pages: 1つのジョブで、解析中・退避待ちにできるページの数 (None の場合はワーカープロセス数の2倍)。
+    """
+
+    def __init__(
+        self,
+        parse_page: ParsePage,
+        open_writer: OpenWriter,
+        max_queued_jobs: int = DEFAULT_MAX_QUEUED_JOBS,
+        concurrent_jobs: int = DEFAULT_CONCURRENT_JOBS,
+        parse_processes: Optional[int] = None,
+        history: int = DEFAULT_HISTORY,
+        write_backlog: int = DEFAULT_WRITE_BACKLOG,
+        parse_initializer: Optional[Callable[..., None]] = None,
+        parse_initargs: Tuple[Any, ...] = (),
+        max_pending_pages: Optional[int] = None,
+    ):
+        if (
+            max_queued_jobs <= 0 or concurrent_jobs <= 0 or write_backlog <= 0
+            or (parse_processes is not None and parse_processes <= 0) or (max_pending_pages is not None and max_pending_pages <= 0)
+        ):
+            raise ValueError("max_queued_jobs / concurrent_jobs / parse_processes / write_backlog / max_pending_pages は1以上を指定してください。")
+        self.parse_page = parse_page
+        self.open_writer = open_writer
+        self.max_queued_jobs = max_queued_jobs
+        self.concurrent_jobs = concurrent_jobs
+        self.parse_processes = parse_processes or os.cpu_count() or 1
+        self.history = history
+        self.write_backlog = write_backlog
+        self.parse_initializer = parse_initializer
+        self.parse_initargs = parse_initargs
+        self.max_pending_pages = max_pending_pages or DEFAULT_PENDING_PAGES_PER_PROCESS * self.parse_processes
+        self._jobs: "OrderedDict[str, UploadJob]" = OrderedDict()
+        self._queue: Optional["asyncio.Queue[UploadJob]"] = None
+        self._writes: Optional["asyncio.Queue[Tuple[UploadJob, _PageStream]]"] = None
+        self._tasks: List["asyncio.Task[None]"] = []
+        self._expand_pool: Optional[ThreadPoolExecutor] = None
+        self._parse_pool: Optional[ProcessPoolExecutor] = None
+        self._write_pool: Optional[ThreadPoolExecutor] = None
+
+    def __repr__(self) -> str:
+        return (
+            f"UploadJobQueue(max_queued_jobs={self.max_queued_jobs}, concurrent_jobs={self.concurrent_jobs}, "
+            f"parse_processes={self.parse_processes}, max_pending_pages={self.max_pending_pages}, history={self.history})"
+        )
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.max_queued_jobs)
+        self._writes = asyncio.Queue(maxsize=self.write_backlog)
+        self._expand_pool = ThreadPoolExecutor(max_workers=self.concurrent_jobs, thread_name_prefix="upload-expand")
+        self._parse_pool = self._new_parse_pool()
+        self._write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload-write")
+        self._tasks = [asyncio.create_task(self._run_jobs()) for _ in range(self.concurrent_jobs)]
+        self._tasks.append(asyncio.create_task(self._write_results()))
+
+    async def stop(self) -> None:
+        """実行中のジョブを打ち切り、スレッドとワーカープロセスの終了を待つ (終わっていないジョブは cancelled になる)"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for pool in (self._expand_pool, self._parse_pool, self._write_pool):
+            if pool is not None:
+                await asyncio.to_thread(pool.shutdown, True, cancel_futures=True)
+        self._expand_pool = self._parse_pool = self._write_pool = None
+        for job in self._jobs.values():
+            if not job.done:
+                job._finish(JOB_CANCELLED)
+
+    def submit(self, uploads: List[Tuple[Optional[str], bytes]], options: Optional[Mapping[str, Any]] = None) -> UploadJob:
+        """
+        アップロードをジョブとしてキューに入れる。
+
+        Raises:
+            UploadQueueFullError: 実行を待っているジョブが `max_queued_jobs` 件ある場合。
+            RuntimeError: `start()` の前に呼んだ場合。
+        """
+        if self._queue is None:
+            raise RuntimeError("UploadJobQueue.start() が呼ばれていません。")
+        job = UploadJob(uploads, options)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise UploadQueueFullError(f"アップロードのジョブが {self.max_queued_jobs} 件待っているため、受け付けられません。") from None
+        self._jobs[job.id] = job
+        self._forget_finished()
+        return job
+
+    def get(self, job_id: str) -> Optional[UploadJob]:
+        return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        statuses: Dict[str, int] = {}
+        for job in self._jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queued_jobs": self.max_queued_jobs,
+            "concurrent_jobs": self.concurrent_jobs,
+            "parse_processes": self.parse_processes,
+            "max_pending_pages": self.max_pending_pages,
+            "write_backlog": self._writes.qsize() if self._writes is not None else 0,
+            "jobs": statuses,
+        }
+
+    def _forget_finished(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+    def _new_parse_pool(self, max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=max_workers or self.parse_processes, mp_context=multiprocessing.get_context("spawn"),
+            initializer=self.parse_initializer, initargs=self.parse_initargs,
+        )
+
+    def _replace_parse_pool(self, broken: ProcessPoolExecutor) -> None:
+        """壊れた解析用のプールを、同じ設定の新しいプールに取り替える (ほかのページの解析ですでに取り替えていれば何もしない)"""
+        if self._parse_pool is not broken:
+            return
+        logger.warning("解析用のワーカープロセスが異常終了したため、ワーカープロセスのプールを作り直します。")
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._parse_pool = self._new_parse_pool()
+
+    async def _parse(self, page: Dict[str, Any], file_name: Optional[str], content: bytes, options: Mapping[str, Any]) -> Any:
+        """
+        1ページをワーカープロセスで解析する (例外は結果として返す)。
+        ワーカープロセスの異常終了でプールが壊れた場合は、プールを作り直したうえで、このページだけを専用のプールで解析し直す。
+        """
+        page["status"] = PAGE_PARSING
+        logger.info(f"商品リストHTMLファイル処理開始: {file_name}")
+        loop = asyncio.get_running_loop()
+        pool = self._parse_pool
+        try:
+            parsed = await loop.run_in_executor(pool, self.parse_page, file_name, content, options)
+        except BrokenProcessPool:
+            assert pool is not None
+            self._replace_parse_pool(pool)
+            logger.warning(f"商品リストHTML '{file_name}' の解析中にワーカープロセスが異常終了したため、専用のワーカープロセスで解析し直します。")
+            retry_pool = self._new_parse_pool(max_workers=1)
+            try:
+                parsed = await loop.run_in_executor(retry_pool, self.parse_page, file_name, content, options)
+            except Exception as e:
+                parsed = e
+            finally:
+                await asyncio.to_thread(retry_pool.shutdown, True, cancel_futures=True)
+        except Exception as e:
+            parsed = e
+        page["status"] = PAGE_PARSED
+        return parsed
+
+    async def _run_jobs(self) -> None:
+        assert self._queue is not None and self._writes is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            job.status = JOB_RUNNING
+            job.started_at = _now()
+            logger.info(f"アップロードのジョブ {job.id} を開始します ({len(job.upload_names)} ファイル)。")
+            # 書き込みタスクはジョブを開始した順に書き込み、このジョブのページは解析が終わったものから受け取って退避する
+            stream = _PageStream(self.max_pending_pages)
+            await self._writes.put((job, stream))
+            parses: Set["asyncio.Future[Any]"] = set()
+            try:
+                uploaded_pages = iter_upload_pages(job.take_uploads())
+                while True:
+                    # 解析中・退避待ちのページが上限に達していれば、退避が進むまで次のページを展開しない
+                    await stream.reserve()
+                    # zip の展開も CPU を使うので、次のページの取り出しはスレッドで行い、展開したページから解析を始める
+                    next_page = await loop.run_in_executor(self._expand_pool, next, uploaded_pages, None)
+                    if next_page is None:
+                        stream.release()
+                        break
+                    file_name, content = next_page
+                    page = job.add_page(file_name)
+                    if isinstance(content, Exception):
+                        _fail_page(page, content)
+                        stream.release()
+                        continue
+                    parse = asyncio.ensure_future(self._parse(page, file_name, content, job.options))
+                    parses.add(parse)
+                    parse.add_done_callback(parses.discard)
+                    stream.put(page, parse)
+                    del content, next_page
+                await asyncio.gather(*parses)
+            except Exception as e:
+                logger.error(f"アップロードのジョブ {job.id} の実行中に予期せぬエラーが発生しました: {e}", exc_info=True)
+                stream.put(job.add_page(None), e)
+                await asyncio.gather(*parses, return_exceptions=True)
+            except asyncio.CancelledError:
+                for parse in parses:
+                    parse.cancel()
+                raise
+            stream.close()
+            self._queue.task_done()
+
+    async def _write_results(self) -> None:
+        assert self._writes is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            job, stream = await self._writes.get()
+            spool = _ParsedSpool()
+            spooled: List[Dict[str, Any]] = []
+            try:
+                # ジョブの全ページの解析が終わるまでは書き込み用の接続を使わず、解析結果を退避しておく
+                while (entry := await stream.get()) is not None:
+                    page, parsed = entry
+                    try:
+                        if isinstance(parsed, asyncio.Future):
+                            parsed = await parsed
+                        if isinstance(parsed, Exception):
+                            _fail_page(page, parsed)
+                        else:
+                            await asyncio.to_thread(spool.add, parsed)
+                            page["status"] = PAGE_SPOOLED
+                            spooled.append(page)
+                    except Exception as e:
+                        _fail_page(page, e)
+                    finally:
+                        # 退避したページの解析結果を手放してから、次のページの枠を返す
+                        entry = parsed = None
+                        stream.release()
+                if spooled:
+                    for page in spooled:
+                        page["status"] = PAGE_WRITING
+                    results = await loop.run_in_executor(self._write_pool, self._write_spooled, job, spool, [page["file_name"] for page in spooled])
+                    for page, result in zip(spooled, results):
+                        page.clear()
+                        page.update(result)
+            finally:
+                await asyncio.to_thread(spool.close)
+            job._finish()
+            self._forget_finished()
+            logger.info(f"アップロードのジョブ {job.id} が終わりました ({len(job.pages)} ページ)。")
+
+    def _write_spooled(self, job: UploadJob, spool: _ParsedSpool, file_names: List[Optional[str]]) -> List[Dict[str, Any]]:
+        """
+        退避したジョブの解析結果を1つのトランザクションで書き込んでコミットし、ページごとの結果を返す (書き込み用のスレッドで実行する)。
+        書き込みかコミットに失敗した場合は、トランザクションごと取り消してジョブの全ページをエラーにする。
+        """
+        writer: Optional[PageWriter] = None
+        try:
+            writer = self.open_writer(job.options)
+            for file_name, parsed in zip(file_names, spool):
+                writer.write(file_name, parsed)
+                del parsed
+            return writer.commit()
+        except Exception as e:
+            logger.error(f"アップロードのジョブ {job.id} の書き込み中に予期せぬエラーが発生しました: {e}", exc_info=True)
+            return [{"file_name": file_name, "status": "error", "message": f"予期せぬサーバーエラー: {e}"} for file_name in file_names]
+        finally:
+            if writer is not None:
+                writer.close()
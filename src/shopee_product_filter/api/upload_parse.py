@@ -0,0 +1,79 @@
+"""
+アップロードされた商品リストHTMLの1ページの解析 (アップロードのジョブキューのワーカープロセスで実行する)
+
+1回のアップロードに含まれるページは、`upload_jobs.py` のジョブキューがワーカープロセスのプールに振り分けて並列に解析する。
+ワーカープロセスは開始時に `init_parse_worker()` で、解析結果のキャッシュ・アイテムの指紋ストア・セレクタの記録を開く
+(`core/batch_parse.py` のワーカーと同じく、どれも同じファイルを複数のプロセスから使える)。
+`parse_uploaded_page()` の結果 (`ParsedUploadPage`) はメインプロセスに送られ、DBへの書き込みはメインプロセスで行う。
+
+ワーカープロセスで API のモジュール (DBのエンジンなど) を読み込まないよう、このモジュールは core だけに依存する。
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+from ..core.extraction_stats import ExtractionStats
+from ..core.item_fingerprints import ItemFingerprintStore
+from ..core.parse_cache import MISSING, ParseCache
+from ..core.parse_product_list import PARSER_VERSION, iter_products
+from ..core.product_record import ProductBatch
+from ..core.selector_order import SelectorOrderStore
+
+# アップロードは件数の上限なしで全アイテムを取り込むため、上限付きの解析結果とはキャッシュを分ける
+UPLOAD_PARSE_VARIANT = "upload:all"
+# メインプロセスで合計するセレクタの記録の件数 (SelectorOrderStore の属性)
+SELECTOR_ORDER_COUNTERS = ("adapted_items", "fallbacks", "resets")
+
+# ワーカープロセスごとの解析結果キャッシュ・アイテムの指紋ストア・セレクタの記録 (init_parse_worker で開く)
+_worker: Dict[str, Any] = {}
+
+
+@dataclass
+class ParsedUploadPage:
+    """アップロードされた1ページの解析結果"""
+
+    items: Iterable[Mapping[str, Any]]
+    list_found: bool
+    from_cache: bool = False
+    stats: Optional[Dict[str, Any]] = None  # collect_stats の場合の ExtractionStats.to_dict() (キャッシュの結果を使った場合は None)
+    selector_order_counts: Dict[str, int] = field(default_factory=dict)  # このページの解析で増えたセレクタの記録の件数
+
+
+def init_parse_worker(cache_dir: str, cache_max_bytes: int, fingerprint_db: str, selector_order_db: str) -> None:
+    """ワーカープロセスの開始時に呼び、解析結果のキャッシュ・アイテムの指紋ストア・セレクタの記録を開く"""
+    _worker["cache"] = ParseCache(cache_dir, PARSER_VERSION, max_bytes=cache_max_bytes)
+    _worker["fingerprints"] = ItemFingerprintStore(fingerprint_db, PARSER_VERSION)
+    _worker["selector_order"] = SelectorOrderStore(selector_order_db, PARSER_VERSION)
+
+
+def parse_uploaded_page(file_name: Optional[str], content: bytes, options: Mapping[str, Any]) -> ParsedUploadPage:
+    """
+    アップロードされた1ページを解析する (`init_parse_worker()` を呼んだプロセスで実行する)。
+    同じ内容のページを解析済みであれば、キャッシュの結果を返す。
+    """
+    parse_cache: ParseCache = _worker["cache"]
+    cache_key = parse_cache.key_for(content, variant=UPLOAD_PARSE_VARIANT)
+    cached_items = parse_cache.get(cache_key)
+    if cached_items is not MISSING:
+        return ParsedUploadPage(items=cached_items or [], list_found=cached_items is not None, from_cache=True)
+
+    # アップロードされたバイト列を一時ファイルを介さずに解析する
+    # (省メモリのストリーミングモード + BeautifulSoup を使わない lxml バックエンド。前回と同じアイテムは抽出しない)。
+    # 指紋ストアとセレクタの記録は、ジェネレータが終了した時点で iter_products が flush() する
+    selector_order: SelectorOrderStore = _worker["selector_order"]
+    counters_before = {name: getattr(selector_order, name) for name in SELECTOR_ORDER_COUNTERS}
+    list_type_info: Dict[str, Optional[str]] = {}
+    file_stats = ExtractionStats() if options.get("collect_stats") else None
+    parsed = ProductBatch()
+    for item_data in iter_products(
+        content, backend="lxml", streaming=True, list_type_info=list_type_info, as_records=True, stats=file_stats,
+        fingerprints=_worker["fingerprints"], selector_order=selector_order,
+    ):
+        parsed.append(item_data)
+    list_found = list_type_info.get("list_type") is not None
+    parse_cache.put(cache_key, parsed if list_found else None)
+    return ParsedUploadPage(
+        items=parsed,
+        list_found=list_found,
+        stats=file_stats.to_dict() if file_stats is not None else None,
+        selector_order_counts={name: getattr(selector_order, name) - before for name, before in counters_before.items()},
+    )
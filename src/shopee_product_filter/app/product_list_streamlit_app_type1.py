@@ -14,6 +14,7 @@ import requests
 import logging
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
+from urllib.parse import urlencode
 
 # calculator.py を同じディレクトリからインポート
 try:
@@ -44,11 +45,18 @@ FASTAPI_PRODUCT_LIST_BASE_URL = "http://127.0.0.1:8002"
 FASTAPI_UPLOAD_PRODUCT_LIST_URL = (
     f"{FASTAPI_PRODUCT_LIST_BASE_URL}/upload-product-list-html/"
 )
-FASTAPI_BASIC_PRODUCTS_URL = f"{FASTAPI_PRODUCT_LIST_BASE_URL}/basic-products/"
+# カーソルでページ送りする検索 (レスポンスは items / next_cursor / total)
+FASTAPI_BASIC_PRODUCTS_PAGE_URL = f"{FASTAPI_PRODUCT_LIST_BASE_URL}/basic-products/page/"
+# 検索条件に一致する商品の分布 (ショップタイプ・ソーシング状況ごとの件数と価格・販売数のヒストグラム)
+FASTAPI_BASIC_PRODUCTS_FACETS_URL = f"{FASTAPI_PRODUCT_LIST_BASE_URL}/basic-products/facets/"
+# 検索条件に一致する全商品の書き出し (サーバーが CSV / JSONL / Parquet でストリーミングする)
+FASTAPI_BASIC_PRODUCTS_EXPORT_URL = f"{FASTAPI_PRODUCT_LIST_BASE_URL}/basic-products/export/"
 # ソーシング情報更新用エンドポイントのテンプレート
 FASTAPI_SOURCING_INFO_URL_TEMPLATE = (
     f"{FASTAPI_PRODUCT_LIST_BASE_URL}/basic-products/{{item_id}}/sourcing-info"
 )
+# アップロードできるファイルの拡張子 (.html.gz / .html.zst / .zip はAPIサーバー側で展開する)
+UPLOAD_FILE_TYPES = ["html", "htm", "gz", "zst", "zip"]
 
 
 # --- 為替レート関連 ---
@@ -77,6 +85,15 @@ SOURCING_STATUS_OPTIONS = [
 ]  # 空文字は「指定なし」または「クリア」
 
 
+# --- 検索結果の並び順 (APIの sort パラメータ) ---
+SORT_OPTIONS = {
+    "登録順 (ID)": "id",
+    "販売数の多い順": "sold_desc",
+    "価格の安い順": "price_asc",
+    "新しい順": "created_at_desc",
+}
+
+
 # --- 為替レート取得・キャッシュ関数 (表示用) ---
 def get_cached_exchange_rate_for_display(
     target_currency: str = "JPY", base_currency: str = "SGD"
@@ -235,7 +252,7 @@ with st.expander(
     # (内容は前回と同じなので省略)
     uploaded_html_files = st.file_uploader(
         "Shopeeの商品一覧HTMLファイルを選択してください。",
-        type="html",
+        type=UPLOAD_FILE_TYPES,
         accept_multiple_files=True,
         help="複数のHTMLファイルを一度にアップロードできます。",
         key="product_list_html_uploader",
@@ -269,20 +286,22 @@ with st.expander(
                     isinstance(results_for_this_request, list)
                     and results_for_this_request
                 ):
-                    result = results_for_this_request[0]
-                    all_results.append(result)
-                    if result.get("status") == "success":
-                        st.success(
-                            f"✅ ファイル '{file_name}' 処理成功: {result.get('message', 'データベースに保存/更新されました。')} (処理アイテム数: {result.get('items_processed', 0)})"
-                        )
-                    elif result.get("status") == "skipped":
-                        st.warning(
-                            f"⚠️ ファイル '{file_name}' スキップ: {result.get('message', '処理されませんでした。')}"
-                        )
-                    else:
-                        st.error(
-                            f"❌ ファイル '{file_name}' 処理失敗: {result.get('message', '不明なエラーが発生しました。')}"
-                        )
+                    # zip は中のページごとに結果が返る (file_name は "<zip名>!<メンバー名>")
+                    for result in results_for_this_request:
+                        all_results.append(result)
+                        result_file_name = result.get("file_name", file_name)
+                        if result.get("status") == "success":
+                            st.success(
+                                f"✅ ファイル '{result_file_name}' 処理成功: {result.get('message', 'データベースに保存/更新されました。')} (処理アイテム数: {result.get('items_processed', 0)})"
+                            )
+                        elif result.get("status") == "skipped":
+                            st.warning(
+                                f"⚠️ ファイル '{result_file_name}' スキップ: {result.get('message', '処理されませんでした。')}"
+                            )
+                        else:
+                            st.error(
+                                f"❌ ファイル '{result_file_name}' 処理失敗: {result.get('message', '不明なエラーが発生しました。')}"
+                            )
                 else:
                     st.error(
                         f"❌ ファイル '{file_name}' のAPIからのレスポンス形式が不正です。"
@@ -412,17 +431,12 @@ with st.form(key="product_list_search_form_with_sourcing"):  # キー名を変
         default=DEFAULT_PRODUCT_LIST_DISPLAY_COLUMNS,
         key="pl_display_cols_s",
     )
-    # ページネーションのための表示開始位置
-    display_start_index = st.number_input(
-        "表示開始位置 (ページネーション用)",
-        min_value=0,
-        value=0,
-        step=20,
-        key="pl_offset_s",
+    selected_sort_label = st.selectbox(
+        "並び順", options=list(SORT_OPTIONS), index=0, key="pl_sort_s"
     )
-    # ページネーションのための最大表示件数
+    # 1ページの表示件数 (ページ送りは検索結果の下のボタンで行う)
     display_limit = st.number_input(
-        "最大表示件数 (リミット)",
+        "1ページの表示件数",
         min_value=1,
         max_value=200,
         value=50,
@@ -435,11 +449,74 @@ with st.form(key="product_list_search_form_with_sourcing"):  # キー名を変
 # セッションステートで検索結果を保持 (ページまたぎや更新UIのために)
 if "searched_product_list_df" not in st.session_state:
     st.session_state.searched_product_list_df = pd.DataFrame()
+# ページ送りの状態: 検索条件 (params)、件数 (total)、表示中のページの cursor (先頭ページは None)、
+# 表示したページの cursor のスタック (cursors)、次のページの cursor、表示中のページの開始位置 (start) と件数 (count)
+if "pl_page_state" not in st.session_state:
+    st.session_state.pl_page_state = {}
+
+
+def load_product_list_page(cursor: Optional[str] = None, with_total: bool = False) -> None:
+    """ページ送りの状態の検索条件で、cursor のページ (None は先頭ページ) をAPIから取得してセッションステートに保存する"""
+    state = st.session_state.pl_page_state
+    params = dict(state["params"])
+    if cursor:
+        params["cursor"] = cursor
+    if with_total:
+        params["total"] = "exact"
+    response = requests.get(FASTAPI_BASIC_PRODUCTS_PAGE_URL, params=params)
+    response.raise_for_status()
+    page = response.json()
+    if with_total:
+        state["total"] = page.get("total")
+    state["current_cursor"] = cursor
+    state["next_cursor"] = page.get("next_cursor")
+    state["count"] = len(page["items"])
+    st.session_state.searched_product_list_df = pd.DataFrame(page["items"])
+
+
+def load_product_list_facets(search_params: Dict[str, Any]) -> None:
+    """検索条件に一致する商品の分布をAPIから取得してセッションステートに保存する (失敗しても検索結果の表示は続ける)"""
+    params = {k: v for k, v in search_params.items() if k not in ["limit", "sort"]}
+    try:
+        response = requests.get(FASTAPI_BASIC_PRODUCTS_FACETS_URL, params=params)
+        response.raise_for_status()
+        st.session_state.pl_facets = response.json()
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"商品の分布の取得に失敗しました: {e}")
+        st.session_state.pl_facets = None
+
+
+def _histogram_frame(histogram: Dict[str, Any]) -> pd.DataFrame:
+    """ヒストグラムの区間を「番号: 下限〜上限」のラベルと件数の DataFrame にする"""
+    def bound(value: Optional[float]) -> str:
+        return "" if value is None else f"{value:g}"
+
+    # グラフの横軸は文字列の順に並ぶので、区間の番号を先頭に付ける
+    labels = [f"{i:02d}: {bound(b['low'])}〜{bound(b['high'])}" for i, b in enumerate(histogram["buckets"])]
+    return pd.DataFrame({"件数": [b["count"] for b in histogram["buckets"]]}, index=labels)
+
+
+def _turn_page(forward: bool) -> None:
+    """「次のページ」「前のページ」ボタンのコールバック (cursors は表示したページの cursor のスタック)"""
+    state = st.session_state.pl_page_state
+    shown_cursor, shown_count = state["current_cursor"], state["count"]
+    try:
+        load_product_list_page(state["next_cursor"] if forward else state["cursors"][-1])
+    except requests.exceptions.RequestException as e:
+        st.error(f"🚨 商品リスト情報のページ送り中にエラー: {e}")
+        return
+    if forward:
+        state["cursors"].append(shown_cursor)
+        state["start"] += shown_count
+    else:
+        state["cursors"].pop()
+        state["start"] = max(0, state["start"] - state["count"])
+
 
 if search_and_update_button:
     search_params: Dict[str, Any] = {
-        "offset": display_start_index,
         "limit": display_limit,
+        "sort": SORT_OPTIONS[selected_sort_label],
     }
     # (中略 - 価格、販売数などのパラメータ組み立ては前回と同じ)
     if display_rate_sgd_jpy:
@@ -476,7 +553,7 @@ if search_and_update_button:
     active_search_filters = {
         k: v
         for k, v in search_params.items()
-        if v is not None and k not in ["offset", "limit"]
+        if v is not None and k not in ["limit", "sort"]
     }
     if active_search_filters:
         st.json(active_search_filters)
@@ -485,19 +562,12 @@ if search_and_update_button:
 
     with st.spinner("商品リスト情報をデータベースから検索中です..."):
         try:
-            response = requests.get(FASTAPI_BASIC_PRODUCTS_URL, params=search_params)
-            response.raise_for_status()
-            searched_data = response.json()
-
-            if searched_data:
-                st.session_state.searched_product_list_df = pd.DataFrame(
-                    searched_data
-                )  # 検索結果をセッションステートに保存
-                # (以降の表示ロジックはセッションステートのデータを使うように変更するが、まずはここまで)
-            else:
-                st.session_state.searched_product_list_df = (
-                    pd.DataFrame()
-                )  # 空のDataFrameをセット
+            # 検索結果の先頭ページと件数をセッションステートに保存 (次のページ以降は下のボタンで取得)
+            st.session_state.pl_page_state = {"params": search_params, "cursors": [], "start": 0}
+            load_product_list_page(with_total=True)
+            load_product_list_facets(search_params)
+
+            if st.session_state.searched_product_list_df.empty:
                 st.info(
                     "指定された条件に一致する商品リスト情報は見つかりませんでした。"
                 )
@@ -514,7 +584,63 @@ if search_and_update_button:
 # --- 検索結果の表示とソーシング情報更新UI ---
 if not st.session_state.searched_product_list_df.empty:
     df_to_display = st.session_state.searched_product_list_df
-    st.subheader(f"検索結果: {len(df_to_display)} 件の商品が見つかりました")
+    page_state = st.session_state.pl_page_state
+    if page_state.get("total") is not None:
+        page_start = page_state.get("start", 0)
+        st.subheader(
+            f"検索結果: {page_state['total']} 件中 {page_start + 1}〜{page_start + len(df_to_display)} 件目"
+        )
+    else:
+        st.subheader(f"検索結果: {len(df_to_display)} 件の商品が見つかりました")
+    facets = st.session_state.get("pl_facets")
+    if facets and facets["total"]:
+        with st.expander("検索条件に一致する商品の分布"):
+            f1, f2 = st.columns(2)
+            with f1:
+                st.write("ショップタイプ")
+                st.bar_chart(
+                    pd.DataFrame(
+                        {"件数": [f["count"] for f in facets["shop_type"]]},
+                        index=[f["value"] or "(なし)" for f in facets["shop_type"]],
+                    )
+                )
+                st.write(f"価格 (SGD, 最小 {facets['price']['min']} / 最大 {facets['price']['max']})")
+                st.bar_chart(_histogram_frame(facets["price"]))
+            with f2:
+                st.write("ソーシング状況")
+                st.bar_chart(
+                    pd.DataFrame(
+                        {"件数": [f["count"] for f in facets["sourcing_status"]]},
+                        index=[f["value"] or "(なし)" for f in facets["sourcing_status"]],
+                    )
+                )
+                st.write(f"販売数 (最小 {facets['sold']['min']} / 最大 {facets['sold']['max']})")
+                st.bar_chart(_histogram_frame(facets["sold"]))
+    export_params = {k: v for k, v in page_state["params"].items() if k != "limit"}
+    st.markdown(
+        "検索条件に一致する全商品を書き出す: "
+        + " / ".join(
+            f"[{fmt.upper()}]({FASTAPI_BASIC_PRODUCTS_EXPORT_URL}?{urlencode({**export_params, 'format': fmt})})"
+            for fmt in ("csv", "jsonl", "parquet")
+        )
+    )
+    col_prev, col_next = st.columns(2)
+    with col_prev:
+        st.button(
+            "← 前のページ",
+            on_click=_turn_page,
+            args=(False,),
+            disabled=not page_state.get("cursors"),
+            key="pl_prev_page",
+        )
+    with col_next:
+        st.button(
+            "次のページ →",
+            on_click=_turn_page,
+            args=(True,),
+            disabled=not page_state.get("next_cursor"),
+            key="pl_next_page",
+        )
 
     # 表示項目の選択 (フォームの外に出して、検索後にも変更できるようにする)
     # (ただし、これを動的にするには、再検索ボタンか、コールバックが必要になる。今回はシンプルに検索時の選択を優先)
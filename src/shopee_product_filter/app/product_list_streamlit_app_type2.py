@@ -13,6 +13,7 @@ import requests
 import logging # logging モジュールをしっかり使うぜ！
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, date
+from urllib.parse import urlencode
 from bs4 import BeautifulSoup
 
 # --- ロギング設定を強化 ---
@@ -31,6 +32,12 @@ if not logger.handlers:
 FASTAPI_PRODUCT_LIST_BASE_URL = "http://127.0.0.1:8002"
 FASTAPI_UPLOAD_URL = f"{FASTAPI_PRODUCT_LIST_BASE_URL}/upload-product-list-html/"
 FASTAPI_PRODUCTS_URL = f"{FASTAPI_PRODUCT_LIST_BASE_URL}/basic-products/"
+# カーソルでページ送りする検索 (レスポンスは items / next_cursor / total)
+FASTAPI_PRODUCTS_PAGE_URL = f"{FASTAPI_PRODUCT_LIST_BASE_URL}/basic-products/page/"
+# 検索条件に一致する全商品の書き出し (サーバーが CSV / JSONL / Parquet でストリーミングする)
+FASTAPI_PRODUCTS_EXPORT_URL = f"{FASTAPI_PRODUCT_LIST_BASE_URL}/basic-products/export/"
+# アップロードできるファイルの拡張子 (.html.gz / .html.zst / .zip はAPIサーバー側で展開する)
+UPLOAD_FILE_TYPES = ["html", "htm", "gz", "zst", "zip"]
 
 # --- 為替レート取得関数 (ログ追加) ---
 DUMMY_RATE_SGD_JPY = 110.0
@@ -84,7 +91,7 @@ st.info("ℹ️ **ご利用の前に、商品リスト情報APIサーバーが
 # --- ファイルアップロードセクション (ログ追加) ---
 with st.expander("📤 商品リストHTMLファイルをアップロードしてDBに登録"):
     uploaded_html_files = st.file_uploader(
-        "Shopeeの商品一覧HTMLファイルを選択してください。", type="html", accept_multiple_files=True,
+        "Shopeeの商品一覧HTMLファイルを選択してください。", type=UPLOAD_FILE_TYPES, accept_multiple_files=True,
         help="複数のHTMLファイルを一度にアップロードできます...", key="product_list_html_uploader"
     )
     if uploaded_html_files:
@@ -148,6 +155,40 @@ if st.button("現在のSGD-JPY為替レートを更新", key="update_rate_button
 if st.session_state.sgd_to_jpy_rate: st.caption(f"現在のSGD-JPYレート (参考): 1 SGD = {st.session_state.sgd_to_jpy_rate:.2f} JPY")
 else: st.warning("SGD-JPY為替レートが未取得です。価格検索（JPY）の精度に影響する可能性があります。")
 
+# --- 検索結果のページ送り ---
+# 状態: 検索条件 (params)、件数 (total)、表示中のページの商品 (items) と cursor、表示したページの cursor のスタック (cursors)、
+# 次のページの cursor、表示中のページの開始位置 (start)
+if 'pl_page_state' not in st.session_state: st.session_state.pl_page_state = {}
+
+def load_products_page(cursor: Optional[str] = None, with_total: bool = False) -> None:
+    """ページ送りの状態の検索条件で、cursor のページ (None は先頭ページ) をAPIから取得してセッションステートに保存する"""
+    state = st.session_state.pl_page_state
+    params = dict(state["params"])
+    if cursor: params["cursor"] = cursor
+    if with_total: params["total"] = "exact"
+    response = requests.get(FASTAPI_PRODUCTS_PAGE_URL, params=params)
+    logger.info(f"FastAPIからの検索レスポンスステータス: {response.status_code}")
+    response.raise_for_status()
+    page = response.json()
+    logger.info(f"FastAPIからの検索レスポンス件数: {len(page['items'])} (全 {page.get('total')} 件)")
+    if with_total: state["total"] = page.get("total")
+    state.update(items=page["items"], current_cursor=cursor, next_cursor=page.get("next_cursor"))
+
+def turn_page(forward: bool) -> None:
+    """「次のページ」「前のページ」ボタンのコールバック"""
+    state = st.session_state.pl_page_state
+    shown_cursor, shown_count = state["current_cursor"], len(state["items"])
+    try:
+        load_products_page(state["next_cursor"] if forward else state["cursors"][-1])
+    except requests.exceptions.RequestException as e:
+        logger.error(f"ページ送り中のエラー: {e}")
+        st.error(f"🚨 ページ送り中にエラー: {e}")
+        return
+    if forward:
+        state["cursors"].append(shown_cursor); state["start"] += shown_count
+    else:
+        state["cursors"].pop(); state["start"] = max(0, state["start"] - len(state["items"]))
+
 with st.form(key="product_list_search_form"):
     st.subheader("絞り込み条件")
     c1, c2 = st.columns(2)
@@ -178,9 +219,8 @@ with st.form(key="product_list_search_form"):
     selected_columns_to_display = st.multiselect(
         "検索結果テーブル表示項目:", options=ALL_PRODUCT_LIST_COLUMNS, default=DEFAULT_PRODUCT_LIST_DISPLAY_COLUMNS, key="pl_display_cols"
     )
-    # ページネーションのための表示開始位置
-    display_start_index = st.number_input("表示開始位置 (ページネーション用)", min_value=0, value=0, step=10, key="pl_offset")
-    display_limit = st.number_input("最大表示件数 (リミット)", min_value=1, max_value=200, value=50, step=10, key="pl_limit")
+    # ページ送りは検索結果の下のボタンで行う
+    display_limit = st.number_input("1ページの表示件数", min_value=1, max_value=200, value=50, step=10, key="pl_limit")
     search_button = st.form_submit_button(label="この条件で検索")
 
 if search_button:
@@ -194,11 +234,11 @@ if search_button:
         "start_date_input (form)": start_date_val.isoformat() if start_date_val else None,
         "end_date_input (form)": end_date_val.isoformat() if end_date_val else None,
         "selected_columns_to_display": selected_columns_to_display,
-        "offset": display_start_index, "limit": display_limit
+        "limit": display_limit
     }
     logger.info(f"検索フォーム入力値: {form_inputs}")
 
-    search_params_api: Dict[str, Any] = {"offset": display_start_index, "limit": display_limit}
+    search_params_api: Dict[str, Any] = {"limit": display_limit}
     min_price_sgd_val: Optional[float] = None
     max_price_sgd_val: Optional[float] = None
     if st.session_state.jpy_to_sgd_rate:
@@ -219,7 +259,7 @@ if search_button:
     if enable_date_filter and end_date_val: search_params_api["end_date"] = end_date_val.isoformat()
         
     st.markdown("---"); st.subheader("現在の検索条件 (API送信値)")
-    active_search_filters_api = {k: v for k, v in search_params_api.items() if v is not None and k not in ["offset", "limit"]}
+    active_search_filters_api = {k: v for k, v in search_params_api.items() if v is not None and k not in ["limit"]}
     if active_search_filters_api: st.json(active_search_filters_api)
     else: st.info("絞り込み条件なし。")
     
@@ -228,51 +268,9 @@ if search_button:
 
     with st.spinner("商品リスト情報をデータベースから検索中です..."):
         try:
-            response = requests.get(FASTAPI_PRODUCTS_URL, params=search_params_api)
-            logger.info(f"FastAPIからの検索レスポンスステータス: {response.status_code}")
-            response.raise_for_status()
-            searched_data = response.json()
-            # --- FastAPIからのレスポンス概要のログ ---
-            logger.info(f"FastAPIからの検索レスポンス件数: {len(searched_data)}")
-            if searched_data: logger.debug(f"FastAPIからの検索レスポンスデータ (最初の1件): {searched_data[0] if searched_data else 'N/A'}") # DEBUGレベルで最初の1件だけ
-            
-            if searched_data:
-                df_searched = pd.DataFrame(searched_data)
-                st.subheader(f"検索結果: {len(df_searched)} 件の商品が見つかりました")
-                if selected_columns_to_display:
-                    cols_to_show = [col for col in selected_columns_to_display if col in df_searched.columns]
-                    if cols_to_show:
-                        df_display = df_searched[cols_to_show].copy()
-                        if 'image_url' in df_display.columns:
-                            # 画像表示は st.data_editor を使う (Streamlit 1.20.0以降)
-                            if hasattr(st, "data_editor"):
-                                st.data_editor(
-                                    df_display,
-                                    column_config={"image_url": st.column_config.ImageColumn("商品画像", help="サムネイル")},
-                                    use_container_width=True, hide_index=True
-                                )
-                            else:
-                                st.markdown("画像表示にはStreamlit 1.20.0以上が必要です。URLを表示します。")
-                                st.dataframe(df_searched[cols_to_show], use_container_width=True)
-                        else:
-                             st.dataframe(df_searched[cols_to_show], use_container_width=True)
-                    else:
-                         st.warning("選択された表示項目が検索結果データにありませんでした。"); st.dataframe(df_searched, use_container_width=True)
-                else:
-                    st.info("表示項目未選択のため全項目表示します。"); st.dataframe(df_searched, use_container_width=True)
-
-                col_dl_pl1, col_dl_pl2 = st.columns(2)
-                with col_dl_pl1: st.download_button("検索結果をCSVでダウンロード", df_searched.to_csv(index=False).encode('utf-8'), "s_searched_pl.csv", "text/csv", key="dl_pl_csv", use_container_width=True)
-                with col_dl_pl2: st.download_button("検索結果をJSONでダウンロード", df_searched.to_json(orient="records", indent=4).encode('utf-8'), "s_searched_pl.json", "application/json", key="dl_pl_json", use_container_width=True)
-                st.markdown("---"); st.subheader("商品リストアイテム詳細 (全項目)")
-                for _, row in df_searched.iterrows():
-                    item_id = row.get('id', 'ID不明'); item_name = row.get('product_name', '商品名不明')
-                    with st.expander(f"ID: {item_id} - {item_name[:60]}{'...' if len(str(item_name)) > 60 else ''}"):
-                        if row.get('image_url'): st.image(row['image_url'], caption=item_name, width=150)
-                        st.json(row.to_dict())
-                        if row.get('product_url'): st.markdown(f"**商品URL:** [{row['product_url']}]({row['product_url']})")
-            else:
-                st.info("指定条件に一致する商品リスト情報は見つかりませんでした。")
+            # 先頭ページと件数を取得してセッションステートに保存する (次のページ以降は検索結果の下のボタンで取得)
+            st.session_state.pl_page_state = {"params": search_params_api, "cursors": [], "start": 0}
+            load_products_page(with_total=True)
         except requests.exceptions.ConnectionError as e:
             logger.error(f"FastAPI接続エラー (検索時): {e}")
             st.error("🚨 APIサーバーに接続できませんでした。")
@@ -282,6 +280,56 @@ if search_button:
         except Exception as e:
             logger.error(f"商品リスト情報検索中の予期せぬエラー: {e}", exc_info=True)
             st.error(f"🚨 検索中にエラー: {e}")
-else:
+
+page_state = st.session_state.pl_page_state
+if "items" not in page_state:
     st.info("上記のフォームに条件を入力し、「この条件で検索」ボタンを押すと、DBから商品リスト情報が検索されます。")
+elif not page_state["items"]:
+    st.info("指定条件に一致する商品リスト情報は見つかりませんでした。")
+else:
+    df_searched = pd.DataFrame(page_state["items"])
+    page_start = page_state["start"]
+    if page_state.get("total") is not None:
+        st.subheader(f"検索結果: {page_state['total']} 件中 {page_start + 1}〜{page_start + len(df_searched)} 件目")
+    else:
+        st.subheader(f"検索結果: {len(df_searched)} 件の商品が見つかりました")
+    col_prev, col_next = st.columns(2)
+    with col_prev: st.button("← 前のページ", on_click=turn_page, args=(False,), disabled=not page_state["cursors"], key="pl_prev_page")
+    with col_next: st.button("次のページ →", on_click=turn_page, args=(True,), disabled=not page_state.get("next_cursor"), key="pl_next_page")
+    if selected_columns_to_display:
+        cols_to_show = [col for col in selected_columns_to_display if col in df_searched.columns]
+        if cols_to_show:
+            df_display = df_searched[cols_to_show].copy()
+            if 'image_url' in df_display.columns:
+                # 画像表示は st.data_editor を使う (Streamlit 1.20.0以降)
+                if hasattr(st, "data_editor"):
+                    st.data_editor(
+                        df_display,
+                        column_config={"image_url": st.column_config.ImageColumn("商品画像", help="サムネイル")},
+                        use_container_width=True, hide_index=True
+                    )
+                else:
+                    st.markdown("画像表示にはStreamlit 1.20.0以上が必要です。URLを表示します。")
+                    st.dataframe(df_searched[cols_to_show], use_container_width=True)
+            else:
+                 st.dataframe(df_searched[cols_to_show], use_container_width=True)
+        else:
+             st.warning("選択された表示項目が検索結果データにありませんでした。"); st.dataframe(df_searched, use_container_width=True)
+    else:
+        st.info("表示項目未選択のため全項目表示します。"); st.dataframe(df_searched, use_container_width=True)
 
+    # 下のダウンロードボタンは表示中のページだけ。全件はAPIサーバーから直接書き出す
+    export_params = {k: v for k, v in page_state["params"].items() if k != "limit"}
+    st.markdown("検索条件に一致する全商品を書き出す: " + " / ".join(
+        f"[{fmt.upper()}]({FASTAPI_PRODUCTS_EXPORT_URL}?{urlencode({**export_params, 'format': fmt}, doseq=True)})" for fmt in ("csv", "jsonl", "parquet")
+    ))
+    col_dl_pl1, col_dl_pl2 = st.columns(2)
+    with col_dl_pl1: st.download_button("検索結果をCSVでダウンロード", df_searched.to_csv(index=False).encode('utf-8'), "s_searched_pl.csv", "text/csv", key="dl_pl_csv", use_container_width=True)
+    with col_dl_pl2: st.download_button("検索結果をJSONでダウンロード", df_searched.to_json(orient="records", indent=4).encode('utf-8'), "s_searched_pl.json", "application/json", key="dl_pl_json", use_container_width=True)
+    st.markdown("---"); st.subheader("商品リストアイテム詳細 (全項目)")
+    for _, row in df_searched.iterrows():
+        item_id = row.get('id', 'ID不明'); item_name = row.get('product_name', '商品名不明')
+        with st.expander(f"ID: {item_id} - {item_name[:60]}{'...' if len(str(item_name)) > 60 else ''}"):
+            if row.get('image_url'): st.image(row['image_url'], caption=item_name, width=150)
+            st.json(row.to_dict())
+            if row.get('product_url'): st.markdown(f"**商品URL:** [{row['product_url']}]({row['product_url']})")
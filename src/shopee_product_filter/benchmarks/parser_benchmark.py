@@ -0,0 +1,264 @@
+"""
+商品リストHTMLパーサーのベンチマーク
+
+合成ページ (`synthetic_pages.py`) または保存ページのディレクトリに対して各パーサーを実行し、
+以下を計測して表にする。
+
+- items/sec: 抽出したアイテム数 / 1回の解析にかかった時間 (繰り返し回数のうち最速の回)
+- ピークメモリ: 1回目の解析中に増えた最大常駐メモリ (ru_maxrss)。
+  libxml2 がC側で確保するメモリも含めるため、計測ごとに新しいプロセスで実行する
+  (`resource` モジュールのない Windows では tracemalloc のピークで代用する)。
+- フィールド別の時間: `parse_product_list.py` のパーサー (bs4 / lxml) のみ。
+  フィールドごとの抽出関数の合計時間と、それ以外 (ツリー構築・アイテム検出) の時間。
+  あわせて、各フィールドの値を見つけたフォールバック段階 (primary / fallback / heuristic) の件数も記録する。
+
+`--save_baseline` で結果をJSONに保存し、`--baseline` で保存済みの結果と比較できる。
+items/sec の低下かピークメモリの増加が `--threshold` (%) を超えた組み合わせがあれば、終了コード 1 を返す。
+
+使い方 (プロジェクトのルートディレクトリで実行):
+    uv run python -m src.shopee_product_filter.benchmarks.parser_benchmark --sizes 60 500 5000 --save_baseline bench_baseline.json
+    uv run python -m src.shopee_product_filter.benchmarks.parser_benchmark --sizes 60 500 5000 --baseline bench_baseline.json
+"""
+import argparse
+import contextlib
+import gc
+import importlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from ..core.extraction_stats import ExtractionStats
+
+from .synthetic_pages import DEFAULT_SIZES, LIST_TYPES, write_corpus
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore[assignment]
+
+# パーサー名 -> (モジュール (このパッケージからの相対), 関数名, キーワード引数)
+PARSERS: Dict[str, Tuple[str, str, Dict[str, Any]]] = {
+    "core.bs4": ("..core.parse_product_list", "parse_shopee_shop_products_from_file_final", {"backend": "bs4"}),
+    "core.lxml": ("..core.parse_product_list", "parse_shopee_shop_products_from_file_final", {"backend": "lxml"}),
+    "core.bs4_streaming": ("..core.parse_product_list", "parse_shopee_shop_products_from_file_final", {"backend": "bs4", "streaming": True}),
+    "core.lxml_streaming": ("..core.parse_product_list", "parse_shopee_shop_products_from_file_final", {"backend": "lxml", "streaming": True}),
+    "experiments.shop": ("..experiments.parse_product_list.parse_shop_products", "parse_shopee_shop_products_from_file_final", {}),
+    "experiments.search": ("..experiments.parse_product_list.parse_search_products", "extract_product_info", {}),
+    "experiments.category": ("..experiments.parse_product_list.parse_category_products", "extract_product_info", {}),
+}
+
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD_PERCENT = 10.0
+
+
+def _resolve_parser(parser_name: str) -> Callable[..., Any]:
+    module_name, function_name, kwargs = PARSERS[parser_name]
+    function = getattr(importlib.import_module(module_name, __package__), function_name)
+    return lambda html_file_path, **extra: function(html_file_path, **kwargs, **extra)
+
+
+def _peak_rss_bytes() -> int:
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Linux は KB 単位
+
+
+@contextlib.contextmanager
+def _extract_limit(uncapped: bool) -> Iterator[None]:
+    """`--uncapped` の場合、core パーサーの抽出件数の上限 (EXTRACT_MAX) を一時的に外す"""
+    if not uncapped:
+        yield
+        return
+    from ..core import parse_product_list
+    original = parse_product_list.EXTRACT_MAX
+    parse_product_list.EXTRACT_MAX = sys.maxsize
+    try:
+        yield
+    finally:
+        parse_product_list.EXTRACT_MAX = original
+
+
+def measure(parser_name: str, html_file_path: str, repeat: int = DEFAULT_REPEAT, uncapped: bool = False) -> Dict[str, Any]:
+    """
+    1つのパーサーで1ページを計測する (ピークメモリを正しく測るため、新しいプロセスで呼ぶこと)。
+
+    Returns:
+        items / best_seconds / items_per_sec / peak_memory_bytes / field_seconds / field_tiers を持つ辞書。
+        パーサーがそのページのリストタイプに対応していない (0件) 場合は items が 0 で、他は None。
+    """
+    parse = _resolve_parser(parser_name)
+    result: Dict[str, Any] = {
+        "parser": parser_name, "page": os.path.basename(html_file_path),
+        "items": 0, "best_seconds": None, "items_per_sec": None, "peak_memory_bytes": None, "field_seconds": None,
+        "field_tiers": None,
+    }
+    with _extract_limit(uncapped), contextlib.redirect_stdout(io.StringIO()):
+        gc.collect()
+        # 1回目: ピークメモリ
+        rss_before = _peak_rss_bytes()
+        if resource is None:
+            tracemalloc.start()
+        started = time.perf_counter()
+        products = parse(html_file_path)
+        first_seconds = time.perf_counter() - started
+        if resource is None:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            peak_memory = max(0, _peak_rss_bytes() - rss_before)
+        item_count = len(products) if products else 0
+        if not item_count:
+            return result
+        del products
+
+        # 2回目以降: スループット (最速の回)
+        timings = [first_seconds]
+        for _ in range(max(0, repeat - 1)):
+            gc.collect()
+            started = time.perf_counter()
+            parse(html_file_path)
+            timings.append(time.perf_counter() - started)
+
+        # フィールド別の時間 (計時の分だけ遅くなるので、スループットとは別に1回だけ実行する)
+        field_seconds: Optional[Dict[str, float]] = None
+        field_tiers: Optional[Dict[str, Dict[str, int]]] = None
+        if parser_name.startswith("core."):
+            stats = ExtractionStats()
+            started = time.perf_counter()
+            parse(html_file_path, stats=stats)
+            total_seconds = time.perf_counter() - started
+            field_seconds = dict(stats.seconds)
+            field_seconds["(ツリー構築・アイテム検出など)"] = max(0.0, total_seconds - sum(stats.seconds.values()))
+            field_tiers = stats.tiers
+
+    best = min(timings)
+    result.update(
+        items=item_count,
+        best_seconds=best,
+        items_per_sec=item_count / best if best > 0 else None,
+        peak_memory_bytes=peak_memory,
+        field_seconds=field_seconds,
+        field_tiers=field_tiers,
+    )
+    return result
+
+
+def run_benchmark(
+    html_file_paths: List[str],
+    parser_names: List[str],
+    repeat: int = DEFAULT_REPEAT,
+    uncapped: bool = False,
+) -> List[Dict[str, Any]]:
+    """全てのページ × パーサーの組み合わせを、組み合わせごとに新しいプロセスで計測する"""
+    results = []
+    with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as executor:
+        for html_file_path in html_file_paths:
+            for parser_name in parser_names:
+                result = executor.submit(measure, parser_name, html_file_path, repeat, uncapped).result()
+                results.append(result)
+                print(_format_row(result), flush=True)
+    return results
+
+
+def _format_row(result: Dict[str, Any]) -> str:
+    head = f"{result['parser']:<22} {result['page']:<36}"
+    if not result["items"]:
+        return f"{head} {'対象外 (0件)':>8}"
+    peak_mb = result["peak_memory_bytes"] / (1024 * 1024)
+    return f"{head} {result['items']:>6} 件 {result['best_seconds']:>8.3f} 秒 {result['items_per_sec']:>9.0f} items/s {peak_mb:>8.1f} MB"
+
+
+def print_field_breakdown(results: List[Dict[str, Any]]) -> None:
+    """フィールド別の時間 (1アイテムあたりのマイクロ秒) を表示する"""
+    rows = [r for r in results if r.get("field_seconds")]
+    if not rows:
+        return
+    print("\n--- フィールド別の時間 (1アイテムあたり µs) ---")
+    for result in rows:
+        parts = [f"{label}={seconds / result['items'] * 1e6:.0f}" for label, seconds in result["field_seconds"].items()]
+        print(f"{result['parser']:<22} {result['page']:<36} " + " ".join(parts))
+        for label, counts in (result.get("field_tiers") or {}).items():
+            total = sum(counts.values())
+            shares = " ".join(f"{tier}={count / total:.0%}" for tier, count in counts.items())
+            print(f"{'':<22} {'':<36}   {label}: {shares}")
+
+
+def compare_with_baseline(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], threshold_percent: float) -> int:
+    """
+    保存済みの結果と比較して表示し、閾値を超えて悪化した組み合わせの数を返す。
+    items/sec は低下、ピークメモリは増加を悪化とみなす。
+    """
+    baseline_by_key = {(r["parser"], r["page"]): r for r in baseline}
+    regressions = 0
+    print(f"\n--- ベースラインとの比較 (閾値: {threshold_percent:.0f}%) ---")
+    for result in results:
+        base = baseline_by_key.get((result["parser"], result["page"]))
+        if base is None or not result["items"] or not base.get("items"):
+            continue
+        speed_change = (result["items_per_sec"] / base["items_per_sec"] - 1) * 100
+        memory_change = None
+        if base.get("peak_memory_bytes"):
+            memory_change = (result["peak_memory_bytes"] / base["peak_memory_bytes"] - 1) * 100
+        regressed = speed_change < -threshold_percent or (memory_change is not None and memory_change > threshold_percent)
+        regressions += regressed
+        memory_text = f"{memory_change:+6.1f}%" if memory_change is not None else "    -"
+        mark = "  ← 悪化" if regressed else ""
+        print(f"{result['parser']:<22} {result['page']:<36} items/s {speed_change:+6.1f}%  メモリ {memory_text}{mark}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='商品リストHTMLパーサーのベンチマーク')
+    parser.add_argument('--corpus_dir', help='計測に使うHTMLのディレクトリ (省略時は合成ページを一時ディレクトリに生成する)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='合成ページのアイテム数 (複数指定可)')
+    parser.add_argument('--list_types', nargs='+', choices=LIST_TYPES, default=list(LIST_TYPES), help='合成ページのリストタイプ')
+    parser.add_argument('--parsers', nargs='+', choices=list(PARSERS), default=list(PARSERS), help='計測するパーサー')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='1組み合わせあたりの解析回数 (最速の回を採用)')
+    parser.add_argument('--uncapped', action='store_true', help='core パーサーの抽出件数の上限 (EXTRACT_MAX) を外して計測する')
+    parser.add_argument('--save_baseline', help='結果をベースラインとしてJSONに保存するパス')
+    parser.add_argument('--baseline', help='比較する保存済みベースラインのJSONのパス')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD_PERCENT, help='悪化とみなす変化率 (%%)')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="shopee_bench_") as tmp_dir:
+        if args.corpus_dir:
+            html_file_paths = sorted(
+                os.path.join(args.corpus_dir, name) for name in os.listdir(args.corpus_dir) if name.endswith(('.html', '.htm'))
+            )
+        else:
+            print(f"合成ページを生成しています: {args.list_types} × {args.sizes}")
+            html_file_paths = write_corpus(tmp_dir, args.sizes, args.list_types)
+        if not html_file_paths:
+            print("計測対象のHTMLファイルが見つかりませんでした。")
+            return 1
+
+        print(f"--- ベンチマーク開始: {len(html_file_paths)} ページ × {len(args.parsers)} パーサー (各 {args.repeat} 回) ---")
+        results = run_benchmark(html_file_paths, args.parsers, args.repeat, args.uncapped)
+    print_field_breakdown(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({"uncapped": args.uncapped, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\nベースラインを保存しました: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("uncapped") != args.uncapped:
+            print("警告: ベースラインと --uncapped の指定が異なるため、比較結果は参考値です。")
+        regressions = compare_with_baseline(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"{regressions} 件の組み合わせで性能が悪化しました。")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+商品リストDB (SQLite) の検索の同時接続時の応答時間のベンチマーク (スレッドプール + 同期のエンジン / async + aiosqlite)
+
+一時ディレクトリに商品テーブルと同じ形のテーブルを作って `--rows` 件の商品を入れておき、
+同じ検索 (価格・販売数での絞り込み + 100件) を返す2種類のエンドポイントを持つ FastAPI アプリに、
+`--clients` 個のクライアントが同時に `--requests` 回ずつリクエストを送る。クライアントは httpx の ASGITransport で
+アプリを同じプロセスのイベントループから呼ぶので、ネットワークやサーバーのプロセスは通らない。
+モデルと同時接続数ごとに以下を表にする。
+
+- 1秒あたりのリクエスト数
+- 応答時間の中央値 / 95パーセンタイル / 99パーセンタイル / 最大、失敗したリクエストの数 (プールの空きを待ちきれなかった場合など)
+
+モデル:
+- threadpool: 以前の検索のエンドポイントと同じ、`def` のエンドポイント (FastAPI のスレッドプールで実行) + 同期の読み込み用のエンジン
+- async: 現在の検索のエンドポイントと同じ、`async def` のエンドポイント + 非同期の読み込み用のエンジン (aiosqlite)。
+  API と同じく、同時に実行する検索を `async_reader_pool_size` までにするセマフォ (到着順) を通す
+
+どちらのエンジンも `api/storage_profile.py` の設定 (環境変数 `SHOPEE_DB_*`。プールの大きさは
+`SHOPEE_DB_READER_POOL_SIZE` と `SHOPEE_DB_ASYNC_READER_POOL_SIZE` など) で作る。
+
+使い方 (プロジェクトのルートディレクトリで実行):
+    uv run python -m src.shopee_product_filter.benchmarks.read_concurrency --rows 50000 --clients 50 100 --requests 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from ..api.storage_profile import StorageProfile, create_async_reader_engine, create_reader_engine, create_writer_engine
+from .sqlite_contention import metadata, product_rows, products, upsert_products
+
+MODELS = ("threadpool", "async")
+DEFAULT_ROWS = 50_000
+DEFAULT_CLIENTS = (50, 100)
+DEFAULT_REQUESTS = 20
+SEARCH_LIMIT = 100
+INSERT_BATCH_SIZE = 5_000
+
+
+def _search_query(low: float, min_sold: int) -> Any:
+    return (
+        select(products)
+        .where(products.c.price >= low, products.c.price <= low + 50, products.c.sold >= min_sold)
+        .order_by(products.c.id)
+        .limit(SEARCH_LIMIT)
+    )
+
+
+def build_app(reader: Engine, async_reader: AsyncEngine, async_slots: int) -> FastAPI:
+    """同じ検索を返す `/threadpool/search` (def) と `/async/search` (async def) を持つアプリ"""
+    app = FastAPI()
+    async_read_slots = asyncio.Semaphore(async_slots)
+
+    @app.get("/threadpool/search")
+    def search_threadpool(low: float, min_sold: int) -> List[Dict[str, Any]]:
+        with reader.connect() as connection:
+            return [dict(row) for row in connection.execute(_search_query(low, min_sold)).mappings()]
+
+    @app.get("/async/search")
+    async def search_async(low: float, min_sold: int) -> List[Dict[str, Any]]:
+        async with async_read_slots, async_reader.connect() as connection:
+            result = await connection.execute(_search_query(low, min_sold))
+            return [dict(row) for row in result.mappings()]
+
+    return app
+
+
+async def _run_clients(app: FastAPI, model: str, clients: int, requests: int, seed: int) -> Tuple[List[float], float, int]:
+    """(成功したリクエストの応答時間, 全体の時間, 失敗したリクエストの数) を返す"""
+    latencies: List[float] = []
+    errors = [0]
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+
+        async def run_client(index: int) -> None:
+            rng = random.Random(seed + index)
+            for _ in range(requests):
+                params = {"low": round(rng.uniform(1, 400), 2), "min_sold": rng.randint(0, 5000)}
+                started = time.perf_counter()
+                response = await client.get(f"/{model}/search", params=params)
+                elapsed = time.perf_counter() - started
+                if response.status_code != 200:
+                    errors[0] += 1
+                    continue
+                latencies.append(elapsed)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run_client(i) for i in range(clients)))
+        elapsed = time.perf_counter() - started
+    return latencies, elapsed, errors[0]
+
+
+def _percentile(latencies: List[float], fraction: float) -> Optional[float]:
+    if not latencies:
+        return None
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000
+
+
+async def run_benchmark(
+    rows: int, clients_list: List[int], requests: int, models: List[str], seed: int = 0
+) -> List[Dict[str, Any]]:
+    """モデルと同時接続数の組ごとに計測を行い、結果の辞書のリストを返す"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        profile = StorageProfile.from_env(path=os.path.join(tmp_dir, "read_concurrency.db"))
+        writer = create_writer_engine(profile)
+        metadata.create_all(writer)
+        rng = random.Random(seed)
+        for start in range(0, rows, INSERT_BATCH_SIZE):
+            upsert_products(writer, product_rows(start, min(INSERT_BATCH_SIZE, rows - start), rng))
+        writer.dispose()
+
+        reader = create_reader_engine(profile)
+        async_reader = create_async_reader_engine(profile)
+        app = build_app(reader, async_reader, profile.async_reader_pool_size)
+        try:
+            for clients in clients_list:
+                for model in models:
+                    # 接続を開く時間を含めないよう、各クライアント1回ずつの慣らしのリクエストを先に送る
+                    await _run_clients(app, model, clients, 1, seed)
+                    latencies, elapsed, errors = await _run_clients(app, model, clients, requests, seed)
+                    latencies.sort()
+                    results.append({
+                        "model": model,
+                        "clients": clients,
+                        "requests": len(latencies),
+                        "requests_per_sec": len(latencies) / elapsed,
+                        "p50_ms": statistics.median(latencies) * 1000 if latencies else None,
+                        "p95_ms": _percentile(latencies, 0.95),
+                        "p99_ms": _percentile(latencies, 0.99),
+                        "max_ms": latencies[-1] * 1000 if latencies else None,
+                        "errors": errors,
+                    })
+        finally:
+            await async_reader.dispose()
+            reader.dispose()
+    return results
+
+
+def _ms(value: Optional[float]) -> str:
+    return f"{value:.1f}" if value is not None else "-"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='商品リストDB (SQLite) の検索の同時接続時の応答時間のベンチマーク (スレッドプール / async)')
+    parser.add_argument('--models', nargs='+', choices=MODELS, default=list(MODELS), help='計測するエンドポイントの実行方式')
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help='最初に入れておく商品数')
+    parser.add_argument('--clients', type=int, nargs='+', default=list(DEFAULT_CLIENTS), help='同時にリクエストを送るクライアントの数 (複数指定可)')
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS, help='1クライアントが送るリクエストの数')
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run_benchmark(args.rows, args.clients, args.requests, args.models))
+    print(f"{'model':<10} {'clients':>7} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>6}")
+    for result in results:
+        print(
+            f"{result['model']:<10} {result['clients']:>7} {result['requests']:>8} {result['requests_per_sec']:>8,.0f} "
+            f"{_ms(result['p50_ms']):>8} {_ms(result['p95_ms']):>8} {_ms(result['p99_ms']):>8} {_ms(result['max_ms']):>8} {result['errors']:>6}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""
+商品リストDB (SQLite) の書き込みと読み込みの競合のベンチマーク
+
+一時ディレクトリに商品テーブルと同じ形のテーブルを作って `--rows` 件の商品を入れておき、
+1つの書き込みスレッドが `--batch_size` 件ずつのアップロード (INSERT ... ON CONFLICT の一括書き込み + コミット) を繰り返す間、
+`--readers` 本の読み込みスレッドが検索 (価格・販売数での絞り込み + 100件) を繰り返す。これを `--seconds` 秒続け、
+接続設定 (プロファイル) ごとに以下を表にする。
+
+- 書き込み: 1秒あたりに書き込んだ商品数と、1回のアップロードの最大時間
+- 読み込み: 検索の回数、応答時間の中央値 / 95パーセンタイル / 最大、"database is locked" で失敗した回数
+
+プロファイル:
+- legacy: 以前の API と同じ、素の `create_engine("sqlite:///...")` (ロールバックジャーナル、PRAGMA の設定なし、読み書き共通のエンジン)
+- tuned: `api/storage_profile.py` の設定 (WAL、PRAGMA、書き込み用の接続1本 + 読み込み専用の接続のプール)
+
+使い方 (プロジェクトのルートディレクトリで実行):
+    uv run python -m src.shopee_product_filter.benchmarks.sqlite_contention --rows 50000 --readers 8 --seconds 10
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Column, DateTime, Float, Integer, MetaData, String, Table, create_engine, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+from ..api.storage_profile import StorageProfile, create_reader_engine, create_writer_engine
+
+PROFILES = ("legacy", "tuned")
+DEFAULT_ROWS = 50_000
+DEFAULT_BATCH_SIZE = 5_000
+DEFAULT_READERS = 8
+DEFAULT_SECONDS = 10.0
+
+# 商品テーブル (`ProductBasicItem`) と同じ列とインデックス
+metadata = MetaData()
+products = Table(
+    "productbasicitem",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("sold", Integer),
+    Column("price", Float),
+    Column("currency", String(10)),
+    Column("product_name", String(512)),
+    Column("shop_type", String(50)),
+    Column("product_url", String(2048), unique=True, index=True, nullable=False),
+    Column("image_url", String(2048)),
+    Column("sourcing_status", String(50), index=True),
+    Column("sourcing_notes", String),
+    Column("created_at", DateTime, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+UPDATE_COLUMNS = ("sold", "price", "currency", "product_name", "shop_type", "image_url", "updated_at")
+
+
+def product_rows(start: int, count: int, rng: random.Random) -> List[Dict[str, Any]]:
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "sold": rng.randint(0, 20_000),
+            "price": round(rng.uniform(1, 500), 2),
+            "currency": "SGD",
+            "product_name": f"Synthetic product {i} " + "x" * rng.randint(10, 80),
+            "shop_type": rng.choice(("Standard", "Preferred", "Mall")),
+            "product_url": f"https://shopee.sg/product-i.{i}",
+            "image_url": f"https://down-sg.img.susercontent.com/file/{i:016x}_tn.webp",
+            "created_at": now,
+            "updated_at": now,
+        }
+        for i in range(start, start + count)
+    ]
+
+
+def upsert_products(engine: Engine, rows: List[Dict[str, Any]]) -> None:
+    statement = sqlite_insert(products)
+    statement = statement.on_conflict_do_update(
+        index_elements=[products.c.product_url], set_={key: statement.excluded[key] for key in UPDATE_COLUMNS}
+    )
+    with engine.begin() as connection:
+        connection.execute(statement, rows)
+
+
+def _engines(profile_name: str, db_path: str) -> Tuple[Engine, Engine]:
+    """(書き込み用, 読み込み用) のエンジンを返す"""
+    if profile_name == "legacy":
+        engine = create_engine(f"sqlite:///{db_path}")
+        return engine, engine
+    profile = StorageProfile.from_env(path=db_path)
+    return create_writer_engine(profile), create_reader_engine(profile)
+
+
+def run_profile(profile_name: str, rows: int, batch_size: int, readers: int, seconds: float, seed: int = 0) -> Dict[str, Any]:
+    """1つのプロファイルで競合の計測を行い、結果の辞書を返す"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "contention.db")
+        writer, reader = _engines(profile_name, db_path)
+        metadata.create_all(writer)
+        rng = random.Random(seed)
+        for start in range(0, rows, batch_size):
+            upsert_products(writer, product_rows(start, min(batch_size, rows - start), rng))
+
+        stop = threading.Event()
+        latencies: List[float] = []
+        lock_errors = [0]
+        write_times: List[float] = []
+        written = [0]
+        lock = threading.Lock()
+
+        def write_loop() -> None:
+            write_rng = random.Random(seed + 1)
+            while not stop.is_set():
+                # 半分は既存の商品の更新、半分は新規の商品
+                start = write_rng.randint(0, rows)
+                batch = product_rows(start, batch_size, write_rng)
+                started = time.perf_counter()
+                try:
+                    upsert_products(writer, batch)
+                except OperationalError:
+                    with lock:
+                        lock_errors[0] += 1
+                    continue
+                write_times.append(time.perf_counter() - started)
+                written[0] += len(batch)
+
+        def read_loop(index: int) -> None:
+            read_rng = random.Random(seed + 100 + index)
+            while not stop.is_set():
+                low = read_rng.uniform(1, 400)
+                query = (
+                    select(products)
+                    .where(products.c.price >= low, products.c.price <= low + 50, products.c.sold >= read_rng.randint(0, 5000))
+                    .order_by(products.c.id)
+                    .limit(100)
+                )
+                started = time.perf_counter()
+                try:
+                    with reader.connect() as connection:
+                        connection.execute(query).fetchall()
+                except OperationalError:
+                    with lock:
+                        lock_errors[0] += 1
+                    continue
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+
+        threads = [threading.Thread(target=write_loop)] + [threading.Thread(target=read_loop, args=(i,)) for i in range(readers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        writer.dispose()
+        reader.dispose()
+
+    latencies.sort()
+    return {
+        "profile": profile_name,
+        "write_rows_per_sec": written[0] / elapsed,
+        "write_max_ms": max(write_times) * 1000 if write_times else None,
+        "reads": len(latencies),
+        "read_p50_ms": statistics.median(latencies) * 1000 if latencies else None,
+        "read_p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else None,
+        "read_max_ms": latencies[-1] * 1000 if latencies else None,
+        "lock_errors": lock_errors[0],
+    }
+
+
+def _ms(value: Optional[float]) -> str:
+    return f"{value:.1f}" if value is not None else "-"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='商品リストDB (SQLite) の書き込みと読み込みの競合のベンチマーク')
+    parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=list(PROFILES), help='計測する接続設定')
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help='最初に入れておく商品数')
+    parser.add_argument('--batch_size', type=int, default=DEFAULT_BATCH_SIZE, help='1回のアップロードで書き込む商品数')
+    parser.add_argument('--readers', type=int, default=DEFAULT_READERS, help='検索を繰り返すスレッドの数')
+    parser.add_argument('--seconds', type=float, default=DEFAULT_SECONDS, help='計測する時間 (秒)')
+    args = parser.parse_args(argv)
+
+    print(f"{'profile':<8} {'write rows/s':>12} {'write max ms':>12} {'reads':>7} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'locked':>7}")
+    for profile_name in args.profiles:
+        result = run_profile(profile_name, args.rows, args.batch_size, args.readers, args.seconds)
+        print(
+            f"{result['profile']:<8} {result['write_rows_per_sec']:>12,.0f} {_ms(result['write_max_ms']):>12} {result['reads']:>7} "
+            f"{_ms(result['read_p50_ms']):>8} {_ms(result['read_p95_ms']):>8} {_ms(result['read_max_ms']):>8} {result['lock_errors']:>7}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""
+ベンチマーク・動作確認用の合成Shopee商品リストページ生成モジュール
+
+使い方 (プロジェクトのルートディレクトリで実行):
+    uv run python -m src.shopee_product_filter.benchmarks.synthetic_pages bench_pages/ --sizes 60 500 5000
+
+実際の保存ページと同じように、商品グリッド以外に大量の `<script>` / `<style>` /
+インラインSVG / フラグ画像 / オーバーレイ画像などのノイズを含むHTMLを生成する。
+リストタイプは以下の3種類:
+
+- shop: ショップ詳細画面 (`div.shop-search-result-view__item`)
+- search: キーワード検索・カテゴリー別 (`li.shopee-search-item-result__item`)
+- data_sqe: 汎用 (`li[data-sqe="item"]`)
+
+各アイテムは一定の割合で主要セレクタに一致しないレイアウトになり、
+パーサーのフォールバック（ヒューリスティック）経路も通るようにしている。
+"""
+import argparse
+import os
+import random
+from typing import Iterable, Iterator, List
+
+LIST_TYPES = ("shop", "search", "data_sqe")
+DEFAULT_SIZES = (60, 500, 5000)
+
+FLAG_SRC = {
+    "Preferred": "https://down-sg.img.susercontent.com/file/flag-preferred-lyan1mv3ncw641.png",
+    "Mall": "https://down-sg.img.susercontent.com/file/flag-mall-lyamz1z3mayu37.png",
+    "Official Store": "https://down-sg.img.susercontent.com/file/flag-official-ly995hjj5h28ab.png",
+}
+LOCATIONS = ("Japan", "Singapore", "Mainland China", "Korea", "Overseas")
+WORDS = (
+    "Japan", "Original", "Premium", "Ceramic", "Bowl", "Kitchen", "Knife", "Tea", "Cup",
+    "Green", "Matcha", "Towel", "Cotton", "Stationery", "Pen", "Set", "Limited", "Edition",
+)
+
+_SVG_ICON = (
+    '<svg viewBox="0 0 15 15" x="0" y="0" class="shopee-svg-icon icon-rating">'
+    '<polygon points="7.5 .8 9.7 5.4 14.5 5.9 10.7 9.1 11.8 14.2 7.5 11.6 3.2 14.2 4.3 9.1 .5 5.9 5.3 5.4" '
+    'stroke-linecap="round" stroke-linejoin="round" stroke-miterlimit="10"></polygon></svg>'
+)
+
+
+def _noise_script(rng: random.Random, size: int) -> str:
+    payload = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789{}[]:,\"") for _ in range(size))
+    return f'<script type="text/javascript">window.__STATE__ = "{payload}";</script>'
+
+
+def _noise_style(rng: random.Random, size: int) -> str:
+    rules = "".join(f".c{rng.randrange(10**6)}{{margin:{rng.randrange(20)}px;color:#{rng.randrange(16**6):06x}}}" for _ in range(size))
+    return f"<style>{rules}</style>"
+
+
+def _image_src(rng: random.Random, index: int) -> str:
+    file_id = f"sg-11134207-7r98o-{index:06d}{rng.randrange(16**6):06x}"
+    variant = rng.random()
+    if variant < 0.70:
+        return f"https://down-sg.img.susercontent.com/file/{file_id}_tn.webp"
+    if variant < 0.80:
+        return f"//down-sg.img.susercontent.com/file/{file_id}_tn.webp"
+    if variant < 0.90:
+        return f"/file/{file_id}_tn.webp"
+    return f"./saved_files/{file_id}_tn.webp"
+
+
+def _product_name(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randrange(3, 9)))
+
+
+def _sold_text(rng: random.Random) -> str:
+    variant = rng.random()
+    if variant < 0.6:
+        return f"{rng.randrange(1, 999)} sold"
+    if variant < 0.9:
+        return f"{rng.randrange(1, 99)}.{rng.randrange(10)}k sold"
+    return f"{rng.randrange(1, 9)},{rng.randrange(100, 999)} sold"
+
+
+def _price_text(rng: random.Random) -> str:
+    value = rng.randrange(100, 250000) / 100
+    return f"{value:,.2f}"
+
+
+def _item_body(rng: random.Random, index: int) -> str:
+    """1アイテム分の内部HTMLを生成する（リストタイプ共通部分）"""
+    url = f"https://shopee.sg/product-i.{rng.randrange(10**8, 10**9)}.{index:08d}"
+    shop_type = rng.choices(["Standard", "Preferred", "Mall", "Official Store"], weights=[70, 18, 8, 4])[0]
+    name = _product_name(rng)
+    flag = f'<img src="{FLAG_SRC[shop_type]}" alt="flag-label" class="mr-0.5 inline-block h-3.5">' if shop_type != "Standard" else ""
+
+    # --- 画像 ---
+    image_layout = rng.random()
+    src = _image_src(rng, index)
+    if image_layout < 0.75:
+        image_html = (
+            '<div class="relative z-0 w-full pt-full">'
+            f'<img src="{src}" alt="{name}" class="inset-y-0 w-full h-full pointer-events-none object-contain absolute" loading="lazy">'
+            '<img src="https://down-sg.img.susercontent.com/file/sg-overlay-abc.png" alt="custom-overlay" class="inset-y-0 absolute">'
+            "</div>"
+        )
+    elif image_layout < 0.9:
+        image_html = (
+            '<div class="w-full relative">'
+            f'<img data-src="{src}" src="" alt="{name}" class="inset-y-0 w-full">'
+            "</div>"
+        )
+    else:
+        image_html = f'<div class="thumb"><img data-src="{src}" alt="product"></div>'
+
+    # --- 商品名 ---
+    if rng.random() < 0.85:
+        name_html = f'<div class="line-clamp-2 break-words min-w-0 min-h-[2.5rem] text-sm">{flag}{name}</div>'
+    else:
+        name_html = f'<div class="item-name">{flag}{name}</div>'
+
+    # --- 価格 ---
+    price_layout = rng.random()
+    price = _price_text(rng)
+    if price_layout < 0.8:
+        price_html = (
+            '<div class="truncate flex items-baseline">'
+            f'<span class="text-xs/sp14 font-medium mr-px">$</span><span class="font-medium text-base/5 truncate">{price}</span>'
+            "</div>"
+        )
+    elif price_layout < 0.9:
+        price_html = f'<div class="price-box"><span class="shopee-price-range__current-price">{price}</span></div>'
+    else:
+        price_html = f'<div class="item-price-wrapper">${price}</div>'
+
+    # --- 販売数 ---
+    sold_layout = rng.random()
+    sold = _sold_text(rng)
+    if sold_layout < 0.75:
+        sold_html = f'<div class="truncate text-shopee-black87 text-xs min-h-4">{sold}</div>'
+    elif sold_layout < 0.85:
+        sold_html = f'<div class="shopee-item-card__footer"><span>{_SVG_ICON}4.9</span><div>{sold}</div></div>'
+    elif sold_layout < 0.95:
+        sold_html = f'<div class="meta"><div class="stats"><span>{_SVG_ICON}</span><span>{sold}</span></div></div>'
+    else:
+        sold_html = ""
+
+    # --- ロケーション ---
+    location = rng.choice(LOCATIONS)
+    location_layout = rng.random()
+    if location_layout < 0.8:
+        location_html = (
+            '<div class="flex items-center space-x-1 max-w-full h-4 text-shopee-black54">'
+            '<img src="https://deo.shopeemobile.com/shopee/location.svg" alt="location-icon" class="w-3 h-3">'
+            f'<span class="ml-[3px] align-middle">{location}</span></div>'
+        )
+    elif location_layout < 0.9:
+        location_html = (
+            '<div class="origin"><img src="https://deo.shopeemobile.com/shopee/location.svg" alt="location-icon">'
+            f"<span>{location}</span></div>"
+        )
+    else:
+        location_html = f'<div class="item-location-label">{location}</div>'
+
+    inner = (
+        '<div class="flex flex-col bg-white cursor-pointer h-full">'
+        f"{image_html}"
+        '<div class="p-2 flex-1 flex flex-col justify-between">'
+        f'<div class="space-y-1 mb-1 flex-1 flex flex-col justify-between min-h-[4rem]">{name_html}</div>'
+        f'<div class="flex justify-between items-center space-x-1">{price_html}</div>'
+        f'<div class="flex items-center">{_SVG_ICON}{sold_html}</div>'
+        f"{location_html}"
+        "</div></div>"
+    )
+    if rng.random() < 0.95:
+        return f'<a class="contents" href="{url}">{inner}</a>'
+    return f'<div class="card"><a class="product-link" href="{url}">link</a>{inner}</div>'
+
+
+def _items(rng: random.Random, list_type: str, count: int) -> Iterator[str]:
+    for index in range(count):
+        body = _item_body(rng, index)
+        if list_type == "shop":
+            yield f'<div class="shop-search-result-view__item col-xs-2-4">{body}</div>'
+        elif list_type == "search":
+            yield f'<li class="col-xs-2-4 shopee-search-item-result__item" data-sqe="item">{body}</li>'
+        else:
+            yield f'<li class="shopee-item-card" data-sqe="item">{body}</li>'
+
+
+def generate_page(list_type: str, item_count: int, seed: int = 0) -> str:
+    """
+    指定されたリストタイプとアイテム数の合成ページHTMLを生成する。
+
+    Args:
+        list_type: "shop" / "search" / "data_sqe" のいずれか。
+        item_count: 生成するアイテム数。
+        seed: 乱数シード（同じ値なら同じHTMLになる）。
+    """
+    if list_type not in LIST_TYPES:
+        raise ValueError(f"不明なリストタイプです: {list_type}")
+    rng = random.Random(f"{list_type}:{item_count}:{seed}")
+
+    parts: List[str] = [
+        "<!DOCTYPE html><html lang=\"en\"><head><meta charset=\"utf-8\">",
+        "<title>Shopee Singapore | Buy and Sell on Mobile or Online</title>",
+    ]
+    parts.extend(_noise_style(rng, 200) for _ in range(5))
+    parts.extend(_noise_script(rng, 20000) for _ in range(10))
+    parts.append("</head><body><div id=\"main\"><header class=\"shopee-top\">")
+    parts.extend(_SVG_ICON for _ in range(50))
+    parts.append("</header>")
+
+    if list_type == "shop":
+        parts.append('<div class="shop-search-result-view"><div class="row">')
+        parts.extend(_items(rng, list_type, item_count))
+        parts.append("</div></div>")
+    else:
+        parts.append('<ul class="row shopee-search-item-result__items">')
+        parts.extend(_items(rng, list_type, item_count))
+        parts.append("</ul>")
+
+    parts.extend(_noise_script(rng, 5000) for _ in range(max(1, item_count // 50)))
+    parts.append("</div></body></html>")
+    return "".join(parts)
+
+
+def write_corpus(output_dir: str, sizes: Iterable[int] = DEFAULT_SIZES, list_types: Iterable[str] = LIST_TYPES, seed: int = 0) -> List[str]:
+    """リストタイプ×サイズの組み合わせで合成ページを書き出し、パスのリストを返す"""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for list_type in list_types:
+        for size in sizes:
+            path = os.path.join(output_dir, f"synthetic_{list_type}_{size}.html")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(generate_page(list_type, size, seed=seed))
+            paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ベンチマーク用の合成Shopee商品リストページを生成するスクリプト")
+    parser.add_argument("output_dir", help="HTMLファイルの出力先ディレクトリ")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="生成するアイテム数 (複数指定可)")
+    parser.add_argument("--list_types", nargs="+", choices=LIST_TYPES, default=list(LIST_TYPES), help="生成するリストタイプ")
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード")
+    args = parser.parse_args()
+
+    for written in write_corpus(args.output_dir, args.sizes, args.list_types, args.seed):
+        print(f"生成しました: {written}")
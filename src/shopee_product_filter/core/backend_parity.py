@@ -0,0 +1,101 @@
+"""
+解析バックエンドの一致確認 (パリティチェック)
+
+同じ保存ページを bs4 バックエンドと lxml バックエンドの両方で解析し、
+アイテムごとに全フィールドを比較して、食い違いを一覧表示する。
+セレクタや XPath を変更したときは、手元の保存ページを集めたディレクトリに対して実行し、
+差分が出ないことを確認すること。
+
+使い方 (プロジェクトのルートディレクトリで実行):
+    uv run python -m src.shopee_product_filter.core.backend_parity saved_pages/ --streaming
+"""
+import argparse
+import contextlib
+import io
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .batch_parse import expand_inputs
+from .parse_product_list import parse_shopee_shop_products_from_file_final
+
+# 比較するフィールド
+COMPARED_FIELDS = ("product_name", "price", "currency", "image_url", "product_url", "location", "sold", "shop_type")
+
+# (アイテム番号 (0始まり、件数の不一致は None), フィールド名, bs4 の値, lxml の値)
+FieldDiff = Tuple[Optional[int], str, Any, Any]
+
+
+def _parse_quietly(html_file_path: str, backend: str, streaming: bool) -> Tuple[Optional[List[Dict[str, Any]]], float]:
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        products = parse_shopee_shop_products_from_file_final(html_file_path, streaming=streaming, backend=backend)
+    return products, time.perf_counter() - started
+
+
+def compare_backends(html_file_path: str, streaming: bool = False) -> Dict[str, Any]:
+    """
+    1ファイルを両方のバックエンドで解析して比較する。
+
+    Returns:
+        file / diffs (FieldDiff のリスト) / items (bs4 の件数) / elapsed (バックエンド名 -> 秒) を持つ辞書。
+    """
+    bs4_products, bs4_elapsed = _parse_quietly(html_file_path, "bs4", streaming)
+    lxml_products, lxml_elapsed = _parse_quietly(html_file_path, "lxml", streaming)
+    diffs: List[FieldDiff] = []
+    if bs4_products is None or lxml_products is None:
+        if (bs4_products is None) != (lxml_products is None):
+            diffs.append((None, "list_container", bs4_products is not None, lxml_products is not None))
+    else:
+        if len(bs4_products) != len(lxml_products):
+            diffs.append((None, "item_count", len(bs4_products), len(lxml_products)))
+        for position, (bs4_item, lxml_item) in enumerate(zip(bs4_products, lxml_products)):
+            for field in COMPARED_FIELDS:
+                if bs4_item.get(field) != lxml_item.get(field):
+                    diffs.append((position, field, bs4_item.get(field), lxml_item.get(field)))
+    return {
+        "file": html_file_path,
+        "diffs": diffs,
+        "items": len(bs4_products) if bs4_products else 0,
+        "elapsed": {"bs4": bs4_elapsed, "lxml": lxml_elapsed},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='bs4 バックエンドと lxml バックエンドの抽出結果を比較するスクリプト')
+    parser.add_argument('inputs', nargs='+', help='HTMLファイル、ディレクトリ、またはglobパターン (複数指定可)')
+    parser.add_argument('--recursive', action='store_true', help='ディレクトリ指定時にサブディレクトリも探す')
+    parser.add_argument('--streaming', action='store_true', help='ストリーミングモード同士で比較する')
+    parser.add_argument('--max_diffs', type=int, default=20, help='1ファイルあたりに表示する差分の最大数')
+    args = parser.parse_args(argv)
+
+    html_file_paths = expand_inputs(args.inputs, recursive=args.recursive)
+    if not html_file_paths:
+        print("処理対象のHTMLファイルが見つかりませんでした。")
+        return 1
+
+    mismatched_files = 0
+    total_items = 0
+    total_elapsed = {"bs4": 0.0, "lxml": 0.0}
+    for html_file_path in html_file_paths:
+        result = compare_backends(html_file_path, streaming=args.streaming)
+        total_items += result["items"]
+        for backend, elapsed in result["elapsed"].items():
+            total_elapsed[backend] += elapsed
+        timing = f"bs4 {result['elapsed']['bs4']:.2f} 秒 / lxml {result['elapsed']['lxml']:.2f} 秒"
+        if not result["diffs"]:
+            print(f"一致: {html_file_path} ({result['items']} 件, {timing})")
+            continue
+        mismatched_files += 1
+        print(f"不一致: {html_file_path} ({len(result['diffs'])} 件の差分, {timing})")
+        for position, field, bs4_value, lxml_value in result["diffs"][:args.max_diffs]:
+            where = f"アイテム {position + 1}" if position is not None else "ファイル全体"
+            print(f"  {where}: {field}: bs4={bs4_value!r} lxml={lxml_value!r}")
+
+    print(f"--- {len(html_file_paths)} ファイル中 {mismatched_files} ファイルで不一致 (比較したアイテム: {total_items} 件) ---")
+    print(f"合計時間: bs4 {total_elapsed['bs4']:.2f} 秒 / lxml {total_elapsed['lxml']:.2f} 秒")
+    return 1 if mismatched_files else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,346 @@
+"""
+保存した商品リストHTMLをまとめて解析するバッチ処理
+
+`parse_product_list.py` のコマンドは1回の起動で1ファイルしか処理できないため、
+ソーシング作業で保存した数百ページを解析するには、その数だけプロセスを起動する必要があった。
+
+このモジュールは、ディレクトリやglobパターンで指定したHTMLファイルを ProcessPoolExecutor で
+複数のワーカーに振り分けて並列に解析する。1ファイルごとに制限時間を設けるので、
+異常に重いページがあってもバッチ全体が止まることはない。
+解析結果は終わったファイルから順に、product_url で重複を除きながら JSONL / CSV に書き出す。
+`.html.gz` / `.html.zst` の圧縮ファイルと `.zip` アーカイブも入力にでき、アーカイブは中のページごとに
+ワーカーへ振り分ける (ディスクには展開しない。`html_archive.py` を参照)。
+`--slim` を付けると、各ページの隣に商品グリッドだけを残したスナップショット (`<名前>.slim.html.gz`) を作り、
+パーサーにはそれを読ませる (`html_slim.py` を参照)。
+
+使い方 (プロジェクトのルートディレクトリで実行):
+    uv run python -m src.shopee_product_filter.core.batch_parse saved_pages/ "archive/**/*.html" \\
+        --workers 8 --timeout 60 --output_jsonl products.jsonl --output_csv products.csv
+"""
+import argparse
+import contextlib
+import glob
+import io
+import os
+import signal
+import sys
+import time
+import zipfile
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, TextIO, Tuple
+
+from .extraction_stats import ExtractionStats
+from .html_archive import is_archive_name, list_archive_members, split_member
+from .html_slim import ensure_slim_snapshot, is_slim_snapshot, slim_path_for
+from .item_fingerprints import ItemFingerprintStore
+from .parse_cache import ParseCache
+from .parse_product_list import BACKENDS, PARSER_VERSION, parse_shopee_shop_products_from_file_final
+from .product_writers import CsvProductWriter, JsonlProductWriter, ParquetProductWriter, ProductWriter
+from .selector_order import SelectorOrderStore
+
+DEFAULT_TIMEOUT_SECONDS = 60.0
+HTML_PATTERNS = ("*.html", "*.htm", "*.html.gz", "*.htm.gz", "*.html.zst", "*.htm.zst", "*.zip")
+
+
+class FileTimeoutError(BaseException):
+    """
+    1ファイルの解析が制限時間を超えた。
+    解析中のどこで発生しても解析を中断できるよう、パーサーの `except Exception` (フィールド抽出の失敗を1件のエラーとして
+    続ける処理など) に捕まらない BaseException にする。
+    """
+
+
+def expand_inputs(inputs: Iterable[str], recursive: bool = False) -> List[str]:
+    """
+    ディレクトリ / globパターン / ファイルパスの指定を、HTMLファイルのパスのリストに展開する。
+    zip アーカイブは中のHTMLページごとの「アーカイブのパス!メンバー名」に展開する。
+    元のページと一緒に見つかったスリム化したスナップショットは、同じページを2回解析しないよう除く。
+    重複は取り除き、パスの昇順に並べる。
+    """
+    paths: Set[str] = set()
+    for spec in inputs:
+        if os.path.isdir(spec):
+            for pattern in HTML_PATTERNS:
+                sub_pattern = os.path.join(spec, "**", pattern) if recursive else os.path.join(spec, pattern)
+                paths.update(glob.glob(sub_pattern, recursive=recursive))
+        elif glob.has_magic(spec):
+            paths.update(p for p in glob.glob(spec, recursive=True) if os.path.isfile(p))
+        elif os.path.isfile(spec):
+            paths.add(spec)
+        else:
+            print(f"警告: 入力が見つかりません - {spec}", file=sys.stderr)
+    expanded: List[str] = []
+    for path in (os.path.abspath(p) for p in paths):
+        if not is_archive_name(path):
+            expanded.append(path)
+            continue
+        try:
+            expanded.extend(list_archive_members(path))
+        except (OSError, zipfile.BadZipFile) as e:
+            print(f"警告: アーカイブを読み込めません - {path}: {e}", file=sys.stderr)
+    shadowed_snapshots = {slim_path_for(path) for path in expanded if not is_slim_snapshot(path)}
+    return sorted(path for path in expanded if path not in shadowed_snapshots)
+
+
+def _raise_file_timeout(signum: int, frame: Any) -> None:
+    raise FileTimeoutError()
+
+
+def parse_file_with_budget(
+    html_file_path: str,
+    timeout: Optional[float],
+    streaming: bool = False,
+    verbose: bool = False,
+    backend: str = "bs4",
+    cache_dir: Optional[str] = None,
+    collect_stats: bool = False,
+    fingerprint_db: Optional[str] = None,
+    slim: bool = False,
+    selector_order_db: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    ワーカープロセスで1ファイルを解析する。
+
+    制限時間は SIGALRM で強制するので、SIGALRM のないプラットフォーム (Windows) では制限時間は効かない。
+    `fingerprint_db` を渡すと、ワーカーごとにそのファイルを開いてアイテムの指紋を参照・保存する。
+    `slim=True` の場合は、ページの隣のスリム化したスナップショットを (なければ作ってから) 解析する。
+    `selector_order_db` を渡すと、ワーカーごとにそのファイルを開いてレイアウトごとのセレクタの記録を参照・保存する。
+    制限時間を超えたファイルの途中までの解析結果は、アイテムの指紋・セレクタの記録・解析結果のキャッシュのどれにも保存しない。
+
+    Returns:
+        file / status ("success", "skipped", "timeout", "error") / products / message / elapsed を持つ辞書。
+        `collect_stats=True` の場合は、フィールド別の抽出の集計 (`ExtractionStats.to_dict()`) を stats に持つ。
+    """
+    started = time.perf_counter()
+    use_alarm = bool(timeout) and hasattr(signal, "setitimer")
+    if use_alarm:
+        previous_handler = signal.signal(signal.SIGALRM, _raise_file_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    result: Dict[str, Any] = {"file": html_file_path, "products": None, "message": "", "stats": None}
+    stats = ExtractionStats() if collect_stats else None
+    fingerprints: Optional[ItemFingerprintStore] = None
+    selector_order: Optional[SelectorOrderStore] = None
+    try:
+        output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            parse_cache = ParseCache(cache_dir, PARSER_VERSION) if cache_dir else None
+            fingerprints = ItemFingerprintStore(fingerprint_db, PARSER_VERSION) if fingerprint_db else None
+            selector_order = SelectorOrderStore(selector_order_db, PARSER_VERSION) if selector_order_db else None
+            parse_path, slim_in_memory = html_file_path, False
+            if slim:
+                if split_member(html_file_path)[1] is None:
+                    parse_path = ensure_slim_snapshot(html_file_path)
+                else:
+                    # zip のメンバーは隣に保存できないので、メモリ上でスリム化する
+                    slim_in_memory = True
+            products = parse_shopee_shop_products_from_file_final(
+                parse_path, streaming=streaming, backend=backend, cache=parse_cache, stats=stats, fingerprints=fingerprints,
+                slim=slim_in_memory, selector_order=selector_order,
+            )
+            # 解析が終わったらすぐにタイマーを止める (stdout を戻す途中で中断されないよう、with の中で止める)
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        if products is None:
+            result.update(status="skipped", message="商品リストのコンテナが見つかりませんでした。")
+        else:
+            result.update(status="success", products=products)
+    except FileTimeoutError:
+        result.update(status="timeout", message=f"制限時間 ({timeout} 秒) を超えたため中断しました。")
+    except Exception as e:
+        result.update(status="error", message=f"{type(e).__name__}: {e}")
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+        timed_out = result.get("status") == "timeout"
+        if fingerprints is not None:
+            fingerprints.close(save=not timed_out)
+        if selector_order is not None:
+            selector_order.close(save=not timed_out)
+    result["elapsed"] = time.perf_counter() - started
+    if stats is not None:
+        result["stats"] = stats.to_dict()
+    return result
+
+
+class MergedOutput:
+    """
+    解析結果を product_url で重複除去しながら JSONL / CSV / Parquet に逐次書き出す
+    (`product_writers.py` のライターでチャンクごとに書き出すので、全ファイル分の結果をメモリに持たない)。
+    最後に close() を呼ぶこと。
+    """
+
+    def __init__(
+        self,
+        jsonl_file: Optional[TextIO] = None,
+        csv_file: Optional[TextIO] = None,
+        writers: Sequence[ProductWriter] = (),
+    ):
+        self.writers: List[ProductWriter] = list(writers)
+        if jsonl_file:
+            self.writers.append(JsonlProductWriter(jsonl_file))
+        if csv_file:
+            self.writers.append(CsvProductWriter(csv_file))
+        self.seen_urls: Set[str] = set()
+        self.written = 0
+        self.duplicates = 0
+
+    def write(self, products: Iterable[Dict[str, Any]]) -> int:
+        """重複していない商品だけを書き出し、書き出した件数を返す"""
+        written = 0
+        for product in products:
+            product_url = product.get("product_url")
+            if product_url:
+                if product_url in self.seen_urls:
+                    self.duplicates += 1
+                    continue
+                self.seen_urls.add(product_url)
+            for writer in self.writers:
+                writer.write(product)
+            written += 1
+        self.written += written
+        return written
+
+    def close(self) -> None:
+        """残りを書き出してライターを閉じる"""
+        for writer in self.writers:
+            writer.close()
+
+
+def run_batch(
+    html_file_paths: List[str],
+    output: MergedOutput,
+    workers: Optional[int] = None,
+    timeout: Optional[float] = DEFAULT_TIMEOUT_SECONDS,
+    streaming: bool = False,
+    verbose: bool = False,
+    backend: str = "bs4",
+    cache_dir: Optional[str] = None,
+    stats: Optional[ExtractionStats] = None,
+    fingerprint_db: Optional[str] = None,
+    slim: bool = False,
+    selector_order_db: Optional[str] = None,
+) -> List[Tuple[str, str, int, str]]:
+    """
+    HTMLファイルを並列に解析し、終わったものから順に output へ書き出す。
+    `stats` を渡すと、各ファイルのフィールド別の抽出の集計をそこに足し込む。
+    `fingerprint_db` を渡すと、前回と同じアイテムはそのファイルに保存した商品情報を使う (`item_fingerprints.py` を参照)。
+    `slim=True` の場合は、各ページのスリム化したスナップショットを解析する (`html_slim.py` を参照)。
+    `selector_order_db` を渡すと、同じレイアウトのページで外れ続けたセレクタの評価を省く (`selector_order.py` を参照)。
+
+    ワーカープロセスが異常終了してプールが壊れた (`BrokenProcessPool`) 場合は、終わっていないファイルを新しいプールで
+    解析し直す。新しいプールでも1ファイルも終わらずに壊れた場合は、残りのファイルを1ファイルずつ専用のワーカープロセスで
+    解析し、異常終了の原因になったファイルだけをエラーにする。
+
+    Returns:
+        ファイルごとの (ファイルパス, ステータス, 書き出した件数, メッセージ) のリスト (完了順)。
+    """
+    summary: List[Tuple[str, str, int, str]] = []
+    parse_args = (timeout, streaming, verbose, backend, cache_dir, stats is not None, fingerprint_db, slim, selector_order_db)
+
+    def report_failure(path: str, e: BaseException) -> None:
+        summary.append((path, "error", 0, f"{type(e).__name__}: {e}"))
+        print(f"[{len(summary)}/{len(html_file_paths)}] error: {path} ワーカーの実行に失敗しました: {e}")
+
+    def report(result: Dict[str, Any]) -> None:
+        written = output.write(result["products"]) if result["products"] else 0
+        if stats is not None and result["stats"]:
+            stats.merge(ExtractionStats.from_dict(result["stats"]))
+        summary.append((result["file"], result["status"], written, result["message"]))
+        parsed_count = len(result["products"]) if result["products"] else 0
+        print(
+            f"[{len(summary)}/{len(html_file_paths)}] {result['status']}: {result['file']} "
+            f"({parsed_count} 件抽出, {written} 件書き出し, {result['elapsed']:.2f} 秒) {result['message']}"
+        )
+
+    outstanding = list(html_file_paths)
+    isolate = False
+    while outstanding:
+        crashed: Set[str] = set()
+        # 1ファイルずつ解析し直す段階では、ファイルごとに専用のプールを作る
+        batches = [[path] for path in outstanding] if isolate else [outstanding]
+        for paths in batches:
+            with ProcessPoolExecutor(max_workers=1 if isolate else workers) as executor:
+                future_paths: Dict[Future, str] = {
+                    executor.submit(parse_file_with_budget, path, *parse_args): path for path in paths
+                }
+                for future in as_completed(future_paths):
+                    path = future_paths[future]
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool as e:
+                        if isolate:
+                            report_failure(path, e)
+                        else:
+                            crashed.add(path)
+                        continue
+                    except Exception as e:
+                        report_failure(path, e)
+                        continue
+                    report(result)
+        if not crashed:
+            break
+        # 新しいプールで1ファイルも終わらなかったら、原因のファイルを特定するため1ファイルずつ解析する
+        isolate = len(crashed) == len(outstanding)
+        outstanding = [path for path in outstanding if path in crashed]
+        how = "1ファイルずつ専用のワーカープロセスで" if isolate else "新しいワーカープロセスで"
+        print(f"警告: ワーカープロセスが異常終了したため、残りの {len(outstanding)} ファイルを{how}解析し直します。", file=sys.stderr)
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='保存したShopeeの商品リストHTMLをまとめて並列に解析するスクリプト')
+    parser.add_argument('inputs', nargs='+', help='HTMLファイル、ディレクトリ、またはglobパターン (複数指定可)')
+    parser.add_argument('--workers', type=int, default=None, help='ワーカープロセス数 (省略時はCPUコア数)')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT_SECONDS, help='1ファイルあたりの制限時間 (秒、0で無制限)')
+    parser.add_argument('--recursive', action='store_true', help='ディレクトリ指定時にサブディレクトリも探す')
+    parser.add_argument('--streaming', action='store_true', help='省メモリのストリーミングモードで解析する')
+    parser.add_argument('--backend', choices=BACKENDS, default="bs4", help='解析バックエンド (bs4: BeautifulSoup, lxml: lxml/XPath)')
+    parser.add_argument('--cache_dir', help='解析結果をキャッシュするディレクトリ (同じ内容のページは解析をスキップする)')
+    parser.add_argument('--fingerprint_db', help='アイテムの指紋を保存する SQLite ファイル (前回と同じアイテムは抽出をスキップする)')
+    parser.add_argument('--selector_order_db', help='レイアウトごとのセレクタの一致回数を保存する SQLite ファイル (外れ続けるセレクタを省く)')
+    parser.add_argument('--slim', action='store_true', help='各ページの隣に商品グリッドだけを残したスナップショットを作り、それを解析する')
+    parser.add_argument('--output_jsonl', help='結果をJSONLファイルに書き出す場合のパス')
+    parser.add_argument('--output_csv', help='結果をCSVファイルに書き出す場合のパス')
+    parser.add_argument('--output_parquet', help='結果を型付きの Parquet ファイルに書き出す場合のパス (pyarrow が必要。uv sync --extra parquet)')
+    parser.add_argument('--verbose', action='store_true', help='パーサーのログをそのまま表示する')
+    parser.add_argument('--stats', action='store_true', help='フィールドごとの抽出時間とフォールバック段階の割合を集計して表示する')
+    args = parser.parse_args(argv)
+
+    html_file_paths = expand_inputs(args.inputs, recursive=args.recursive)
+    if not html_file_paths:
+        print("処理対象のHTMLファイルが見つかりませんでした。")
+        return 1
+    if not args.output_jsonl and not args.output_csv and not args.output_parquet:
+        print("警告: --output_jsonl / --output_csv / --output_parquet が指定されていないため、結果は書き出されません。")
+
+    print(f"--- バッチ処理開始: {len(html_file_paths)} ファイル (ワーカー数: {args.workers or os.cpu_count()}) ---")
+    started = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        jsonl_file = stack.enter_context(open(args.output_jsonl, 'w', encoding='utf-8')) if args.output_jsonl else None
+        csv_file = stack.enter_context(open(args.output_csv, 'w', newline='', encoding='utf-8')) if args.output_csv else None
+        parquet_writers = [ParquetProductWriter(args.output_parquet)] if args.output_parquet else []
+        output = MergedOutput(jsonl_file, csv_file, parquet_writers)
+        stack.callback(output.close)
+        extraction_stats = ExtractionStats() if args.stats else None
+        summary = run_batch(
+            html_file_paths, output, args.workers, args.timeout or None, args.streaming, args.verbose, args.backend, args.cache_dir,
+            extraction_stats, args.fingerprint_db, args.slim, args.selector_order_db,
+        )
+
+    status_counts: Dict[str, int] = {}
+    for _, file_status, _, _ in summary:
+        status_counts[file_status] = status_counts.get(file_status, 0) + 1
+    print(f"--- バッチ処理終了 ({time.perf_counter() - started:.2f} 秒) ---")
+    print(f"ファイル: {status_counts}")
+    print(f"書き出した商品: {output.written} 件 (重複として除外: {output.duplicates} 件)")
+    if extraction_stats is not None:
+        print(f"--- フィールド別の抽出時間とフォールバック段階 ({extraction_stats.items} アイテム、キャッシュ分を除く) ---")
+        for line in extraction_stats.format_lines():
+            print(line)
+    return 0 if status_counts.get("success") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,590 @@
+"""
+商品リストHTMLの抽出プラン（コンパイル済みセレクタ）とその実行エンジン
+
+`parse_product_list.py` は1アイテムあたり約20回の `select_one` / `select` を呼んでおり、
+呼び出しのたびに soupsieve がCSSセレクタ文字列を解析し直していた。
+このモジュールでは、リストタイプ（ショップ / 検索・カテゴリー / data-sqe）ごとの
+セレクタと正規表現をインポート時に一度だけコンパイルし、レジストリに保持する。
+
+レジストリは宣言的な設定（dict または JSONファイル）から読み込み直すこともできる。
+設定の形式は以下の通りで、`selectors` に書いたキーだけが `DEFAULT_FIELD_SELECTORS` を上書きする。
+
+    {
+        "shop": {
+            "item_selector": "div.shop-search-result-view > div.row > div.shop-search-result-view__item",
+            "selectors": {"sold_primary": ["div.truncate.text-shopee-black87.text-xs"]},
+            "stream_match": {"tag": "div", "classes": ["shop-search-result-view__item"]},
+            "signatures": ["shop-search-result-view__item"]
+        }
+    }
+
+`stream_match` は任意で、ストリーミング解析モード (`streaming_parser.py`) がDOM全体を作らずに
+アイテムのコンテナ要素を見分けるための条件。指定のないリストタイプはストリーミングモードでは検出されない。
+
+`signatures` も任意で、そのリストタイプのページの生のHTMLに必ず含まれる文字列のリスト (どれか1つを含めばよい)。
+通常モードでは、DOMを作る前にHTMLの生の内容に対して `probe_plans` で照合し、シグネチャを含まないリストタイプは
+アイテムの検出 (文書全体に対するセレクタの評価) を省く。どのリストタイプにも一致しなければDOM自体を作らない。
+指定のないリストタイプは常に検出の対象になる。
+新しいレイアウトに対応するときは、ここにリストタイプを1件追加する (抽出処理は全リストタイプで共通)。
+"""
+import re
+import os
+import json
+import time
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple, Union
+
+import soupsieve as sv
+from bs4.element import Tag
+
+from .extraction_stats import TIER_ERROR, TIER_FALLBACK, TIER_HEURISTIC, TIER_NONE, TIER_PRIMARY, ExtractionStats
+from .text_index import SoupTextIndex
+
+# Shopee CDNの画像ベースURL - ファイル名の前に付加
+SHOPEE_SG_IMAGE_BASE_URL = "https://down-sg.img.susercontent.com/file/"
+
+# ShopeeのPreferred/Mall/Official Storeショップを示す画像ファイル名のSuffix
+PREFERRED_SRC_SUFFIX = "lyan1mv3ncw641"
+MALL_SRC_SUFFIX = "lyamz1z3mayu37"
+OFFICIAL_STORE_SUFFIX = "ly995hjj5h28ab"
+
+ProductInfo = Dict[str, Optional[Union[str, float, int]]]
+
+# --- フィールド抽出用のセレクタ（全リストタイプ共通のデフォルト） ---
+# 値が文字列のものは単一セレクタ、リストのものは先頭から順に試すフォールバックチェーン。
+DEFAULT_FIELD_SELECTORS: Dict[str, Union[str, List[str]]] = {
+    "link": 'a.contents',
+    "link_img": 'img[src], img[data-src]',
+    "image_fallbacks": [
+        'div.w-full.relative > img.inset-y-0:not([alt*="custom-overlay"]):not([alt="flag-label"])',
+        'div.relative.z-0.w-full.pt-full > img',
+        'div.shopee-search-item-result__item__info img',
+        'div.shop-search-result-view__item__info img',
+    ],
+    "image_candidates": 'img[src], img[data-src]',
+    "location_primary": 'div.flex.items-center.space-x-1.max-w-full span.ml-\\[3px\\]',
+    "location_icon": 'img[alt="location-icon"]',
+    "location_candidates": 'div[class*="location"], span[class*="location"], div[class*="shipping"], span[class*="shipping"], div.shopee-item-card__footer span, div.shopee-item-card__footer div',
+    "name_containers": [
+        'div.line-clamp-2',
+        'div[class*="name"], div[class*="Name"]',
+    ],
+    "flag_in_name": 'img[alt="flag-label"]',
+    "flag_fallbacks": [
+        'img[alt="flag-label"]',
+        'img[alt*="Preferred"], img[alt*="Mall"], img[alt*="Official Store"]',
+    ],
+    "price_container": 'div.truncate.flex.items-baseline',
+    "price_currency": 'span:nth-of-type(1)',
+    "price_value": 'span:nth-of-type(2)',
+    "price_alt": 'span.shopee-price-range__current-price',
+    "price_candidates": 'div.truncate.flex.items-baseline, span.shopee-price-range__current-price, div[class*="price"], div[class*="Price"], div[class*="Price"] span, div[class*="ProductCard"] div[class*="Price"], div[class*="item-card"] div[class*="price"]',
+    "sold_primary": [
+        'div.truncate.text-shopee-black87.text-xs',
+        'div.shopee-item-card__footer > div:last-child',
+    ],
+    # 'div.shopee-item-card__footer span, div.shopee-item-card__footer div, span, div' と同じ要素の集合
+    # (子孫結合子の部分は 'span, div' に含まれるので、祖先をたどる照合を省く)
+    "sold_candidates": 'span, div',
+}
+
+# --- リストタイプごとの設定 (検出の優先順に並べる) ---
+DEFAULT_PLAN_CONFIG: Dict[str, Dict[str, Any]] = {
+    # ショップの商品リスト
+    "shop": {
+        "item_selector": 'div.shop-search-result-view > div.row > div.shop-search-result-view__item',
+        "stream_match": {"tag": "div", "classes": ["shop-search-result-view__item"], "ancestor_classes": [["row"], ["shop-search-result-view"]]},
+        "signatures": ["shop-search-result-view__item"],
+    },
+    # キーワード検索 と カテゴリー別 の商品リスト (同じセレクタを使用)
+    "search_category": {
+        "item_selector": 'li.col-xs-2-4.shopee-search-item-result__item',
+        "stream_match": {"tag": "li", "classes": ["col-xs-2-4", "shopee-search-item-result__item"]},
+        "signatures": ["shopee-search-item-result__item"],
+    },
+    # data-sqe="item" の商品リスト (汎用的なセレクタ)
+    "data_sqe": {
+        "item_selector": 'li[data-sqe="item"]',
+        "stream_match": {"tag": "li", "attrs": {"data-sqe": "item"}},
+        # 属性値の引用符の有無や種類に依らないよう、属性名だけを見る
+        "signatures": ["data-sqe"],
+    },
+}
+
+# --- 抽出処理で使う正規表現 (ループ内で毎回組み立てないよう、ここでコンパイルしておく) ---
+RE_IMAGE_FILE_PATH = re.compile(r'/file/([a-zA-Z0-9_-]+(?:/[^/]+)?\.\w+)$')
+RE_IMAGE_FILENAME = re.compile(r'^[a-zA-Z0-9_-]+(?:_[a-zA-Z0-9]+)?\.\w+$')
+RE_HAS_LETTER_OR_SPACE = re.compile(r'[a-zA-Z\s]')
+RE_NUMERIC_ONLY = re.compile(r'^\d+(\.\d+)?$')
+RE_CURRENCY_SYMBOL = re.compile(r'[$€£¥]')
+RE_PAGE_COUNT = re.compile(r'^\d+ / \d+$')
+RE_SHOP_TYPE_LABEL = re.compile(r'\s*\[(Preferred|Mall|Official Store)\]\s*', re.IGNORECASE)
+RE_FLAG_SUFFIX = re.compile(r'-([a-zA-Z0-9]+)$')
+RE_NUMBER = re.compile(r'[\d,.]+')
+RE_SOLD = re.compile(r'([\d,.]+)([kK])?\s*sold', re.IGNORECASE)
+
+
+class ExtractionPlan:
+    """
+    1つのリストタイプ分のコンパイル済みセレクタをまとめたもの。
+
+    属性名は `DEFAULT_FIELD_SELECTORS` のキーと同じ。
+    フォールバックチェーンはコンパイル済みセレクタのタプルになる。
+    """
+
+    def __init__(
+        self,
+        list_type: str,
+        item_selector: str,
+        selectors: Mapping[str, Union[str, List[str]]],
+        stream_match: Optional[Mapping[str, Any]] = None,
+        signatures: Optional[List[str]] = None,
+    ):
+        self.list_type = list_type
+        self.item_selector = item_selector
+        self.stream_match = dict(stream_match) if stream_match else None
+        self.signatures = tuple(signatures or ())
+        self._byte_signatures = tuple(signature.encode('utf-8') for signature in self.signatures)
+        self.item = sv.compile(item_selector)
+        self.selectors = dict(selectors)
+        for key, value in self.selectors.items():
+            if isinstance(value, str):
+                setattr(self, key, sv.compile(value))
+            else:
+                setattr(self, key, tuple(sv.compile(v) for v in value))
+
+    def __repr__(self) -> str:
+        return f"ExtractionPlan(list_type={self.list_type!r}, item_selector={self.item_selector!r})"
+
+    def select_items(self, soup: Tag) -> List[Tag]:
+        """ドキュメントからこのリストタイプの商品アイテムを全て取得する"""
+        return self.item.select(soup)
+
+    def probe(self, document: Union[bytes, str]) -> bool:
+        """生のHTMLがこのリストタイプのページでありうるか (シグネチャを1つでも含むか)。シグネチャがなければ常に True"""
+        if not self.signatures:
+            return True
+        signatures = self.signatures if isinstance(document, str) else self._byte_signatures
+        return any(signature in document for signature in signatures)
+
+
+def build_plan(list_type: str, config: Mapping[str, Any]) -> ExtractionPlan:
+    """設定1件分から抽出プランを組み立てる"""
+    if "item_selector" not in config:
+        raise ValueError(f"リストタイプ '{list_type}' の設定に item_selector がありません。")
+    selectors: Dict[str, Union[str, List[str]]] = dict(DEFAULT_FIELD_SELECTORS)
+    overrides = config.get("selectors") or {}
+    unknown_keys = set(overrides) - set(DEFAULT_FIELD_SELECTORS)
+    if unknown_keys:
+        raise ValueError(f"リストタイプ '{list_type}' の設定に不明なセレクタキーがあります: {sorted(unknown_keys)}")
+    selectors.update(overrides)
+    return ExtractionPlan(list_type, config["item_selector"], selectors, config.get("stream_match"), config.get("signatures"))
+
+
+def load_plan_registry(config: Mapping[str, Mapping[str, Any]]) -> Dict[str, ExtractionPlan]:
+    """
+    宣言的な設定からリストタイプ名 -> 抽出プランのレジストリを作る。
+    dict の順番がそのままリストタイプ検出の優先順になる。
+    """
+    return {list_type: build_plan(list_type, plan_config) for list_type, plan_config in config.items()}
+
+
+def load_plan_registry_from_file(config_file_path: str) -> Dict[str, ExtractionPlan]:
+    """JSONファイルに書かれた設定から抽出プランのレジストリを作る"""
+    with open(config_file_path, 'r', encoding='utf-8') as f:
+        return load_plan_registry(json.load(f))
+
+
+# インポート時に一度だけコンパイルされるデフォルトのレジストリ
+PLAN_REGISTRY: Dict[str, ExtractionPlan] = load_plan_registry(DEFAULT_PLAN_CONFIG)
+
+
+def probe_plans(document: Union[bytes, str], plans: Optional[Mapping[str, ExtractionPlan]] = None) -> Dict[str, ExtractionPlan]:
+    """
+    DOMを作る前に生のHTMLをシグネチャと照合し、そのページでありうるリストタイプのプランだけを優先順のまま返す。
+    空の辞書が返った場合は、どのリストタイプのアイテムも見つからないことが確定している。
+    """
+    return {list_type: plan for list_type, plan in (plans if plans is not None else PLAN_REGISTRY).items() if plan.probe(document)}
+
+
+def detect_items(soup: Tag, plans: Optional[Mapping[str, ExtractionPlan]] = None) -> Tuple[Optional[ExtractionPlan], List[Tag]]:
+    """
+    レジストリの優先順にアイテムセレクタを試し、最初に一致したプランとアイテムのリストを返す。
+    どのプランにも一致しなかった場合は (None, []) を返す。
+    """
+    for plan in (plans if plans is not None else PLAN_REGISTRY).values():
+        items = plan.select_items(soup)
+        if items:
+            return plan, items
+    return None, []
+
+
+# --- フィールドごとの抽出関数 ---
+# いずれも (item, plan, product_info, link_tag, texts) を受け取り、product_info を直接更新して、
+# 値を見つけた段階 (extraction_stats.TIER_*) を返す。
+# ヒューリスティックの段階では、候補のテキストを get_text() で作り直さずに、アイテムのテキスト索引 (texts) から引く。
+
+def _extract_product_url(item: Tag, plan: ExtractionPlan, product_info: ProductInfo, link_tag: Optional[Tag], texts: SoupTextIndex) -> str:
+    if link_tag:
+        href_value = link_tag.get('href')
+        if isinstance(href_value, str):
+            product_info['product_url'] = href_value
+            return TIER_PRIMARY
+    return TIER_NONE
+
+
+def _find_main_image(item: Tag, plan: ExtractionPlan, link_tag: Optional[Tag]) -> Tuple[Optional[Tag], str]:
+    # 1. Prioritize image within the main product link (a.contents)
+    if link_tag:
+        main_img_tag = plan.link_img.select_one(link_tag)
+        if main_img_tag:
+            return main_img_tag, TIER_PRIMARY
+
+    # 2. If not found in link, try other common places with specific selectors
+    for selector in plan.image_fallbacks:
+        main_img_tag = selector.select_one(item)
+        if main_img_tag:
+            return main_img_tag, TIER_FALLBACK
+
+    # 3. If still not found, try a more general img selector within the item (heuristic)
+    #    Filter out known icons or non-product images
+    for img in plan.image_candidates.iselect(item):
+        src_candidate = img.get('src') or img.get('data-src')
+        if isinstance(src_candidate, str) and len(src_candidate) > 10:
+            alt = img.get('alt', '').lower()
+            if 'icon' not in alt and 'flag' not in alt and 'overlay' not in alt and 'logo' not in alt and 'qr code' not in alt:
+                if not src_candidate.startswith('data:') and not src_candidate.endswith('.svg') and not src_candidate.endswith('.gif'):
+                    if '/file/' in src_candidate or 'img.susercontent.com' in src_candidate:
+                        return img, TIER_HEURISTIC  # Take the first plausible one
+    return None, TIER_NONE
+
+
+def normalize_image_url(src: Any) -> Optional[str]:
+    """img の src / data-src の値を Shopee CDN の絶対URLに変換する。変換できなければ None"""
+    if not isinstance(src, str) or not src:
+        return None
+    image_url = None
+    if src.startswith('http'):
+        image_url = src
+    elif src.startswith('//'):  # Handle protocol-relative URLs
+        image_url = 'https:' + src
+    elif src.startswith('/file/'):  # Specific Shopee CDN root-relative pattern
+        match = RE_IMAGE_FILE_PATH.search(src)
+        if match:
+            image_url = f"{SHOPEE_SG_IMAGE_BASE_URL}{match.group(1)}"
+
+    # Handle relative paths (e.g., just "filename.webp" or "path/to/filename.webp")
+    if image_url is None:
+        try:
+            image_filename = os.path.basename(src)
+            if image_filename and '.' in image_filename and len(image_filename) > 3:
+                if RE_IMAGE_FILENAME.match(image_filename):  # e.g., filename_tn.webp
+                    image_url = f"{SHOPEE_SG_IMAGE_BASE_URL}{image_filename}"
+        except Exception:
+            pass
+    return image_url
+
+
+def _extract_image_url(item: Tag, plan: ExtractionPlan, product_info: ProductInfo, link_tag: Optional[Tag], texts: SoupTextIndex) -> str:
+    image_url = None
+    main_img_tag, tier = _find_main_image(item, plan, link_tag)
+    if main_img_tag:
+        src = main_img_tag.get('src')
+        if not src:  # If src is empty or missing, try data-src
+            src = main_img_tag.get('data-src')
+        image_url = normalize_image_url(src)
+    product_info['image_url'] = image_url  # image_url will be None if not found or parsed
+    return tier if image_url is not None else TIER_NONE
+
+
+def is_plausible_location_candidate(text: str) -> bool:
+    """ロケーションのフォールバック候補として妥当なテキストか（販売数・評価・価格らしいものを除外）"""
+    if text and 1 < len(text) < 50 and RE_HAS_LETTER_OR_SPACE.search(text):
+        text_lower = text.lower()
+        if "sold" not in text_lower and "%" not in text_lower and not RE_NUMERIC_ONLY.match(text) and not RE_CURRENCY_SYMBOL.search(text):
+            if not RE_PAGE_COUNT.match(text):  # e.g., "1 / 5"
+                return True
+    return False
+
+
+def _extract_location(item: Tag, plan: ExtractionPlan, product_info: ProductInfo, link_tag: Optional[Tag], texts: SoupTextIndex) -> str:
+    location = None
+    tier = TIER_NONE
+    # 1. Try the primary selector (known class structure)
+    location_tag = plan.location_primary.select_one(item)
+    if isinstance(location_tag, Tag):
+        location = location_tag.get_text(strip=True)
+        tier = TIER_PRIMARY
+
+    # 2. If not found, try finding the location icon and getting text next to it
+    if location is None:
+        location_icon = plan.location_icon.select_one(item)
+        if location_icon:
+            location_candidates = [location_icon.find_parent()] + location_icon.find_parents(limit=2) + location_icon.find_next_siblings(limit=2)
+            for container in location_candidates:
+                if container and isinstance(container, Tag):
+                    text = texts.text(container)
+                    # Clean text to remove icon's alt text if present
+                    text = text.replace(location_icon.get('alt', ''), '').strip()
+                    if text and 1 < len(text) < 50 and RE_HAS_LETTER_OR_SPACE.search(text):
+                        location = text
+                        tier = TIER_FALLBACK
+                        break
+
+    # 3. If still not found, try finding elements with class names suggesting location or shipping in common areas
+    if location is None:
+        for candidate in plan.location_candidates.iselect(item):
+            text = texts.text(candidate)
+            if is_plausible_location_candidate(text):
+                location = text
+                tier = TIER_HEURISTIC
+                break
+
+    product_info['location'] = location  # location will be None if not found by any method
+    return tier
+
+
+def shop_type_from_flag_src(img_src: Any) -> Optional[str]:
+    """フラグ画像の src からショップタイプを判定する。判定できなければ None"""
+    if not isinstance(img_src, str):
+        return None
+    preferred_mall_suffix = None
+    filename = os.path.basename(img_src)
+    base_name = os.path.splitext(filename)[0]
+    match = RE_FLAG_SUFFIX.search(base_name)
+    if match:
+        preferred_mall_suffix = match.group(1)
+    # Also check for known suffixes if the filename ends with them
+    elif base_name.endswith(PREFERRED_SRC_SUFFIX):
+        preferred_mall_suffix = PREFERRED_SRC_SUFFIX
+    elif base_name.endswith(MALL_SRC_SUFFIX):
+        preferred_mall_suffix = MALL_SRC_SUFFIX
+    elif base_name.endswith(OFFICIAL_STORE_SUFFIX):
+        preferred_mall_suffix = OFFICIAL_STORE_SUFFIX
+
+    if preferred_mall_suffix == PREFERRED_SRC_SUFFIX:
+        return 'Preferred'
+    elif preferred_mall_suffix == MALL_SRC_SUFFIX:
+        return 'Mall'
+    elif preferred_mall_suffix == OFFICIAL_STORE_SUFFIX:
+        return 'Official Store'
+    return None
+
+
+def clean_product_name(name_text: str) -> Optional[str]:
+    """商品名から "[Preferred]" などのショップタイプ表記を取り除く"""
+    name_text = RE_SHOP_TYPE_LABEL.sub('', name_text).strip()
+    return name_text if name_text else None
+
+
+def _extract_name_and_shop_type(item: Tag, plan: ExtractionPlan, product_info: ProductInfo, link_tag: Optional[Tag], texts: SoupTextIndex) -> str:
+    product_name = None
+    shop_type = 'Standard'  # Default shop type
+    name_div = None
+    tier = TIER_NONE
+    for i, selector in enumerate(plan.name_containers):
+        name_div = selector.select_one(item)
+        if name_div:
+            tier = TIER_PRIMARY if i == 0 else TIER_FALLBACK
+            break
+
+    if name_div:
+        product_name = clean_product_name(name_div.get_text(strip=True))
+
+        # Shop Type (based on flag image near the name or within the item)
+        shop_type_img = plan.flag_in_name.select_one(name_div)
+        if not shop_type_img:
+            for selector in plan.flag_fallbacks:
+                shop_type_img = selector.select_one(item)
+                if shop_type_img:
+                    break
+
+        if shop_type_img:
+            try:
+                shop_type = shop_type_from_flag_src(shop_type_img.get('src')) or shop_type
+            except Exception:
+                pass  # Suppress frequent image processing errors unless crucial
+
+    product_info['product_name'] = product_name
+    product_info['shop_type'] = shop_type  # Will be 'Standard' if not found/determined
+    return tier if product_name is not None else TIER_NONE
+
+
+def parse_price_text(text: str) -> Optional[float]:
+    try:
+        return float(text.replace(',', ''))
+    except (ValueError, TypeError):
+        return None
+
+
+def _extract_price_and_currency(item: Tag, plan: ExtractionPlan, product_info: ProductInfo, link_tag: Optional[Tag], texts: SoupTextIndex) -> str:
+    price = None
+    currency = None
+    tier = TIER_NONE
+    # Try common price/currency container first
+    price_container = plan.price_container.select_one(item)
+    if price_container:
+        currency_tag = plan.price_currency.select_one(price_container)
+        currency = currency_tag.get_text(strip=True) if currency_tag else None
+        price_span = plan.price_value.select_one(price_container)
+        if price_span:
+            price = parse_price_text(price_span.get_text(strip=True))
+            tier = TIER_PRIMARY
+
+    # If price wasn't found, try alternative common selectors
+    if price is None:
+        alt_price_span = plan.price_alt.select_one(item)
+        if alt_price_span:
+            price = parse_price_text(alt_price_span.get_text(strip=True))
+            tier = TIER_FALLBACK
+
+    # Try a more general price text pattern if still not found (heuristic)
+    if price is None:
+        for candidate in plan.price_candidates.iselect(item):
+            text = texts.text(candidate)
+            if text and 1 < len(text) < 30 and RE_NUMBER.search(text):
+                num_match = RE_NUMBER.search(text.replace(',', ''))
+                currency_match = RE_CURRENCY_SYMBOL.search(text)
+                if num_match:
+                    try:
+                        price = float(num_match.group(0))
+                        tier = TIER_HEURISTIC
+                        if currency_match and currency is None:
+                            currency = currency_match.group(0)
+                        break  # Found a price, stop searching
+                    except (ValueError, TypeError):
+                        pass
+
+    product_info['price'] = price
+    product_info['currency'] = "SGD" if currency == "$" else currency
+    return tier if price is not None else TIER_NONE
+
+
+def parse_sold_text(sold_text: str) -> int:
+    """"1.2k sold" のようなテキストを販売数の整数に変換する。変換できなければ 0"""
+    match = RE_SOLD.search(sold_text)
+    if match:
+        try:
+            sold_num = float(match.group(1).replace(',', ''))
+            if match.group(2):  # Handle 'k' suffix
+                sold_num *= 1000
+            return int(sold_num)
+        except (ValueError, TypeError):
+            pass
+    return 0
+
+
+def _extract_sold(item: Tag, plan: ExtractionPlan, product_info: ProductInfo, link_tag: Optional[Tag], texts: SoupTextIndex) -> str:
+    sold_text = None
+    tier = TIER_NONE
+    for i, selector in enumerate(plan.sold_primary):
+        sold_div = selector.select_one(item)
+        if sold_div:
+            sold_text = sold_div.get_text(strip=True)
+            tier = TIER_PRIMARY if i == 0 else TIER_FALLBACK
+            break
+    if sold_text is None:
+        # Look for text "sold" in common areas like footer spans/divs
+        for candidate in plan.sold_candidates.iselect(item):
+            candidate_text = texts.text(candidate)
+            if "sold" in candidate_text.lower():
+                sold_text = candidate_text
+                tier = TIER_HEURISTIC
+                break
+
+    product_info['sold'] = parse_sold_text(sold_text) if sold_text is not None else 0
+    return tier
+
+
+# (エラーメッセージ・計測用のラベル, 抽出関数, エラー時に設定するデフォルト値) を抽出順に並べたもの
+FieldExtractor = Callable[[Tag, ExtractionPlan, ProductInfo, Optional[Tag], SoupTextIndex], str]
+FIELD_EXTRACTORS: Tuple[Tuple[str, FieldExtractor, ProductInfo], ...] = (
+    ("product_url", _extract_product_url, {}),
+    ("image_url", _extract_image_url, {}),
+    ("location", _extract_location, {}),
+    ("product_name/shop_type", _extract_name_and_shop_type, {"shop_type": 'Standard'}),
+    ("price/currency", _extract_price_and_currency, {}),
+    ("sold count", _extract_sold, {"sold": 0}),
+)
+
+
+def new_product_info() -> ProductInfo:
+    """抽出結果の初期値（キーの順番は出力の列順になる）"""
+    return {
+        "product_name": None,
+        "price": None,
+        "currency": None,
+        "image_url": None,
+        "product_url": None,
+        "location": None,  # 必須
+        "sold": 0,  # 必須, Default value
+        "shop_type": None,  # 必須, Default determined later
+    }
+
+
+# 抽出結果の入れ物を作る関数 (new_product_info または product_record.ProductRecord)
+RecordFactory = Callable[[], Any]
+
+
+def run_field_extractors(
+    extractors: Tuple[Tuple[str, Callable[..., str], ProductInfo], ...],
+    item: Any,
+    plan: Any,
+    product_info: Any,
+    link_tag: Any,
+    texts: Any,
+    position: int,
+    stats: Optional[ExtractionStats] = None,
+) -> None:
+    """
+    フィールドの抽出関数を順に実行する (bs4 / lxml バックエンド共通)。
+    `stats` を渡した場合だけ、フィールドごとの所要時間と値を見つけた段階を記録する。
+    """
+    if stats is None:
+        for label, extractor, defaults in extractors:
+            try:
+                extractor(item, plan, product_info, link_tag, texts)
+            except Exception as e:
+                print(f"  アイテム {position+1}: {label} 抽出中にエラーが発生しました: {e}")
+                product_info.update(defaults)
+        return
+
+    stats.items += 1
+    perf_counter = time.perf_counter
+    for label, extractor, defaults in extractors:
+        started = perf_counter()
+        try:
+            tier = extractor(item, plan, product_info, link_tag, texts)
+        except Exception as e:
+            print(f"  アイテム {position+1}: {label} 抽出中にエラーが発生しました: {e}")
+            product_info.update(defaults)
+            tier = TIER_ERROR
+            stats.record_error(label, position, e)
+        stats.record(label, tier, perf_counter() - started)
+
+
+def extract_item(
+    item: Tag,
+    plan: ExtractionPlan,
+    position: int,
+    record_factory: RecordFactory = new_product_info,
+    stats: Optional[ExtractionStats] = None,
+) -> Any:
+    """
+    1アイテムを抽出プランに通して商品情報の辞書を作る。
+    各フィールドの抽出でエラーが発生しても、可能な限り処理を続行する。
+
+    Args:
+        item: 商品アイテムのタグ。
+        plan: リストタイプに対応する抽出プラン。
+        position: ページ内でのアイテムの位置 (0始まり、エラーメッセージ用)。
+        record_factory: 抽出結果の入れ物を作る関数。省略時は辞書 (`new_product_info`)。
+            `ProductRecord` を渡すと、辞書の代わりに `__slots__` のレコードを返す。
+        stats: 渡された場合、フィールドごとの所要時間と値を見つけた段階を記録する (`extraction_stats.py`)。
+    """
+    product_info = record_factory()
+    # a.contents は商品URLと画像の両方で使うので、1回だけ探す
+    link_tag = plan.link.select_one(item)
+    # ヒューリスティックの段階に入ったときだけ、アイテム内の全要素のテキストを1回で索引にする
+    texts = SoupTextIndex(item)
+    run_field_extractors(FIELD_EXTRACTORS, item, plan, product_info, link_tag, texts, position, stats)
+    return product_info
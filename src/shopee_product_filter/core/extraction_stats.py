@@ -0,0 +1,113 @@
+"""
+フィールド抽出の計測 (フィールドごとの所要時間と、値を見つけたフォールバック段階の集計)
+
+各フィールドの抽出関数は、主要セレクタ → 代替のセレクタ → `span, div` などを総なめして
+テキストで判定するヒューリスティック、の順に試す。Shopee がマークアップを変更すると主要セレクタが外れ、
+重いヒューリスティックの段階が黙って使われるようになって取り込み時間が伸びるが、結果の件数は変わらないので気づけない。
+
+抽出関数はどの段階で値が見つかったかを返す。`extract_item` / `extract_item_lxml` に `ExtractionStats` を
+渡した場合だけ、フィールドごとの所要時間・段階ごとの件数・エラーを集計する
+(渡さなければ計時もしないので、通常の解析の速度には影響しない)。
+"""
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+# 値を見つけた段階
+TIER_PRIMARY = "primary"  # 主要セレクタ
+TIER_FALLBACK = "fallback"  # 代替のセレクタ (アイコンの隣のテキストなども含む)
+TIER_HEURISTIC = "heuristic"  # 候補の要素を総なめしてテキストで判定
+TIER_NONE = "none"  # どの段階でも見つからなかった
+TIER_ERROR = "error"  # 抽出中に例外が発生した
+TIERS = (TIER_PRIMARY, TIER_FALLBACK, TIER_HEURISTIC, TIER_NONE, TIER_ERROR)
+
+# 保持するエラーメッセージの最大数 (件数はすべて数える)
+MAX_ERROR_SAMPLES = 20
+
+
+class ExtractionStats:
+    """
+    フィールドの抽出結果の集計。1ファイル分でも、複数ファイル分を `merge` でまとめたものでもよい。
+
+    フィールド名は `FIELD_EXTRACTORS` のラベル ("image_url", "price/currency" など)。
+    """
+
+    def __init__(self) -> None:
+        self.items = 0
+        self.seconds: Dict[str, float] = {}
+        self.tiers: Dict[str, Dict[str, int]] = {}
+        self.error_samples: List[str] = []
+
+    def __repr__(self) -> str:
+        return f"ExtractionStats(items={self.items}, fields={list(self.tiers)})"
+
+    def record(self, label: str, tier: Optional[str], seconds: float) -> None:
+        """1アイテムの1フィールド分の結果を記録する"""
+        tier = tier or TIER_NONE
+        self.seconds[label] = self.seconds.get(label, 0.0) + seconds
+        counts = self.tiers.setdefault(label, {})
+        counts[tier] = counts.get(tier, 0) + 1
+
+    def record_error(self, label: str, position: int, error: Exception) -> None:
+        """抽出中の例外のメッセージを記録する (段階の件数は `record` で TIER_ERROR として数える)"""
+        if len(self.error_samples) < MAX_ERROR_SAMPLES:
+            self.error_samples.append(f"アイテム {position+1}: {label}: {type(error).__name__}: {error}")
+
+    def merge(self, other: "ExtractionStats") -> None:
+        """他の集計を足し込む"""
+        self.items += other.items
+        for label, seconds in other.seconds.items():
+            self.seconds[label] = self.seconds.get(label, 0.0) + seconds
+        for label, counts in other.tiers.items():
+            merged = self.tiers.setdefault(label, {})
+            for tier, count in counts.items():
+                merged[tier] = merged.get(tier, 0) + count
+        room = MAX_ERROR_SAMPLES - len(self.error_samples)
+        if room > 0:
+            self.error_samples.extend(other.error_samples[:room])
+
+    def tier_share(self, label: str, tier: str) -> float:
+        """フィールドの全抽出のうち、指定した段階で終わった割合 (0〜1)"""
+        counts = self.tiers.get(label)
+        if not counts:
+            return 0.0
+        return counts.get(tier, 0) / sum(counts.values())
+
+    def degraded_fields(self, threshold: float, tiers: Tuple[str, ...] = (TIER_HEURISTIC, TIER_ERROR)) -> Dict[str, float]:
+        """ヒューリスティック (とエラー) の割合が閾値以上のフィールドと、その割合を返す"""
+        degraded = {}
+        for label in self.tiers:
+            share = sum(self.tier_share(label, tier) for tier in tiers)
+            if share >= threshold:
+                degraded[label] = share
+        return degraded
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSONにできる辞書に変換する (APIのレスポンスやプロセス間の受け渡し用)"""
+        return {
+            "items": self.items,
+            "fields": {
+                label: {"seconds": self.seconds.get(label, 0.0), "tiers": dict(counts)}
+                for label, counts in self.tiers.items()
+            },
+            "error_samples": list(self.error_samples),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "ExtractionStats":
+        """`to_dict` の結果から戻す"""
+        stats = cls()
+        stats.items = data.get("items", 0)
+        for label, field in (data.get("fields") or {}).items():
+            stats.seconds[label] = field.get("seconds", 0.0)
+            stats.tiers[label] = dict(field.get("tiers") or {})
+        stats.error_samples = list(data.get("error_samples") or [])
+        return stats
+
+    def format_lines(self) -> List[str]:
+        """フィールドごとの 1アイテムあたりの時間と段階の割合を、表示用の行にする"""
+        lines = []
+        for label, counts in self.tiers.items():
+            total = sum(counts.values())
+            per_item_us = self.seconds.get(label, 0.0) / total * 1e6 if total else 0.0
+            shares = " ".join(f"{tier}={counts[tier] / total:.0%}" for tier in TIERS if counts.get(tier))
+            lines.append(f"{label:<24} {per_item_us:>8.0f} µs/件  {shares}")
+        return lines
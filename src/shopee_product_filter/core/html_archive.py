@@ -0,0 +1,217 @@
+"""
+圧縮・アーカイブされた商品リストHTMLの読み込み (gzip / zstd / zip)
+
+保存したページは非圧縮だと数十GBになるため、`.html.gz` / `.html.zst` に圧縮したり、
+多数のページを `.zip` にまとめたりして保管している。
+
+このモジュールは、それらをディスクに展開せずに、ページ単位でストリームとして読み込む。
+- `.gz` / `.zst` は1ページ分として、読み進めながら展開する (`open_html_stream`)。
+- `.zip` はメンバー (中の `.html` / `.htm`、およびそれを gzip / zstd で圧縮したもの) を1つずつ開く
+  (`iter_html_streams`)。zip の中のメンバーは「アーカイブのパス!メンバー名」の形式で指定できる。
+- 形式はファイル名ではなく先頭のマジックナンバーで判定するので、拡張子が付いていないアップロードでも扱える。
+
+zstd の展開には、Python 3.14 以降は標準ライブラリの `compression.zstd` を、それより前は
+`zstandard` パッケージ (使う場合のみ必要。`uv sync --extra zstd`) を使う。
+"""
+import gzip
+import io
+import os
+import zipfile
+from contextlib import contextmanager
+from typing import IO, Iterator, List, Optional, Tuple, Union
+
+# 「アーカイブのパス!メンバー名」の区切り文字
+MEMBER_SEPARATOR = "!"
+
+HTML_SUFFIXES = (".html", ".htm")
+COMPRESSED_SUFFIXES = (".gz", ".zst")
+ARCHIVE_SUFFIXES = (".zip",)
+
+FORMAT_GZIP = "gzip"
+FORMAT_ZSTD = "zstd"
+FORMAT_ZIP = "zip"
+_MAGIC_NUMBERS = (
+    (b"\x1f\x8b", FORMAT_GZIP),
+    (b"\x28\xb5\x2f\xfd", FORMAT_ZSTD),
+    (b"PK\x03\x04", FORMAT_ZIP),
+    (b"PK\x05\x06", FORMAT_ZIP),  # メンバーのない zip
+)
+_MAGIC_LENGTH = 4
+
+HtmlInput = Union[bytes, bytearray, memoryview, IO[bytes]]
+
+
+def is_html_name(name: str) -> bool:
+    """`.html` / `.htm` と、それを gzip / zstd で圧縮したファイル名か"""
+    name = name.lower()
+    for suffix in COMPRESSED_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+            break
+    return name.endswith(HTML_SUFFIXES)
+
+
+def is_archive_name(name: str) -> bool:
+    """複数のページをまとめたアーカイブ (`.zip`) のファイル名か"""
+    return name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def detect_format(head: bytes) -> Optional[str]:
+    """先頭のバイト列から圧縮・アーカイブの形式を判定する。非圧縮のHTMLなら None"""
+    for magic, fmt in _MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return fmt
+    return None
+
+
+def _peek(stream: IO[bytes]) -> Tuple[bytes, IO[bytes]]:
+    """ストリームの先頭を読み進めずに覗く。覗けないストリームは先頭を読んでつなぎ直したものを返す"""
+    peek = getattr(stream, "peek", None)
+    if peek is not None:
+        return peek(_MAGIC_LENGTH)[:_MAGIC_LENGTH], stream
+    if stream.seekable():
+        position = stream.tell()
+        head = stream.read(_MAGIC_LENGTH)
+        stream.seek(position)
+        return head, stream
+    head = stream.read(_MAGIC_LENGTH)
+    return head, _PrefixedStream(head, stream)
+
+
+class _PrefixedStream(io.RawIOBase):
+    """先に読んでしまったバイト列を、元のストリームの前につなげて読めるようにする"""
+
+    def __init__(self, prefix: bytes, stream: IO[bytes]):
+        self._prefix = prefix
+        self._stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: bytearray) -> int:  # type: ignore[override]
+        if self._prefix:
+            n = min(len(buffer), len(self._prefix))
+            buffer[:n] = self._prefix[:n]
+            self._prefix = self._prefix[n:]
+            return n
+        data = self._stream.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+def _open_zstd(stream: IO[bytes]) -> IO[bytes]:
+    try:
+        from compression import zstd  # type: ignore[import-not-found]  # Python 3.14 以降
+    except ImportError:
+        pass
+    else:
+        return zstd.ZstdFile(stream)
+    try:
+        import zstandard  # type: ignore[import-not-found]
+    except ImportError as e:
+        raise ImportError(".zst の展開には zstandard パッケージが必要です (uv sync --extra zstd)") from e
+    return zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True, closefd=False)
+
+
+def open_html_stream(stream: IO[bytes]) -> IO[bytes]:
+    """
+    1ページ分のストリームを、gzip / zstd で圧縮されていれば読み進めながら展開するストリームにして返す
+    (非圧縮ならそのまま返す)。
+
+    Raises:
+        ValueError: zip アーカイブが渡された場合 (`iter_html_streams` を使うこと)。
+        ImportError: zstd の展開に必要なモジュールがない場合。
+    """
+    head, stream = _peek(stream)
+    fmt = detect_format(head)
+    if fmt == FORMAT_GZIP:
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    if fmt == FORMAT_ZSTD:
+        return _open_zstd(stream)
+    if fmt == FORMAT_ZIP:
+        raise ValueError("zip アーカイブには複数のページが含まれるため、iter_html_streams で1ページずつ開いてください。")
+    return stream
+
+
+@contextmanager
+def decompressed(stream: IO[bytes]) -> Iterator[IO[bytes]]:
+    """`open_html_stream` のコンテキストマネージャー版。展開用のストリームだけを閉じ、渡されたストリームは閉じない"""
+    page = open_html_stream(stream)
+    try:
+        yield page
+    finally:
+        if page is not stream:
+            page.close()
+
+
+def split_member(path: str) -> Tuple[str, Optional[str]]:
+    """「アーカイブのパス!メンバー名」を (アーカイブのパス, メンバー名) に分ける。メンバーの指定がなければ None"""
+    archive, sep, member = path.partition(MEMBER_SEPARATOR)
+    if sep and is_archive_name(archive) and not os.path.exists(path):
+        return archive, member
+    return path, None
+
+
+@contextmanager
+def open_html(path: str) -> Iterator[IO[bytes]]:
+    """
+    HTMLファイル (圧縮されていてもよい) または「アーカイブのパス!メンバー名」を開き、
+    展開済みのHTMLを読めるバイナリストリームを返すコンテキストマネージャー。
+
+    Raises:
+        FileNotFoundError: ファイルまたはアーカイブのメンバーが見つからない場合。
+    """
+    archive_path, member = split_member(path)
+    with open(archive_path, 'rb') as f:
+        if member is None:
+            with decompressed(f) as stream:
+                yield stream
+            return
+        with zipfile.ZipFile(f) as archive:
+            try:
+                info = archive.getinfo(member)
+            except KeyError:
+                raise FileNotFoundError(f"アーカイブにメンバーが見つかりません: {path}") from None
+            with archive.open(info) as member_file, decompressed(member_file) as stream:
+                yield stream
+
+
+def list_archive_members(archive_path: str) -> List[str]:
+    """アーカイブ内のHTMLページを「アーカイブのパス!メンバー名」のリストで返す (中央ディレクトリを読むだけで展開はしない)"""
+    with zipfile.ZipFile(archive_path) as archive:
+        return [
+            f"{archive_path}{MEMBER_SEPARATOR}{info.filename}"
+            for info in archive.infolist()
+            if not info.is_dir() and is_html_name(info.filename)
+        ]
+
+
+def iter_html_streams(source: HtmlInput, name: str = "") -> Iterator[Tuple[str, IO[bytes]]]:
+    """
+    アップロードされたファイルなど (バイト列またはバイナリストリーム) を、HTMLページ単位の
+    (ページ名, 展開済みのストリーム) に分けて返すジェネレータ。
+
+    非圧縮のHTMLと `.gz` / `.zst` は1ページ、zip アーカイブはHTMLのメンバーごとに1ページとして返す。
+    zip のページ名は「name!メンバー名」になる。各ストリームは、次のページに進むと閉じられる。
+    """
+    stream: IO[bytes] = io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source
+    head, stream = _peek(stream)
+    if detect_format(head) != FORMAT_ZIP:
+        with decompressed(stream) as page:
+            yield name, page
+        return
+    if not stream.seekable():
+        # zip は末尾の中央ディレクトリから読むため、シークできないストリームは読み込んでから開く
+        stream = io.BytesIO(stream.read())
+    with zipfile.ZipFile(stream) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not is_html_name(info.filename):
+                continue
+            with archive.open(info) as member_file, decompressed(member_file) as page:
+                yield f"{name}{MEMBER_SEPARATOR}{info.filename}", page
+
+
+def iter_html_pages(source: HtmlInput, name: str = "") -> Iterator[Tuple[str, bytes]]:
+    """`iter_html_streams` と同じだが、ページごとに展開済みのHTMLをバイト列で返す (一度に展開するのは1ページ分だけ)"""
+    for page_name, stream in iter_html_streams(source, name):
+        yield page_name, stream.read()
@@ -0,0 +1,233 @@
+"""
+バイト列レベルの簡易HTMLレキサー
+
+保存ページをチャンク単位で読み進めながら、タグ・テキスト・コメントなどのトークンに分解する。
+DOMツリーは作らず、未処理のバッファだけを保持するので、メモリ使用量はページサイズに依存しない
+(呼び出し側が `discard_rawtext` で捨てない RAWTEXT 要素は、その要素の大きさだけ保持する)。
+
+`<script>` / `<style>` などの中身は解析せず、開始タグから終了タグまでを1つの RAWTEXT トークンとして返す。
+厳密なHTML5のトークナイザではないが、保存ページのアイテム境界の検出や不要ノードの除去には十分な精度がある。
+"""
+import re
+from html import unescape
+from typing import IO, Callable, Dict, Iterator, List, Optional, Tuple
+
+# トークンの種類
+TEXT = "text"
+START = "start"
+END = "end"
+COMMENT = "comment"
+DECL = "decl"
+RAWTEXT = "rawtext"
+
+# 中身をHTMLとして解析しない要素
+RAWTEXT_ELEMENTS = frozenset({"script", "style", "textarea", "title", "xmp", "iframe", "noembed", "noframes"})
+# 終了タグを持たない要素
+VOID_ELEMENTS = frozenset({
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr",
+})
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_RE_START_TAG = re.compile(rb'<([a-zA-Z][^\t\n\f\r />]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>')
+_RE_END_TAG = re.compile(rb'</([a-zA-Z][^\t\n\f\r />]*)[^>]*>')
+_RAWTEXT_CLOSE = {
+    name: re.compile(rb'</' + name.encode('latin-1') + rb'[\t\n\f\r />]', re.IGNORECASE) for name in RAWTEXT_ELEMENTS
+}
+_RE_ATTR = re.compile(rb'([^\t\n\f\r "\'>/=]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\t\n\f\r >]+)))?')
+
+Token = Tuple[str, Optional[str], bytes]
+
+
+def parse_attrs(raw_start_tag: bytes) -> Dict[str, str]:
+    """開始タグのバイト列から属性の辞書を作る (属性名は小文字、値は文字参照を展開済み)"""
+    match = _RE_START_TAG.match(raw_start_tag)
+    if not match:
+        return {}
+    attrs: Dict[str, str] = {}
+    for attr_match in _RE_ATTR.finditer(match.group(2)):
+        name = attr_match.group(1).decode('latin-1').lower()
+        raw_value = next((g for g in attr_match.groups()[1:] if g is not None), b'')
+        attrs.setdefault(name, unescape(raw_value.decode('utf-8', errors='replace')))
+    return attrs
+
+
+def is_self_closing(raw_start_tag: bytes) -> bool:
+    """`<path ... />` のような自己終了タグかどうか"""
+    return raw_start_tag.endswith(b'/>')
+
+
+def is_void_tag(name: str, raw_start_tag: bytes) -> bool:
+    """終了タグを持たない (スタックに積まれない) 開始タグかどうか"""
+    return name in VOID_ELEMENTS or is_self_closing(raw_start_tag)
+
+
+def iter_html_tokens(
+    stream: IO[bytes],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    discard_rawtext: Optional[Callable[[str], bool]] = None,
+) -> Iterator[Token]:
+    """
+    バイナリストリームからHTMLトークンを順に返すジェネレータ。
+
+    Args:
+        discard_rawtext: RAWTEXT 要素の開始タグを読んだ時点で要素名を渡して呼ばれ、True を返すとその中身を
+            保持せずに読み飛ばす (トークンは開始タグと終了タグだけになる)。呼び出し側が読まない
+            アイテムの外側の巨大な `<script>` などを、メモリに載せずに済ませるために使う。
+
+    Yields:
+        (種類, 要素名 (START / END / RAWTEXT のみ、小文字), 元のバイト列)
+    """
+    buf = b''
+    pos = 0
+    eof = False
+
+    def fill() -> bool:
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    fill()
+    while True:
+        if pos >= len(buf):
+            if not fill():
+                return
+            continue
+
+        if buf[pos] != 0x3C:  # '<' 以外はテキスト
+            next_lt = buf.find(b'<', pos)
+            if next_lt == -1:
+                end = len(buf)
+            else:
+                end = next_lt
+            yield TEXT, None, buf[pos:end]
+            pos = end
+            continue
+
+        head = buf[pos:pos + 9]
+        if len(head) < 9 and not eof and fill():
+            continue
+
+        if head.startswith(b'<!--'):
+            end = buf.find(b'-->', pos + 4)
+            if end == -1:
+                if fill():
+                    continue
+                end = len(buf) - 3
+            yield COMMENT, None, buf[pos:end + 3]
+            pos = end + 3
+            continue
+
+        if head.startswith(b'<!') or head.startswith(b'<?'):
+            end = buf.find(b'>', pos)
+            if end == -1:
+                if fill():
+                    continue
+                end = len(buf) - 1
+            yield DECL, None, buf[pos:end + 1]
+            pos = end + 1
+            continue
+
+        if head.startswith(b'</'):
+            match = _RE_END_TAG.match(buf, pos)
+            if match is None:
+                if buf.find(b'>', pos) == -1 and fill():
+                    continue
+                yield TEXT, None, buf[pos:pos + 2]
+                pos += 2
+                continue
+            yield END, match.group(1).decode('latin-1').lower(), match.group(0)
+            pos = match.end()
+            continue
+
+        match = _RE_START_TAG.match(buf, pos)
+        if match is None:
+            if len(buf) - pos > 1 and not (0x41 <= buf[pos + 1] <= 0x5A or 0x61 <= buf[pos + 1] <= 0x7A):
+                yield TEXT, None, buf[pos:pos + 1]
+                pos += 1
+                continue
+            if fill():
+                continue
+            yield TEXT, None, buf[pos:pos + 1]
+            pos += 1
+            continue
+
+        name = match.group(1).decode('latin-1').lower()
+        if name in RAWTEXT_ELEMENTS and not is_self_closing(match.group(0)):
+            start_tag = match.group(0)
+            drop = discard_rawtext is not None and discard_rawtext(name)
+            close_pattern = _RAWTEXT_CLOSE[name]
+            # 終了タグの前までの中身 (捨てる場合は読んだそばから捨てる)
+            content: List[bytes] = []
+            pos = match.end()
+            while True:
+                close_match = close_pattern.search(buf, pos)
+                end = buf.find(b'>', close_match.end() - 1) if close_match else -1
+                if end != -1:
+                    break
+                # 終了タグの途中までが読み込まれている可能性のある末尾だけを残し、その前の中身を読み終えてから読み足す
+                # (読み足すたびに中身の先頭から探し直さないので、中身の大きさに比例する時間で済む)
+                keep = close_match.start() if close_match else max(pos, len(buf) - len(name) - 2)
+                if not drop:
+                    content.append(buf[pos:keep])
+                pos = keep
+                if not fill():
+                    break
+            if end == -1:
+                yield RAWTEXT, name, start_tag + b''.join(content) + (b'' if drop else buf[pos:])
+                pos = len(buf)
+                continue
+            assert close_match is not None
+            if not drop:
+                content.append(buf[pos:close_match.start()])
+            yield RAWTEXT, name, start_tag + b''.join(content) + buf[close_match.start():end + 1]
+            pos = end + 1
+            continue
+
+        yield START, name, match.group(0)
+        pos = match.end()
+
+
+class OpenElementStack:
+    """
+    開いている要素のスタック。終了タグの省略 (`<li>` の連続など) や void 要素を考慮して
+    ブラウザに近い形で要素の入れ子を追跡する。各エントリは (要素名, 開始タグのバイト列)。
+    """
+
+    def __init__(self) -> None:
+        self.entries: List[Tuple[str, bytes]] = []
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def push_start(self, name: str, raw: bytes) -> List[Tuple[str, bytes]]:
+        """開始タグを処理し、暗黙に閉じられた要素のリストを返す"""
+        closed: List[Tuple[str, bytes]] = []
+        if name == "li":
+            for index in range(len(self.entries) - 1, -1, -1):
+                open_name = self.entries[index][0]
+                if open_name in ("ul", "ol"):
+                    break
+                if open_name == "li":
+                    closed = self.entries[index:]
+                    del self.entries[index:]
+                    break
+        if not is_void_tag(name, raw):
+            self.entries.append((name, raw))
+        return closed
+
+    def pop_end(self, name: str) -> List[Tuple[str, bytes]]:
+        """終了タグを処理し、閉じられた要素のリストを返す (対応する開始タグがなければ何もしない)"""
+        for index in range(len(self.entries) - 1, -1, -1):
+            if self.entries[index][0] == name:
+                closed = self.entries[index:]
+                del self.entries[index:]
+                return closed
+        return []
@@ -0,0 +1,223 @@
+"""
+保存ページのスリム化 (商品グリッド以外のノードをバイト列レベルで取り除く前処理)
+
+保存した Shopee のページの大部分は `<script>` / `<style>` / インラインの SVG / トラッキング用のマークアップで、
+パーサーはそれらを読まない。それでも通常モードではページ全体のツリーを作るので、解析時間もメモリもページの大きさに比例する。
+
+`slim_html` は、HTMLレキサー (`html_lexer.py`) でページを先頭から読み進め、
+- いずれかのリストタイプのアイテムのコンテナ (`stream_match` に一致する要素) と、その祖先の開始タグだけを残し、
+- コンテナの中の `<script>` / `<style>` / `<svg>` とコメントを取り除いた
+小さなHTMLを作る。`<noscript>` / `<template>` の中身はパーサーが通常の要素として読む (遅延読み込みの商品画像が
+`<noscript><img ...></noscript>` にある場合など) ので残す。祖先の開始タグを残すので、子結合子を使ったアイテムのセレクタ
+(`div.shop-search-result-view > div.row > ...`) もそのまま一致し、抽出結果は元のページと同じになる。
+リストタイプの判定が元のページと変わらないよう、アイテムの検出は最初に一致したリストタイプに固定せず、全候補で行う。
+
+`write_slim_snapshot` はスリム化したページを元のファイルの隣に `<名前>.slim.html.gz` として保存する。
+長期保存用のスナップショットとして元のページの代わりに残しておけ、パーサーにもそのまま渡せる。
+スナップショットの先頭にはスリム化の規則のバージョン (`SLIM_FORMAT_VERSION`) を書き、`ensure_slim_snapshot` は
+古い規則で作ったスナップショットを作り直す。
+
+使い方 (プロジェクトのルートディレクトリで実行):
+    uv run python -m src.shopee_product_filter.core.html_slim saved_pages/
+"""
+import argparse
+import gzip
+import io
+import os
+import sys
+import tempfile
+from typing import IO, Iterator, List, Mapping, Optional, Tuple, Union
+
+from .extraction_plan import PLAN_REGISTRY, ExtractionPlan
+from .html_archive import COMPRESSED_SUFFIXES, HTML_SUFFIXES, open_html
+from .html_lexer import COMMENT, END, RAWTEXT, START, OpenElementStack, is_void_tag, iter_html_tokens
+from .streaming_parser import match_plan
+
+# アイテムの中から取り除く RAWTEXT 要素 (開始タグから終了タグまでが1トークン)
+DROP_RAWTEXT = frozenset({"script", "style"})
+# アイテムの中から部分木ごと取り除く要素 (パーサーが中身を読む noscript / template は残す)
+DROP_ELEMENTS = frozenset({"svg"})
+# スリム化の規則のバージョン。取り除く要素を変えたら上げること (古いスナップショットは作り直される)
+SLIM_FORMAT_VERSION = 2
+# スリム化したページの先頭 (元のページの <head> は残さないので、文字コードと規則のバージョンだけを書く)
+SLIM_PREAMBLE = b'<!DOCTYPE html>\n<meta charset="utf-8">\n<!-- shopee-slim:%d -->\n' % SLIM_FORMAT_VERSION
+SLIM_SUFFIX = ".slim.html.gz"
+
+Entry = Tuple[str, bytes]
+
+
+def _sync_ancestors(emitted: List[Entry], ancestors: List[Entry]) -> Iterator[bytes]:
+    """出力中で開いている祖先を、次のアイテムの祖先に合わせる (不要な祖先を閉じ、足りない祖先を開く)"""
+    common = 0
+    while common < len(emitted) and common < len(ancestors) and emitted[common] is ancestors[common]:
+        common += 1
+    for name, _ in reversed(emitted[common:]):
+        yield b'</' + name.encode('latin-1') + b'>'
+    for _, raw in ancestors[common:]:
+        yield raw
+    emitted[:] = ancestors
+
+
+def iter_slim_html(stream: IO[bytes], plans: Optional[Mapping[str, ExtractionPlan]] = None) -> Iterator[bytes]:
+    """スリム化したHTMLをバイト列の断片として順に返すジェネレータ (元のページ全体はメモリに読み込まない)"""
+    candidates = [plan for plan in (plans if plans is not None else PLAN_REGISTRY).values() if plan.stream_match]
+    stack = OpenElementStack()
+    emitted: List[Entry] = []
+    item_depth: Optional[int] = None  # 出力中のアイテムのスタックの深さ
+    skip_depth: Optional[int] = None  # 取り除いている部分木のスタックの深さ
+
+    yield SLIM_PREAMBLE
+    def discard_rawtext(name: str) -> bool:
+        """出力しない script / style などは、中身をバッファに溜めずに読み飛ばす"""
+        return item_depth is None or skip_depth is not None or name in DROP_RAWTEXT
+
+    for kind, name, raw in iter_html_tokens(stream, discard_rawtext=discard_rawtext):
+        if kind == START:
+            assert name is not None
+            closed = stack.push_start(name, raw)
+            pushed = not is_void_tag(name, raw)
+            if item_depth is not None and closed and len(stack) - pushed < item_depth:
+                # `<li>` の連続などで、出力中のアイテムが暗黙に閉じられた
+                item_depth = skip_depth = None
+            if item_depth is None:
+                ancestors = stack.entries[:-1] if pushed else stack.entries
+                if pushed and match_plan(name, raw, ancestors, candidates) is not None:
+                    yield from _sync_ancestors(emitted, ancestors)
+                    item_depth = len(stack)
+                    yield raw
+                continue
+            if skip_depth is not None:
+                continue
+            if name in DROP_ELEMENTS:
+                if pushed:
+                    skip_depth = len(stack)
+                continue
+            yield raw
+            continue
+
+        if kind == END:
+            assert name is not None
+            stack.pop_end(name)
+            if item_depth is None:
+                continue
+            if skip_depth is not None:
+                if len(stack) < skip_depth:
+                    skip_depth = None
+                if len(stack) < item_depth:
+                    item_depth = skip_depth = None
+                continue
+            yield raw
+            if len(stack) < item_depth:
+                item_depth = None
+            continue
+
+        if item_depth is None or skip_depth is not None or kind == COMMENT:
+            continue
+        if kind == RAWTEXT and name in DROP_RAWTEXT:
+            continue
+        yield raw
+
+    yield from _sync_ancestors(emitted, [])
+
+
+def slim_html(source: Union[bytes, IO[bytes]], plans: Optional[Mapping[str, ExtractionPlan]] = None) -> bytes:
+    """HTMLのバイト列またはバイナリストリームをスリム化したバイト列を返す"""
+    stream = io.BytesIO(source) if isinstance(source, bytes) else source
+    return b''.join(iter_slim_html(stream, plans))
+
+
+def slim_path_for(html_file_path: str) -> str:
+    """元のページのパスから、スリム化したスナップショットのパス (`<名前>.slim.html.gz`) を作る"""
+    base = html_file_path
+    for suffixes in (COMPRESSED_SUFFIXES, HTML_SUFFIXES):
+        for suffix in suffixes:
+            if base.lower().endswith(suffix):
+                base = base[: -len(suffix)]
+                break
+    return base + SLIM_SUFFIX
+
+
+def is_slim_snapshot(path: str) -> bool:
+    return path.lower().endswith(SLIM_SUFFIX)
+
+
+def write_slim_snapshot(
+    html_file_path: str,
+    output_path: Optional[str] = None,
+    plans: Optional[Mapping[str, ExtractionPlan]] = None,
+) -> str:
+    """
+    ページ (圧縮ファイルでもよい) をスリム化して保存し、保存先のパスを返す。
+    保存先を省略した場合は元のファイルの隣 (`slim_path_for`)。`.gz` で終わる保存先は gzip で圧縮する。
+    一時ファイルに書いてから置き換えるので、並列に実行しても壊れたスナップショットは読まれない。
+    """
+    output_path = output_path or slim_path_for(html_file_path)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as raw_file, open_html(html_file_path) as stream:
+            out: IO[bytes] = gzip.GzipFile(fileobj=raw_file, mode='wb', mtime=0) if output_path.lower().endswith(".gz") else raw_file
+            with out:
+                for chunk in iter_slim_html(stream, plans):
+                    out.write(chunk)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return output_path
+
+
+def _is_current_snapshot(snapshot_path: str) -> bool:
+    """スナップショットが今のスリム化の規則で作られたものか (先頭が SLIM_PREAMBLE と同じか)"""
+    with open_html(snapshot_path) as stream:
+        return stream.read(len(SLIM_PREAMBLE)) == SLIM_PREAMBLE
+
+
+def ensure_slim_snapshot(html_file_path: str, plans: Optional[Mapping[str, ExtractionPlan]] = None) -> str:
+    """
+    元のファイルの隣のスナップショットが元のファイルより新しく、今のスリム化の規則で作られたものであればそのパスを、
+    そうでなければ作り直して返す
+    """
+    if is_slim_snapshot(html_file_path):
+        return html_file_path
+    snapshot_path = slim_path_for(html_file_path)
+    try:
+        if os.path.getmtime(snapshot_path) >= os.path.getmtime(html_file_path) and _is_current_snapshot(snapshot_path):
+            return snapshot_path
+    except (OSError, EOFError):
+        pass
+    return write_slim_snapshot(html_file_path, snapshot_path, plans)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from .batch_parse import expand_inputs
+
+    parser = argparse.ArgumentParser(description='保存したShopeeの商品リストHTMLをスリム化したスナップショットを元のファイルの隣に保存する')
+    parser.add_argument('inputs', nargs='+', help='HTMLファイル、ディレクトリ、またはglobパターン (複数指定可)')
+    parser.add_argument('--recursive', action='store_true', help='ディレクトリ指定時にサブディレクトリも探す')
+    parser.add_argument('--force', action='store_true', help='スナップショットが新しくても作り直す')
+    args = parser.parse_args(argv)
+
+    # zip のメンバーは隣に保存できないので対象外
+    paths = [p for p in expand_inputs(args.inputs, recursive=args.recursive) if os.path.isfile(p) and not is_slim_snapshot(p)]
+    if not paths:
+        print("処理対象のHTMLファイルが見つかりませんでした。")
+        return 1
+    original_total = slim_total = 0
+    for path in paths:
+        try:
+            snapshot_path = write_slim_snapshot(path) if args.force else ensure_slim_snapshot(path)
+        except Exception as e:
+            print(f"エラー: {path}: {type(e).__name__}: {e}", file=sys.stderr)
+            continue
+        original_size, slim_size = os.path.getsize(path), os.path.getsize(snapshot_path)
+        original_total += original_size
+        slim_total += slim_size
+        print(f"{path} -> {snapshot_path} ({original_size:,} -> {slim_size:,} バイト)")
+    if original_total:
+        print(f"合計: {original_total:,} -> {slim_total:,} バイト ({slim_total / original_total:.1%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
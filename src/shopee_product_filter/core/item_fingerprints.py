@@ -0,0 +1,153 @@
+"""
+アイテム単位の指紋 (fingerprint) による抽出のスキップ
+
+追跡しているショップのページは毎日保存し直すが、ほとんどのアイテムは前回とバイト単位で同じで、
+ページ全体の解析キャッシュ (`parse_cache.py`) はページのどこか1か所でも変わると効かない。
+
+このモジュールは、アイテムのコンテナ要素のHTML (ストリーミングモードでは切り出した断片のバイト列、
+通常モードでは要素をシリアライズしたもの) の SHA-256 を指紋とし、前回そのアイテムから抽出した商品情報を
+SQLite のファイルに保存しておく。同じ指紋のアイテムが再び現れたら、ツリーの構築もフィールドの抽出も行わずに
+保存済みの商品情報を返す。再取り込みの時間は、ページの大きさではなく変わったアイテムの数に比例するようになる。
+
+- 指紋にはパーサーのバージョンと解析方法 (バックエンド / モード / リストタイプ) を含める。
+  抽出結果が変わる変更をしたら `parse_product_list.PARSER_VERSION` を上げること。
+  独自の抽出プランのレジストリを使う場合は、デフォルトのレジストリとは別のファイルを使うこと。
+- 解析方法と product_url が同じ古い指紋は新しい指紋を保存したときに削除するので、
+  エントリ数はほぼ (商品数 x 使っている解析方法の数) で頭打ちになる。
+  さらに `max_entries` を超えたら、最後に使われた時刻が古いものから削除する (LRU)。
+- 書き込み (新しい指紋の保存と最終使用時刻の更新) はまとめて行う。解析の最後に `flush()` を呼ぶこと
+  (`parse_product_list` の関数は呼び出し側の代わりに呼ぶ)。
+"""
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from .product_record import PRODUCT_FIELDS
+
+DEFAULT_MAX_ENTRIES = 200_000
+# 保存待ちの件数がこれを超えたら、flush() を待たずに書き込む
+AUTO_FLUSH_PENDING = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS item_fingerprints (
+    fingerprint TEXT PRIMARY KEY,
+    variant TEXT NOT NULL,
+    product_url TEXT,
+    record TEXT NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_item_fingerprints_product_url ON item_fingerprints (variant, product_url);
+CREATE INDEX IF NOT EXISTS ix_item_fingerprints_last_used ON item_fingerprints (last_used);
+"""
+
+
+class ItemFingerprintStore:
+    """
+    アイテムの指紋 -> 抽出済みの商品情報 の永続ストア。
+
+    Args:
+        db_path: SQLite のファイルのパス (なければ作成する)。
+        parser_version: 指紋に含めるパーサーのバージョン。
+        max_entries: 保存するエントリ数の上限。
+    """
+
+    def __init__(self, db_path: str, parser_version: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.db_path = db_path
+        self.parser_version = parser_version
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # 複数のワーカープロセスから同じファイルを使えるよう、WAL にして書き込みの待ち時間を長めにとる
+        self._conn = sqlite3.connect(db_path, timeout=30.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._pending: Dict[str, Tuple[str, Optional[str], str]] = {}
+        self._used: Set[str] = set()
+
+    def __repr__(self) -> str:
+        return f"ItemFingerprintStore(db_path={self.db_path!r}, parser_version={self.parser_version!r}, max_entries={self.max_entries})"
+
+    def key_for(self, item_html: bytes, variant: str = "") -> str:
+        """アイテムのHTMLから指紋を作る。`variant` には解析方法の違い (バックエンド / モード / リストタイプ) を渡す"""
+        digest = hashlib.sha256(f"{self.parser_version}\0{variant}\0".encode('utf-8'))
+        digest.update(item_html)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[List[Any]]:
+        """保存済みの商品情報 (PRODUCT_FIELDS の順の値のリスト) を返す。なければ None"""
+        pending = self._pending.get(key)
+        if pending is not None:
+            return json.loads(pending[2])
+        row = self._conn.execute("SELECT record FROM item_fingerprints WHERE fingerprint = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._used.add(key)
+        return json.loads(row[0])
+
+    def put(self, key: str, variant: str, product: Any) -> None:
+        """抽出した商品情報を保存する (実際の書き込みは flush() でまとめて行う)"""
+        values = [product.get(field) for field in PRODUCT_FIELDS]
+        self._pending[key] = (variant, product.get("product_url"), json.dumps(values, ensure_ascii=False, separators=(',', ':')))
+        if len(self._pending) >= AUTO_FLUSH_PENDING:
+            self.flush()
+
+    def reuse_or_extract(self, item_html: bytes, variant: str, record_factory: Callable[[], Any], extract: Callable[[], Any]) -> Any:
+        """
+        指紋が一致すれば保存済みの商品情報から `record_factory` の入れ物を作って返し、
+        一致しなければ `extract()` を呼んで抽出した結果を保存してから返す (`extract()` が None を返した場合は保存しない)。
+        """
+        key = self.key_for(item_html, variant)
+        values = self.get(key)
+        if values is not None:
+            self.hits += 1
+            product = record_factory()
+            for field, value in zip(PRODUCT_FIELDS, values):
+                product[field] = value
+            return product
+        self.misses += 1
+        product = extract()
+        if product is not None:
+            self.put(key, variant, product)
+        return product
+
+    def flush(self) -> None:
+        """保存待ちの商品情報と最終使用時刻を書き込み、上限を超えていれば古いエントリを削除する"""
+        if not self._pending and not self._used:
+            return
+        now = time.time()
+        with self._conn:
+            if self._pending:
+                rows = [(key, variant, product_url, record, now) for key, (variant, product_url, record) in self._pending.items()]
+                self._conn.executemany("INSERT OR REPLACE INTO item_fingerprints VALUES (?, ?, ?, ?, ?)", rows)
+                # 同じ解析方法での同じ商品の古い指紋は、もう一致することがないので消す
+                self._conn.executemany(
+                    "DELETE FROM item_fingerprints WHERE variant = ? AND product_url = ? AND fingerprint != ?",
+                    [(variant, product_url, key) for key, variant, product_url, _, _ in rows if product_url],
+                )
+            if self._used:
+                self._conn.executemany("UPDATE item_fingerprints SET last_used = ? WHERE fingerprint = ?", [(now, key) for key in self._used])
+            self._evict()
+        self._pending.clear()
+        self._used.clear()
+
+    def _evict(self) -> None:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM item_fingerprints").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM item_fingerprints WHERE fingerprint IN "
+                "(SELECT fingerprint FROM item_fingerprints ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """このインスタンスでの一致 / 不一致の件数と、保存済みのエントリ数を返す"""
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM item_fingerprints").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": count, "max_entries": self.max_entries}
+
+    def close(self, save: bool = True) -> None:
+        """閉じる。`save=False` の場合は保存待ちの商品情報を書き込まずに捨てる (中断した解析の途中の結果を残さない)"""
+        if save:
+            self.flush()
+        self._conn.close()
@@ -0,0 +1,388 @@
+"""
+BeautifulSoup を使わない lxml / XPath の解析バックエンド
+
+bs4 バックエンド (`extraction_plan.py`) は lxml が作ったツリーを BeautifulSoup のオブジェクトに包み直し、
+soupsieve でCSSセレクタを評価している。ツリーの包み直しとPython側のセレクタ評価には、
+lxml (libxml2) 自身のツリー走査の数倍の時間がかかる。
+
+このバックエンドは lxml の要素を直接扱い、`DEFAULT_FIELD_SELECTORS` と同じ意味の XPath を
+インポート時にコンパイルしておく。抽出の手順と判定条件は bs4 バックエンドと同じで、
+結果が一致することは `backend_parity.py` で確認できる。
+
+XPath は soupsieve の評価方法に合わせて書いている:
+- `A > B` / `A B` は `B[parent::A]` / `B[ancestor::A]` とし、アイテムの外側の祖先にも一致させる。
+- テキストは `Tag.get_text(strip=True)` と同じく、script / style / コメントを除いた文字列を
+  文書順に1つずつ strip して連結する (`text_of`)。
+
+`DEFAULT_FIELD_SELECTORS` を変更した場合は、`DEFAULT_FIELD_XPATHS` も合わせて変更すること。
+"""
+from typing import IO, Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+from lxml import etree
+
+from .extraction_plan import (
+    RE_CURRENCY_SYMBOL,
+    RE_HAS_LETTER_OR_SPACE,
+    RE_NUMBER,
+    ProductInfo,
+    RecordFactory,
+    clean_product_name,
+    is_plausible_location_candidate,
+    new_product_info,
+    normalize_image_url,
+    parse_price_text,
+    parse_sold_text,
+    run_field_extractors,
+    shop_type_from_flag_src,
+)
+from .extraction_stats import TIER_FALLBACK, TIER_HEURISTIC, TIER_NONE, TIER_PRIMARY, ExtractionStats
+from .text_index import LxmlTextIndex, element_text
+
+Element = etree._Element
+
+
+def _has_class(*class_names: str) -> str:
+    """class 属性に全ての class 名が含まれることを表す XPath の条件式"""
+    return " and ".join(f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')" for name in class_names)
+
+
+# --- フィールド抽出用の XPath (キーと意味は DEFAULT_FIELD_SELECTORS と同じ) ---
+DEFAULT_FIELD_XPATHS: Dict[str, Union[str, List[str]]] = {
+    "link": f'.//a[{_has_class("contents")}]',
+    "link_img": './/img[@src or @data-src]',
+    "image_fallbacks": [
+        f'.//img[{_has_class("inset-y-0")} and not(contains(@alt, "custom-overlay")) and not(@alt = "flag-label")'
+        f' and parent::div[{_has_class("w-full", "relative")}]]',
+        f'.//img[parent::div[{_has_class("relative", "z-0", "w-full", "pt-full")}]]',
+        f'.//img[ancestor::div[{_has_class("shopee-search-item-result__item__info")}]]',
+        f'.//img[ancestor::div[{_has_class("shop-search-result-view__item__info")}]]',
+    ],
+    "image_candidates": './/img[@src or @data-src]',
+    "location_primary": f'.//span[{_has_class("ml-[3px]")} and ancestor::div[{_has_class("flex", "items-center", "space-x-1", "max-w-full")}]]',
+    "location_icon": './/img[@alt = "location-icon"]',
+    "location_candidates": (
+        './/*[(self::div or self::span) and (contains(@class, "location") or contains(@class, "shipping")'
+        f' or ancestor::div[{_has_class("shopee-item-card__footer")}])]'
+    ),
+    "name_containers": [
+        f'.//div[{_has_class("line-clamp-2")}]',
+        './/div[contains(@class, "name") or contains(@class, "Name")]',
+    ],
+    "flag_in_name": './/img[@alt = "flag-label"]',
+    "flag_fallbacks": [
+        './/img[@alt = "flag-label"]',
+        './/img[contains(@alt, "Preferred") or contains(@alt, "Mall") or contains(@alt, "Official Store")]',
+    ],
+    "price_container": f'.//div[{_has_class("truncate", "flex", "items-baseline")}]',
+    "price_currency": './/span[not(preceding-sibling::span)]',
+    "price_value": './/span[count(preceding-sibling::span) = 1]',
+    "price_alt": f'.//span[{_has_class("shopee-price-range__current-price")}]',
+    "price_candidates": (
+        f'.//*[(self::div and (({_has_class("truncate", "flex", "items-baseline")}) or contains(@class, "price") or contains(@class, "Price")))'
+        f' or (self::span and (({_has_class("shopee-price-range__current-price")}) or ancestor::div[contains(@class, "Price")]))]'
+    ),
+    "sold_primary": [
+        f'.//div[{_has_class("truncate", "text-shopee-black87", "text-xs")}]',
+        f'.//div[not(following-sibling::*) and parent::div[{_has_class("shopee-item-card__footer")}]]',
+    ],
+    # 'div.shopee-item-card__footer span, ..., span, div' は結局全ての span / div に一致する
+    "sold_candidates": './/*[self::span or self::div]',
+}
+
+# --- リストタイプごとのアイテムの XPath (DEFAULT_PLAN_CONFIG と同じ検出の優先順) ---
+DEFAULT_ITEM_XPATHS: Dict[str, str] = {
+    "shop": (
+        f'//div[{_has_class("shop-search-result-view__item")}'
+        f' and parent::div[{_has_class("row")} and parent::div[{_has_class("shop-search-result-view")}]]]'
+    ),
+    "search_category": f'//li[{_has_class("col-xs-2-4", "shopee-search-item-result__item")}]',
+    "data_sqe": '//li[@data-sqe = "item"]',
+}
+
+
+class XPathPlan:
+    """
+    1つのリストタイプ分のコンパイル済み XPath をまとめたもの (`ExtractionPlan` の lxml 版)。
+    属性名は `DEFAULT_FIELD_XPATHS` のキーと同じで、フォールバックチェーンはタプルになる。
+    """
+
+    def __init__(self, list_type: str, item_xpath: str, xpaths: Mapping[str, Union[str, List[str]]]):
+        self.list_type = list_type
+        self.item_xpath = item_xpath
+        self.item = etree.XPath(item_xpath)
+        self.xpaths = dict(xpaths)
+        for key, value in self.xpaths.items():
+            if isinstance(value, str):
+                setattr(self, key, etree.XPath(value))
+            else:
+                setattr(self, key, tuple(etree.XPath(v) for v in value))
+
+    def __repr__(self) -> str:
+        return f"XPathPlan(list_type={self.list_type!r}, item_xpath={self.item_xpath!r})"
+
+    def select_items(self, root: Element) -> List[Element]:
+        """ドキュメントからこのリストタイプの商品アイテムを全て取得する"""
+        return self.item(root)
+
+
+# インポート時に一度だけコンパイルされるデフォルトのレジストリ
+XPATH_PLAN_REGISTRY: Dict[str, XPathPlan] = {
+    list_type: XPathPlan(list_type, item_xpath, DEFAULT_FIELD_XPATHS) for list_type, item_xpath in DEFAULT_ITEM_XPATHS.items()
+}
+
+
+def detect_items_lxml(root: Element, plans: Optional[Mapping[str, XPathPlan]] = None) -> Tuple[Optional[XPathPlan], List[Element]]:
+    """`detect_items` の lxml 版。最初に一致したプランとアイテムのリストを返す"""
+    for plan in (plans if plans is not None else XPATH_PLAN_REGISTRY).values():
+        items = plan.select_items(root)
+        if items:
+            return plan, items
+    return None, []
+
+
+def xpath_plans_for(list_types: Iterable[str]) -> Dict[str, XPathPlan]:
+    """リストタイプ名の並び (`probe_plans` の結果など) に対応する XPath プランを、同じ順に返す"""
+    return {list_type: XPATH_PLAN_REGISTRY[list_type] for list_type in list_types if list_type in XPATH_PLAN_REGISTRY}
+
+
+def parse_html_document(source: Union[str, bytes, IO[bytes]]) -> Optional[Element]:
+    """HTMLファイルのパス / バイト列 / バイナリのファイルオブジェクトから lxml のツリーを作る"""
+    parser = etree.HTMLParser(encoding='utf-8', huge_tree=True)
+    if isinstance(source, bytes):
+        return etree.fromstring(source, parser)
+    return etree.parse(source, parser).getroot()
+
+
+def parse_html_fragment(fragment: bytes, name: str) -> Optional[Element]:
+    """切り出したアイテムのHTML断片から、アイテムのコンテナ要素を取り出す (ストリーミングモード用)"""
+    root = etree.fromstring(fragment, etree.HTMLParser(encoding='utf-8', huge_tree=True))
+    if root is None:
+        return None
+    return next(root.iter(name), None)
+
+
+def _first(xpath: Callable[[Element], List[Element]], element: Element) -> Optional[Element]:
+    result = xpath(element)
+    return result[0] if result else None
+
+
+def text_of(element: Element) -> str:
+    """`Tag.get_text(strip=True)` と同じ規則で要素のテキストを取り出す"""
+    return element_text(element)
+
+
+# --- フィールドごとの抽出関数 (extraction_plan.py の同名の関数と同じ手順で、値を見つけた段階を返す) ---
+
+def _extract_product_url(item: Element, plan: XPathPlan, product_info: ProductInfo, link_tag: Optional[Element], texts: LxmlTextIndex) -> str:
+    if link_tag is not None:
+        href_value = link_tag.get('href')
+        if href_value is not None:
+            product_info['product_url'] = href_value
+            return TIER_PRIMARY
+    return TIER_NONE
+
+
+def _find_main_image(item: Element, plan: XPathPlan, link_tag: Optional[Element]) -> Tuple[Optional[Element], str]:
+    if link_tag is not None:
+        main_img_tag = _first(plan.link_img, link_tag)
+        if main_img_tag is not None:
+            return main_img_tag, TIER_PRIMARY
+
+    for xpath in plan.image_fallbacks:
+        main_img_tag = _first(xpath, item)
+        if main_img_tag is not None:
+            return main_img_tag, TIER_FALLBACK
+
+    for img in plan.image_candidates(item):
+        src_candidate = img.get('src') or img.get('data-src')
+        if src_candidate and len(src_candidate) > 10:
+            alt = img.get('alt', '').lower()
+            if 'icon' not in alt and 'flag' not in alt and 'overlay' not in alt and 'logo' not in alt and 'qr code' not in alt:
+                if not src_candidate.startswith('data:') and not src_candidate.endswith('.svg') and not src_candidate.endswith('.gif'):
+                    if '/file/' in src_candidate or 'img.susercontent.com' in src_candidate:
+                        return img, TIER_HEURISTIC
+    return None, TIER_NONE
+
+
+def _extract_image_url(item: Element, plan: XPathPlan, product_info: ProductInfo, link_tag: Optional[Element], texts: LxmlTextIndex) -> str:
+    image_url = None
+    main_img_tag, tier = _find_main_image(item, plan, link_tag)
+    if main_img_tag is not None:
+        src = main_img_tag.get('src')
+        if not src:
+            src = main_img_tag.get('data-src')
+        image_url = normalize_image_url(src)
+    product_info['image_url'] = image_url
+    return tier if image_url is not None else TIER_NONE
+
+
+def _next_sibling_elements(element: Element, limit: int) -> List[Element]:
+    siblings = []
+    for sibling in element.itersiblings():
+        if isinstance(sibling.tag, str):
+            siblings.append(sibling)
+            if len(siblings) == limit:
+                break
+    return siblings
+
+
+def _extract_location(item: Element, plan: XPathPlan, product_info: ProductInfo, link_tag: Optional[Element], texts: LxmlTextIndex) -> str:
+    location = None
+    tier = TIER_NONE
+    location_tag = _first(plan.location_primary, item)
+    if location_tag is not None:
+        location = text_of(location_tag)
+        tier = TIER_PRIMARY
+
+    if location is None:
+        location_icon = _first(plan.location_icon, item)
+        if location_icon is not None:
+            parent = location_icon.getparent()
+            grandparent = parent.getparent() if parent is not None else None
+            # bs4 版の [find_parent()] + find_parents(limit=2) + find_next_siblings(limit=2) と同じ並び
+            location_candidates = [parent, parent, grandparent] + _next_sibling_elements(location_icon, 2)
+            for container in location_candidates:
+                if container is not None:
+                    text = texts.text(container)
+                    text = text.replace(location_icon.get('alt', ''), '').strip()
+                    if text and 1 < len(text) < 50 and RE_HAS_LETTER_OR_SPACE.search(text):
+                        location = text
+                        tier = TIER_FALLBACK
+                        break
+
+    if location is None:
+        for candidate in plan.location_candidates(item):
+            text = texts.text(candidate)
+            if is_plausible_location_candidate(text):
+                location = text
+                tier = TIER_HEURISTIC
+                break
+
+    product_info['location'] = location
+    return tier
+
+
+def _extract_name_and_shop_type(item: Element, plan: XPathPlan, product_info: ProductInfo, link_tag: Optional[Element], texts: LxmlTextIndex) -> str:
+    product_name = None
+    shop_type = 'Standard'
+    name_div = None
+    tier = TIER_NONE
+    for i, xpath in enumerate(plan.name_containers):
+        name_div = _first(xpath, item)
+        if name_div is not None:
+            tier = TIER_PRIMARY if i == 0 else TIER_FALLBACK
+            break
+
+    if name_div is not None:
+        product_name = clean_product_name(text_of(name_div))
+
+        shop_type_img = _first(plan.flag_in_name, name_div)
+        if shop_type_img is None:
+            for xpath in plan.flag_fallbacks:
+                shop_type_img = _first(xpath, item)
+                if shop_type_img is not None:
+                    break
+
+        if shop_type_img is not None:
+            try:
+                shop_type = shop_type_from_flag_src(shop_type_img.get('src')) or shop_type
+            except Exception:
+                pass
+
+    product_info['product_name'] = product_name
+    product_info['shop_type'] = shop_type
+    return tier if product_name is not None else TIER_NONE
+
+
+def _extract_price_and_currency(item: Element, plan: XPathPlan, product_info: ProductInfo, link_tag: Optional[Element], texts: LxmlTextIndex) -> str:
+    price = None
+    currency = None
+    tier = TIER_NONE
+    price_container = _first(plan.price_container, item)
+    if price_container is not None:
+        currency_tag = _first(plan.price_currency, price_container)
+        currency = text_of(currency_tag) if currency_tag is not None else None
+        price_span = _first(plan.price_value, price_container)
+        if price_span is not None:
+            price = parse_price_text(text_of(price_span))
+            tier = TIER_PRIMARY
+
+    if price is None:
+        alt_price_span = _first(plan.price_alt, item)
+        if alt_price_span is not None:
+            price = parse_price_text(text_of(alt_price_span))
+            tier = TIER_FALLBACK
+
+    if price is None:
+        for candidate in plan.price_candidates(item):
+            text = texts.text(candidate)
+            if text and 1 < len(text) < 30 and RE_NUMBER.search(text):
+                num_match = RE_NUMBER.search(text.replace(',', ''))
+                currency_match = RE_CURRENCY_SYMBOL.search(text)
+                if num_match:
+                    try:
+                        price = float(num_match.group(0))
+                        tier = TIER_HEURISTIC
+                        if currency_match and currency is None:
+                            currency = currency_match.group(0)
+                        break
+                    except (ValueError, TypeError):
+                        pass
+
+    product_info['price'] = price
+    product_info['currency'] = "SGD" if currency == "$" else currency
+    return tier if price is not None else TIER_NONE
+
+
+def _extract_sold(item: Element, plan: XPathPlan, product_info: ProductInfo, link_tag: Optional[Element], texts: LxmlTextIndex) -> str:
+    sold_text = None
+    tier = TIER_NONE
+    for i, xpath in enumerate(plan.sold_primary):
+        sold_div = _first(xpath, item)
+        if sold_div is not None:
+            sold_text = text_of(sold_div)
+            tier = TIER_PRIMARY if i == 0 else TIER_FALLBACK
+            break
+    if sold_text is None:
+        for candidate in plan.sold_candidates(item):
+            candidate_text = texts.text(candidate)
+            if "sold" in candidate_text.lower():
+                sold_text = candidate_text
+                tier = TIER_HEURISTIC
+                break
+
+    product_info['sold'] = parse_sold_text(sold_text) if sold_text is not None else 0
+    return tier
+
+
+LxmlFieldExtractor = Callable[[Element, XPathPlan, ProductInfo, Optional[Element], LxmlTextIndex], str]
+FIELD_EXTRACTORS_LXML: Tuple[Tuple[str, LxmlFieldExtractor, ProductInfo], ...] = (
+    ("product_url", _extract_product_url, {}),
+    ("image_url", _extract_image_url, {}),
+    ("location", _extract_location, {}),
+    ("product_name/shop_type", _extract_name_and_shop_type, {"shop_type": 'Standard'}),
+    ("price/currency", _extract_price_and_currency, {}),
+    ("sold count", _extract_sold, {"sold": 0}),
+)
+
+
+def extract_item_lxml(
+    item: Element,
+    plan: XPathPlan,
+    position: int,
+    record_factory: RecordFactory = new_product_info,
+    stats: Optional[ExtractionStats] = None,
+) -> Any:
+    """`extract_item` の lxml 版。1アイテムを XPath プランに通して商品情報を作る"""
+    product_info = record_factory()
+    link_tag = _first(plan.link, item)
+    run_field_extractors(FIELD_EXTRACTORS_LXML, item, plan, product_info, link_tag, LxmlTextIndex(item), position, stats)
+    return product_info
+
+
+def xpath_plan_for(list_type: str) -> XPathPlan:
+    """リストタイプ名に対応する XPath プランを返す (ストリーミングモードで bs4 のプランから引き当てる)"""
+    try:
+        return XPATH_PLAN_REGISTRY[list_type]
+    except KeyError:
+        raise ValueError(f"リストタイプ '{list_type}' には lxml バックエンドの XPath が定義されていません。") from None
@@ -0,0 +1,205 @@
+"""
+解析結果のディスクキャッシュ (HTMLの内容をキーにしたコンテンツアドレス方式)
+
+Streamlit のアップローダーや `/upload-product-list-html/` からは、同じ保存ページが何度も
+アップロードされることが多く、そのたびにページ全体を解析し直していた。
+
+このキャッシュは「生のHTMLバイト列 + パーサーのバージョン (+ 抽出件数の上限などの違い)」の SHA-256 をキーにして、
+抽出結果の商品リストをディスクに保存する。同じページが再度アップロードされた場合は、
+HTMLを解析せずにキャッシュの結果をそのまま使える。
+
+- 保存形式: フィールド名の並びと各商品の値のリストだけを持つJSONを zlib で圧縮したもの
+  (商品ごとにキー名を繰り返さないので、そのままのJSONより大幅に小さい)。
+- 追い出し: 合計サイズが上限を超えたら、最後に使われた時刻 (ファイルの mtime) が古いものから削除する (LRU)。
+- 商品リストのコンテナが見つからなかったページ (解析結果が None) もキャッシュする。
+
+書き込みは一時ファイルに書いてから置き換えるので、複数のプロセスから同じディレクトリを使っても
+壊れたエントリが読まれることはない。
+
+抽出ロジックやセレクタを変更したときは `parse_product_list.PARSER_VERSION` を上げること。
+古いバージョンのエントリは参照されなくなり、いずれ LRU で追い出される。
+"""
+import hashlib
+import json
+import os
+import tempfile
+import zlib
+from typing import Any, Dict, List, Optional, Union
+
+from .html_archive import open_html
+from .product_record import PRODUCT_FIELDS, ProductBatch
+
+ProductList = Optional[List[Dict[str, Any]]]
+
+CACHE_FILE_SUFFIX = ".json.z"
+FORMAT_VERSION = 1
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# get() でキャッシュに存在しなかったことを表す値 (解析結果の None と区別するため)
+MISSING: Any = object()
+
+
+def encode_products(products: Union[ProductList, ProductBatch]) -> bytes:
+    """商品リスト (または ProductBatch) をキャッシュの保存形式 (列名 + 行の値を zlib 圧縮したJSON) に変換する"""
+    if products is None:
+        payload: Dict[str, Any] = {"v": FORMAT_VERSION, "fields": None, "rows": None}
+    elif isinstance(products, ProductBatch):
+        payload = {"v": FORMAT_VERSION, "fields": list(PRODUCT_FIELDS), "rows": list(products.rows())}
+    else:
+        fields: List[str] = []
+        for product in products:
+            for key in product:
+                if key not in fields:
+                    fields.append(key)
+        rows = [[product.get(key) for key in fields] for product in products]
+        payload = {"v": FORMAT_VERSION, "fields": fields, "rows": rows}
+    return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def decode_products(data: bytes) -> ProductList:
+    """`encode_products` で変換したバイト列を商品リストに戻す"""
+    payload = json.loads(zlib.decompress(data).decode('utf-8'))
+    if payload.get("v") != FORMAT_VERSION:
+        raise ValueError(f"未対応のキャッシュ形式です: {payload.get('v')}")
+    if payload["rows"] is None:
+        return None
+    fields = payload["fields"]
+    return [dict(zip(fields, row)) for row in payload["rows"]]
+
+
+class ParseCache:
+    """
+    解析結果のディスクキャッシュ。
+
+    Args:
+        cache_dir: キャッシュを保存するディレクトリ (なければ作成する)。
+        parser_version: キーに含めるパーサーのバージョン。
+        max_bytes: キャッシュの合計サイズの上限 (バイト)。
+    """
+
+    def __init__(self, cache_dir: str, parser_version: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.parser_version = parser_version
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def __repr__(self) -> str:
+        return f"ParseCache(cache_dir={self.cache_dir!r}, parser_version={self.parser_version!r}, max_bytes={self.max_bytes})"
+
+    def _new_digest(self, variant: str) -> Any:
+        return hashlib.sha256(f"{self.parser_version}\0{variant}\0".encode('utf-8'))
+
+    def key_for(self, html_bytes: bytes, variant: str = "") -> str:
+        """
+        生のHTMLバイト列からキャッシュのキーを作る。
+        `variant` には抽出件数の上限など、同じHTMLでも結果が変わる呼び出し方の違いを渡す。
+        """
+        digest = self._new_digest(variant)
+        digest.update(html_bytes)
+        return digest.hexdigest()
+
+    def key_for_file(self, html_file_path: str, variant: str = "") -> str:
+        """
+        HTMLファイルの内容からキャッシュのキーを作る (ファイル全体をメモリに読み込まない)。
+        圧縮ファイルやアーカイブのメンバーは展開後の内容をキーにするので、圧縮し直しても同じキーになる。
+        """
+        digest = self._new_digest(variant)
+        with open_html(html_file_path) as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + CACHE_FILE_SUFFIX)
+
+    def get(self, key: str) -> Any:
+        """
+        キャッシュされた解析結果を返す。存在しない (または読めない) 場合は `MISSING` を返す。
+        読み込んだエントリは最終使用時刻を更新する。
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            products = decode_products(data)
+        except FileNotFoundError:
+            return MISSING
+        except Exception as e:
+            print(f"警告: 解析キャッシュのエントリを読み込めませんでした - {path}: {e}")
+            self._remove(path)
+            return MISSING
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return products
+
+    def put(self, key: str, products: Union[ProductList, ProductBatch]) -> None:
+        """解析結果を保存し、合計サイズが上限を超えていれば古いエントリを追い出す"""
+        data = encode_products(products)
+        if len(data) > self.max_bytes:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self) -> int:
+        """合計サイズが上限以下になるまで、最終使用時刻の古いエントリから削除する。削除した件数を返す"""
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(CACHE_FILE_SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        removed = 0
+        if total <= self.max_bytes:
+            return removed
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if self._remove(path):
+                removed += 1
+            total -= size
+        return removed
+
+    def clear(self) -> None:
+        """全てのエントリを削除する"""
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(CACHE_FILE_SUFFIX):
+                    self._remove(entry.path)
+
+    def stats(self) -> Dict[str, Any]:
+        """エントリ数と合計サイズを返す"""
+        count = 0
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(CACHE_FILE_SUFFIX):
+                    count += 1
+                    try:
+                        total += entry.stat().st_size
+                    except FileNotFoundError:
+                        pass
+        return {"entries": count, "bytes": total, "max_bytes": self.max_bytes}
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
@@ -10,39 +10,108 @@ Shopeeシンガポールのショップ詳細画面に表示されている、
 コマンドの引数に与えるHTMLファイルは、ショップ詳細画面のHTMLでないといけません。
 トップ画面からのキーワード検索結果に表示されるリスト画面とは、構造が違います。
 """
-import re
+import io
 import os
-from bs4 import BeautifulSoup
-from bs4.element import Tag
-from typing import List, Dict, Optional, Union
 import json
 import argparse
 import csv
-
-# Shopee CDNの画像ベースURL - ファイル名の前に付加
-SHOPEE_SG_IMAGE_BASE_URL = "https://down-sg.img.susercontent.com/file/"
-
-# ShopeeのPreferred/Mall/Official Storeショップを示す画像ファイル名のSuffix
-PREFERRED_SRC_SUFFIX = "lyan1mv3ncw641"
-MALL_SRC_SUFFIX = "lyamz1z3mayu37"
-OFFICIAL_STORE_SUFFIX = "ly995hjj5h28ab"
-
-
-def parse_shopee_shop_products_from_file_final(html_file_path: str) -> List[Dict[str, Optional[Union[str, float, int]]]] | None:
+from bs4 import BeautifulSoup
+from bs4.element import Tag
+from contextlib import contextmanager
+from itertools import islice
+from lxml import etree
+from typing import IO, Any, Iterator, List, Dict, Mapping, Optional, Union
+
+from .extraction_plan import (
+    ExtractionPlan,
+    ProductInfo,
+    RecordFactory,
+    new_product_info,
+    detect_items,
+    extract_item,
+    probe_plans,
+    # 既存の利用箇所との互換性のため、定数はここからも参照できるようにしておく
+    SHOPEE_SG_IMAGE_BASE_URL,  # noqa: F401
+    PREFERRED_SRC_SUFFIX,  # noqa: F401
+    MALL_SRC_SUFFIX,  # noqa: F401
+    OFFICIAL_STORE_SUFFIX,  # noqa: F401
+)
+from .extraction_stats import ExtractionStats
+from .html_archive import decompressed, open_html
+from .html_slim import slim_html
+from .item_fingerprints import ItemFingerprintStore
+from .lxml_backend import detect_items_lxml, extract_item_lxml, parse_html_document, xpath_plans_for
+from .parse_cache import MISSING, ParseCache
+from .product_record import ProductBatch, ProductRecord
+from .product_writers import open_product_writer
+from .selector_order import PageSelectorOrder, SelectorOrderStore
+from .streaming_parser import iter_shopee_products_streaming
+
+EXTRACT_MAX = 500  # 最大抽出件数
+BACKENDS = ("bs4", "lxml")  # 選択できる解析バックエンド
+# 解析結果のキャッシュのキーに含めるバージョン。抽出結果が変わる変更をしたら必ず上げること
+PARSER_VERSION = "2025.07.09-5"
+
+# iter_products() に渡せる入力: ファイルパス / HTMLのバイト列 / バイナリモードのファイルオブジェクト
+ProductSource = Union[str, os.PathLike, bytes, bytearray, memoryview, IO[bytes]]
+
+
+def parse_shopee_shop_products_from_file_final(
+    html_file_path: str,
+    plans: Optional[Mapping[str, ExtractionPlan]] = None,
+    streaming: bool = False,
+    backend: str = "bs4",
+    cache: Optional[ParseCache] = None,
+    stats: Optional[ExtractionStats] = None,
+    fingerprints: Optional[ItemFingerprintStore] = None,
+    slim: bool = False,
+    selector_order: Optional[SelectorOrderStore] = None,
+) -> List[Dict[str, Optional[Union[str, float, int]]]] | None:
     """
     HTMLファイルを読み込み、商品情報を抽出する。
+    `.html.gz` / `.html.zst` の圧縮ファイルと、「zip アーカイブのパス!メンバー名」も指定できる
+    (ディスクには展開しない。`html_archive.py` を参照)。
     - sold_countを取得する。
     - 画像URLをCDN形式に変換する。
     - ショップタイプを判定する。
     - ロケーションを取得する（必須項目）。
     - リストのタイプ（ショップ、検索/カテゴリー、汎用）を判定・表示する。
     - 各フィールドの抽出でエラーが発生しても、可能な限り処理を続行する。
-    - 抽出件数を先頭5件に限定する。
+    - 抽出件数を先頭 `EXTRACT_MAX` 件 (500件) に限定する (どのモード・バックエンドでも同じ。キャッシュのキーにも含める)。
+      全件が必要な場合 (APIのアップロードなど) は、件数の上限のない `iter_products()` を使う。
     - rating および discount は抽出しない。
+
+    セレクタと正規表現は `extraction_plan.py` でリストタイプごとにコンパイル済みのものを使う。
+    `plans` を渡すと、デフォルトのレジストリの代わりにそのレジストリでリストタイプを判定する。
+    DOMを作る前に生のHTMLを各リストタイプのシグネチャと照合し (`probe_plans`)、ありえないリストタイプの検出は省く。
+    `streaming=True` の場合は文書全体のツリーを作らず、アイテムのコンテナだけを順に読み込む
+    省メモリモードで解析する (詳細は `streaming_parser.py` を参照)。
+    `backend="lxml"` の場合は BeautifulSoup を使わず、lxml の要素とコンパイル済み XPath で抽出する
+    (詳細は `lxml_backend.py` を参照)。lxml バックエンドは独自の XPath を使うため、`plans` によるセレクタの
+    上書きはストリーミングモードのアイテム検出にのみ反映される。
+    `cache` を渡すと、ファイルの内容が同じページの解析結果がキャッシュにあればそれを返し、
+    なければ解析した結果をキャッシュに保存する (詳細は `parse_cache.py` を参照)。
+    `stats` を渡すと、フィールドごとの所要時間と値を見つけたフォールバック段階をそこに集計する
+    (詳細は `extraction_stats.py` を参照。キャッシュの結果を使った場合は何も記録されない)。
+    `fingerprints` を渡すと、HTMLが前回と同じアイテムはフィールドの抽出をせずに保存済みの商品情報を使う
+    (詳細は `item_fingerprints.py` を参照。解析の最後に flush() する)。
+    `slim=True` の場合は、商品グリッド以外のノードを取り除いたHTMLをメモリ上で作ってから解析する
+    (抽出結果は同じ。詳細は `html_slim.py` を参照)。
+    `selector_order` を渡すと、同じレイアウトのページで外れ続けたセレクタの評価を省く
+    (詳細は `selector_order.py` を参照。解析の最後に flush() する)。
     """
+    if backend not in BACKENDS:
+        raise ValueError(f"不明な解析バックエンドです: {backend} (選択肢: {', '.join(BACKENDS)})")
+    if cache is not None:
+        return _parse_with_cache(html_file_path, cache, plans, streaming, backend, stats, fingerprints, slim, selector_order)
+    if streaming:
+        return _parse_streaming(html_file_path, plans, backend, stats, fingerprints, slim, selector_order)
+    if backend == "lxml":
+        return _parse_lxml(html_file_path, stats, fingerprints, slim, selector_order)
+
     try:
-        with open(html_file_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
+        with _open_page(html_file_path, slim) as f:
+            html_content = f.read().decode('utf-8')
     except FileNotFoundError:
         print(f"エラー: ファイルが見つかりません - {html_file_path}")
         return []
@@ -50,24 +119,18 @@ def parse_shopee_shop_products_from_file_final(html_file_path: str) -> List[Dict
         print(f"エラー: ファイル読み込み中にエラーが発生しました - {html_file_path}: {e}")
         return []
 
+    # DOMを作る前に、生のHTMLにシグネチャを含まないリストタイプを候補から外す (1つも残らなければDOMを作らない)
+    candidate_plans = probe_plans(html_content, plans)
+    if not candidate_plans:
+        print(f"エラー: 商品リストの抽出箇所を特定できませんでした。({html_file_path})")
+        return None # 商品リストが見つからなかった場合はNoneを返す
+
     soup = BeautifulSoup(html_content, 'lxml')
     products = []
     # 商品リストのタイプを判定し、アイテムのリストを取得
-    # ショップの商品リスト
-    shop_items = soup.select('div.shop-search-result-view > div.row > div.shop-search-result-view__item')
-    # キーワード検索 と カテゴリー別 の商品リスト (同じセレクタを使用)
-    search_category_items = soup.select('li.col-xs-2-4.shopee-search-item-result__item')
-    # data-sqe="item" の商品リスト (汎用的なセレクタ) - これが最も一般的かも
-    data_sqe_items = soup.select('li[data-sqe="item"]')
-
-
-    if shop_items:
-        items = shop_items
-    elif search_category_items: # キーワード検索とカテゴリー別のリストに対応
-        items = search_category_items
-    elif data_sqe_items:
-        items = data_sqe_items
-    else:
+    # (ショップ → キーワード検索/カテゴリー別 → data-sqe="item" の順。一致した時点で残りの判定は行わない)
+    plan, items = detect_items(soup, candidate_plans)
+    if plan is None:
         print(f"エラー: 商品リストの抽出箇所を特定できませんでした。({html_file_path})")
         return None # 商品リストが見つからなかった場合はNoneを返す
 
@@ -75,345 +138,315 @@ def parse_shopee_shop_products_from_file_final(html_file_path: str) -> List[Dict
         print(f"情報が見つかりませんでした: 該当するアイテムがありませんでした。({html_file_path})")
         return []
 
-    EXTRACT_MAX = 500  # 最大抽出件数
+    # 抽出件数を先頭 EXTRACT_MAX 件に限定
+    items_to_process = items[:EXTRACT_MAX]
+    print(f"合計 {len(items)} 個のアイテムが見つかりましたが、先頭 {len(items_to_process)} 件のみ抽出します。")
+
+    layouts = selector_order.page() if selector_order is not None else None
+    for i, item in enumerate(items_to_process):
+        products.append(_extract_soup_item(item, plan, i, new_product_info, stats, fingerprints, layouts))
+    _flush_stores(fingerprints, selector_order)
+
+    return products
+
+
+@contextmanager
+def _open_page(html_file_path: str, slim: bool) -> Iterator[IO[bytes]]:
+    """ページを開く (`slim=True` の場合は、スリム化したHTMLを読めるストリームを返す)"""
+    with open_html(html_file_path) as f:
+        yield io.BytesIO(slim_html(f)) if slim else f
+
+
+def _flush_stores(fingerprints: Optional[ItemFingerprintStore], selector_order: Optional[SelectorOrderStore]) -> None:
+    """アイテムの指紋とセレクタの順序の記録を書き込む"""
+    if fingerprints is not None:
+        fingerprints.flush()
+    if selector_order is not None:
+        selector_order.flush()
+
+
+def _extract_soup_item(
+    item: Tag,
+    plan: ExtractionPlan,
+    position: int,
+    record_factory: RecordFactory,
+    stats: Optional[ExtractionStats],
+    fingerprints: Optional[ItemFingerprintStore],
+    layouts: Optional[PageSelectorOrder] = None,
+) -> Any:
+    """`extract_item` の前に、アイテムのHTMLの指紋が前回と同じかを確認する (`layouts` があれば学習したセレクタの順序で抽出する)"""
+    def extract() -> Any:
+        if layouts is None:
+            return extract_item(item, plan, position, record_factory, stats)
+        return layouts.extract(extract_item, item, plan, position, record_factory, stats)
+
+    if fingerprints is None:
+        return extract()
+    return fingerprints.reuse_or_extract(item.encode('utf-8'), f"bs4:dom:{plan.list_type}", record_factory, extract)
+
+
+def _extract_lxml_item(
+    item: etree._Element,
+    plan: Any,
+    position: int,
+    record_factory: RecordFactory,
+    stats: Optional[ExtractionStats],
+    fingerprints: Optional[ItemFingerprintStore],
+    layouts: Optional[PageSelectorOrder] = None,
+) -> Any:
+    """`extract_item_lxml` の前に、アイテムのHTMLの指紋が前回と同じかを確認する (`layouts` があれば学習したセレクタの順序で抽出する)"""
+    def extract() -> Any:
+        if layouts is None:
+            return extract_item_lxml(item, plan, position, record_factory, stats)
+        return layouts.extract(extract_item_lxml, item, plan, position, record_factory, stats)
+
+    if fingerprints is None:
+        return extract()
+    return fingerprints.reuse_or_extract(
+        etree.tostring(item, method='html', with_tail=False), f"lxml:dom:{plan.list_type}", record_factory, extract
+    )
+
+
+def _parse_with_cache(
+    html_file_path: str,
+    cache: ParseCache,
+    plans: Optional[Mapping[str, ExtractionPlan]],
+    streaming: bool,
+    backend: str,
+    stats: Optional[ExtractionStats] = None,
+    fingerprints: Optional[ItemFingerprintStore] = None,
+    slim: bool = False,
+    selector_order: Optional[SelectorOrderStore] = None,
+) -> List[Dict[str, Optional[Union[str, float, int]]]] | None:
+    """キャッシュを参照してから `parse_shopee_shop_products_from_file_final` を呼ぶ"""
+    try:
+        cache_key = cache.key_for_file(html_file_path, variant=f"max={EXTRACT_MAX}")
+    except FileNotFoundError:
+        print(f"エラー: ファイルが見つかりません - {html_file_path}")
+        return []
+    cached = cache.get(cache_key)
+    if cached is not MISSING:
+        print(f"解析キャッシュを使用します ({len(cached) if cached is not None else 0} 件): {html_file_path}")
+        return cached
+    products = parse_shopee_shop_products_from_file_final(
+        html_file_path, plans, streaming, backend, stats=stats, fingerprints=fingerprints, slim=slim, selector_order=selector_order
+    )
+    # 読み込みエラー時の空リストはキャッシュしない (ファイルを直して再実行したときに解析し直せるように)
+    if products is None or products:
+        cache.put(cache_key, products)
+    return products
+
+
+def _parse_lxml(
+    html_file_path: str,
+    stats: Optional[ExtractionStats] = None,
+    fingerprints: Optional[ItemFingerprintStore] = None,
+    slim: bool = False,
+    selector_order: Optional[SelectorOrderStore] = None,
+) -> List[Dict[str, Optional[Union[str, float, int]]]] | None:
+    """`parse_shopee_shop_products_from_file_final` の lxml バックエンド本体"""
+    try:
+        with _open_page(html_file_path, slim) as f:
+            html_bytes = f.read()
+        # シグネチャを含むリストタイプがなければ、ツリーを作らない
+        candidate_plans = xpath_plans_for(probe_plans(html_bytes))
+        root = parse_html_document(html_bytes) if candidate_plans else None
+    except FileNotFoundError:
+        print(f"エラー: ファイルが見つかりません - {html_file_path}")
+        return []
+    except Exception as e:
+        print(f"エラー: ファイル読み込み中にエラーが発生しました - {html_file_path}: {e}")
+        return []
+
+    plan, items = detect_items_lxml(root, candidate_plans) if root is not None else (None, [])
+    if plan is None:
+        print(f"エラー: 商品リストの抽出箇所を特定できませんでした。({html_file_path})")
+        return None # 商品リストが見つからなかった場合はNoneを返す
 
-    # 抽出件数を先頭5件に限定
     items_to_process = items[:EXTRACT_MAX]
     print(f"合計 {len(items)} 個のアイテムが見つかりましたが、先頭 {len(items_to_process)} 件のみ抽出します。")
+    layouts = selector_order.page() if selector_order is not None else None
+    products = [
+        _extract_lxml_item(item, plan, i, new_product_info, stats, fingerprints, layouts) for i, item in enumerate(items_to_process)
+    ]
+    _flush_stores(fingerprints, selector_order)
+    return products
 
 
-    for i, item in enumerate(items_to_process):
-        # print(f"  アイテム {i+1}/{len(items_to_process)} を処理中...")
-        product_info: Dict[str, Optional[Union[str, float, int]]] = {
-            "product_name": None,
-            "price": None,
-            "currency": None,
-            "image_url": None,
-            "product_url": None,
-            "location": None, # 必須
-            "sold": 0, # 必須, Default value
-            "shop_type": None, # 必須, Default determined later
-            # rating および discount は抽出しないため、ここでは初期化しない
-        }
-
-        # --- Extract Product URL (必須) ---
-        try:
-            link_tag = item.select_one('a.contents')
-            if link_tag:
-                 href_value = link_tag.get('href')
-                 if isinstance(href_value, str):
-                      product_info['product_url'] = href_value
-        except Exception as e:
-            print(f"  アイテム {i+1}: product_url 抽出中にエラーが発生しました: {e}")
-
-        # --- Extract Image URL (必須) ---
-        # naoさんが取得できているとのことなので、前回の最も頑丈にしたロジックを維持
-        try:
-            image_url = None
-            main_img_tag = None
-
-            # 1. Prioritize image within the main product link (a.contents)
-            link_tag = item.select_one('a.contents')
-            if link_tag:
-                 main_img_tag = link_tag.select_one('img[src], img[data-src]') # Look for src or data-src inside the link
-
-            # 2. If not found in link, try other common places with specific selectors
-            if not main_img_tag:
-                 main_img_tag = item.select_one('div.w-full.relative > img.inset-y-0:not([alt*="custom-overlay"]):not([alt="flag-label"])')
-            if not main_img_tag:
-                 main_img_tag = item.select_one('div.relative.z-0.w-full.pt-full > img')
-            if not main_img_tag:
-                 # Sometimes image is directly under the item div or a common container
-                 main_img_tag = item.select_one('div.shopee-search-item-result__item__info img')
-                 if not main_img_tag:
-                      main_img_tag = item.select_one('div.shop-search-result-view__item__info img')
-
-
-            # 3. If still not found, try a more general img selector within the item (heuristic)
-            #    Filter out known icons or non-product images
-            if not main_img_tag:
-                 all_imgs = item.select('img[src], img[data-src]') # Look for src or data-src
-                 for img in all_imgs:
-                      src_candidate = img.get('src') or img.get('data-src')
-                      if isinstance(src_candidate, str) and len(src_candidate) > 10: # Basic length check
-                           alt = img.get('alt', '').lower()
-                           # Simple heuristic: check if alt suggests it's NOT a product image
-                           if 'icon' not in alt and 'flag' not in alt and 'overlay' not in alt and 'logo' not in alt and 'qr code' not in alt:
-                                # Check src/data-src pattern - avoid very short or clearly non-product image URLs
-                                if not src_candidate.startswith('data:') and not src_candidate.endswith('.svg') and not src_candidate.endswith('.gif'):
-                                     # Check if the src looks like a Shopee product image URL fragment
-                                     if '/file/' in src_candidate or 'img.susercontent.com' in src_candidate: # Check for domain part too
-                                          main_img_tag = img
-                                          break # Take the first plausible one
-
-            # 4. Process the found image tag's src or data-src
-            if main_img_tag:
-                src = main_img_tag.get('src')
-                if not src: # If src is empty or missing, try data-src
-                     src = main_img_tag.get('data-src')
-
-                if isinstance(src, str) and src: # Ensure src is a non-empty string
-                    # Handle different URL formats
-                    if src.startswith('http'):
-                        image_url = src # Use full URL directly
-                    elif src.startswith('//'): # Handle protocol-relative URLs
-                        image_url = 'https:' + src
-                    elif src.startswith('/file/'): # Specific Shopee CDN root-relative pattern
-                        # Extract the path after /file/ and prepend base URL
-                        # Use regex for more robustness in extracting the path segment
-                        match = re.search(r'/file/([a-zA-Z0-9_-]+(?:/[^/]+)?\.\w+)$', src)
-                        if match:
-                             image_filename_with_path = match.group(1)
-                             image_url = f"{SHOPEE_SG_IMAGE_BASE_URL}{image_filename_with_path}"
-                        # Add handling for other known root-relative patterns if necessary
-
-                    # Handle relative paths (e.g., just "filename.webp" or "path/to/filename.webp")
-                    # Assume these might be relative to the CDN base URL path.
-                    if image_url is None: # If not handled by the above patterns
-                         try:
-                             # Try to extract filename and use base URL
-                             image_filename = os.path.basename(src)
-                             if image_filename and '.' in image_filename and len(image_filename) > 3:
-                                  # Basic check if the filename looks like a potential CDN asset name
-                                   if re.match(r'^[a-zA-Z0-9_-]+(?:_[a-zA-Z0-9]+)?\.\w+$', image_filename): # e.g., filename_tn.webp
-                                        image_url = f"{SHOPEE_SG_IMAGE_BASE_URL}{image_filename}" # Prepend base URL
-                                   # Consider handling paths with subdirectories if necessary, but basename loses path.
-                                   # A regex approach might be better for complex relative paths if the structure is known.
-                                   # For now, basename + base URL heuristic for simple filenames.
-                         except Exception: pass # Handle potential error in os.path.basename
-
-
-            product_info['image_url'] = image_url # image_url will be None if not found or parsed
-        except Exception as e:
-            print(f"  アイテム {i+1}: image_url 抽出中にエラーが発生しました: {e}")
-
-
-        # --- Extract Location (必須) ---
-        try:
-            location = None
-            # 1. Try the primary selector (known class structure) - Corrected escaping
-            location_tag = item.select_one('div.flex.items-center.space-x-1.max-w-full span.ml-\\[3px\\]')
-            if isinstance(location_tag, Tag):
-                 location = location_tag.get_text(strip=True)
-
-            # 2. If not found, try finding the location icon and getting text next to it
-            if location is None:
-                 location_icon = item.select_one('img[alt="location-icon"]')
-                 if location_icon:
-                      # Get the parent or sibling element containing the location text
-                      # Look for a span or div near the icon within the parent or nearby siblings
-                      location_candidates = [location_icon.find_parent()] + location_icon.find_parents(limit=2) + location_icon.find_next_siblings(limit=2)
-                      for container in location_candidates:
-                           if container and isinstance(container, Tag):
-                                text = container.get_text(strip=True)
-                                # Clean text to remove icon's alt text if present
-                                text = text.replace(location_icon.get('alt', ''), '').strip()
-                                # Basic heuristic: text is short and contains letters/spaces
-                                if text and 1 < len(text) < 50 and re.search(r'[a-zA-Z\s]', text):
-                                     location = text # Found a plausible location text
-                                     break # Take the first plausible one
-
-
-            # 3. If still not found, try finding elements with class names suggesting location or shipping in common areas
-            if location is None:
-                # Look in the main item div, footer, etc.
-                location_candidates = item.select('div[class*="location"], span[class*="location"], div[class*="shipping"], span[class*="shipping"], div.shopee-item-card__footer span, div.shopee-item-card__footer div') # Look in various places
-                for candidate in location_candidates:
-                     text = candidate.get_text(strip=True)
-                     # Simple heuristic: text is short, contains letters/spaces, and doesn't look like sold count, rating, discount, price
-                     if text and 1 < len(text) < 50 and re.search(r'[a-zA-Z\s]', text):
-                          text_lower = text.lower()
-                           # Exclude text containing "sold", "%", looks purely numeric (rating), or looks like price
-                          if "sold" not in text_lower and "%" not in text_lower and not re.match(r'^\d+(\.\d+)?$', text) and not re.search(r'[$€£¥]', text):
-                               # Further check: exclude text that is clearly just a product count or similar
-                               if not re.match(r'^\d+ / \d+$', text): # e.g., "1 / 5"
-                                   location = text # Found a plausible location text
-                                   break # Take the first plausible one
-
-
-            product_info['location'] = location # location will be None if not found by any method
-        except Exception as e:
-            print(f"  アイテム {i+1}: location 抽出中にエラーが発生しました: {e}")
-
-
-        # --- Extract Product Name (必須) and Shop Type (必須) ---
-        # Shop type flag is usually near the name, extract together for context
-        try:
-            product_name = None
-            shop_type = 'Standard' # Default shop type
-            name_div = item.select_one('div.line-clamp-2') # Common selector for name container
-            if not name_div: # Try alternative name container selectors
-                 name_div = item.select_one('div[class*="name"], div[class*="Name"]')
-
-            if name_div:
-                # Product Name
-                name_text = name_div.get_text(strip=True)
-                # Remove potential shop type text like "[Preferred]" with optional surrounding space, case-insensitive
-                name_text = re.sub(r'\s*\[(Preferred|Mall|Official Store)\]\s*', '', name_text, flags=re.IGNORECASE).strip()
-                product_name = name_text if name_text else None
-
-                # Shop Type (based on flag image near the name or within the item)
-                preferred_mall_suffix = None
-                # Look for flag image inside or near the name container
-                shop_type_img = name_div.select_one('img[alt="flag-label"]')
-                if not shop_type_img:
-                     # Try looking directly within the item if not in name_div
-                     shop_type_img = item.select_one('img[alt="flag-label"]')
-                if not shop_type_img:
-                     # Try looking for images with alt attributes containing "Preferred" or "Mall" or "Official Store"
-                     shop_type_img = item.select_one('img[alt*="Preferred"], img[alt*="Mall"], img[alt*="Official Store"]')
-
-
-                if shop_type_img:
-                    img_src = shop_type_img.get('src')
-                    if isinstance(img_src, str):
-                        try:
-                            filename = os.path.basename(img_src)
-                            base_name = os.path.splitext(filename)[0]
-                            # Match suffixes
-                            match = re.search(r'-([a-zA-Z0-9]+)$', base_name)
-                            if match:
-                                preferred_mall_suffix = match.group(1)
-                            # Also check for known suffixes if the filename ends with them
-                            elif base_name.endswith(PREFERRED_SRC_SUFFIX):
-                                preferred_mall_suffix = PREFERRED_SRC_SUFFIX
-                            elif base_name.endswith(MALL_SRC_SUFFIX):
-                                preferred_mall_suffix = MALL_SRC_SUFFIX
-                            elif base_name.endswith(OFFICIAL_STORE_SUFFIX):
-                                preferred_mall_suffix = OFFICIAL_STORE_SUFFIX
-
-
-                            # Determine shop type based on suffix
-                            if preferred_mall_suffix == PREFERRED_SRC_SUFFIX:
-                                shop_type = 'Preferred'
-                            elif preferred_mall_suffix == MALL_SRC_SUFFIX:
-                                shop_type = 'Mall'
-                            elif preferred_mall_suffix == OFFICIAL_STORE_SUFFIX:
-                                shop_type = 'Official Store'
-                            # Default 'Standard' is already set
-                        except Exception as img_e:
-                             pass # Suppress frequent image processing errors unless crucial
-
-            product_info['product_name'] = product_name
-            product_info['shop_type'] = shop_type # Will be 'Standard' if not found/determined
-
-        except Exception as e:
-            print(f"  アイテム {i+1}: product_name/shop_type 抽出中にエラーが発生しました: {e}")
-            # Ensure default shop_type is set even on error
-            if product_info['shop_type'] is None:
-                 product_info['shop_type'] = 'Standard'
-
-
-        # --- Extract Price (必須) and Currency (必須) ---
-        try:
-            price = None
-            currency = None
-            # Try common price/currency container first
-            price_container = item.select_one('div.truncate.flex.items-baseline')
-            if price_container:
-                # Currency (usually the first span in this container)
-                currency_tag = price_container.select_one('span:nth-of-type(1)')
-                currency = currency_tag.get_text(strip=True) if currency_tag else None
-
-                # Price (usually the second span in this container)
-                price_span = price_container.select_one('span:nth-of-type(2)')
-                if price_span:
-                    try: price = float(price_span.get_text(strip=True).replace(',', ''))
-                    except (ValueError, TypeError): pass
-
-            # If price wasn't found, try alternative common selectors
-            if price is None:
-                 alt_price_span = item.select_one('span.shopee-price-range__current-price')
-                 if alt_price_span:
-                      try: price = float(alt_price_span.get_text(strip=True).replace(',', ''))
-                      except (ValueError, TypeError): pass
-
-            # Try a more general price text pattern if still not found (heuristic)
-            if price is None:
-                 # Look for text containing numbers and currency symbols in common price areas
-                 price_candidates = item.select('div.truncate.flex.items-baseline, span.shopee-price-range__current-price, div[class*="price"], div[class*="Price"], div[class*="Price"] span, div[class*="ProductCard"] div[class*="Price"], div[class*="item-card"] div[class*="price"]') # Added more containers
-                 for candidate in price_candidates:
-                      text = candidate.get_text(strip=True)
-                      # Simple heuristic: text contains currency or number and currency-like pattern
-                      if text and 1 < len(text) < 30 and (re.search(r'[$€£¥]\s*[\d,.]+', text) or re.search(r'[\d,.]+\s*[$€£¥]', text) or re.search(r'[\d,.]+', text)): # Match just numbers as a last resort if currency is found nearby?
-                            # Extract number and currency from this text
-                            num_match = re.search(r'[\d,.]+', text.replace(',', ''))
-                            currency_match = re.search(r'[$€£¥]', text)
-                            if num_match:
-                                try:
-                                    price = float(num_match.group(0))
-                                    # If currency wasn't found by primary method, try to find it in this text
-                                    if currency_match and currency is None:
-                                         currency = currency_match.group(0)
-                                    break # Found a price, stop searching
-                                except (ValueError, TypeError):
-                                    pass
-
-            product_info['price'] = price
-            # Apply currency conversion after trying to get currency
-            product_info['currency'] = "SGD" if currency == "$" else currency if currency is not None else None
-
-
-        except Exception as e:
-            print(f"  アイテム {i+1}: price/currency 抽出中にエラーが発生しました: {e}")
-
-
-        # --- Extract Sold Count (必須) ---
-        try:
-            sold_count_value = 0 # Default value
-            # Try primary sold count selectors
-            sold_div = item.select_one('div.truncate.text-shopee-black87.text-xs')
-            if not sold_div: # Try alternative
-                 sold_div = item.select_one('div.shopee-item-card__footer > div:last-child')
-            # Add more alternative sold count selectors if needed
-            if not sold_div:
-                 # Look for text "sold" in common areas like footer spans/divs
-                 sold_candidates = item.select('div.shopee-item-card__footer span, div.shopee-item-card__footer div, span, div')
-                 for candidate in sold_candidates:
-                      text = candidate.get_text(strip=True)
-                      # Heuristic: text contains "sold" keyword
-                      if "sold" in text.lower():
-                           sold_div = candidate # Found a plausible sold text container
-                           break # Take the first one
-
-            if sold_div:
-                sold_text = sold_div.get_text(strip=True)
-                # Regex to find number before "sold", handling commas, decimals, and optional 'k'
-                match = re.search(r'([\d,.]+)([kK])?\s*sold', sold_text, re.IGNORECASE)
-                if match:
-                    try:
-                        sold_num_str = match.group(1).replace(',', '')
-                        sold_num = float(sold_num_str)
-                        # Handle 'k' suffix
-                        if match.group(2):
-                             sold_num *= 1000
-                        sold_count_value = int(sold_num) # Convert to integer
-                    except (ValueError, TypeError):
-                        # If conversion fails, keep default 0
-                        pass
-                # else sold_count_value remains 0
-
-            product_info['sold'] = sold_count_value
-        except Exception as e:
-            print(f"  アイテム {i+1}: sold count 抽出中にエラーが発生しました: {e}")
-            product_info['sold'] = 0 # Ensure default is 0 on error
-
-
-        products.append(product_info)
-        # print(f"  アイテム {i+1} 処理完了。") # 各アイテムの完了を表示 (詳細ログが必要なら)
-
-
-    # print("全てのアイテムの処理が完了しました。") # 全アイテム処理完了を表示
+def _parse_streaming(
+    html_file_path: str,
+    plans: Optional[Mapping[str, ExtractionPlan]] = None,
+    backend: str = "bs4",
+    stats: Optional[ExtractionStats] = None,
+    fingerprints: Optional[ItemFingerprintStore] = None,
+    slim: bool = False,
+    selector_order: Optional[SelectorOrderStore] = None,
+) -> List[Dict[str, Optional[Union[str, float, int]]]] | None:
+    """`parse_shopee_shop_products_from_file_final` のストリーミングモード本体"""
+    list_type_info: Dict[str, Optional[str]] = {}
+    try:
+        with _open_page(html_file_path, slim) as f:
+            products = list(islice(
+                iter_shopee_products_streaming(
+                    f, plans, list_type_info, backend, stats=stats, fingerprints=fingerprints, selector_order=selector_order
+                ),
+                EXTRACT_MAX,
+            ))
+        _flush_stores(fingerprints, selector_order)
+    except FileNotFoundError:
+        print(f"エラー: ファイルが見つかりません - {html_file_path}")
+        return []
+    except Exception as e:
+        print(f"エラー: ファイル読み込み中にエラーが発生しました - {html_file_path}: {e}")
+        return []
 
+    if list_type_info.get("list_type") is None:
+        print(f"エラー: 商品リストの抽出箇所を特定できませんでした。({html_file_path})")
+        return None # 商品リストが見つからなかった場合はNoneを返す
+
+    print(f"{list_type_info['list_type']} の商品リストから、先頭 {len(products)} 件 (最大 {EXTRACT_MAX} 件) を抽出しました。")
     return products
 
+def iter_products(
+    source: ProductSource,
+    backend: str = "lxml",
+    streaming: bool = True,
+    plans: Optional[Mapping[str, ExtractionPlan]] = None,
+    limit: Optional[int] = None,
+    list_type_info: Optional[Dict[str, Optional[str]]] = None,
+    as_records: bool = False,
+    stats: Optional[ExtractionStats] = None,
+    fingerprints: Optional[ItemFingerprintStore] = None,
+    selector_order: Optional[SelectorOrderStore] = None,
+) -> Iterator[Union[ProductInfo, ProductRecord]]:
+    """
+    商品リストHTMLから、商品情報を1件ずつ返すジェネレータ。
+
+    `parse_shopee_shop_products_from_file_final` と違い、入力はファイルパスに限らず、
+    アップロードされたバイト列やファイルオブジェクトをそのまま渡せる (一時ファイルは不要)。
+    件数の上限はなく (`limit` で指定した場合のみ打ち切る)、結果のリストも作らないので、
+    呼び出し側は1件ずつDBなどに書き込める。
+
+    Args:
+        source: HTMLファイルのパス、HTMLのバイト列、またはバイナリモードのファイルオブジェクト。
+            gzip / zstd で圧縮されたものはそのまま渡せる (読み進めながら展開する)。パスは「zip アーカイブのパス!メンバー名」でもよい。
+            zip アーカイブ自体は複数のページを含むので、`html_archive.iter_html_streams` でページに分けてから渡すこと。
+        backend: 解析バックエンド ("bs4" または "lxml")。
+        streaming: True の場合はアイテム単位で読み進める省メモリモード、False の場合は文書全体のツリーを作る。
+        plans: 抽出プランのレジストリ (bs4 バックエンドとストリーミングモードのアイテム検出に使う)。
+        limit: 返す件数の上限。None の場合は全件。
+        list_type_info: 渡された場合、判定したリストタイプを "list_type" キーに書き込む
+            (商品リストのコンテナが見つからなければ None)。
+        as_records: True の場合、辞書の代わりに `ProductRecord` (`__slots__` のレコード) を返す。
+        stats: 渡された場合、フィールドごとの所要時間と値を見つけたフォールバック段階を集計する
+            (`extraction_stats.py` を参照)。
+        fingerprints: 渡された場合、HTMLが前回と同じアイテムはフィールドの抽出をせずに保存済みの商品情報を返す
+            (`item_fingerprints.py` を参照)。ジェネレータが終了 (または close) した時点で flush() する。
+        selector_order: 渡された場合、同じレイアウトのページで外れ続けたセレクタの評価を省く
+            (`selector_order.py` を参照)。ジェネレータが終了 (または close) した時点で flush() する。
+
+    Raises:
+        ValueError: 不明なバックエンドが指定された場合、または zip アーカイブが渡された場合。
+        TypeError: テキストモードのファイルオブジェクトが渡された場合。
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"不明な解析バックエンドです: {backend} (選択肢: {', '.join(BACKENDS)})")
+    if isinstance(source, (str, os.PathLike)):
+        with open_html(os.fspath(source)) as f:
+            yield from iter_products(f, backend, streaming, plans, limit, list_type_info, as_records, stats, fingerprints, selector_order)
+        return
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    elif isinstance(source, io.TextIOBase):
+        raise TypeError("iter_products にはバイナリモードで開いたファイルオブジェクトを渡してください。")
+    with decompressed(source) as stream:
+        yield from _iter_products_stream(
+            stream, backend, streaming, plans, limit, list_type_info, as_records, stats, fingerprints, selector_order
+        )
+
+
+def _iter_products_stream(
+    source: IO[bytes],
+    backend: str,
+    streaming: bool,
+    plans: Optional[Mapping[str, ExtractionPlan]],
+    limit: Optional[int],
+    list_type_info: Optional[Dict[str, Optional[str]]],
+    as_records: bool,
+    stats: Optional[ExtractionStats],
+    fingerprints: Optional[ItemFingerprintStore],
+    selector_order: Optional[SelectorOrderStore] = None,
+) -> Iterator[Union[ProductInfo, ProductRecord]]:
+    """`iter_products` の本体 (展開済みのバイナリストリームを受け取る)"""
+    if list_type_info is None:
+        list_type_info = {}
+    record_factory = ProductRecord if as_records else new_product_info
+    if streaming:
+        products = iter_shopee_products_streaming(
+            source, plans, list_type_info, backend, record_factory, stats, fingerprints, selector_order
+        )
+    else:
+        products = _iter_products_dom(source, backend, plans, list_type_info, record_factory, stats, fingerprints, selector_order)
+    try:
+        yield from (products if limit is None else islice(products, limit))
+    finally:
+        _flush_stores(fingerprints, selector_order)
+
+
+def _iter_products_dom(
+    stream: IO[bytes],
+    backend: str,
+    plans: Optional[Mapping[str, ExtractionPlan]],
+    list_type_info: Dict[str, Optional[str]],
+    record_factory: RecordFactory,
+    stats: Optional[ExtractionStats] = None,
+    fingerprints: Optional[ItemFingerprintStore] = None,
+    selector_order: Optional[SelectorOrderStore] = None,
+) -> Iterator[ProductInfo]:
+    """`iter_products` の通常モード本体。ツリーを作った後、アイテムは1件ずつ抽出して返す"""
+    list_type_info["list_type"] = None
+    layouts = selector_order.page() if selector_order is not None else None
+    html_bytes = stream.read()
+    if backend == "lxml":
+        candidate_xpath_plans = xpath_plans_for(probe_plans(html_bytes))
+        root = parse_html_document(html_bytes) if candidate_xpath_plans else None
+        lxml_plan, lxml_items = detect_items_lxml(root, candidate_xpath_plans) if root is not None else (None, [])
+        if lxml_plan is None:
+            return
+        list_type_info["list_type"] = lxml_plan.list_type
+        for i, lxml_item in enumerate(lxml_items):
+            yield _extract_lxml_item(lxml_item, lxml_plan, i, record_factory, stats, fingerprints, layouts)
+        return
+
+    candidate_plans = probe_plans(html_bytes, plans)
+    if not candidate_plans:
+        return
+    soup = BeautifulSoup(html_bytes.decode('utf-8'), 'lxml')
+    plan, items = detect_items(soup, candidate_plans)
+    if plan is None:
+        return
+    list_type_info["list_type"] = plan.list_type
+    for i, item in enumerate(items):
+        yield _extract_soup_item(item, plan, i, record_factory, stats, fingerprints, layouts)
+
+
+def parse_product_batch(source: ProductSource, **kwargs: Any) -> Optional[ProductBatch]:
+    """
+    `iter_products` の結果を、フィールドごとの列で持つ `ProductBatch` にまとめて返す。
+    商品リストのコンテナが見つからなかった場合は None を返す。キーワード引数は `iter_products` と同じ。
+    """
+    list_type_info: Dict[str, Optional[str]] = {}
+    batch = ProductBatch.from_products(iter_products(source, list_type_info=list_type_info, as_records=True, **kwargs))
+    return batch if list_type_info.get("list_type") is not None else None
+
+
 # ★★★ 新しい関数: CSVファイル書き出し ★★★
-def write_to_csv(data: List[Dict[str, Optional[Union[str, float, int]]]], csv_file_path: str):
+def write_to_csv(data: Union[List[Dict[str, Optional[Union[str, float, int]]]], ProductBatch], csv_file_path: str):
     """
     商品情報のリストをCSVファイルに書き出す。
 
     Args:
-        data: 商品情報の辞書のリスト。
+        data: 商品情報の辞書のリスト、または ProductBatch (行ごとの辞書を作らずに書き出す)。
         csv_file_path: 出力するCSVファイルのパス。
     """
     if not data:
@@ -437,6 +470,10 @@ def write_to_csv(data: List[Dict[str, Optional[Union[str, float, int]]]], csv_fi
 
     try:
         with open(csv_file_path, 'w', newline='', encoding='utf-8') as csvfile:
+            if isinstance(data, ProductBatch):
+                data.write_csv(csvfile, fieldnames)
+                print(f"CSVファイルが正常に書き出されました: {csv_file_path}")
+                return
             writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
 
             # ヘッダー行を書き込む
@@ -455,12 +492,12 @@ def write_to_csv(data: List[Dict[str, Optional[Union[str, float, int]]]], csv_fi
 
 
 # ★★★ 新しい関数: JSONファイル書き出し ★★★
-def write_to_json(data: List[Dict[str, Optional[Union[str, float, int]]]], json_file_path: str):
+def write_to_json(data: Union[List[Dict[str, Optional[Union[str, float, int]]]], ProductBatch], json_file_path: str):
      """
      商品情報のリストをJSONファイルに書き出す。
 
      Args:
-         data: 商品情報の辞書のリスト。
+         data: 商品情報の辞書のリスト、または ProductBatch (行ごとの辞書を作らずに書き出す)。
          json_file_path: 出力するJSONファイルのパス。
      """
      if not data:
@@ -468,15 +505,11 @@ def write_to_json(data: List[Dict[str, Optional[Union[str, float, int]]]], json_
          return
 
      try:
-         # JSON書き出し時に rating と discount を含めないように、一旦新しい辞書を作成
-         data_to_dump = []
-         for item in data:
-              cleaned_item = {k: v for k, v in item.items() if k not in ['rating', 'discount']}
-              data_to_dump.append(cleaned_item)
-
+         # 辞書ごとのコピーは作らず、列形式にまとめてから書き出す
+         # (ProductBatch は PRODUCT_FIELDS しか持たないので、rating / discount は含まれない)
+         batch = data if isinstance(data, ProductBatch) else ProductBatch.from_products(data)
          with open(json_file_path, 'w', encoding='utf-8') as jsonfile:
-             # JSON形式で整形して書き出す
-             json.dump(data_to_dump, jsonfile, ensure_ascii=False, indent=4)
+             batch.write_json(jsonfile, indent=4)
 
          print(f"JSONファイルが正常に書き出されました: {json_file_path}")
 
@@ -490,13 +523,35 @@ if __name__ == "__main__":
     parser.add_argument('html_file_path', help='処理するHTMLファイルのパス')
     parser.add_argument('--output_csv', help='結果をCSVファイルに書き出す場合のパス')
     parser.add_argument('--output_json', help='結果をJSONファイルに書き出す場合のパス')
+    parser.add_argument('--output_jsonl', help='結果をJSONLファイルに書き出す場合のパス')
+    parser.add_argument('--output_parquet', help='結果を型付きの Parquet ファイルに書き出す場合のパス (pyarrow が必要。uv sync --extra parquet)')
+    parser.add_argument('--streaming', action='store_true', help='文書全体のツリーを作らない省メモリモードで解析する')
+    parser.add_argument('--backend', choices=BACKENDS, default="bs4", help='解析バックエンド (bs4: BeautifulSoup, lxml: lxml/XPath)')
+    parser.add_argument('--cache_dir', help='解析結果をキャッシュするディレクトリ (同じ内容のページは解析をスキップする)')
+    parser.add_argument('--stats', action='store_true', help='フィールドごとの抽出時間とフォールバック段階の割合を表示する')
+    parser.add_argument('--fingerprint_db', help='アイテムの指紋を保存する SQLite ファイル (前回と同じアイテムは抽出をスキップする)')
+    parser.add_argument('--slim', action='store_true', help='商品グリッド以外のノードを取り除いてから解析する')
+    parser.add_argument('--selector_order_db', help='レイアウトごとのセレクタの一致回数を保存する SQLite ファイル (外れ続けるセレクタを省く)')
 
     args = parser.parse_args()
 
     print(f"--- 処理開始: {args.html_file_path} ---") # 処理開始を示すメッセージ
 
     # HTMLファイルを指定して抽出関数を呼び出す
-    products_list = parse_shopee_shop_products_from_file_final(args.html_file_path)
+    parse_cache = ParseCache(args.cache_dir, PARSER_VERSION) if args.cache_dir else None
+    extraction_stats = ExtractionStats() if args.stats else None
+    item_fingerprints = ItemFingerprintStore(args.fingerprint_db, PARSER_VERSION) if args.fingerprint_db else None
+    selector_order = SelectorOrderStore(args.selector_order_db, PARSER_VERSION) if args.selector_order_db else None
+    products_list = parse_shopee_shop_products_from_file_final(
+        args.html_file_path, streaming=args.streaming, backend=args.backend, cache=parse_cache, stats=extraction_stats,
+        fingerprints=item_fingerprints, slim=args.slim, selector_order=selector_order,
+    )
+    if item_fingerprints is not None:
+        print(f"アイテムの指紋: {item_fingerprints.stats()}")
+        item_fingerprints.close()
+    if selector_order is not None:
+        print(f"セレクタの順序: {selector_order.stats()}")
+        selector_order.close()
 
     print("\n--- 抽出結果 ---") # 結果表示の前に区切り線
 
@@ -520,7 +575,21 @@ if __name__ == "__main__":
         # JSONファイルに書き出し (指定がある場合)
         if args.output_json:
              write_to_json(products_list, args.output_json) # write_to_json 関数内で rating/discount を除外するように修正済み
+
+        # JSONL / Parquet に書き出し (指定がある場合)
+        for output_path in (args.output_jsonl, args.output_parquet):
+            if output_path:
+                with open_product_writer(output_path) as writer:
+                    writer.write_many(products_list)
+                print(f"ファイルが正常に書き出されました: {output_path}")
     else:
         print("商品リストの解析に失敗しました（リストのコンテナが見つかりませんでした）。")
+
+    if extraction_stats is not None:
+        print(f"\n--- フィールド別の抽出時間とフォールバック段階 ({extraction_stats.items} アイテム) ---")
+        for line in extraction_stats.format_lines():
+            print(line)
+        for message in extraction_stats.error_samples:
+            print(f"  エラー: {message}")
     print("--- 処理終了 ---") # 処理終了を示すメッセージ
 
@@ -0,0 +1,264 @@
+"""
+商品情報の省メモリな表現
+
+抽出結果は1アイテムごとに辞書として作られ、さらにAPIやJSON書き出しでフィルタ用の辞書が
+何度も作り直されていた。1日に数千ページを取り込むと、この辞書の確保と破棄が無視できない。
+
+- `ProductRecord`: 1アイテム分の商品情報。`__slots__` で属性を固定しているので辞書より小さく、
+  `record["price"]` / `record.get("price")` / `record.items()` のように辞書と同じ書き方でも読み書きできる
+  (抽出関数やキャッシュなど、辞書を前提にしたコードにそのまま渡せる)。
+- `ProductBatch`: 1ページ分 (または複数ページ分) の商品情報を、フィールドごとのリスト (列) で持つコンテナ。
+  DBへの一括書き込み用のタプル、CSV / JSON / JSONL、pandas の DataFrame、pyarrow の Table に
+  行ごとの辞書を作らずに変換できる。
+"""
+import csv
+import json
+from typing import IO, Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+# 商品情報のフィールド (出力の列順)
+PRODUCT_FIELDS: Tuple[str, ...] = (
+    "product_name",
+    "price",
+    "currency",
+    "image_url",
+    "product_url",
+    "location",
+    "sold",
+    "shop_type",
+)
+_FIELD_SET = frozenset(PRODUCT_FIELDS)
+# Arrow / Parquet に書き出すときの列の型 (ここにないフィールドは文字列)
+ARROW_FIELD_TYPES: Dict[str, str] = {"price": "float64", "sold": "int64"}
+
+FieldValue = Optional[Union[str, float, int]]
+
+
+class ProductRecord:
+    """1アイテム分の商品情報 (辞書と同じインターフェースでも扱える)"""
+
+    __slots__ = PRODUCT_FIELDS
+
+    def __init__(self, **values: FieldValue):
+        self.product_name = None
+        self.price = None
+        self.currency = None
+        self.image_url = None
+        self.product_url = None
+        self.location = None  # 必須
+        self.sold = 0  # 必須, Default value
+        self.shop_type = None  # 必須, Default determined later
+        for key, value in values.items():
+            self[key] = value
+
+    @classmethod
+    def from_mapping(cls, values: Mapping[str, Any]) -> "ProductRecord":
+        """辞書などから作る (PRODUCT_FIELDS 以外のキーは無視する)"""
+        record = cls()
+        for key in PRODUCT_FIELDS:
+            if key in values:
+                setattr(record, key, values[key])
+        return record
+
+    def __getitem__(self, key: str) -> FieldValue:
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value: FieldValue) -> None:
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key: object) -> bool:
+        return key in _FIELD_SET
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(PRODUCT_FIELDS)
+
+    def __len__(self) -> int:
+        return len(PRODUCT_FIELDS)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, ProductRecord):
+            return self.as_tuple() == other.as_tuple()
+        if isinstance(other, Mapping):
+            return set(other) == _FIELD_SET and all(other[key] == getattr(self, key) for key in PRODUCT_FIELDS)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        values = ", ".join(f"{key}={getattr(self, key)!r}" for key in PRODUCT_FIELDS)
+        return f"ProductRecord({values})"
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in _FIELD_SET else default
+
+    def keys(self) -> Tuple[str, ...]:
+        return PRODUCT_FIELDS
+
+    def values(self) -> List[FieldValue]:
+        return [getattr(self, key) for key in PRODUCT_FIELDS]
+
+    def items(self) -> List[Tuple[str, FieldValue]]:
+        return [(key, getattr(self, key)) for key in PRODUCT_FIELDS]
+
+    def update(self, values: Mapping[str, FieldValue]) -> None:
+        for key, value in values.items():
+            self[key] = value
+
+    def as_tuple(self, fields: Sequence[str] = PRODUCT_FIELDS) -> Tuple[FieldValue, ...]:
+        """指定したフィールドの値をタプルで返す (DBへの一括書き込みのパラメータ用)"""
+        return tuple(getattr(self, key) for key in fields)
+
+    def to_dict(self) -> Dict[str, FieldValue]:
+        """辞書に変換する (JSON出力など、辞書が必要な場面用)"""
+        return {key: getattr(self, key) for key in PRODUCT_FIELDS}
+
+
+def _encode_json_keys(fields: Sequence[str], indent: Optional[int], level: int) -> Tuple[List[str], str]:
+    """
+    JSONオブジェクトの各値の直前に置く文字列 ("{" / 区切り + キー) と、オブジェクトを閉じる文字列を作る。
+    区切り文字は `json.dumps` のデフォルトと同じにする。
+    """
+    keys = [json.dumps(key, ensure_ascii=False) for key in fields]
+    if indent is None:
+        return [("{" if i == 0 else ", ") + key + ": " for i, key in enumerate(keys)], "}"
+    inner = "\n" + " " * (indent * (level + 1))
+    prefixes = [("{" if i == 0 else ",") + inner + key + ": " for i, key in enumerate(keys)]
+    return prefixes, "\n" + " " * (indent * level) + "}"
+
+
+class ProductBatch:
+    """
+    商品情報をフィールドごとの列 (リスト) で持つコンテナ。
+
+    `columns[field][i]` が i 番目の商品の field の値。行を取り出すときは
+    `rows()` (タプル) か `record(i)` (ProductRecord) を使う。
+    """
+
+    __slots__ = ("columns",)
+
+    def __init__(self, columns: Optional[Mapping[str, List[FieldValue]]] = None):
+        self.columns: Dict[str, List[FieldValue]] = {key: [] for key in PRODUCT_FIELDS}
+        if columns:
+            lengths = {len(values) for values in columns.values()}
+            if len(lengths) > 1:
+                raise ValueError("ProductBatch の列の長さが揃っていません。")
+            for key, values in columns.items():
+                if key not in _FIELD_SET:
+                    raise KeyError(key)
+                self.columns[key] = list(values)
+            size = lengths.pop() if lengths else 0
+            for key in PRODUCT_FIELDS:
+                if key not in columns:
+                    self.columns[key] = [0 if key == "sold" else None] * size
+
+    @classmethod
+    def from_products(cls, products: Iterable[Mapping[str, Any]]) -> "ProductBatch":
+        """ProductRecord や辞書の並びから作る"""
+        batch = cls()
+        batch.extend(products)
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.columns["product_url"])
+
+    def __iter__(self) -> Iterator[ProductRecord]:
+        for i in range(len(self)):
+            yield self.record(i)
+
+    def __getitem__(self, index: int) -> ProductRecord:
+        return self.record(index)
+
+    def __repr__(self) -> str:
+        return f"ProductBatch(len={len(self)})"
+
+    def append(self, product: Mapping[str, Any]) -> None:
+        """ProductRecord または辞書を1件追加する (足りないフィールドは初期値になる)"""
+        if isinstance(product, ProductRecord):
+            for key in PRODUCT_FIELDS:
+                self.columns[key].append(getattr(product, key))
+            return
+        for key in PRODUCT_FIELDS:
+            self.columns[key].append(product.get(key, 0 if key == "sold" else None))
+
+    def extend(self, products: Iterable[Mapping[str, Any]]) -> None:
+        for product in products:
+            self.append(product)
+
+    def record(self, index: int) -> ProductRecord:
+        """i 番目の商品を ProductRecord として取り出す"""
+        record = ProductRecord()
+        for key in PRODUCT_FIELDS:
+            setattr(record, key, self.columns[key][index])
+        return record
+
+    def rows(self, fields: Sequence[str] = PRODUCT_FIELDS) -> Iterator[Tuple[FieldValue, ...]]:
+        """指定したフィールドの値のタプルを1行ずつ返す (DBの executemany などにそのまま渡せる)"""
+        return zip(*(self.columns[key] for key in fields))
+
+    def write_csv(self, f: IO[str], fields: Sequence[str] = PRODUCT_FIELDS, header: bool = True) -> None:
+        """CSVとして書き出す (None は空文字列にする)"""
+        writer = csv.writer(f)
+        if header:
+            writer.writerow(fields)
+        writer.writerows(tuple('' if value is None else value for value in row) for row in self.rows(fields))
+
+    def iter_json(self, fields: Sequence[str] = PRODUCT_FIELDS, indent: Optional[int] = None, level: int = 0) -> Iterator[str]:
+        """
+        各商品をJSONオブジェクトの文字列として1件ずつ返す。
+        キーの部分は最初に一度だけ組み立て、値だけを行ごとに変換する。
+        """
+        prefixes, closing = _encode_json_keys(fields, indent, level)
+        dumps = json.dumps
+        for row in self.rows(fields):
+            yield "".join(prefix + dumps(value, ensure_ascii=False) for prefix, value in zip(prefixes, row)) + closing
+
+    def write_jsonl(self, f: IO[str], fields: Sequence[str] = PRODUCT_FIELDS) -> None:
+        """JSON Lines として書き出す"""
+        for line in self.iter_json(fields):
+            f.write(line)
+            f.write("\n")
+
+    def write_json(self, f: IO[str], fields: Sequence[str] = PRODUCT_FIELDS, indent: Optional[int] = 4) -> None:
+        """
+        JSONの配列として書き出す。`json.dump(list_of_dicts, f, ensure_ascii=False, indent=indent)` と同じ出力になる。
+        """
+        if not len(self):
+            f.write("[]")
+            return
+        if indent is None:
+            separator, opening, closing = ", ", "[", "]"
+        else:
+            pad = "\n" + " " * indent
+            separator, opening, closing = "," + pad, "[" + pad, "\n]"
+        f.write(opening)
+        for i, obj in enumerate(self.iter_json(fields, indent, level=1 if indent is not None else 0)):
+            if i:
+                f.write(separator)
+            f.write(obj)
+        f.write(closing)
+
+    def to_pandas(self) -> Any:
+        """pandas の DataFrame に変換する (列のリストをそのまま渡すので、行ごとの辞書は作らない)"""
+        try:
+            import pandas as pd
+        except ImportError as e:
+            raise ImportError("ProductBatch.to_pandas() には pandas が必要です。") from e
+        return pd.DataFrame(self.columns, columns=list(PRODUCT_FIELDS))
+
+    def to_arrow(self, fields: Sequence[str] = PRODUCT_FIELDS) -> Any:
+        """pyarrow の Table に変換する (列の型は `arrow_schema()`。値がすべて None の列も型が付く)"""
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise ImportError("ProductBatch.to_arrow() には pyarrow が必要です (uv sync --extra parquet)。") from e
+        return pa.Table.from_pydict({key: self.columns[key] for key in fields}, schema=arrow_schema(fields))
+
+
+def arrow_schema(fields: Sequence[str] = PRODUCT_FIELDS) -> Any:
+    """商品情報の pyarrow のスキーマ (price は float64、sold は int64、それ以外は文字列。いずれも null を許す)"""
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise ImportError("arrow_schema() には pyarrow が必要です (uv sync --extra parquet)。") from e
+    return pa.schema([(key, getattr(pa, ARROW_FIELD_TYPES.get(key, "string"))()) for key in fields])
@@ -0,0 +1,177 @@
+"""
+商品情報の逐次書き出し (JSONL / CSV / Parquet)
+
+`write_to_csv` / `write_to_json` は1ページ分のリストを受け取って一度に書き出すため、
+複数ページをまとめて書き出すには全ページの結果をメモリに持っておく必要があった。
+
+このモジュールのライターは、`iter_products()` やバッチ処理の結果を届いた順に受け取り、
+`chunk_size` 件ごとに `ProductBatch` (列形式) にまとめて書き出す。メモリに持つのは書き出し前の1チャンク分だけなので、
+何ページ分でも一定のメモリで書き出せる。
+
+- JSONL / CSV: `ProductBatch.write_jsonl` / `write_csv` と同じ形式 (CSV のヘッダーは最初の1回だけ)。
+- Parquet: 型付きのスキーマ (`product_record.arrow_schema()`) で、チャンクごとに1つの row group として書き出す。
+  pandas などで読み込むときに文字列から型を推測し直す必要がない。pyarrow は Parquet を使う場合のみ必要 (`uv sync --extra parquet`)。
+
+使い方:
+    with open_product_writer("products.parquet") as writer:
+        writer.write_many(iter_products(html_bytes))
+"""
+import os
+from typing import IO, Any, Iterable, Mapping, Optional, Sequence, Union
+
+from .product_record import PRODUCT_FIELDS, ProductBatch, arrow_schema
+
+DEFAULT_CHUNK_SIZE = 5000
+# 拡張子から判定する書き出し形式
+WRITER_FORMATS = {".jsonl": "jsonl", ".csv": "csv", ".parquet": "parquet"}
+
+OutputTarget = Union[str, os.PathLike, IO[Any]]
+
+
+class ProductWriter:
+    """
+    ライターの共通部分。`write` / `write_many` で受け取った商品を `chunk_size` 件ごとに書き出す。
+    パスを渡した場合はファイルを開いて close() で閉じ、ファイルオブジェクトを渡した場合は閉じない。
+    """
+
+    _binary = False
+
+    def __init__(self, target: OutputTarget, chunk_size: int = DEFAULT_CHUNK_SIZE, fields: Sequence[str] = PRODUCT_FIELDS):
+        if chunk_size <= 0:
+            raise ValueError("chunk_size は1以上を指定してください。")
+        self.chunk_size = chunk_size
+        self.fields = tuple(fields)
+        self.written = 0
+        self._buffer = ProductBatch()
+        self._owns_file = isinstance(target, (str, os.PathLike))
+        if self._owns_file:
+            self.file: IO[Any] = open(target, 'wb') if self._binary else open(target, 'w', newline='', encoding='utf-8')
+        else:
+            self.file = target  # type: ignore[assignment]
+        self.closed = False
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(written={self.written}, pending={len(self._buffer)})"
+
+    def __enter__(self) -> "ProductWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def write(self, product: Mapping[str, Any]) -> None:
+        """ProductRecord または辞書を1件書き出す (実際の書き込みはチャンクがたまってから)"""
+        self._buffer.append(product)
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def write_many(self, products: Iterable[Mapping[str, Any]]) -> int:
+        """商品を順に書き出し、受け取った件数を返す"""
+        count = 0
+        for product in products:
+            self.write(product)
+            count += 1
+        return count
+
+    def flush(self) -> None:
+        """たまっている商品を書き出す"""
+        if len(self._buffer):
+            self._write_batch(self._buffer)
+            self.written += len(self._buffer)
+            self._buffer = ProductBatch()
+        self.file.flush()
+
+    def close(self) -> None:
+        """残りを書き出して閉じる (何度呼んでもよい)"""
+        if self.closed:
+            return
+        try:
+            self.flush()
+            self._finish()
+        finally:
+            self.closed = True
+            if self._owns_file:
+                self.file.close()
+
+    def _write_batch(self, batch: ProductBatch) -> None:
+        raise NotImplementedError
+
+    def _finish(self) -> None:
+        """書き出しの最後に必要な処理 (Parquet のフッターなど)"""
+
+
+class JsonlProductWriter(ProductWriter):
+    """JSON Lines で書き出す"""
+
+    def _write_batch(self, batch: ProductBatch) -> None:
+        batch.write_jsonl(self.file, self.fields)
+
+
+class CsvProductWriter(ProductWriter):
+    """CSV で書き出す (ヘッダーは最初のチャンクの前に1回だけ。0件でもヘッダーは書く)"""
+
+    def __init__(self, target: OutputTarget, chunk_size: int = DEFAULT_CHUNK_SIZE, fields: Sequence[str] = PRODUCT_FIELDS):
+        super().__init__(target, chunk_size, fields)
+        self._header_written = False
+
+    def _write_batch(self, batch: ProductBatch) -> None:
+        batch.write_csv(self.file, self.fields, header=not self._header_written)
+        self._header_written = True
+
+    def _finish(self) -> None:
+        if not self._header_written:
+            ProductBatch().write_csv(self.file, self.fields)
+            self._header_written = True
+
+
+class ParquetProductWriter(ProductWriter):
+    """型付きのスキーマの Parquet で書き出す (チャンクごとに1つの row group)"""
+
+    _binary = True
+
+    def __init__(
+        self,
+        target: OutputTarget,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        fields: Sequence[str] = PRODUCT_FIELDS,
+        compression: str = "zstd",
+    ):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet の書き出しには pyarrow が必要です (uv sync --extra parquet)。") from e
+        super().__init__(target, chunk_size, fields)
+        self._schema = arrow_schema(self.fields)
+        self._parquet = pq.ParquetWriter(self.file, self._schema, compression=compression)
+
+    def _write_batch(self, batch: ProductBatch) -> None:
+        self._parquet.write_table(batch.to_arrow(self.fields), row_group_size=len(batch))
+
+    def _finish(self) -> None:
+        self._parquet.close()
+
+
+_WRITER_CLASSES = {"jsonl": JsonlProductWriter, "csv": CsvProductWriter, "parquet": ParquetProductWriter}
+
+
+def open_product_writer(
+    target: OutputTarget,
+    fmt: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    fields: Sequence[str] = PRODUCT_FIELDS,
+) -> ProductWriter:
+    """
+    書き出し形式 ("jsonl" / "csv" / "parquet") のライターを作る。`fmt` を省略した場合はパスの拡張子から判定する。
+
+    Raises:
+        ValueError: 形式を判定できない場合。
+    """
+    if fmt is None:
+        if not isinstance(target, (str, os.PathLike)):
+            raise ValueError("ファイルオブジェクトに書き出す場合は fmt を指定してください。")
+        fmt = WRITER_FORMATS.get(os.path.splitext(os.fspath(target))[1].lower())
+        if fmt is None:
+            raise ValueError(f"拡張子から書き出し形式を判定できません: {target} (選択肢: {', '.join(WRITER_FORMATS)})")
+    if fmt not in _WRITER_CLASSES:
+        raise ValueError(f"不明な書き出し形式です: {fmt} (選択肢: {', '.join(_WRITER_CLASSES)})")
+    return _WRITER_CLASSES[fmt](target, chunk_size, fields)
@@ -0,0 +1,402 @@
+"""
+レイアウトごとのセレクタの順序の学習 (外れ続ける段階の省略)
+
+画像・ロケーション・商品名・価格・販売数の抽出関数は、主要セレクタ → 代替のセレクタ → ヒューリスティック
+の順に試す。レイアウトによっては最初の1〜2段階が必ず外れ、アイテムごとにその分の評価が無駄になっている。
+
+`SelectorOrderStore` は、ページの最初に抽出するアイテムに含まれる (タグ名, class) の組の集合をレイアウトの指紋とし、
+そのレイアウトで各段階のセレクタ (`SKIPPABLE_SELECTORS`) が評価された回数と一致した回数を記録する。
+`min_samples` 回以上評価されて一度も一致しなかったセレクタは、同じ指紋のページでは評価せずに外れとして扱う。
+抽出関数はそのまま次の段階へ進むので、実質的に「そのレイアウトで値を見つけたセレクタ」から試すことになる。
+記録は SQLite のファイルに保存し、次回以降の実行でも使う。
+
+学習した省略が外れた場合に備えて、次の確認を行う。
+- 省略を適用するのは、部分木の (タグ名, class) の組がどれも、同じページで全段階を試したアイテムに含まれていたアイテムだけ。
+  新しい組を含むアイテム (ページの途中でロケーションの要素が現れた場合など) は、省略したセレクタが一致しうるので
+  全段階を試す (一致すれば下の確認と同じく学習し直す)。組を集めるのは部分木を1回たどるだけなので、
+  省略したセレクタをそれぞれ評価するより安い。
+- 省略したセレクタが担当するフィールドの値が見つからなかったアイテムは、全段階を試して抽出し直す
+  (そのレイアウトでもともと値がないことの多いフィールド (`GUARD_FOUND_SHARE` 未満) は除く)。
+- 各ページの最初のアイテムと、以降 `audit_interval` 件ごとのアイテムは全段階を試し、
+  省略していたセレクタが一致した場合はそのレイアウトの記録を消して学習し直す。
+ヒューリスティックの段階 (候補の要素を総なめする最後の手段) とフィールドの値を決めない補助のセレクタは省略しない。
+
+抽出結果が変わる変更をしたら `parse_product_list.PARSER_VERSION` を上げること (指紋に含めるので記録も作り直される)。
+書き込みはまとめて行う。解析の最後に `flush()` を呼ぶこと (`parse_product_list` の関数は呼び出し側の代わりに呼ぶ)。
+"""
+import copy
+import hashlib
+import json
+import os
+import pathlib
+import sqlite3
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from bs4.element import Tag
+
+from .extraction_stats import ExtractionStats
+
+# フィールド -> 値を見つける段階のセレクタ (プランの属性名。タプルの属性は要素ごとに扱う)
+SKIPPABLE_SELECTORS: Dict[str, Tuple[str, ...]] = {
+    "image_url": ("link_img", "image_fallbacks"),
+    "location": ("location_primary", "location_icon"),
+    "product_name": ("name_containers",),
+    "price": ("price_container", "price_alt"),
+    "sold": ("sold_primary",),
+}
+
+DEFAULT_MIN_SAMPLES = 50
+DEFAULT_AUDIT_INTERVAL = 100
+# 全段階を試したアイテムのうち、この割合以上で値が見つかったフィールドだけ、値がなければ抽出し直す
+GUARD_FOUND_SHARE = 0.9
+# フィールドの値が見つかった回数を記録するキーの接頭辞 (評価回数 = 全段階を試したアイテム数)
+FOUND_PREFIX = "found:"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS selector_order (
+    layout TEXT NOT NULL,
+    selector TEXT NOT NULL,
+    evaluated INTEGER NOT NULL,
+    hits INTEGER NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (layout, selector)
+);
+"""
+
+_COUNT_LAYOUTS = "SELECT COUNT(DISTINCT layout) FROM selector_order"
+
+# 抽出関数 (`extract_item` / `extract_item_lxml`)
+ItemExtractor = Callable[[Any, Any, int, Callable[[], Any], Optional[ExtractionStats]], Any]
+
+
+def _raw_pairs(item: Any) -> Set[Tuple[Any, Any]]:
+    """
+    アイテムの部分木に含まれる (タグ名, class 属性) の組の集合 (class は分割・整列しない。省略を適用してよいかの確認用で、
+    レイアウトの指紋には使わない)
+    """
+    if isinstance(item, Tag):
+        return {(tag.name, tuple(tag.get("class") or ())) for tag in (item, *item.find_all(True))}
+    return {(element.tag, element.get("class")) for element in item.iter()}
+
+
+def layout_signature(item: Any) -> str:
+    """アイテム (bs4 の Tag または lxml の要素) の部分木に含まれる (タグ名, class) の組を、重複を除いて並べた文字列"""
+    signatures: Set[str] = set()
+    if isinstance(item, Tag):
+        for tag in (item, *item.find_all(True)):
+            signatures.add(".".join([tag.name, *sorted(tag.get("class") or ())]))
+    else:
+        for element in item.iter():
+            if isinstance(element.tag, str):
+                signatures.add(".".join([element.tag, *sorted((element.get("class") or "").split())]))
+    return "\n".join(sorted(signatures))
+
+
+def _selector_keys(plan: Any) -> Iterator[Tuple[str, str, Optional[int]]]:
+    """(記録のキー, フィールド, タプル内の位置) を返す。キーは属性名、タプルの要素は "属性名[位置]" """
+    for field, attrs in SKIPPABLE_SELECTORS.items():
+        for attr in attrs:
+            value = getattr(plan, attr)
+            if isinstance(value, tuple):
+                for i in range(len(value)):
+                    yield f"{attr}[{i}]", field, i
+            else:
+                yield attr, field, None
+
+
+def _replace_selectors(plan: Any, make: Callable[[str, Any], Any]) -> Any:
+    """プランの浅いコピーを作り、省略できるセレクタを `make(キー, 元のセレクタ)` の結果に置き換える"""
+    replaced = copy.copy(plan)
+    for attr in {attr for attrs in SKIPPABLE_SELECTORS.values() for attr in attrs}:
+        value = getattr(plan, attr)
+        if isinstance(value, tuple):
+            setattr(replaced, attr, tuple(make(f"{attr}[{i}]", selector) for i, selector in enumerate(value)))
+        else:
+            setattr(replaced, attr, make(attr, value))
+    return replaced
+
+
+class _SkippedSelector:
+    """常に外れるセレクタ (soupsieve のコンパイル済みセレクタと lxml の XPath のどちらの使い方にも対応する)"""
+
+    __slots__ = ()
+
+    def select_one(self, tag: Any) -> None:
+        return None
+
+    def __call__(self, element: Any) -> List[Any]:
+        return []
+
+
+_SKIPPED = _SkippedSelector()
+
+
+class _RecordingSelector:
+    """評価されたこと・一致したことを記録するセレクタ (学習と確認に使う)"""
+
+    __slots__ = ("selector", "key", "evaluated", "hits")
+
+    def __init__(self, selector: Any, key: str, evaluated: Set[str], hits: Set[str]):
+        self.selector = selector
+        self.key = key
+        self.evaluated = evaluated
+        self.hits = hits
+
+    def select_one(self, tag: Any) -> Any:
+        self.evaluated.add(self.key)
+        result = self.selector.select_one(tag)
+        if result is not None:
+            self.hits.add(self.key)
+        return result
+
+    def __call__(self, element: Any) -> List[Any]:
+        self.evaluated.add(self.key)
+        result = self.selector(element)
+        if result:
+            self.hits.add(self.key)
+        return result
+
+
+class _LayoutRecord:
+    """1つのレイアウトの、セレクタごとの評価回数と一致回数 (保存済みのものと未保存の差分)"""
+
+    def __init__(self, key: str, rows: Iterable[Tuple[str, int, int]]):
+        self.key = key
+        self.evaluated: Dict[str, int] = {}
+        self.hits: Dict[str, int] = {}
+        for selector, evaluated, hits in rows:
+            self.evaluated[selector] = evaluated
+            self.hits[selector] = hits
+        self.pending_evaluated: Dict[str, int] = {}
+        self.pending_hits: Dict[str, int] = {}
+        self.reset_pending = False
+
+    def observe(self, evaluated: Set[str], hits: Set[str]) -> None:
+        for selector in evaluated:
+            self.evaluated[selector] = self.evaluated.get(selector, 0) + 1
+            self.pending_evaluated[selector] = self.pending_evaluated.get(selector, 0) + 1
+        for selector in hits:
+            self.hits[selector] = self.hits.get(selector, 0) + 1
+            self.pending_hits[selector] = self.pending_hits.get(selector, 0) + 1
+
+    def reset(self) -> None:
+        """記録を消して学習し直す (保存済みの行も flush() で消す)"""
+        self.evaluated.clear()
+        self.hits.clear()
+        self.pending_evaluated.clear()
+        self.pending_hits.clear()
+        self.reset_pending = True
+
+    def skipped(self, min_samples: int) -> frozenset:
+        return frozenset(
+            selector for selector, evaluated in self.evaluated.items()
+            if evaluated >= min_samples and not self.hits.get(selector) and not selector.startswith(FOUND_PREFIX)
+        )
+
+    def found_share(self, field: str) -> float:
+        evaluated = self.evaluated.get(FOUND_PREFIX + field, 0)
+        return self.hits.get(FOUND_PREFIX + field, 0) / evaluated if evaluated else 0.0
+
+
+class _LayoutRun:
+    """1ページ・1プラン分の抽出の状態 (学習した省略を適用したプランと、全段階を試すプラン)"""
+
+    def __init__(self, store: "SelectorOrderStore", record: _LayoutRecord, plan: Any):
+        self.store = store
+        self.record = record
+        self.plan = plan
+        self.count = 0
+        self._evaluated: Set[str] = set()
+        self._hits: Set[str] = set()
+        self.recording_plan = _replace_selectors(plan, lambda key, selector: _RecordingSelector(selector, key, self._evaluated, self._hits))
+        self.skipped: frozenset = frozenset()
+        self.adapted_plan: Any = None
+        self.guarded_fields: Tuple[str, ...] = ()
+        # このページで全段階を試したアイテムに含まれていた (タグ名, class) の組 (省略を適用している間だけ集める)
+        self._known_pairs: Set[Tuple[Any, Any]] = set()
+        self._refresh()
+
+    def _refresh(self) -> None:
+        skipped = self.record.skipped(self.store.min_samples)
+        if skipped == self.skipped and (self.adapted_plan is not None or not skipped):
+            return
+        self.skipped = skipped
+        if not skipped:
+            self.adapted_plan = None
+            self.guarded_fields = ()
+            return
+        self.adapted_plan = _replace_selectors(self.plan, lambda key, selector: _SKIPPED if key in skipped else selector)
+        self.guarded_fields = tuple(sorted(
+            {field for key, field, _ in _selector_keys(self.plan) if key in skipped and self.record.found_share(field) >= GUARD_FOUND_SHARE}
+        ))
+
+    def extract(self, extract: ItemExtractor, item: Any, position: int, record_factory: Callable[[], Any], stats: Optional[ExtractionStats]) -> Any:
+        store = self.store
+        audit = self.count % store.audit_interval == 0
+        self.count += 1
+        pairs = _raw_pairs(item) if self.adapted_plan is not None else None
+        if pairs is not None and not audit and not pairs <= self._known_pairs:
+            # 全段階を試したアイテムにない要素を含む: 省略したセレクタが一致しうるので全段階を試す
+            store.fallbacks += 1
+        elif pairs is not None and not audit:
+            item_stats = ExtractionStats() if stats is not None else None
+            product = extract(item, self.adapted_plan, position, record_factory, item_stats)
+            if all(product.get(field) for field in self.guarded_fields):
+                store.adapted_items += 1
+                if stats is not None and item_stats is not None:
+                    stats.merge(item_stats)
+                return product
+            # 省略したセレクタが担当するフィールドが見つからなかったので、全段階を試し直す
+            store.fallbacks += 1
+
+        self._evaluated.clear()
+        self._hits.clear()
+        product = extract(item, self.recording_plan, position, record_factory, stats)
+        for field in SKIPPABLE_SELECTORS:
+            self._evaluated.add(FOUND_PREFIX + field)
+            if product.get(field):
+                self._hits.add(FOUND_PREFIX + field)
+        if self.skipped & self._hits:
+            # 省略していたセレクタが一致した: このレイアウトの記録は当てにならないので学習し直す
+            store.resets += 1
+            self.record.reset()
+            self._known_pairs.clear()
+        elif pairs is not None:
+            self._known_pairs |= pairs
+        self.record.observe(self._evaluated, self._hits)
+        self._refresh()
+        return product
+
+
+class PageSelectorOrder:
+    """1ページ分の抽出で使う、プランごとの学習状態 (`SelectorOrderStore.page()` で作る)"""
+
+    def __init__(self, store: "SelectorOrderStore"):
+        self.store = store
+        self._runs: Dict[int, _LayoutRun] = {}
+
+    def extract(self, extract: ItemExtractor, item: Any, plan: Any, position: int, record_factory: Callable[[], Any], stats: Optional[ExtractionStats]) -> Any:
+        """
+        `extract(item, plan, position, record_factory, stats)` でアイテムを抽出する。
+        そのプランで最初に抽出するアイテムからレイアウトの指紋を作り、学習した省略を適用する。
+        """
+        run = self._runs.get(id(plan))
+        if run is None:
+            run = self._runs[id(plan)] = _LayoutRun(self.store, self.store.layout_for(plan, item), plan)
+        return run.extract(extract, item, position, record_factory, stats)
+
+
+class SelectorOrderStore:
+    """
+    レイアウトの指紋 -> セレクタごとの評価回数と一致回数 の永続ストア。
+
+    Args:
+        db_path: SQLite のファイルのパス (なければ作成する)。
+        parser_version: 指紋に含めるパーサーのバージョン。
+        min_samples: 省略するまでに、一度も一致せずに評価される必要がある回数。
+        audit_interval: 学習した省略を適用しているページで、全段階を試して確認するアイテムの間隔。
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        parser_version: str,
+        min_samples: int = DEFAULT_MIN_SAMPLES,
+        audit_interval: int = DEFAULT_AUDIT_INTERVAL,
+    ):
+        if min_samples <= 0 or audit_interval <= 0:
+            raise ValueError("min_samples と audit_interval は1以上を指定してください。")
+        self.db_path = db_path
+        self.parser_version = parser_version
+        self.min_samples = min_samples
+        self.audit_interval = audit_interval
+        self.adapted_items = 0
+        self.fallbacks = 0
+        self.resets = 0
+        # 複数のワーカープロセスから同じファイルを使えるよう、WAL にして書き込みの待ち時間を長めにとる
+        self._conn = sqlite3.connect(db_path, timeout=30.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._layouts: Dict[str, _LayoutRecord] = {}
+
+    def __repr__(self) -> str:
+        return (
+            f"SelectorOrderStore(db_path={self.db_path!r}, parser_version={self.parser_version!r}, "
+            f"min_samples={self.min_samples}, audit_interval={self.audit_interval})"
+        )
+
+    def layout_key(self, plan: Any, item: Any) -> str:
+        """プラン (リストタイプとセレクタの設定) とアイテムのレイアウトから指紋を作る"""
+        selectors = getattr(plan, "selectors", None) or getattr(plan, "xpaths", None) or {}
+        digest = hashlib.sha256(f"{self.parser_version}\0{type(plan).__name__}\0{plan.list_type}\0".encode('utf-8'))
+        digest.update(json.dumps(selectors, sort_keys=True).encode('utf-8'))
+        digest.update(layout_signature(item).encode('utf-8'))
+        return digest.hexdigest()
+
+    def layout_for(self, plan: Any, item: Any) -> _LayoutRecord:
+        key = self.layout_key(plan, item)
+        record = self._layouts.get(key)
+        if record is None:
+            rows = self._conn.execute("SELECT selector, evaluated, hits FROM selector_order WHERE layout = ?", (key,)).fetchall()
+            record = self._layouts[key] = _LayoutRecord(key, rows)
+        return record
+
+    def page(self) -> PageSelectorOrder:
+        """1ページ分の抽出の状態を作る"""
+        return PageSelectorOrder(self)
+
+    def flush(self) -> None:
+        """未保存の評価回数と一致回数を書き込む"""
+        records = [record for record in self._layouts.values() if record.reset_pending or record.pending_evaluated]
+        if not records:
+            return
+        now = time.time()
+        with self._conn:
+            for record in records:
+                if record.reset_pending:
+                    self._conn.execute("DELETE FROM selector_order WHERE layout = ?", (record.key,))
+                self._conn.executemany(
+                    "INSERT INTO selector_order VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (layout, selector) DO UPDATE SET "
+                    "evaluated = evaluated + excluded.evaluated, hits = hits + excluded.hits, updated = excluded.updated",
+                    [
+                        (record.key, selector, evaluated, record.pending_hits.get(selector, 0), now)
+                        for selector, evaluated in record.pending_evaluated.items()
+                    ],
+                )
+        for record in records:
+            record.pending_evaluated.clear()
+            record.pending_hits.clear()
+            record.reset_pending = False
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        このインスタンスで省略を適用したアイテム数・省略を適用できずに全段階を試した件数 (値が見つからなかった場合と、
+        新しい要素を含んでいた場合)・学習し直した回数と、保存済みのレイアウト数を返す
+        """
+        (layouts,) = self._conn.execute(_COUNT_LAYOUTS).fetchone()
+        return {"adapted_items": self.adapted_items, "fallbacks": self.fallbacks, "resets": self.resets, "layouts": layouts}
+
+    def close(self, save: bool = True) -> None:
+        """閉じる。`save=False` の場合は保存待ちの評価回数と一致回数を書き込まずに捨てる (中断した解析の途中の結果を残さない)"""
+        if save:
+            self.flush()
+        self._conn.close()
+
+
+def stored_layout_count(db_path: str) -> int:
+    """
+    保存済みのレイアウト数を、ストアを開かずに読み込み専用の接続で数える
+    (ファイルを作らず、PRAGMA やテーブルの作成も行わない。ファイルやテーブルがまだなければ 0)
+    """
+    if not os.path.exists(db_path):
+        return 0
+    connection = sqlite3.connect(f"{pathlib.Path(db_path).absolute().as_uri()}?mode=ro", uri=True, timeout=30.0)
+    try:
+        (layouts,) = connection.execute(_COUNT_LAYOUTS).fetchone()
+        return layouts
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        connection.close()
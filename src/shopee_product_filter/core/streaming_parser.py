@@ -0,0 +1,320 @@
+"""
+省メモリのストリーミング解析モード
+
+通常モードは保存ページ全体を文字列として読み込み、BeautifulSoup で文書全体のツリーを作ってから
+リストタイプを判定する。保存ページは数MBあり、その大部分は script / style / SVG なので、
+同時に複数のアップロードを処理するとメモリを大きく消費する。
+
+ストリーミングモードではページをチャンク単位で読み進め (`html_lexer.py`)、
+商品アイテムのコンテナ要素の範囲だけを切り出して BeautifulSoup のツリーに変換し、抽出プランに通す。
+アイテム以外のトークンは読んだそばから捨て、アイテムのツリーも商品情報を返した時点で解放されるので、
+ピークメモリはページの大きさではなく1アイテム分の大きさで決まる。
+
+(lxml の iterparse も試したが、HTMLパーサーが読み込んだ入力全体をバッファに保持し続けるため、
+ページサイズに比例してメモリが増えてしまい採用しなかった。)
+
+`backend="lxml"` の場合は、切り出した断片を BeautifulSoup ではなく lxml のツリーに変換し、
+`lxml_backend.py` の XPath プランで抽出する (アイテムの検出には同じ `stream_match` を使う)。
+
+リストタイプは通常モードと同じくレジストリの優先順 (ショップ → キーワード検索/カテゴリー → data-sqe) で決める。
+シーク可能な入力は先にチャンク単位でシグネチャと照合し (`ExtractionPlan.probe`)、ありえないリストタイプを候補から外す。
+残った候補のうち最も優先順位の高いリストタイプのアイテムが見つかればその時点で固定し、それより低いリストタイプの
+アイテムしか見つかっていない間は、そのアイテムを (ツリーにせず) 断片のバイト列のまま保留する。より優先順位の高い
+アイテムが現れたら保留分は捨て、文書の最後まで現れなければ保留分を抽出して返す。
+(data-sqe のアイテムがショップのグリッドより前にある混在ページでも、通常モードと同じくショップのアイテムを返す)
+保留分が `MAX_PENDING_ITEMS` 件または `MAX_PENDING_BYTES` バイトを超えたら、その時点で保留中のリストタイプに固定して
+保留分を返し始める (シークできない入力でメモリがページの大きさに比例しないようにするため。
+上限を超えた後に優先順位の高いアイテムが現れるページでは、通常モードと結果が異なる)。
+gzip / zstd / zip の展開ストリームはシークできても先頭に戻ると展開をやり直すことになるので、事前の照合はしない。
+
+注意: 各アイテムは単独の断片として評価されるため、アイテムの外側の要素に依存する
+セレクタ（祖先要素の class を見るものなど）は通常モードと結果が異なる場合がある。
+"""
+import gzip
+import zipfile
+from typing import IO, Any, Dict, Iterator, List, Mapping, Optional, Tuple, Union
+
+from bs4 import BeautifulSoup
+from bs4.element import Tag
+
+from .extraction_plan import PLAN_REGISTRY, ExtractionPlan, ProductInfo, RecordFactory, extract_item, new_product_info
+from .extraction_stats import ExtractionStats
+from .html_lexer import DEFAULT_CHUNK_SIZE, END, START, OpenElementStack, is_void_tag, iter_html_tokens, parse_attrs
+from .item_fingerprints import ItemFingerprintStore
+from .lxml_backend import extract_item_lxml, parse_html_fragment, xpath_plan_for
+from .selector_order import SelectorOrderStore
+
+HtmlSource = Union[str, IO[bytes]]
+
+# 固定前に保留するアイテムの上限 (件数と断片の合計バイト数。超えたら保留中のリストタイプに固定する)
+MAX_PENDING_ITEMS = 200
+MAX_PENDING_BYTES = 4 * 1024 * 1024
+
+
+def _classes(attrs: Mapping[str, str]) -> Tuple[str, ...]:
+    class_attr = attrs.get('class')
+    return tuple(class_attr.split()) if class_attr else ()
+
+
+def matches_container(
+    name: str,
+    attrs: Mapping[str, str],
+    ancestors: List[Tuple[str, bytes]],
+    stream_match: Mapping[str, Any],
+) -> bool:
+    """
+    開始タグがプランの `stream_match` 定義に一致するかを判定する。
+
+    `stream_match` のキー:
+        tag: 要素名
+        classes: 全て含まれている必要がある class のリスト
+        attrs: 値が一致する必要がある属性の辞書
+        ancestor_classes: 親、祖父母…の順に、それぞれが含む必要がある class のリスト
+
+    Args:
+        name: 要素名。
+        attrs: 開始タグの属性。
+        ancestors: 開いている祖先要素 (外側から順) の (要素名, 開始タグ) のリスト。
+        stream_match: プランのコンテナ判定条件。
+    """
+    if name != stream_match.get("tag", name):
+        return False
+    required_classes = stream_match.get("classes")
+    if required_classes and not set(required_classes).issubset(_classes(attrs)):
+        return False
+    for attr_name, value in (stream_match.get("attrs") or {}).items():
+        if attrs.get(attr_name) != value:
+            return False
+    ancestor_classes_list = stream_match.get("ancestor_classes") or []
+    if len(ancestor_classes_list) > len(ancestors):
+        return False
+    for depth, ancestor_classes in enumerate(ancestor_classes_list, start=1):
+        ancestor_attrs = parse_attrs(ancestors[-depth][1])
+        if not set(ancestor_classes).issubset(_classes(ancestor_attrs)):
+            return False
+    return True
+
+
+def match_plan(
+    name: str,
+    raw: bytes,
+    ancestors: List[Tuple[str, bytes]],
+    candidates: List[ExtractionPlan],
+) -> Optional[ExtractionPlan]:
+    tags = {plan.stream_match.get("tag") for plan in candidates if plan.stream_match}
+    if None not in tags and name not in tags:
+        return None  # 対象外の要素は属性の解析もしない
+    attrs = parse_attrs(raw)
+    for plan in candidates:
+        if plan.stream_match and matches_container(name, attrs, ancestors, plan.stream_match):
+            return plan
+    return None
+
+
+def _is_decompressing(source: IO[bytes]) -> bool:
+    """gzip / zstd / zip のメンバーを読み進めながら展開するストリームか"""
+    if isinstance(source, (gzip.GzipFile, zipfile.ZipExtFile)):
+        return True
+    return type(source).__name__ in ("ZstdFile", "ZstdDecompressionReader")
+
+
+def probe_stream(source: IO[bytes], candidates: List[ExtractionPlan]) -> List[ExtractionPlan]:
+    """
+    シーク可能な入力をチャンク単位でシグネチャと照合し、そのページでありうるプランだけを優先順のまま返す
+    (読み終えたら読み始めの位置に戻す)。シーク可能でない入力と、展開しながら読むストリーム
+    (先頭に戻ると展開をやり直すため) では候補をそのまま返す。
+    """
+    if len(candidates) < 2 or not source.seekable() or _is_decompressing(source):
+        return candidates
+    start = source.tell()
+    # チャンクの境目をまたぐシグネチャも見つかるよう、前のチャンクの末尾を重ねて照合する
+    overlap = max((len(signature.encode('utf-8')) for plan in candidates for signature in plan.signatures), default=1) - 1
+    remaining = list(candidates)
+    tail = b''
+    while remaining:
+        chunk = source.read(DEFAULT_CHUNK_SIZE)
+        if not chunk:
+            break
+        window = tail + chunk
+        remaining = [plan for plan in remaining if not plan.probe(window)]
+        tail = window[-overlap:] if overlap > 0 else b''
+    source.seek(start)
+    return [plan for plan in candidates if plan not in remaining]
+
+
+def _to_soup_item(fragment: bytes, name: str) -> Optional[Tag]:
+    """切り出したアイテムのHTML断片を、抽出プランに通せる BeautifulSoup の Tag に変換する"""
+    soup = BeautifulSoup(fragment, 'lxml', from_encoding='utf-8')
+    item = soup.find(name)
+    return item if isinstance(item, Tag) else None
+
+
+def iter_shopee_products_streaming(
+    source: HtmlSource,
+    plans: Optional[Mapping[str, ExtractionPlan]] = None,
+    list_type_info: Optional[Dict[str, Optional[str]]] = None,
+    backend: str = "bs4",
+    record_factory: RecordFactory = new_product_info,
+    stats: Optional[ExtractionStats] = None,
+    fingerprints: Optional[ItemFingerprintStore] = None,
+    selector_order: Optional[SelectorOrderStore] = None,
+) -> Iterator[ProductInfo]:
+    """
+    HTMLを先頭から読み進めながら、商品アイテムを1件ずつ抽出して返すジェネレータ。
+
+    リストタイプは通常モードと同じくレジストリの優先順で決め、固定した後はそのタイプのアイテムだけを対象にする
+    (優先順位の低いタイプのアイテムは、より高いタイプが現れないと分かるまで、上限まで断片のまま保留する。モジュールの説明を参照)。
+    件数の上限は設けないので、必要であれば呼び出し側で打ち切ること。
+
+    Args:
+        source: HTMLファイルのパス、またはバイナリモードのファイルオブジェクト。
+        plans: 抽出プランのレジストリ。省略時はデフォルトのレジストリ。
+        list_type_info: 渡された場合、判定したリストタイプを "list_type" キーに書き込む
+            (アイテムが1件も見つからなければ None のまま)。
+        backend: アイテムの抽出に使う解析バックエンド ("bs4" または "lxml")。
+        record_factory: 抽出結果の入れ物を作る関数 (`extract_item` を参照)。
+        stats: 渡された場合、フィールドごとの所要時間と値を見つけた段階を記録する (`extract_item` を参照)。
+        fingerprints: 渡された場合、切り出した断片のバイト列が前回と同じアイテムは、断片をツリーに変換せずに
+            保存済みの商品情報を返す (`item_fingerprints.py` を参照。flush() は呼び出し側で行う)。
+        selector_order: 渡された場合、同じレイアウトのページで外れ続けたセレクタの評価を省く
+            (`selector_order.py` を参照。flush() は呼び出し側で行う)。
+    """
+    if backend not in ("bs4", "lxml"):
+        raise ValueError(f"不明な解析バックエンドです: {backend}")
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            yield from iter_shopee_products_streaming(
+                f, plans, list_type_info, backend, record_factory, stats, fingerprints, selector_order
+            )
+        return
+
+    candidates = [plan for plan in (plans if plans is not None else PLAN_REGISTRY).values() if plan.stream_match]
+    candidates = probe_stream(source, candidates)
+    if list_type_info is not None:
+        list_type_info["list_type"] = None
+    stack = OpenElementStack()
+    locked_plan: Optional[ExtractionPlan] = None
+    # 固定する前に見つかった、最も優先順位の高いリストタイプとそのアイテムの (要素名, 断片のバイト列)
+    pending_plan: Optional[ExtractionPlan] = None
+    pending: List[Tuple[str, bytes]] = []
+    pending_bytes = 0
+
+    # 切り出し中のアイテム: (プラン, 要素名, スタック上の深さ, 断片のバイト列のリスト)
+    current: Optional[Tuple[ExtractionPlan, str, int, List[bytes]]] = None
+    position = 0
+    layouts = selector_order.page() if selector_order is not None else None
+
+    def extract_fragment(plan: ExtractionPlan, name: str, fragment: bytes) -> Optional[ProductInfo]:
+        item: Any
+        if backend == "lxml":
+            item = parse_html_fragment(fragment, name)
+            extract, item_plan = extract_item_lxml, xpath_plan_for(plan.list_type)
+        else:
+            item = _to_soup_item(fragment, name)
+            extract, item_plan = extract_item, plan
+        if item is None:
+            return None
+        if layouts is not None:
+            return layouts.extract(extract, item, item_plan, position, record_factory, stats)
+        return extract(item, item_plan, position, record_factory, stats)
+
+    def lock(plan: ExtractionPlan) -> None:
+        nonlocal locked_plan
+        locked_plan = plan
+        clear_pending()
+        if list_type_info is not None:
+            list_type_info["list_type"] = plan.list_type
+
+    def clear_pending() -> None:
+        nonlocal pending_bytes
+        pending.clear()
+        pending_bytes = 0
+
+    def lock_pending() -> Iterator[ProductInfo]:
+        """保留中のリストタイプに固定し、保留したアイテムを抽出して返す"""
+        assert pending_plan is not None
+        items = list(pending)
+        lock(pending_plan)
+        for name, fragment in items:
+            product_info = extract_captured(pending_plan, name, fragment)
+            if product_info is not None:
+                yield product_info
+
+    def finish_item() -> Iterator[ProductInfo]:
+        nonlocal current, pending_bytes
+        assert current is not None
+        plan, name, _, parts = current
+        current = None
+        fragment = b''.join(parts)
+        if plan is not locked_plan:
+            pending.append((name, fragment))
+            pending_bytes += len(fragment)
+            if len(pending) >= MAX_PENDING_ITEMS or pending_bytes >= MAX_PENDING_BYTES:
+                yield from lock_pending()
+            return
+        product_info = extract_captured(plan, name, fragment)
+        if product_info is not None:
+            yield product_info
+
+    def extract_captured(plan: ExtractionPlan, name: str, fragment: bytes) -> Optional[ProductInfo]:
+        nonlocal position
+        if fingerprints is not None:
+            product_info = fingerprints.reuse_or_extract(
+                fragment, f"{backend}:stream:{plan.list_type}", record_factory, lambda: extract_fragment(plan, name, fragment)
+            )
+        else:
+            product_info = extract_fragment(plan, name, fragment)
+        if product_info is None:
+            return None
+        position += 1
+        return product_info
+
+    # アイテムの外側の script / style などは、中身をバッファに溜めずに読み飛ばす
+    for kind, name, raw in iter_html_tokens(source, discard_rawtext=lambda _: current is None):
+        if kind == START:
+            assert name is not None
+            closed = stack.push_start(name, raw)
+            pushed = not is_void_tag(name, raw)
+            if current is not None and closed and len(stack) - pushed < current[2]:
+                # `<li>` の連続などで、切り出し中のアイテムが暗黙に閉じられた
+                yield from finish_item()
+            if current is not None:
+                current[3].append(raw)
+                continue
+            ancestors = stack.entries[:-1] if pushed else stack.entries
+            if locked_plan is not None:
+                active = [locked_plan]
+            else:
+                # 保留中のタイプより優先順位の低いタイプのアイテムは見ない
+                active = candidates[:candidates.index(pending_plan) + 1] if pending_plan is not None else candidates
+            plan = match_plan(name, raw, ancestors, active)
+            if plan is not None and pushed:
+                if locked_plan is None:
+                    if plan is candidates[0]:
+                        lock(plan)
+                    elif plan is not pending_plan:
+                        pending_plan = plan
+                        clear_pending()
+                current = (plan, name, len(stack), [raw])
+            continue
+
+        if current is None:
+            if kind == END:
+                assert name is not None
+                stack.pop_end(name)
+            # アイテムの外側のトークン (script / style / SVG など) は読んだそばから捨てる
+            continue
+
+        current[3].append(raw)
+        if kind == END:
+            assert name is not None
+            stack.pop_end(name)
+            if len(stack) < current[2]:
+                yield from finish_item()
+
+    if current is not None:
+        yield from finish_item()
+
+    # より優先順位の高いリストタイプのアイテムは現れなかったので、保留したアイテムを返す
+    if locked_plan is None and pending_plan is not None:
+        yield from lock_pending()
@@ -0,0 +1,105 @@
+"""
+アイテム内の要素のテキストの索引 (ヒューリスティックな抽出の高速化)
+
+ロケーション・価格・販売数の抽出は、主要セレクタで見つからなかった場合に、アイテム内の
+`span` / `div` などの候補を先頭から順に取り出し、候補ごとに `get_text(strip=True)` でテキストを作って判定する。
+候補は入れ子になっているので、外側の候補のテキストを作るたびに内側の文字列を何度もたどり直すことになり、
+最悪の場合はアイテムの要素数の2乗に比例した時間がかかっていた (主要セレクタが外れたページだけが極端に遅くなる)。
+
+`SoupTextIndex` / `LxmlTextIndex` は、最初に問い合わせがあった時点でアイテムの部分木を1回だけたどり、
+全要素のテキスト (`get_text(strip=True)` / `text_of` と同じ値) を子要素のテキストの連結として記録する。
+以降のヒューリスティックは、同じアイテムの要素のテキストをこの索引から引く。
+主要セレクタで全フィールドが見つかるアイテムでは問い合わせが起きないので、索引は作られない。
+
+索引にない要素 (アイテムの外側の祖先など) は、その場で通常どおりテキストを作る。
+"""
+from typing import Dict, List, Optional
+
+from bs4.element import CData, NavigableString, Tag
+from lxml import etree
+
+Element = etree._Element
+
+# get_text() が文字列として扱わない要素 (bs4 では Script / Stylesheet / TemplateString になる)
+NON_TEXT_ELEMENTS = frozenset({"script", "style", "template"})
+
+# bs4 の `Tag.get_text()` が div / span などで対象にする文字列の型
+_SOUP_TEXT_TYPES = frozenset({NavigableString, CData})
+
+
+def _index_soup(tag: Tag, texts: Dict[int, str]) -> str:
+    parts: List[str] = []
+    for child in tag.children:
+        if isinstance(child, Tag):
+            text = _index_soup(child, texts)
+        elif type(child) in _SOUP_TEXT_TYPES:
+            text = child.strip()
+        else:
+            continue
+        if text:
+            parts.append(text)
+    text = ''.join(parts)
+    # script / style / rt などは get_text() の対象の型が違うので、索引に載せずに都度 get_text() させる
+    if tag.interesting_string_types == _SOUP_TEXT_TYPES:
+        texts[id(tag)] = text
+    return text
+
+
+class SoupTextIndex:
+    """BeautifulSoup のアイテム用のテキスト索引 (`text(tag)` は `tag.get_text(strip=True)` と同じ値を返す)"""
+
+    __slots__ = ("item", "_texts")
+
+    def __init__(self, item: Tag):
+        self.item = item
+        self._texts: Optional[Dict[int, str]] = None
+
+    def text(self, tag: Tag) -> str:
+        if self._texts is None:
+            self._texts = {}
+            _index_soup(self.item, self._texts)
+        text = self._texts.get(id(tag))
+        return text if text is not None else tag.get_text(strip=True)
+
+
+def element_text(element: Element, texts: Optional[Dict[Element, str]] = None) -> str:
+    """
+    `Tag.get_text(strip=True)` と同じ規則で要素のテキストを取り出す
+    (script / style / template とコメントの中身を除いた文字列を、文書順に1つずつ strip して連結する)。
+    `texts` を渡すと、たどった全要素のテキストをそこに記録する。
+    """
+    parts: List[str] = []
+    if isinstance(element.tag, str) and element.tag not in NON_TEXT_ELEMENTS and element.text:
+        text = element.text.strip()
+        if text:
+            parts.append(text)
+    for child in element:
+        text = element_text(child, texts)
+        if text:
+            parts.append(text)
+        if child.tail:
+            text = child.tail.strip()
+            if text:
+                parts.append(text)
+    text = ''.join(parts)
+    if texts is not None:
+        texts[element] = text
+    return text
+
+
+class LxmlTextIndex:
+    """lxml のアイテム用のテキスト索引 (`text(element)` は `element_text(element)` と同じ値を返す)"""
+
+    __slots__ = ("item", "_texts")
+
+    def __init__(self, item: Element):
+        self.item = item
+        # キーの要素を保持しておくことで、lxml が同じ要素に同じプロキシオブジェクトを返し続ける
+        self._texts: Optional[Dict[Element, str]] = None
+
+    def text(self, element: Element) -> str:
+        if self._texts is None:
+            self._texts = {}
+            element_text(self.item, self._texts)
+        text = self._texts.get(element)
+        return text if text is not None else element_text(element)
@@ -0,0 +1,38 @@
+"""API のテスト用の共通のフィクスチャ (一時的なDBファイルを使う)"""
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+from sqlmodel import SQLModel
+
+
+@pytest.fixture(scope="session")
+def product_list_api(tmp_path_factory):
+    """
+    一時ディレクトリのDBを使う `api/product_list_api.py` のモジュール
+    (DBのパスはモジュールの import 時に環境変数から読むので、import の前に設定する)
+    """
+    os.environ["SHOPEE_DB_PATH"] = str(tmp_path_factory.mktemp("db") / "shopee_product_list_data.db")
+    # 検索の同時実行の上限 (セマフォ) で待つリクエストが出るよう、非同期の読み込み用のプールを小さくする
+    os.environ["SHOPEE_DB_ASYNC_READER_POOL_SIZE"] = "2"
+    from src.shopee_product_filter.api import product_list_api
+
+    assert product_list_api.DB_FILE_PRODUCT_LIST == os.environ["SHOPEE_DB_PATH"], "テスト用のDBより前に API のモジュールが import されています。"
+    SQLModel.metadata.create_all(product_list_api.engine_product_list)
+    return product_list_api
+
+
+@pytest.fixture
+def empty_products(product_list_api):
+    """商品テーブルを空にしてから API のモジュールを返す"""
+    with product_list_api.engine_product_list.begin() as connection:
+        connection.execute(delete(product_list_api.ProductBasicItem.__table__))
+    return product_list_api
+
+
+@pytest.fixture
+def client(empty_products):
+    """商品テーブルを空にした API のクライアント (起動/終了時の処理 (lifespan) も実行する)"""
+    with TestClient(empty_products.product_list_app) as client:
+        yield client
@@ -0,0 +1,40 @@
+"""bs4 バックエンドと lxml バックエンドの抽出結果の一致 (backend_parity.compare_backends)"""
+import pytest
+
+from src.shopee_product_filter.benchmarks.synthetic_pages import generate_page
+from src.shopee_product_filter.core.backend_parity import compare_backends
+from src.shopee_product_filter.core.parse_product_list import iter_products
+
+
+def _page_with_huge_script(item_count: int) -> str:
+    """libxml2 の既定のテキストノードの上限 (10 MB) を超えるインラインの script を持つページ"""
+    page = generate_page("shop", item_count, seed=11)
+    huge_script = "<script>var state = \"" + "x" * (16 * 1024 * 1024) + "\";</script>"
+    return page.replace("</head>", huge_script + "</head>", 1)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+@pytest.mark.parametrize("list_type", ["shop", "search", "data_sqe"])
+def test_backends_agree(tmp_path, list_type, streaming):
+    path = tmp_path / f"synthetic_{list_type}.html"
+    path.write_text(generate_page(list_type, 60, seed=5), encoding="utf-8")
+    result = compare_backends(str(path), streaming=streaming)
+    assert result["items"] == 60
+    assert result["diffs"] == []
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_backends_agree_with_huge_inline_script(tmp_path, streaming):
+    path = tmp_path / "synthetic_shop_huge_script.html"
+    path.write_text(_page_with_huge_script(100), encoding="utf-8")
+    result = compare_backends(str(path), streaming=streaming)
+    assert result["items"] == 100
+    assert result["diffs"] == []
+
+
+def test_iter_products_lxml_with_huge_inline_script():
+    data = _page_with_huge_script(100).encode("utf-8")
+    bs4_products = list(iter_products(data, backend="bs4", streaming=False))
+    lxml_products = list(iter_products(data, backend="lxml", streaming=False))
+    assert len(bs4_products) == 100
+    assert lxml_products == bs4_products
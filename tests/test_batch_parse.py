@@ -0,0 +1,82 @@
+"""バッチ処理の1ファイルあたりの制限時間 (parse_file_with_budget) とワーカープロセスの異常終了からの回復 (run_batch)"""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+from src.shopee_product_filter.benchmarks.synthetic_pages import generate_page
+from src.shopee_product_filter.core import batch_parse
+from src.shopee_product_filter.core.batch_parse import MergedOutput, parse_file_with_budget, run_batch
+
+
+@pytest.fixture(scope="module")
+def large_page(tmp_path_factory):
+    path = tmp_path_factory.mktemp("pages") / "synthetic_shop_700.html"
+    path.write_text(generate_page("shop", 700, seed=3), encoding="utf-8")
+    return str(path)
+
+
+def _fingerprint_count(db_path):
+    with sqlite3.connect(db_path) as connection:
+        return connection.execute("SELECT COUNT(*) FROM item_fingerprints").fetchone()[0]
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+@pytest.mark.parametrize("backend", ["bs4", "lxml"])
+def test_timed_out_file_is_reported_and_not_cached(tmp_path, large_page, backend, streaming):
+    cache_dir = tmp_path / "cache"
+    fingerprint_db = str(tmp_path / "fingerprints.db")
+    stdout = sys.stdout
+    result = parse_file_with_budget(
+        large_page, 0.005, streaming=streaming, backend=backend, cache_dir=str(cache_dir), fingerprint_db=fingerprint_db,
+    )
+    assert result["status"] == "timeout"
+    assert result["products"] is None
+    assert sys.stdout is stdout
+    assert not [path for path in cache_dir.rglob("*") if path.is_file()]
+    assert _fingerprint_count(fingerprint_db) == 0
+
+    # 制限時間なしで解析し直すと、キャッシュと指紋を使わない解析と同じ結果になる
+    expected = parse_file_with_budget(large_page, None, streaming=streaming, backend=backend)
+    retried = parse_file_with_budget(
+        large_page, None, streaming=streaming, backend=backend, cache_dir=str(cache_dir), fingerprint_db=fingerprint_db,
+    )
+    assert expected["status"] == retried["status"] == "success"
+    assert retried["products"] == expected["products"]
+    assert len(expected["products"]) == 500
+
+
+def _parse_or_crash(html_file_path, *args):
+    """テスト用の解析 (ワーカープロセスで実行する)。名前に crash を含むファイルではワーカープロセスを異常終了させる"""
+    if "crash" in os.path.basename(html_file_path):
+        os._exit(1)
+    return parse_file_with_budget(html_file_path, *args)
+
+
+class _CollectingOutput(MergedOutput):
+    def __init__(self):
+        super().__init__()
+        self.products = []
+
+    def write(self, products):
+        products = list(products)
+        self.products.extend(products)
+        return super().write(products)
+
+
+def test_worker_crash_fails_only_the_crashing_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_parse, "parse_file_with_budget", _parse_or_crash)
+    paths = []
+    for index in range(12):
+        name = "page_05_crash.html" if index == 5 else f"page_{index:02d}.html"
+        path = tmp_path / name
+        path.write_text(generate_page("shop", 20, seed=index), encoding="utf-8")
+        paths.append(str(path))
+
+    output = _CollectingOutput()
+    summary = run_batch(paths, output, workers=3, timeout=None)
+    statuses = {path: status for path, status, _, _ in summary}
+    assert len(summary) == len(paths)
+    assert statuses == {path: "error" if "crash" in os.path.basename(path) else "success" for path in paths}
+    assert len(output.products) == 11 * 20
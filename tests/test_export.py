@@ -0,0 +1,85 @@
+"""書き出し (/basic-products/export/) の形式ごとの内容と圧縮の選び方"""
+import csv
+import io
+import json
+
+import pytest
+
+from src.shopee_product_filter.api.product_export import accepts_gzip
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip", True),
+    ("GZIP", True),
+    ("gzip, deflate, br", True),
+    ("br;q=1.0, gzip;q=0.5", True),
+    ("x-gzip", True),
+    ("*", True),
+    ("", False),
+    ("identity", False),
+    ("br, deflate", False),
+    ("gzip;q=0", False),
+    ("gzip; q=0.000", False),
+    ("*;q=0", False),
+    ("gzip;q=0, *", False),
+    ("identity, *;q=0.1", True),
+    ("gzip;q=abc", False),
+    ("gzip;q=2", False),
+])
+def test_accepts_gzip(header, expected):
+    assert accepts_gzip(header) is expected
+
+
+@pytest.fixture
+def export_client(client, product_list_api):
+    with product_list_api.engine_product_list.begin() as connection:
+        connection.execute(product_list_api.ProductBasicItem.__table__.insert(), [
+            {"product_url": f"https://shopee.sg/p-i.1.{index}", "price": index + 0.5, "sold": index} for index in range(20)
+        ])
+    return client
+
+
+@pytest.mark.parametrize("accept_encoding, gzipped", [("gzip, deflate", True), ("gzip;q=0", False), ("identity", False)])
+def test_export_content_encoding(export_client, accept_encoding, gzipped):
+    response = export_client.get("/basic-products/export/", params={"format": "csv"}, headers={"Accept-Encoding": accept_encoding})
+    assert response.status_code == 200
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert ("content-encoding" in response.headers) is gzipped
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 20
+
+
+def _search_items(client, params):
+    response = client.get("/basic-products/", params={**params, "limit": 200})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@pytest.mark.parametrize("params", [{}, {"sort": "price_asc", "min_price_sgd": 5.0}])
+def test_export_jsonl_matches_search(export_client, product_list_api, monkeypatch, params):
+    # 読み出しのチャンクの境目をまたいでも、全件が並び順どおりに書き出される
+    monkeypatch.setattr(product_list_api, "EXPORT_CHUNK_SIZE", 3)
+    response = export_client.get("/basic-products/export/", params={**params, "format": "jsonl"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    expected = _search_items(export_client, params)
+    assert [row["id"] for row in exported] == [item["id"] for item in expected]
+    for row, item in zip(exported, expected):
+        assert (row["product_url"], row["price"], row["sold"]) == (item["product_url"], item["price"], item["sold"])
+
+
+def test_export_parquet_keeps_types(export_client, product_list_api, monkeypatch):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    monkeypatch.setattr(product_list_api, "EXPORT_CHUNK_SIZE", 7)
+    response = export_client.get("/basic-products/export/", params={"format": "parquet", "sort": "sold_desc"}, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    table = pq.read_table(io.BytesIO(response.content))
+    assert pa.types.is_float64(table.schema.field("price").type)
+    assert pa.types.is_int64(table.schema.field("sold").type)
+    assert pa.types.is_timestamp(table.schema.field("created_at").type)
+    expected = _search_items(export_client, {"sort": "sold_desc"})
+    assert table.column("id").to_pylist() == [item["id"] for item in expected]
+    assert table.column("price").to_pylist() == [item["price"] for item in expected]
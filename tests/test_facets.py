@@ -0,0 +1,85 @@
+"""分布 (/basic-products/facets/) の件数とヒストグラムを、Python で数えた値と比べる"""
+import random
+from bisect import bisect_right
+from collections import Counter
+from datetime import datetime, timezone
+
+import pytest
+
+PRODUCT_COUNT = 300
+PRICE_EDGES = [5.0, 10.0, 20.0, 50.0]
+SOLD_EDGES = [10, 100, 1000]
+
+
+@pytest.fixture
+def products(client, product_list_api):
+    """価格・販売数・ショップタイプ・ソーシング状況に NULL と区切りちょうどの値を含む商品を入れて、行を返す"""
+    rng = random.Random(0)
+    now = datetime(2025, 7, 1, tzinfo=timezone.utc)
+    rows = [
+        {
+            "product_url": f"https://shopee.sg/p-i.1.{index}",
+            "product_name": f"Product {index}",
+            "price": None if index % 9 == 0 else rng.choice((0.5, 5.0, 7.25, 10.0, 19.99, 20.0, 49.0, 50.0, 120.0)),
+            "sold": None if index % 13 == 0 else rng.choice((0, 9, 10, 99, 100, 999, 1000, 25000)),
+            "shop_type": rng.choice(("Mall", "Preferred", None)),
+            "sourcing_status": rng.choice(("candidate", "ordered", None)),
+            "created_at": now,
+            "updated_at": now,
+        }
+        for index in range(PRODUCT_COUNT)
+    ]
+    with product_list_api.engine_product_list.begin() as connection:
+        connection.execute(product_list_api.ProductBasicItem.__table__.insert(), rows)
+    return rows
+
+
+def _expected_histogram(values, edges):
+    present = [value for value in values if value is not None]
+    counts = Counter(bisect_right(edges, value) for value in present)
+    return {
+        "min": min(present, default=None),
+        "max": max(present, default=None),
+        "missing": len(values) - len(present),
+        "counts": [counts.get(index, 0) for index in range(len(edges) + 1)],
+    }
+
+
+def _histogram(response_histogram):
+    return {
+        "min": response_histogram["min"],
+        "max": response_histogram["max"],
+        "missing": response_histogram["missing"],
+        "counts": [bucket["count"] for bucket in response_histogram["buckets"]],
+    }
+
+
+@pytest.mark.parametrize("filters", [{}, {"shop_type": "Mall"}, {"min_price_sgd": 7.0, "max_sold": 999}])
+def test_facets_match_python_counts(client, products, filters):
+    response = client.get(
+        "/basic-products/facets/", params={**filters, "price_edges": PRICE_EDGES, "sold_edges": SOLD_EDGES}
+    )
+    assert response.status_code == 200, response.text
+    facets = response.json()
+
+    matched = products
+    if "shop_type" in filters:
+        matched = [row for row in matched if row["shop_type"] == filters["shop_type"]]
+    if "min_price_sgd" in filters:
+        matched = [row for row in matched if row["price"] is not None and row["price"] >= filters["min_price_sgd"]]
+    if "max_sold" in filters:
+        matched = [row for row in matched if row["sold"] is not None and row["sold"] <= filters["max_sold"]]
+    assert matched
+
+    assert facets["total"] == len(matched)
+    assert {f["value"]: f["count"] for f in facets["shop_type"]} == Counter(row["shop_type"] for row in matched)
+    assert {f["value"]: f["count"] for f in facets["sourcing_status"]} == Counter(row["sourcing_status"] for row in matched)
+    assert _histogram(facets["price"]) == _expected_histogram([row["price"] for row in matched], PRICE_EDGES)
+    assert _histogram(facets["sold"]) == _expected_histogram([row["sold"] for row in matched], SOLD_EDGES)
+    assert [(b["low"], b["high"]) for b in facets["price"]["buckets"]] == list(zip([None, *PRICE_EDGES], [*PRICE_EDGES, None]))
+
+
+@pytest.mark.parametrize("price_edges", [[10.0, 5.0], [5.0, 5.0, 10.0]])
+def test_unsorted_price_edges_are_rejected(client, price_edges):
+    response = client.get("/basic-products/facets/", params={"price_edges": price_edges})
+    assert response.status_code == 400
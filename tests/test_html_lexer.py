@@ -0,0 +1,33 @@
+"""HTMLレキサーの RAWTEXT 要素の読み進め (チャンク境界の終了タグ、中身の読み飛ばし)"""
+import io
+
+import pytest
+
+from src.shopee_product_filter.core.html_lexer import RAWTEXT, iter_html_tokens
+
+PAGE = (
+    b'<html><head><script type="text/javascript">var a = "</scrip" + "t>";' + b'x' * 5000 + b'</script >'
+    b'<style>.a{color:red}</style></head><body><div class="item"><script>var b = 1;</script>'
+    b'<p>text</p></div><script>unterminated'
+)
+
+
+def _tokens(chunk_size, discard_rawtext=None):
+    return list(iter_html_tokens(io.BytesIO(PAGE), chunk_size=chunk_size, discard_rawtext=discard_rawtext))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 1 << 16])
+def test_tokens_do_not_depend_on_chunk_size(chunk_size):
+    assert _tokens(chunk_size) == _tokens(len(PAGE))
+    assert b''.join(raw for _, _, raw in _tokens(chunk_size)) == PAGE
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 16])
+def test_discarded_rawtext_keeps_only_the_tags(chunk_size):
+    kept = _tokens(chunk_size)
+    discarded = _tokens(chunk_size, discard_rawtext=lambda name: name == "script")
+    assert [(kind, name) for kind, name, _ in discarded] == [(kind, name) for kind, name, _ in kept]
+    scripts = [raw for kind, name, raw in discarded if kind == RAWTEXT and name == "script"]
+    assert scripts == [b'<script type="text/javascript"></script >', b'<script></script>', b'<script>']
+    styles = [raw for kind, name, raw in discarded if kind == RAWTEXT and name == "style"]
+    assert styles == [b'<style>.a{color:red}</style>']
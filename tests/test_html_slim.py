@@ -0,0 +1,64 @@
+"""スリム化したページ (html_slim) の抽出結果が元のページと同じであること"""
+import gzip
+import os
+
+import pytest
+
+from src.shopee_product_filter.benchmarks.synthetic_pages import LIST_TYPES, generate_page
+from src.shopee_product_filter.core.html_slim import SLIM_PREAMBLE, ensure_slim_snapshot, slim_html
+from src.shopee_product_filter.core.parse_product_list import iter_products
+
+BACKENDS = ("bs4", "lxml")
+OVERLAY_SRC = "https://down-sg.img.susercontent.com/file/sg-overlay-abc.png"
+
+
+def _noscript_item(index: int) -> str:
+    """商品画像が遅延読み込みの <noscript><img></noscript> にあり、その隣にオーバーレイ画像があるアイテム"""
+    return (
+        f'<div class="shop-search-result-view__item col-xs-2-4"><a class="contents" href="https://shopee.sg/p-i.1.{index}">'
+        f'<div class="relative z-0 w-full pt-full">'
+        f'<noscript><img src="https://down-sg.img.susercontent.com/file/img{index}" alt="p{index}" class="inset-y-0 w-full"></noscript>'
+        f'<img src="{OVERLAY_SRC}" class="absolute inset-0"></div>'
+        f'<div class="line-clamp-2">Product {index}</div>'
+        f'<div class="truncate flex items-baseline"><span>$</span><span>{index + 1}.50</span></div>'
+        f'<div class="truncate text-shopee-black87 text-xs">{index} sold</div>'
+        f'<svg viewBox="0 0 10 10"><path d="M0 0"></path></svg><script>var item = {index};</script><!-- tracking --></a></div>'
+    )
+
+
+def _noscript_page() -> bytes:
+    items = "".join(_noscript_item(index) for index in range(20))
+    return f'<html><body><div class="shop-search-result-view"><div class="row">{items}</div></div></body></html>'.encode("utf-8")
+
+
+def _pages():
+    yield "noscript", _noscript_page()
+    for list_type in LIST_TYPES:
+        yield list_type, generate_page(list_type, 80, seed=5).encode("utf-8")
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("name, page", list(_pages()), ids=lambda value: value if isinstance(value, str) else "")
+def test_slim_output_matches_original(name, page, backend, streaming):
+    expected = list(iter_products(page, backend=backend, streaming=streaming))
+    assert expected
+    assert list(iter_products(slim_html(page), backend=backend, streaming=streaming)) == expected
+    if name == "noscript":
+        assert all(product["image_url"] != OVERLAY_SRC for product in expected)
+
+
+def test_snapshot_of_older_rules_is_rewritten(tmp_path):
+    page_path = tmp_path / "page.html"
+    page_path.write_bytes(_noscript_page())
+    snapshot_path = ensure_slim_snapshot(str(page_path))
+    with gzip.open(snapshot_path, "rb") as f:
+        assert f.read(len(SLIM_PREAMBLE)) == SLIM_PREAMBLE
+
+    # 古い規則 (noscript を取り除いていた) で作られた、元のページより新しいスナップショット
+    with gzip.open(snapshot_path, "wb") as f:
+        f.write(b'<!DOCTYPE html>\n<meta charset="utf-8">\n<div class="shop-search-result-view"></div>')
+    os.utime(snapshot_path, (os.path.getmtime(page_path) + 10,) * 2)
+    assert ensure_slim_snapshot(str(page_path)) == snapshot_path
+    with gzip.open(snapshot_path, "rb") as f:
+        assert f.read(len(SLIM_PREAMBLE)) == SLIM_PREAMBLE
@@ -0,0 +1,110 @@
+"""アイテムの指紋による抽出のスキップ (ItemFingerprintStore)"""
+import itertools
+import sqlite3
+
+import pytest
+
+from src.shopee_product_filter.benchmarks.synthetic_pages import generate_page
+from src.shopee_product_filter.core import item_fingerprints
+from src.shopee_product_filter.core.item_fingerprints import ItemFingerprintStore
+from src.shopee_product_filter.core.parse_product_list import PARSER_VERSION, iter_products
+
+VARIANT = "bs4:dom:shop"
+
+
+def _product(index, price=1.5):
+    return {"product_name": f"Product {index}", "price": price, "product_url": f"https://shopee.sg/p-i.1.{index}", "sold": index}
+
+
+def _rows(db_path):
+    with sqlite3.connect(db_path) as connection:
+        return connection.execute("SELECT product_url, record FROM item_fingerprints ORDER BY product_url").fetchall()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "fingerprints.db")
+
+
+def test_hit_reuses_stored_record_without_extracting(db_path):
+    store = ItemFingerprintStore(db_path, PARSER_VERSION)
+    extracted = store.reuse_or_extract(b"<div>1</div>", VARIANT, dict, lambda: _product(1))
+    store.close()
+
+    store = ItemFingerprintStore(db_path, PARSER_VERSION)
+    try:
+        def fail():
+            raise AssertionError("指紋が一致したアイテムを抽出し直しています。")
+
+        reused = store.reuse_or_extract(b"<div>1</div>", VARIANT, dict, fail)
+        assert reused == {**dict.fromkeys(item_fingerprints.PRODUCT_FIELDS), **extracted}
+        assert store.stats()["hits"] == 1 and store.stats()["misses"] == 0
+        # 解析方法が違えば同じHTMLでも別の指紋になる
+        assert store.reuse_or_extract(b"<div>1</div>", "lxml:dom:shop", dict, lambda: _product(1, 2.0))["price"] == 2.0
+    finally:
+        store.close()
+
+
+def test_changed_item_replaces_old_fingerprint(db_path):
+    store = ItemFingerprintStore(db_path, PARSER_VERSION)
+    try:
+        store.reuse_or_extract(b"<div>old</div>", VARIANT, dict, lambda: _product(1))
+        store.reuse_or_extract(b"<div>other</div>", VARIANT, dict, lambda: _product(2))
+        store.flush()
+        store.reuse_or_extract(b"<div>new</div>", VARIANT, dict, lambda: _product(1, 9.9))
+        store.flush()
+        rows = _rows(db_path)
+        assert [url for url, _ in rows] == ["https://shopee.sg/p-i.1.1", "https://shopee.sg/p-i.1.2"]
+        assert store.get(store.key_for(b"<div>old</div>", VARIANT)) is None
+        assert store.get(store.key_for(b"<div>new</div>", VARIANT))[1] == 9.9
+    finally:
+        store.close()
+
+
+def test_least_recently_used_entries_are_evicted(db_path, monkeypatch):
+    clock = itertools.count(1000)
+    monkeypatch.setattr(item_fingerprints.time, "time", lambda: float(next(clock)))
+    store = ItemFingerprintStore(db_path, PARSER_VERSION, max_entries=3)
+    try:
+        for index in range(3):
+            store.reuse_or_extract(f"<div>{index}</div>".encode(), VARIANT, dict, lambda: _product(index))
+            store.flush()
+        # アイテム 0 を使ってから新しいアイテムを保存すると、最後に使われたのが最も古いアイテム 1 が消える
+        store.reuse_or_extract(b"<div>0</div>", VARIANT, dict, lambda: None)
+        store.flush()
+        store.reuse_or_extract(b"<div>3</div>", VARIANT, dict, lambda: _product(3))
+        store.flush()
+        assert store.stats()["entries"] == 3
+        assert [url for url, _ in _rows(db_path)] == [f"https://shopee.sg/p-i.1.{index}" for index in (0, 2, 3)]
+    finally:
+        store.close()
+
+
+def test_close_without_save_discards_pending_writes(db_path):
+    store = ItemFingerprintStore(db_path, PARSER_VERSION)
+    store.reuse_or_extract(b"<div>1</div>", VARIANT, dict, lambda: _product(1))
+    store.flush()
+    store.reuse_or_extract(b"<div>2</div>", VARIANT, dict, lambda: _product(2))
+    store.close(save=False)
+    assert [url for url, _ in _rows(db_path)] == ["https://shopee.sg/p-i.1.1"]
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+@pytest.mark.parametrize("backend", ["bs4", "lxml"])
+def test_reparse_extracts_only_changed_items(db_path, backend, streaming):
+    page = generate_page("shop", 50, seed=8)
+    # 最初のアイテムのコンテナのHTMLだけを変える
+    container = '<div class="shop-search-result-view__item col-xs-2-4">'
+    changed_page = page.replace(container, '<div class="shop-search-result-view__item col-xs-2-4" data-changed="1">', 1)
+    assert changed_page != page
+    expected = list(iter_products(changed_page.encode("utf-8"), backend=backend, streaming=streaming))
+
+    store = ItemFingerprintStore(db_path, PARSER_VERSION)
+    try:
+        list(iter_products(page.encode("utf-8"), backend=backend, streaming=streaming, fingerprints=store))
+        store.hits = store.misses = 0
+        reparsed = list(iter_products(changed_page.encode("utf-8"), backend=backend, streaming=streaming, fingerprints=store))
+        assert reparsed == expected
+        assert (store.hits, store.misses) == (49, 1)
+    finally:
+        store.close()
@@ -0,0 +1,122 @@
+"""カーソルによるページ送り (/basic-products/page/) と offset のページ送り (/basic-products/) の結果の一致"""
+import base64
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+SORTS = ("id", "sold_desc", "price_asc", "created_at_desc")
+PRODUCT_COUNT = 157
+PAGE_SIZE = 10
+
+
+@pytest.fixture
+def products_client(client, product_list_api):
+    """並びのキーが同じ値の商品と NULL の商品を含む商品を入れたクライアント"""
+    rng = random.Random(0)
+    started = datetime(2025, 7, 1, tzinfo=timezone.utc)
+    rows = [
+        {
+            "product_url": f"https://shopee.sg/p-i.1.{index}",
+            "product_name": f"Product {index}",
+            "price": None if index % 7 == 0 else float(rng.choice((1.5, 2.0, 9.9, 15.0, 42.0))),
+            "sold": None if index % 11 == 0 else rng.choice((0, 5, 5, 120, 3000)),
+            "shop_type": rng.choice(("Mall", "Preferred", None)),
+            "created_at": started + timedelta(hours=rng.randint(0, 5)),
+            "updated_at": started,
+        }
+        for index in range(PRODUCT_COUNT)
+    ]
+    with product_list_api.engine_product_list.begin() as connection:
+        connection.execute(product_list_api.ProductBasicItem.__table__.insert(), rows)
+    return client
+
+
+def _offset_ids(client, params):
+    ids, offset = [], 0
+    while True:
+        response = client.get("/basic-products/", params={**params, "offset": offset, "limit": PAGE_SIZE})
+        assert response.status_code == 200, response.text
+        page = [item["id"] for item in response.json()]
+        ids.extend(page)
+        if len(page) < PAGE_SIZE:
+            return ids
+        offset += PAGE_SIZE
+
+
+def _cursor_ids(client, params):
+    ids, cursor = [], None
+    while True:
+        response = client.get("/basic-products/page/", params={**params, "limit": PAGE_SIZE, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200, response.text
+        page = response.json()
+        ids.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("filters", [{}, {"shop_type": "Mall"}, {"min_price_sgd": 2.0, "max_sold": 200}])
+@pytest.mark.parametrize("sort", SORTS)
+def test_cursor_pages_match_offset_pages(products_client, sort, filters):
+    params = {"sort": sort, **filters}
+    expected = _offset_ids(products_client, params)
+    assert expected
+    cursor_ids = _cursor_ids(products_client, params)
+    assert cursor_ids == expected
+    assert len(set(cursor_ids)) == len(cursor_ids)
+
+
+@pytest.mark.parametrize("sort", SORTS)
+def test_cursor_total(products_client, sort):
+    response = products_client.get("/basic-products/page/", params={"sort": sort, "limit": PAGE_SIZE, "total": "exact"})
+    assert response.json()["total"] == PRODUCT_COUNT
+
+
+def test_cursor_of_other_sort_is_rejected(products_client):
+    cursor = products_client.get("/basic-products/page/", params={"sort": "sold_desc", "limit": PAGE_SIZE}).json()["next_cursor"]
+    response = products_client.get("/basic-products/page/", params={"sort": "price_asc", "cursor": cursor})
+    assert response.status_code == 400
+
+
+def _raw_cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+@pytest.mark.parametrize("payload", [
+    ["price_asc", 1, [1, 2], 8],
+    ["price_asc", 1, {"a": 1}, 8],
+    ["price_asc", 1, "1.5", 8],
+    ["price_asc", 1, True, 8],
+    ["price_asc", 1, None, 8],
+    ["price_asc", 0, 1.5, 8],
+    ["price_asc", 2, 1.5, 8],
+    ["sold_desc", 0, "abc", 5],
+    ["sold_desc", 0, 1.5, 5],
+    ["sold_desc", 1, 5, 5],
+    ["sold_desc", 0, 5, "5"],
+    ["created_at_desc", 0, 12345, 5],
+    ["created_at_desc", 0, "not a date", 5],
+    ["id", 0, "5", 5],
+    ["id", 0, None, 5],
+    ["id", "0", 5, 5],
+    ["sold_desc", 0, 5],
+])
+def test_malformed_cursor_is_rejected(products_client, payload):
+    response = products_client.get("/basic-products/page/", params={"sort": payload[0], "cursor": _raw_cursor(payload)})
+    assert response.status_code == 400, response.text
+
+
+@pytest.mark.parametrize("payload", [
+    ["price_asc", 1, 2, 8],
+    ["price_asc", 1, 2.5, 8],
+    ["price_asc", 0, None, 8],
+    ["sold_desc", 0, 5, 5],
+    ["sold_desc", 1, None, 5],
+    ["created_at_desc", 0, "2025-07-01T03:00:00+00:00", 5],
+    ["id", 0, 5, 5],
+])
+def test_well_formed_cursor_is_accepted(products_client, payload):
+    response = products_client.get("/basic-products/page/", params={"sort": payload[0], "cursor": _raw_cursor(payload)})
+    assert response.status_code == 200, response.text
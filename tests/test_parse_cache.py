@@ -0,0 +1,73 @@
+"""HTMLの内容をキーにした解析結果のキャッシュ (ParseCache)"""
+import gzip
+import os
+
+from src.shopee_product_filter.benchmarks.synthetic_pages import generate_page
+from src.shopee_product_filter.core import parse_product_list
+from src.shopee_product_filter.core.parse_cache import MISSING, ParseCache
+from src.shopee_product_filter.core.parse_product_list import PARSER_VERSION, parse_shopee_shop_products_from_file_final
+
+
+def test_round_trip_keeps_products_and_none(tmp_path):
+    cache = ParseCache(str(tmp_path), PARSER_VERSION)
+    products = [{"product_name": "商品", "price": 1.5, "sold": 3}, {"product_name": "B", "price": None, "location": "Japan"}]
+    cache.put("a", products)
+    cache.put("b", None)
+    assert cache.get("a") == [
+        {"product_name": "商品", "price": 1.5, "sold": 3, "location": None},
+        {"product_name": "B", "price": None, "sold": None, "location": "Japan"},
+    ]
+    assert cache.get("b") is None
+    assert cache.get("c") is MISSING
+
+
+def test_key_depends_on_content_version_and_variant(tmp_path):
+    cache = ParseCache(str(tmp_path), PARSER_VERSION)
+    key = cache.key_for(b"<html></html>")
+    assert key == ParseCache(str(tmp_path), PARSER_VERSION).key_for(b"<html></html>")
+    assert key != cache.key_for(b"<html> </html>")
+    assert key != cache.key_for(b"<html></html>", variant="max=10")
+    assert key != ParseCache(str(tmp_path), PARSER_VERSION + "-next").key_for(b"<html></html>")
+
+    # 圧縮したファイルは展開後の内容をキーにする
+    page = tmp_path / "page.html"
+    page.write_bytes(b"<html></html>")
+    compressed = tmp_path / "page.html.gz"
+    compressed.write_bytes(gzip.compress(b"<html></html>"))
+    assert cache.key_for_file(str(page)) == cache.key_for_file(str(compressed)) == key
+
+
+def test_corrupt_entry_is_removed(tmp_path):
+    cache = ParseCache(str(tmp_path), PARSER_VERSION)
+    cache.put("a", [{"product_name": "A"}])
+    (tmp_path / "a.json.z").write_bytes(b"not zlib")
+    assert cache.get("a") is MISSING
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ParseCache(str(tmp_path), PARSER_VERSION)
+    products = [{"product_name": f"Product {index}", "price": index} for index in range(50)]
+    for index, key in enumerate(("a", "b", "c")):
+        cache.put(key, products)
+        os.utime(tmp_path / f"{key}.json.z", (1000 + index, 1000 + index))
+    entry_size = (tmp_path / "a.json.z").stat().st_size
+    cache.max_bytes = entry_size * 3
+    # a を使うと、最後に使われたのが最も古い b が追い出される
+    assert cache.get("a") == products
+    cache.put("d", products)
+    assert sorted(name for name in os.listdir(tmp_path)) == ["a.json.z", "c.json.z", "d.json.z"]
+
+
+def test_cached_page_is_not_parsed_again(tmp_path, monkeypatch):
+    page = tmp_path / "synthetic_shop.html"
+    page.write_text(generate_page("shop", 40, seed=2), encoding="utf-8")
+    cache = ParseCache(str(tmp_path / "cache"), PARSER_VERSION)
+    products = parse_shopee_shop_products_from_file_final(str(page), cache=cache)
+    assert len(products) == 40
+
+    def fail(*args, **kwargs):
+        raise AssertionError("キャッシュにあるページを解析し直しています。")
+
+    monkeypatch.setattr(parse_product_list, "BeautifulSoup", fail)
+    assert parse_shopee_shop_products_from_file_final(str(page), cache=cache) == [dict(p) for p in products]
@@ -0,0 +1,68 @@
+"""商品情報の逐次書き出し (JSONL / CSV / Parquet のライター)"""
+import csv
+import io
+import json
+
+import pytest
+
+from src.shopee_product_filter.core.product_record import PRODUCT_FIELDS, ProductRecord
+from src.shopee_product_filter.core.product_writers import CsvProductWriter, JsonlProductWriter, open_product_writer
+
+PRODUCTS = [
+    {"product_name": f"商品 {index}", "price": None if index % 4 == 0 else index + 0.25, "currency": "$",
+     "product_url": f"https://shopee.sg/p-i.1.{index}", "sold": index * 10, "location": "Japan" if index % 3 else None}
+    for index in range(23)
+]
+
+
+def _expected(product):
+    return {field: product.get(field) for field in PRODUCT_FIELDS}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 100])
+def test_jsonl_writer_writes_every_chunk(chunk_size):
+    out = io.StringIO()
+    with JsonlProductWriter(out, chunk_size=chunk_size) as writer:
+        writer.write_many(PRODUCTS[:10])
+        writer.write_many(ProductRecord(**product) for product in PRODUCTS[10:])
+    assert writer.written == len(PRODUCTS)
+    assert not out.closed
+    assert [json.loads(line) for line in out.getvalue().splitlines()] == [_expected(p) for p in PRODUCTS]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 100])
+def test_csv_writer_writes_header_once(chunk_size):
+    out = io.StringIO()
+    with CsvProductWriter(out, chunk_size=chunk_size, fields=("product_url", "price", "sold")) as writer:
+        writer.write_many(PRODUCTS)
+    rows = list(csv.reader(io.StringIO(out.getvalue())))
+    assert rows[0] == ["product_url", "price", "sold"]
+    assert rows[1:] == [[p["product_url"], "" if p["price"] is None else str(p["price"]), str(p["sold"])] for p in PRODUCTS]
+
+
+def test_csv_writer_writes_header_without_products():
+    out = io.StringIO()
+    CsvProductWriter(out).close()
+    assert out.getvalue().strip() == ",".join(PRODUCT_FIELDS)
+
+
+def test_parquet_writer_keeps_types(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "products.parquet"
+    with open_product_writer(str(path), chunk_size=10) as writer:
+        writer.write_many(PRODUCTS)
+    parquet_file = pq.ParquetFile(str(path))
+    assert parquet_file.metadata.num_row_groups == 3
+    table = parquet_file.read()
+    assert str(table.schema.field("price").type) == "double"
+    assert str(table.schema.field("sold").type) == "int64"
+    assert table.to_pylist() == [_expected(p) for p in PRODUCTS]
+
+
+def test_format_is_chosen_from_the_suffix(tmp_path):
+    with open_product_writer(str(tmp_path / "products.jsonl")) as writer:
+        assert isinstance(writer, JsonlProductWriter)
+    with pytest.raises(ValueError):
+        open_product_writer(str(tmp_path / "products.txt"))
+    with pytest.raises(ValueError):
+        open_product_writer(io.StringIO())
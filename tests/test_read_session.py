@@ -0,0 +1,19 @@
+"""非同期の検索の同時実行の上限 (async_read_slots) が、起動 (lifespan) ごとのイベントループで使えること"""
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+
+
+def test_concurrent_searches_across_restarts(empty_products):
+    api = empty_products
+    with api.engine_product_list.begin() as connection:
+        connection.execute(api.ProductBasicItem.__table__.insert(), [
+            {"product_url": f"https://shopee.sg/p-i.1.{index}", "price": index + 0.5, "sold": index} for index in range(50)
+        ])
+    # TestClient は起動ごとに別のイベントループで動くので、2回起動して、どちらでも上限を超える数の検索を同時に送る
+    for _ in range(2):
+        with TestClient(api.product_list_app) as client, ThreadPoolExecutor(max_workers=8) as pool:
+            responses = list(pool.map(lambda offset: client.get("/basic-products/", params={"offset": offset, "limit": 5}), range(0, 40)))
+        assert [response.status_code for response in responses] == [200] * 40
+        assert all(len(response.json()) == 5 for response in responses[:10])
+    assert api.async_read_slots is None
@@ -0,0 +1,64 @@
+"""セレクタの評価順の学習 (selector_order) を使っても抽出結果が変わらないこと"""
+import pytest
+
+from src.shopee_product_filter.core.parse_product_list import PARSER_VERSION, iter_products
+from src.shopee_product_filter.core.selector_order import SelectorOrderStore, stored_layout_count
+
+BACKENDS = ("bs4", "lxml")
+LOCATION_FROM = 60
+
+
+def _item(index: int) -> str:
+    location = (
+        '<div class="flex items-center space-x-1 max-w-full h-4"><span class="ml-[3px] align-middle">Japan</span></div>'
+        if index >= LOCATION_FROM else ""
+    )
+    return (
+        f'<div class="shop-search-result-view__item col-xs-2-4"><a class="contents" href="https://shopee.sg/p-i.1.{index}">'
+        f'<div class="relative z-0 w-full pt-full"><img src="https://down-sg.img.susercontent.com/file/img{index}" alt="p{index}" class="inset-y-0 w-full"></div>'
+        f'<div class="line-clamp-2">Product {index}</div>'
+        f'<div class="truncate flex items-baseline"><span>$</span><span>{index + 1}.50</span></div>'
+        f'<div class="truncate text-shopee-black87 text-xs">{index} sold</div>'
+        f'<div class="free-shipping">Free shipping</div>{location}</a></div>'
+    )
+
+
+def _layout_shift_page(count: int = 200) -> bytes:
+    """途中のアイテムからロケーションの主要セレクタが一致するようになるページ (それより前は下位の段階が「Free shipping」を拾う)"""
+    items = "".join(_item(index) for index in range(count))
+    return f'<html><body><div class="shop-search-result-view"><div class="row">{items}</div></div></body></html>'.encode("utf-8")
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_layout_shift_within_page(tmp_path, backend, streaming):
+    page = _layout_shift_page()
+    expected = list(iter_products(page, backend=backend, streaming=streaming))
+    assert expected[LOCATION_FROM + 10]["location"] == "Japan"
+
+    store = SelectorOrderStore(str(tmp_path / "selector_order.db"), PARSER_VERSION)
+    try:
+        # 1ページ目で省略を学習し、2ページ目で学習した省略を適用する
+        for _ in range(2):
+            assert list(iter_products(page, backend=backend, streaming=streaming, selector_order=store)) == expected
+        assert store.stats()["adapted_items"] > 0
+    finally:
+        store.close()
+
+
+def test_stored_layout_count_is_read_only(tmp_path):
+    db_path = tmp_path / "selector_order.db"
+    assert stored_layout_count(str(db_path)) == 0
+    assert not db_path.exists()
+
+    store = SelectorOrderStore(str(db_path), PARSER_VERSION)
+    try:
+        list(iter_products(_layout_shift_page(), selector_order=store))
+        store.flush()
+        layouts = store.stats()["layouts"]
+        assert layouts > 0
+        # 書き込み中のストアが開いていても、閉じた後でも数えられる
+        assert stored_layout_count(str(db_path)) == layouts
+    finally:
+        store.close()
+    assert stored_layout_count(str(db_path)) == layouts
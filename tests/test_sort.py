@@ -0,0 +1,71 @@
+"""検索 (/basic-products/) の並び順と、並び順・絞り込みにインデックスを使う実行計画 (/basic-products/query-plan/)"""
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+PRODUCT_COUNT = 80
+
+
+@pytest.fixture
+def products(client, product_list_api):
+    """並びのキーが同じ値の商品と NULL の商品を含む商品を入れて、(id, 行) のリストを返す"""
+    rng = random.Random(1)
+    started = datetime(2025, 7, 1, tzinfo=timezone.utc)
+    rows = [
+        {
+            "product_url": f"https://shopee.sg/p-i.2.{index}",
+            "product_name": f"Product {index}",
+            "price": None if index % 6 == 0 else rng.choice((1.5, 2.0, 9.9, 15.0)),
+            "sold": None if index % 10 == 0 else rng.choice((0, 5, 120, 3000)),
+            "shop_type": rng.choice(("Mall", "Preferred", None)),
+            "created_at": started + timedelta(hours=rng.randint(0, 3)),
+            "updated_at": started,
+        }
+        for index in range(PRODUCT_COUNT)
+    ]
+    with product_list_api.engine_product_list.begin() as connection:
+        connection.execute(product_list_api.ProductBasicItem.__table__.insert(), rows)
+    response = client.get("/basic-products/", params={"limit": 200})
+    return [(item["id"], rows[index]) for index, item in enumerate(response.json())]
+
+
+def _expected_ids(products, sort):
+    """SQLite の並び順 (昇順では NULL が先、降順では後) で並べた id"""
+    if sort == "id":
+        return sorted(product_id for product_id, _ in products)
+    column, descending = {"sold_desc": ("sold", True), "price_asc": ("price", False), "created_at_desc": ("created_at", True)}[sort]
+
+    def key(pair):
+        product_id, row = pair
+        value = row[column]
+        return (value is not None, value if value is not None else 0, product_id)
+
+    return [product_id for product_id, _ in sorted(products, key=key, reverse=descending)]
+
+
+@pytest.mark.parametrize("sort", ["id", "sold_desc", "price_asc", "created_at_desc"])
+def test_sort_orders(client, products, sort):
+    response = client.get("/basic-products/", params={"sort": sort, "limit": 200})
+    assert response.status_code == 200, response.text
+    assert [item["id"] for item in response.json()] == _expected_ids(products, sort)
+
+
+def test_unknown_sort_is_rejected(client):
+    assert client.get("/basic-products/", params={"sort": "name"}).status_code == 422
+
+
+@pytest.mark.parametrize("params, index", [
+    ({"sort": "sold_desc"}, "ix_productbasicitem_sold"),
+    ({"sort": "created_at_desc"}, "ix_productbasicitem_created_at"),
+    ({"sort": "price_asc", "min_price_sgd": 3}, "ix_productbasicitem_price"),
+    ({"sort": "price_asc", "shop_type": "Mall"}, "ix_productbasicitem_shop_type_price"),
+    ({"sort": "sold_desc", "shop_type": "Mall", "min_sold": 10}, "ix_productbasicitem_shop_type_sold"),
+])
+def test_query_plan_uses_index_without_temp_sort(client, products, params, index):
+    response = client.get("/basic-products/query-plan/", params=params)
+    assert response.status_code == 200, response.text
+    plan = response.json()
+    assert not plan["table_scan"]
+    assert not plan["temp_sort"]
+    assert any(index in step["detail"] for step in plan["plan"])
@@ -0,0 +1,122 @@
+"""通常モード (文書全体のツリー) とストリーミングモードの抽出結果の一致"""
+import gzip
+import io
+
+import pytest
+
+from src.shopee_product_filter.benchmarks.synthetic_pages import generate_page
+from src.shopee_product_filter.core import streaming_parser
+from src.shopee_product_filter.core.extraction_plan import ExtractionPlan
+from src.shopee_product_filter.core.parse_product_list import iter_products
+from src.shopee_product_filter.core.streaming_parser import iter_shopee_products_streaming
+
+BACKENDS = ("bs4", "lxml")
+
+
+class _UnseekableStream(io.RawIOBase):
+    """シークできない入力 (シグネチャの事前照合をしない経路) の代わり"""
+
+    def __init__(self, data: bytes) -> None:
+        self._buffer = io.BytesIO(data)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:  # type: ignore[override]
+        data = self._buffer.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _mixed_page() -> bytes:
+    """ショップのグリッドより前に data-sqe のアイテムのリストがあるページ"""
+    shop = generate_page("shop", 30, seed=1)
+    data_sqe = generate_page("data_sqe", 5, seed=2)
+    data_sqe_list = data_sqe[data_sqe.index('<ul class="row'):data_sqe.index("</ul>") + len("</ul>")]
+    return shop.replace("</header>", "</header>" + data_sqe_list, 1).encode("utf-8")
+
+
+def _parse(data: bytes, backend: str, streaming: bool):
+    list_type_info: dict = {}
+    products = list(iter_products(data, backend=backend, streaming=streaming, list_type_info=list_type_info))
+    return list_type_info["list_type"], products
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("list_type", ["shop", "search", "data_sqe"])
+def test_streaming_matches_dom(list_type, backend):
+    data = generate_page(list_type, 120, seed=7).encode("utf-8")
+    dom_type, dom_products = _parse(data, backend, streaming=False)
+    stream_type, stream_products = _parse(data, backend, streaming=True)
+    assert len(dom_products) == 120
+    assert stream_type == dom_type
+    assert stream_products == dom_products
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_mixed_page_uses_registry_priority(backend):
+    data = _mixed_page()
+    dom_type, dom_products = _parse(data, backend, streaming=False)
+    stream_type, stream_products = _parse(data, backend, streaming=True)
+    assert dom_type == stream_type == "shop"
+    assert len(dom_products) == 30
+    assert stream_products == dom_products
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_mixed_page_without_seek(backend):
+    """シークできない入力では、優先順位の低いアイテムを保留して、ショップのアイテムが現れたら捨てる"""
+    data = _mixed_page()
+    _, dom_products = _parse(data, backend, streaming=False)
+    list_type_info: dict = {}
+    products = list(iter_shopee_products_streaming(_UnseekableStream(data), list_type_info=list_type_info, backend=backend))
+    assert list_type_info["list_type"] == "shop"
+    assert [p["product_url"] for p in products] == [p["product_url"] for p in dom_products]
+
+
+def test_lower_priority_page_without_seek():
+    """より優先順位の高いアイテムが最後まで現れなければ、保留したアイテムを返す"""
+    data = generate_page("data_sqe", 40, seed=3).encode("utf-8")
+    _, dom_products = _parse(data, "bs4", streaming=False)
+    list_type_info: dict = {}
+    products = list(iter_shopee_products_streaming(_UnseekableStream(data), list_type_info=list_type_info))
+    assert list_type_info["list_type"] == "data_sqe"
+    assert [p["product_url"] for p in products] == [p["product_url"] for p in dom_products]
+
+
+class _CountingStream(_UnseekableStream):
+    """読み進めたバイト数を記録するシークできない入力"""
+
+    def __init__(self, data: bytes) -> None:
+        super().__init__(data)
+        self.size = len(data)
+
+    @property
+    def consumed(self) -> int:
+        return self._buffer.tell()
+
+
+def test_pending_items_are_capped_without_seek(monkeypatch):
+    """保留したアイテムが上限に達したら、文書の最後を待たずにそのリストタイプに固定して返し始める"""
+    monkeypatch.setattr(streaming_parser, "MAX_PENDING_ITEMS", 20)
+    data = generate_page("data_sqe", 400, seed=4).encode("utf-8")
+    _, dom_products = _parse(data, "bs4", streaming=False)
+    stream = _CountingStream(data)
+    list_type_info: dict = {}
+    products = iter_shopee_products_streaming(stream, list_type_info=list_type_info)
+    first = next(products)
+    assert list_type_info["list_type"] == "data_sqe"
+    assert stream.consumed < stream.size // 2
+    assert [first["product_url"]] + [p["product_url"] for p in products] == [p["product_url"] for p in dom_products]
+
+
+def test_probe_is_skipped_for_compressed_streams(monkeypatch):
+    """gzip の展開ストリームは、シークできても事前の照合で読み直さない"""
+    data = generate_page("shop", 30, seed=5).encode("utf-8")
+    _, dom_products = _parse(data, "bs4", streaming=False)
+    probed = []
+    monkeypatch.setattr(ExtractionPlan, "probe", lambda self, window: probed.append(self) or False)
+    with gzip.GzipFile(fileobj=io.BytesIO(gzip.compress(data))) as page:
+        products = list(iter_shopee_products_streaming(page))
+    assert not probed
+    assert products == dom_products
@@ -0,0 +1,152 @@
+"""アップロードのジョブキュー (解析中のページの上限・ワーカープロセスの異常終了からの回復・ジョブ単位のコミット・書き込みのロック)"""
+import asyncio
+import os
+import time
+
+from sqlmodel import Session, select
+
+from src.shopee_product_filter.api.upload_jobs import PAGE_PARSED, PAGE_PARSING, PAGE_QUEUED, PageWriter, UploadJobQueue
+from src.shopee_product_filter.api.upload_parse import ParsedUploadPage
+
+CRASH = b"crash"
+
+
+def parse_page(file_name, content, options):
+    """テスト用の解析 (ワーカープロセスで実行する)。CRASH のページではワーカープロセスを異常終了させる"""
+    if content == CRASH:
+        os._exit(1)
+    time.sleep(options.get("parse_seconds", 0))
+    return content.decode("utf-8")
+
+
+def parse_product_page(file_name, content, options):
+    """テスト用の解析 (ワーカープロセスで実行する)。HTMLの代わりに商品の product_url をそのまま受け取る"""
+    time.sleep(options.get("parse_seconds", 0))
+    return ParsedUploadPage(items=[{"product_url": content.decode("utf-8"), "product_name": file_name}], list_found=True)
+
+
+class RecordingWriter(PageWriter):
+    """書き込んだページを記録する書き込み (commit() した時点のページだけを committed に入れる)"""
+
+    def __init__(self, options, committed, on_write=None):
+        self.options = options
+        self.committed = committed
+        self.on_write = on_write
+        self.pages = []
+
+    def write(self, file_name, parsed):
+        if self.on_write is not None:
+            self.on_write(file_name)
+        if parsed == "fail":
+            raise RuntimeError("書き込みに失敗しました")
+        self.pages.append((file_name, parsed))
+
+    def commit(self):
+        self.committed.extend(self.pages)
+        return [{"file_name": file_name, "status": "success", "message": parsed} for file_name, parsed in self.pages]
+
+
+def _run(uploads, options=None, on_write=None, **queue_options):
+    committed = []
+
+    async def main():
+        queue = UploadJobQueue(
+            parse_page, lambda options: RecordingWriter(options, committed, on_write), **queue_options
+        )
+        await queue.start()
+        try:
+            job = queue.submit(uploads, options)
+            await asyncio.wait_for(job.wait(), timeout=120)
+            return job
+        finally:
+            await queue.stop()
+
+    return asyncio.run(main()), committed
+
+
+def test_pages_are_committed_in_page_order():
+    uploads = [(f"page{index}.html", f"content {index}".encode()) for index in range(12)]
+    job, committed = _run(uploads, parse_processes=3)
+    assert [page["status"] for page in job.results()] == ["success"] * 12
+    assert committed == [(f"page{index}.html", f"content {index}") for index in range(12)]
+
+
+def test_pending_pages_are_bounded():
+    uploads = [(f"page{index}.html", f"content {index}".encode()) for index in range(10)]
+    pending = []
+    committed = []
+
+    async def main():
+        queue = UploadJobQueue(parse_page, lambda options: RecordingWriter(options, committed), parse_processes=1, max_pending_pages=2)
+        await queue.start()
+        try:
+            job = queue.submit(uploads, {"parse_seconds": 0.05})
+            while not job.done:
+                # 展開したが、まだ解析結果を退避していないページの数
+                pending.append(sum(page["status"] in (PAGE_QUEUED, PAGE_PARSING, PAGE_PARSED) for page in job.pages))
+                await asyncio.sleep(0.01)
+        finally:
+            await queue.stop()
+
+    asyncio.run(main())
+    assert len(committed) == 10
+    assert max(pending) == 2
+
+
+def test_worker_crash_fails_only_the_crashing_page():
+    uploads = [(f"page{index}.html", f"content {index}".encode()) for index in range(6)]
+    uploads.insert(2, ("crash.html", CRASH))
+    job, committed = _run(uploads, {"parse_seconds": 0.2}, parse_processes=2)
+    statuses = {page["file_name"]: page["status"] for page in job.results()}
+    assert statuses.pop("crash.html") == "error"
+    assert set(statuses.values()) == {"success"}
+    assert [file_name for file_name, _ in committed] == [file_name for file_name, _ in uploads if file_name != "crash.html"]
+
+
+def test_write_failure_rolls_back_the_job():
+    uploads = [("page0.html", b"content 0"), ("page1.html", b"fail"), ("page2.html", b"content 2")]
+    job, committed = _run(uploads, parse_processes=1)
+    assert [page["status"] for page in job.results()] == ["error"] * 3
+    assert committed == []
+
+
+def test_sourcing_update_during_long_job(empty_products):
+    """ジョブのページを解析している間は書き込み用の接続を使わないので、ソーシング情報の更新は待たされない"""
+    api = empty_products
+    with Session(api.engine_product_list) as session:
+        product = api.ProductBasicItem(product_url="https://shopee.sg/p-i.9.0", product_name="existing")
+        session.add(product)
+        session.commit()
+        product_id = product.id
+    uploads = [(f"page{index}.html", f"https://shopee.sg/p-i.9.{index}".encode()) for index in range(4)]
+
+    def update_sourcing():
+        with Session(api.engine_product_list) as session:
+            return api.update_sourcing_info(product_id, api.SourcingInfoUpdate(sourcing_status="contacted"), session)
+
+    async def main():
+        queue = UploadJobQueue(parse_product_page, api._ParsedPageWriter, parse_processes=1, max_pending_pages=1)
+        await queue.start()
+        try:
+            job = queue.submit(uploads, {"parse_seconds": 0.5})
+            # 最初のページの解析が終わり、残りのページを解析している間に更新する
+            while not job.pages or job.pages[0]["status"] in (PAGE_QUEUED, PAGE_PARSING, PAGE_PARSED):
+                await asyncio.sleep(0.01)
+            assert not job.done
+            updated = await asyncio.wait_for(asyncio.to_thread(update_sourcing), timeout=1)
+            assert not job.done
+            await asyncio.wait_for(job.wait(), timeout=120)
+            return job, updated
+        finally:
+            await queue.stop()
+
+    job, updated = asyncio.run(main())
+    assert updated.sourcing_status == "contacted"
+    assert [(page["status"], page["items_inserted"], page["items_updated"]) for page in job.results()] == [
+        ("success", 0, 1), ("success", 1, 0), ("success", 1, 0), ("success", 1, 0),
+    ]
+    with Session(api.engine_product_list) as session:
+        products = session.exec(select(api.ProductBasicItem).order_by(api.ProductBasicItem.id)).all()
+    assert [(product.product_url, product.sourcing_status) for product in products] == [
+        (f"https://shopee.sg/p-i.9.{index}", "contacted" if index == 0 else None) for index in range(4)
+    ]
@@ -0,0 +1,127 @@
+"""アップロードの商品の保存/更新 (INSERT ... ON CONFLICT) を繰り返しても結果が変わらないこと"""
+from sqlmodel import Session, select
+
+from src.shopee_product_filter.api.upload_parse import ParsedUploadPage
+
+
+def _items(count: int, price_offset: float = 0.0):
+    return [
+        {
+            "product_url": f"https://shopee.sg/p-i.1.{index}",
+            "product_name": f"Product {index}",
+            "price": index + 0.5 + price_offset,
+            "currency": "$",
+            "sold": index * 10,
+            "shop_type": "Mall" if index % 2 else None,
+            "image_url": f"https://down-sg.img.susercontent.com/file/img{index}",
+            "location": "Japan",
+        }
+        for index in range(count)
+    ]
+
+
+def _rows(api, exclude=("updated_at",)):
+    with Session(api.engine_product_list) as session:
+        products = session.exec(select(api.ProductBasicItem).order_by(api.ProductBasicItem.id)).all()
+        return [product.model_dump(exclude=set(exclude)) for product in products]
+
+
+def _upsert(api, items):
+    with Session(api.engine_product_list) as session:
+        counts = api.upsert_basic_products(session, items)
+        session.commit()
+    return counts
+
+
+def test_upsert_same_items_twice(empty_products):
+    api = empty_products
+    items = _items(1200)
+    assert _upsert(api, items) == (1200, 0)
+    first = _rows(api)
+
+    assert _upsert(api, items) == (0, 1200)
+    assert _rows(api) == first
+
+
+def test_upsert_keeps_created_at_and_sourcing_info(empty_products):
+    api = empty_products
+    _upsert(api, _items(10))
+    with Session(api.engine_product_list) as session:
+        product = session.exec(select(api.ProductBasicItem).where(api.ProductBasicItem.product_url == "https://shopee.sg/p-i.1.3")).one()
+        product.sourcing_status, product.sourcing_notes = "contacted", "sample ordered"
+        session.add(product)
+        session.commit()
+    before = {row["product_url"]: row for row in _rows(api)}
+
+    # 値が変わった再アップロードでも、created_at とソーシング情報はそのまま残る
+    assert _upsert(api, _items(12, price_offset=1.0)) == (2, 10)
+    after = {row["product_url"]: row for row in _rows(api)}
+    assert len(after) == 12
+    for url, row in before.items():
+        assert after[url]["id"] == row["id"]
+        assert after[url]["created_at"] == row["created_at"]
+        assert after[url]["sourcing_status"] == row["sourcing_status"]
+        assert after[url]["sourcing_notes"] == row["sourcing_notes"]
+        assert after[url]["price"] == row["price"] + 1.0
+
+
+def test_duplicate_urls_in_one_batch_count_once(empty_products):
+    api = empty_products
+    items = _items(3)
+    duplicate = dict(items[1], price=99.0)
+    assert _upsert(api, [*items, duplicate]) == (3, 0)
+    # 後に現れた値を使う
+    assert [row["price"] for row in _rows(api)] == [0.5, 99.0, 2.5]
+
+
+def _write_pages(api, pages):
+    writer = api._ParsedPageWriter({})
+    try:
+        for file_name, page in pages:
+            writer.write(file_name, page)
+        return writer.commit()
+    finally:
+        writer.close()
+
+
+def test_write_parsed_pages_twice(empty_products):
+    api = empty_products
+    pages = [
+        ("page1.html", ParsedUploadPage(items=_items(30), list_found=True)),
+        ("page2.html", ParsedUploadPage(items=_items(40)[20:], list_found=True)),
+    ]
+    first = _write_pages(api, pages)
+    assert [(result["items_inserted"], result["items_updated"]) for result in first] == [(30, 0), (10, 10)]
+    rows = _rows(api)
+
+    second = _write_pages(api, pages)
+    assert [(result["items_inserted"], result["items_updated"]) for result in second] == [(0, 30), (0, 20)]
+    assert _rows(api) == rows
+
+
+def test_failed_page_is_rolled_back_alone(empty_products):
+    api = empty_products
+    broken = [{"product_url": "https://shopee.sg/p-i.2.0", "price": object()}]
+    pages = [
+        ("page1.html", ParsedUploadPage(items=_items(5), list_found=True)),
+        ("broken.html", ParsedUploadPage(items=_items(3, price_offset=100.0)[:2] + broken, list_found=True)),
+        ("page3.html", ParsedUploadPage(items=_items(8)[5:], list_found=True)),
+    ]
+    results = _write_pages(api, pages)
+    assert [result["status"] for result in results] == ["success", "error", "success"]
+    # 失敗したページの商品 (前の2件の更新も含めて) は取り消され、ほかのページはコミットされる
+    assert [row["price"] for row in _rows(api)] == [index + 0.5 for index in range(8)]
+
+
+def test_duplicate_urls_across_batches_count_once(empty_products):
+    """1ページの商品が書き込みのバッチをまたいでも、同じ product_url は追加/更新のどちらか1件として数える"""
+    api = empty_products
+    items = _items(api.UPLOAD_UPSERT_BATCH_SIZE + 5)
+    duplicate = dict(items[0], price=99.0)
+    pages = [("page1.html", ParsedUploadPage(items=[*items, duplicate], list_found=True))]
+    [result] = _write_pages(api, pages)
+    assert (result["items_inserted"], result["items_updated"]) == (len(items), 0)
+    assert _rows(api)[0]["price"] == 99.0
+
+    [result] = _write_pages(api, pages)
+    assert (result["items_inserted"], result["items_updated"]) == (0, len(items))